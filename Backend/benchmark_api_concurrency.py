@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark: FastAPI throughput under parallel load, blocking vs async Supabase.
+
+Drives the real app from main.py in process (httpx.ASGITransport, no
+network) with `--concurrency` parallel clients, against the in-memory
+Supabase from Backend/fake_services.py with a fixed per-call latency:
+
+- blocking: every Supabase call sleeps with time.sleep inside the endpoint,
+  which is what calling the sync client from an async endpoint did. One slow
+  call holds up every other request on the worker's event loop.
+- async: every Supabase call is awaited, as with the AsyncClient the app now
+  creates at startup, so requests wait on Supabase concurrently.
+
+Endpoints: GET /health (one query) and GET /api/users/{email} (one
+get_user_by_email lookup; the profile cache is disabled so every request
+reaches Supabase). Reports requests/sec. The load generator shares
+the app's event loop, so per-request latencies are not comparable between
+the modes (a blocked loop pauses the clients' timers too) and are not shown.
+
+Usage:
+    python Backend/benchmark_api_concurrency.py
+    python Backend/benchmark_api_concurrency.py --requests 400 --concurrency 50 --latency-ms 20
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+from typing import Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# No request leaves the process; dummy credentials only let the app import
+for name, value in {
+    "SUPABASE_URL": "https://benchmark.supabase.co",
+    "SUPABASE_KEY": "benchmark",
+    "SUPABASE_ANON_KEY": "benchmark",
+    "OPENAI_API_KEY": "sk-benchmark",
+    "SENDGRID_API_KEY": "SG.benchmark",
+}.items():
+    os.environ.setdefault(name, value)
+# main.py serves static files relative to the repository root
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import httpx
+
+from Backend import clients
+from Backend.profile_cache import profile_cache
+from Backend.fake_services import FakeAsyncSupabase, FakeSupabase, LatencyModel, seed_users
+
+MODES = ("blocking", "async")
+
+async def run_mode(app_module, mode: str, path: str, args) -> Dict:
+    """Send `args.requests` GETs for `path` with `args.concurrency` in flight."""
+    db = FakeSupabase()
+    seed_users(db, args.users, history_per_user=0)
+    fake = FakeAsyncSupabase(db, LatencyModel(args.latency_ms / 1000), blocking=(mode == "blocking"))
+    clients.register_async_client("supabase:SUPABASE_ANON_KEY", fake)
+    emails = [user["email"] for user in db.tables["users"]]
+
+    statuses: Dict[int, int] = {}
+    next_request = iter(range(args.requests))
+
+    async with app_module.lifespan(app_module.app):
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as http:
+            async def worker():
+                for i in next_request:
+                    response = await http.get(path.format(email=emails[i % len(emails)]))
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+
+    return {
+        "mode": mode,
+        "path": path,
+        "requests": args.requests,
+        "statuses": statuses,
+        "seconds": elapsed,
+        "rps": args.requests / elapsed if elapsed else 0.0,
+        "supabase_calls": sum(db.stats.counts.values()),
+    }
+
+def run(args) -> List[Dict]:
+    import main as app_module
+
+    # Measure Supabase access, not the profile cache
+    ttl, profile_cache.ttl = profile_cache.ttl, 0
+    results = []
+    try:
+        for path in ("/health", "/api/users/{email}"):
+            for mode in MODES:
+                results.append(asyncio.run(run_mode(app_module, mode, path, args)))
+    finally:
+        profile_cache.ttl = ttl
+    return results
+
+def print_report(results: List[Dict], args):
+    print(f"\n📊 API throughput, {args.requests} requests, {args.concurrency} in parallel, "
+          f"{args.latency_ms:g} ms per Supabase call")
+    print(f"{'endpoint':<22}{'mode':<10}{'req/s':>9}{'seconds':>9}{'calls':>7}  statuses")
+    for r in results:
+        print(f"{r['path']:<22}{r['mode']:<10}{r['rps']:>9.1f}{r['seconds']:>9.2f}"
+              f"{r['supabase_calls']:>7}  {r['statuses']}")
+    by_key = {(r["path"], r["mode"]): r for r in results}
+    for path in dict.fromkeys(r["path"] for r in results):
+        blocking, concurrent = by_key[(path, "blocking")], by_key[(path, "async")]
+        if blocking["rps"]:
+            print(f"{path}: {concurrent['rps'] / blocking['rps']:.1f}x requests/sec with the async client")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark API throughput with blocking vs async Supabase calls.")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and mode")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight")
+    parser.add_argument("--latency-ms", type=float, default=20, help="latency of every Supabase call")
+    parser.add_argument("--users", type=int, default=50, help="seeded users (looked up round robin)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    logging.disable(logging.INFO)
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: topic detection over a user's recent Bennie emails.
+
+Compares, per target language and per email shape:
+- legacy: the keyword loop analyze_topic_diversity used before
+  Backend/topic_classifier.py (keyword dict rebuilt on every call, lowercase
+  each email, `keyword in email` for every keyword until one matches)
+- legacy scoring: the same substring approach extended to count every
+  keyword, i.e. what scores per topic would cost without the classifier
+- classifier: the precompiled classifier for the user's language
+- classifier (all languages): the classifier used when the language is unknown
+
+Email shapes: "early" mentions a topic in the first sentence, "late" only in
+the last one, "none" mentions no topic (the worst case for the legacy loop).
+
+Usage:
+    python Backend/benchmark_topic_classifier.py
+    python Backend/benchmark_topic_classifier.py --emails 10 --sentences 40 --repeat 200
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from typing import Callable, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from Backend.topic_classifier import TOPIC_KEYWORDS, get_classifier
+
+LEGACY_TOPIC_KEYWORDS = {
+    'food': ['comida', 'cocinar', 'restaurante', 'cena', 'almuerzo', 'desayuno', 'manger', 'cuisine', 'dîner', 'déjeuner', 'petit-déjeuner', '食物', '做饭', '餐厅', '晚餐', '午餐', '早餐', '食べ物', '料理', 'レストラン', '夕食', '昼食', '朝食', 'Essen', 'kochen', 'Restaurant', 'Abendessen', 'Mittagessen', 'Frühstück', 'cibo', 'cucinare', 'ristorante', 'cena', 'pranzo', 'colazione'],
+    'travel': ['viaje', 'vacaciones', 'turismo', 'ciudad', 'país', 'voyage', 'vacances', 'tourisme', 'ville', 'pays', '旅行', '假期', '旅游', '城市', '国家', '旅行', '休暇', '観光', '都市', '国', 'Reise', 'Urlaub', 'Tourismus', 'Stadt', 'Land', 'viaggio', 'vacanze', 'turismo', 'città', 'paese'],
+    'work': ['trabajo', 'oficina', 'proyecto', 'reunión', 'travail', 'bureau', 'projet', 'réunion', '工作', '办公室', '项目', '会议', '仕事', 'オフィス', 'プロジェクト', '会議', 'Arbeit', 'Büro', 'Projekt', 'Meeting', 'lavoro', 'ufficio', 'progetto', 'riunione'],
+    'family': ['familia', 'hijos', 'padres', 'hermanos', 'famille', 'enfants', 'parents', 'frères', '家庭', '孩子', '父母', '兄弟', '家族', '子供', '親', '兄弟', 'Familie', 'Kinder', 'Eltern', 'Geschwister', 'famiglia', 'figli', 'genitori', 'fratelli'],
+    'hobbies': ['hobby', 'deportes', 'música', 'arte', 'lectura', 'passe-temps', 'sports', 'musique', 'art', 'lecture', '爱好', '运动', '音乐', '艺术', '阅读', '趣味', 'スポーツ', '音楽', '芸術', '読書', 'Hobby', 'Sport', 'Musik', 'Kunst', 'Lesen', 'hobby', 'sport', 'musica', 'arte', 'lettura'],
+    'technology': ['tecnología', 'computadora', 'internet', 'aplicación', 'technologie', 'ordinateur', 'internet', 'application', '技术', '电脑', '互联网', '应用程序', '技術', 'コンピューター', 'インターネット', 'アプリケーション', 'Technologie', 'Computer', 'Internet', 'Anwendung', 'tecnologia', 'computer', 'internet', 'applicazione'],
+    'weather': ['clima', 'lluvia', 'sol', 'frío', 'calor', 'temps', 'pluie', 'soleil', 'froid', 'chaud', '天气', '雨', '太阳', '冷', '热', '天気', '雨', '太陽', '寒い', '暑い', 'Wetter', 'Regen', 'Sonne', 'kalt', 'warm', 'tempo', 'pioggia', 'sole', 'freddo', 'caldo']
+}
+
+# Sentences without topic keywords, to pad emails to a realistic length
+FILLER = {
+    "spanish": "Espero que estés muy bien esta semana. ¿Qué piensas de esta idea? Cuéntame un poco más, por favor.",
+    "french": "J'espère que tu vas bien cette semaine. Qu'en penses-tu ? Raconte-moi un peu plus, s'il te plaît.",
+    "mandarin": "希望你这周过得很好。你觉得这个想法怎么样？请多告诉我一些。",
+    "japanese": "今週も元気に過ごしていますか。このアイデアについてどう思いますか。もう少し教えてください。",
+    "german": "Ich hoffe, es geht dir diese Woche gut. Was denkst du darüber? Erzähl mir bitte ein bisschen mehr.",
+    "italian": "Spero che tu stia bene questa settimana. Cosa ne pensi? Raccontami un po' di più, per favore.",
+}
+
+def legacy_first_match(email_texts: List[str]) -> List[str]:
+    """The topic loop of analyze_topic_diversity before the classifier."""
+    topic_keywords = {topic: list(keywords) for topic, keywords in LEGACY_TOPIC_KEYWORDS.items()}
+    recent_topics = []
+    for email in email_texts:
+        email_lower = email.lower()
+        for topic, keywords in topic_keywords.items():
+            if any(keyword in email_lower for keyword in keywords):
+                recent_topics.append(topic)
+                break
+    return recent_topics
+
+def legacy_scoring(email_texts: List[str]) -> List[Dict[str, int]]:
+    """Per-topic scores with one substring count per keyword."""
+    results = []
+    for email in email_texts:
+        email_lower = email.lower()
+        scores = {}
+        for topic, keywords in LEGACY_TOPIC_KEYWORDS.items():
+            count = sum(email_lower.count(keyword.lower()) for keyword in keywords)
+            if count:
+                scores[topic] = count
+        results.append(scores)
+    return results
+
+def make_emails(language: str, shape: str, count: int, sentences: int, rng: random.Random) -> List[str]:
+    """Build `count` emails of `sentences` filler sentences with a topic keyword placed by `shape`."""
+    filler = FILLER[language]
+    separator = "" if language in ("mandarin", "japanese") else " "
+    emails = []
+    for _ in range(count):
+        body = [filler] * sentences
+        topic = rng.choice(list(TOPIC_KEYWORDS[language]))
+        keyword = rng.choice(TOPIC_KEYWORDS[language][topic])
+        if shape == "early":
+            body[0] = keyword + separator + body[0]
+        elif shape == "late":
+            body[-1] = body[-1] + separator + keyword
+        emails.append(separator.join(body))
+    return emails
+
+def per_call_us(func: Callable, emails: List[str], repeat: int) -> float:
+    func(emails)  # warm up (compiles the classifier on first use)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(emails)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def run(args) -> List[Dict]:
+    rng = random.Random(args.seed)
+    results = []
+    for language in TOPIC_KEYWORDS:
+        classifier = get_classifier(language)
+        any_language = get_classifier(None)
+        for shape in ("early", "late", "none"):
+            emails = make_emails(language, shape, args.emails, args.sentences, rng)
+            results.append({
+                "language": language,
+                "shape": shape,
+                "chars": sum(len(e) for e in emails),
+                "legacy": per_call_us(legacy_first_match, emails, args.repeat),
+                "legacy_scoring": per_call_us(legacy_scoring, emails, args.repeat),
+                "classifier": per_call_us(classifier.classify_batch, emails, args.repeat),
+                "classifier_all": per_call_us(any_language.classify_batch, emails, args.repeat),
+            })
+    return results
+
+def print_report(results: List[Dict], args):
+    print(f"\n📊 Topic detection, {args.emails} emails of {args.sentences} sentences per call (µs per call)")
+    print(f"{'language':<10}{'shape':<7}{'chars':>7}{'legacy':>10}{'legacy scoring':>16}{'classifier':>12}{'all langs':>11}")
+    for r in results:
+        print(f"{r['language']:<10}{r['shape']:<7}{r['chars']:>7}{r['legacy']:>10.0f}"
+              f"{r['legacy_scoring']:>16.0f}{r['classifier']:>12.0f}{r['classifier_all']:>11.0f}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the topic classifier against the legacy keyword loop.")
+    parser.add_argument("--emails", type=int, default=10, help="emails per call (analyze_topic_diversity reads 10)")
+    parser.add_argument("--sentences", type=int, default=12, help="filler sentences per email")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    print_report(run(args), args)
+
+if __name__ == "__main__":
+    main()
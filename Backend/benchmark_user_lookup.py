@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark: finding one user by email, at 10k and 100k users.
+
+Loads synthetic users into an in-memory SQLite database (the same users /
+auth users split as Supabase) and times, per lookup:
+
+- list_users scan: what GET /api/users/{email} did, paging through every
+  auth user (--per-page per request, GoTrue's maximum is 1000) and comparing
+  emails in Python until the user is found. The endpoint actually stopped
+  after the first page, so most users were reported as not found.
+- lower(email), no index: the get_user_by_email query without its index
+  (a full table scan per lookup)
+- lower(email) index: get_user_by_email with idx_users_lower_email, as in
+  database/user_email_lookup.sql
+- profile cache hit: Backend/profile_cache.py
+
+"round trips" is the number of Supabase requests a lookup needs; each costs a
+network round trip on top of the time shown. No network or credentials are used.
+
+Usage:
+    python Backend/benchmark_user_lookup.py
+    python Backend/benchmark_user_lookup.py --users 10000 100000 --lookups 200
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+from typing import Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from Backend.profile_cache import MemoryBackend, ProfileCache
+
+PROFILE_COLUMNS = "auth_user_id, email, name, target_language, proficiency_level, learning_goal, created_at"
+LOOKUP_QUERY = f"SELECT {PROFILE_COLUMNS} FROM users WHERE lower(email) = lower(?) ORDER BY created_at LIMIT 1"
+
+def build_database(users: int, indexed: bool, seed: int = 0) -> sqlite3.Connection:
+    rng = random.Random(seed)
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE auth_users (id TEXT PRIMARY KEY, email TEXT NOT NULL)")
+    db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, auth_user_id TEXT NOT NULL, email TEXT NOT NULL, "
+               "name TEXT, target_language TEXT, proficiency_level INTEGER, learning_goal TEXT, created_at TEXT)")
+    rows = [(f"auth-{i}", f"Learner{i}@Example.com") for i in range(users)]
+    db.executemany("INSERT INTO auth_users VALUES (?, ?)", [(id_, email.lower()) for id_, email in rows])
+    db.executemany("INSERT INTO users (auth_user_id, email, name, target_language, proficiency_level, learning_goal, created_at) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                   [(id_, email, f"Learner {i}", rng.choice(["spanish", "french", "japanese"]),
+                     rng.randint(1, 100), "Travel confidently", f"2025-01-01T00:00:{i:06d}")
+                    for i, (id_, email) in enumerate(rows)])
+    db.execute("CREATE INDEX idx_users_email ON users(email)")
+    if indexed:
+        db.execute("CREATE INDEX idx_users_lower_email ON users(lower(email))")
+    db.commit()
+    return db
+
+def list_users_scan(db: sqlite3.Connection, email: str, per_page: int):
+    """Page through auth users until the email is found, then read the profile; returns (row, round trips)."""
+    page, round_trips = 0, 0
+    while True:
+        users = db.execute("SELECT id, email FROM auth_users ORDER BY rowid LIMIT ? OFFSET ?",
+                           (per_page, page * per_page)).fetchall()
+        round_trips += 1
+        if not users:
+            return None, round_trips
+        match = next((user for user in users if user[1] == email.lower()), None)
+        if match:
+            row = db.execute(f"SELECT {PROFILE_COLUMNS} FROM users WHERE auth_user_id = ?", (match[0],)).fetchone()
+            return row, round_trips + 1
+        page += 1
+
+def indexed_lookup(db: sqlite3.Connection, email: str):
+    return db.execute(LOOKUP_QUERY, (email,)).fetchone(), 1
+
+def uses_index(db: sqlite3.Connection) -> bool:
+    plan = " ".join(str(row[-1]) for row in db.execute(f"EXPLAIN QUERY PLAN {LOOKUP_QUERY}", ("x",)))
+    return "idx_users_lower_email" in plan
+
+def time_lookups(lookup, emails: List[str]) -> Dict:
+    round_trips, found = 0, 0
+    started = time.perf_counter()
+    for email in emails:
+        row, trips = lookup(email)
+        round_trips += trips
+        found += row is not None
+    elapsed = time.perf_counter() - started
+    return {"us_per_lookup": elapsed / len(emails) * 1e6, "round_trips": round_trips / len(emails),
+            "found": found / len(emails)}
+
+def run(args) -> List[Dict]:
+    rng = random.Random(args.seed)
+    results = []
+    for users in args.users:
+        emails = [f"learner{rng.randrange(users)}@example.com" for _ in range(args.lookups)]
+        # The scan is slow at 100k users; a few lookups give a stable average
+        scan_emails = emails[:max(1, args.lookups // 20)]
+        plain, indexed = build_database(users, indexed=False), build_database(users, indexed=True)
+        cache = ProfileCache(MemoryBackend(max_entries=2 * users), ttl=3600)
+        for email in emails:
+            cache.set({"auth_user_id": f"auth-{email[7:-12]}", "email": email})
+
+        def cached(email):
+            return cache.get(email=email), 0
+
+        rows = {
+            "list_users scan": time_lookups(lambda email: list_users_scan(plain, email, args.per_page), scan_emails),
+            "lower(email), no index": time_lookups(lambda email: indexed_lookup(plain, email), scan_emails),
+            "lower(email) index": time_lookups(lambda email: indexed_lookup(indexed, email), emails),
+            "profile cache hit": time_lookups(cached, emails),
+        }
+        for method, row in rows.items():
+            results.append({"users": users, "method": method, **row})
+        results.append({"users": users, "method": "index used", "value": uses_index(indexed)})
+    return results
+
+def print_report(results: List[Dict], args):
+    print(f"\n📊 User lookup by email ({args.per_page} users per list_users page)")
+    print(f"{'users':>8}  {'method':<24}{'µs/lookup':>12}{'round trips':>13}{'found':>8}")
+    for r in results:
+        if r["method"] == "index used":
+            print(f"{r['users']:>8}  query plan uses idx_users_lower_email: {r['value']}")
+            continue
+        print(f"{r['users']:>8}  {r['method']:<24}{r['us_per_lookup']:>12.1f}{r['round_trips']:>13.1f}{r['found']:>8.0%}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark user lookup by email: list_users scan vs indexed lookup.")
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000], help="synthetic user counts")
+    parser.add_argument("--lookups", type=int, default=200, help="lookups per method (the scans use 1 in 20)")
+    parser.add_argument("--per-page", type=int, default=1000, help="auth users per list_users request")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    print_report(run(args), args)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,23 @@
 # using SendGrid's Python Library
 # https://github.com/sendgrid/sendgrid-python
 import os
+import asyncio
 from dotenv import load_dotenv
-import sendgrid
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
-from openai import OpenAI
 import logging
-from supabase import create_client, Client
+from supabase import Client
 from typing import List, Dict, Optional, Tuple
 import random
 import json
+from Backend import clients, conversation_memory
+from Backend.topic_classifier import get_classifier
+from Backend.email_metadata import build_email_metadata, has_metadata
+from Backend.prompt_builder import PromptBuilder
+from Backend.profile_cache import profile_cache
+from Backend.learning_email import RESPONSE_FORMAT, parse_learning_email, render_html, render_text
+from Backend.proficiency import (
+    LANGUAGES, get_vocabulary_guidance, language_info, level_info, level_to_semester, normalize_language,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +32,7 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("Missing required environment variables")
 
 try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase: Client = clients.get_supabase()
     logger.info("Supabase client initialized successfully")
 except Exception as e:
     logger.error(f"Failed to initialize Supabase client: {e}")
@@ -55,24 +62,76 @@ def get_email_subject(user_language: str) -> str:
     Returns:
         str: The email subject line in both English and the target language
     """
-    user_language = user_language.lower()
-    language_subjects = {
-        'spanish': 'Spanish Learning Email from Bennie! - Correo de aprendizaje de español',
-        'french': 'French Learning Email from Bennie! - E-mail d\'apprentissage du français',
-        'mandarin': 'Chinese Learning Email from Bennie! - 中文学习邮件',
-        'japanese': 'Japanese Learning Email from Bennie! - 日本語学習メール',
-        'german': 'German Learning Email from Bennie! - Deutsch-Lern-E-Mail',
-        'italian': 'Italian Learning Email from Bennie! - E-mail di apprendimento dell\'italiano'
+    return language_info(user_language).subject
+
+USER_CONTEXT_COLUMNS = "auth_user_id, email, name, target_language, proficiency_level, topics_of_interest, learning_goal"
+HISTORY_LIMIT = 20
+
+# Bennie's personality and purpose, sent once as the system message
+SYSTEM_MESSAGE = "You are Bennie, a warm, enthusiastic, and encouraging AI language learning friend. You have a playful personality and love sharing your daily experiences. You write natural, conversational emails in the user's target language while helping them learn. You're genuinely excited about helping people learn languages and you treat each user like a close friend. You're curious about their lives and always ask engaging questions to keep the conversation flowing."
+# Token budget per section of the learning email prompt (python Backend/prompt_report.py shows actual counts)
+PROMPT_SECTION_BUDGETS = {"writing": 400, "format": 250, "example": 300, "topic_rules": 150,
+                          "requirements": 300, "vocabulary": 150, "semester": 100,
+                          "user": 150, "memory": 200, "topics": 150}
+
+# How Bennie writes, the same for every user
+WRITING_GUIDE = """
+WRITING GUIDE:
+- Start by reacting to their last reply, before your own news; if they haven't replied, pick up where your last email left off
+- Share one small, concrete scene from your own week around the selected topic (a place, a person, something that surprised you) rather than general statements
+- Put each new vocabulary word in a sentence that makes its meaning clear from context
+- Reuse one or two of the words already taught naturally, without defining them again
+- Prefer the everyday words a native speaker would use in a friendly email over textbook phrasing
+- Keep the grammar at or slightly below the level guidance; split long sentences in two
+- Ask exactly one question, at the end, about their life and easy to answer with words from the email
+- Never correct their mistakes; use the correct forms naturally in your own sentences instead
+- Never invent facts about the user
+- No markdown, bullet points, headings or emojis in the body; write plain paragraphs
+"""
+
+# The fields of RESPONSE_FORMAT (Backend/learning_email.py)
+OUTPUT_FORMAT = """
+OUTPUT FORMAT:
+Reply with the JSON object of the response format:
+- body: the email in the target language, starting with a friendly greeting that uses their name, without the closing or the vocabulary. Separate paragraphs with a blank line
+- closing: only the closing line for the target language given in the requirements
+- vocabulary: the 2-3 new words as they appear in the body (the dictionary form of a verb is fine), each with a short English definition of its meaning in this email; never a word already taught
+- topic: the one topic from the list that best matches the body; "other" only if none fits
+- user_facts: short English sentences in the third person ("Has a dog called Luna"), only facts worth remembering that they stated in their last reply; empty if there is no reply or nothing new
+"""
+
+EXAMPLE_EMAIL = """
+EXAMPLE (in English only to show the shape; yours is in the target language, at their level), after a reply saying they will visit Lisbon in May:
+""" + json.dumps({
+    "body": "Hi Robin!\n\nLisbon in May sounds wonderful! This week I baked bread for the first time. "
+            "The dough was so sticky that it stuck to my fingers and even my cat! The bread was a bit flat, "
+            "but it smelled delicious.\n\nWhat do you want to eat first in Lisbon?",
+    "closing": "With love, Bennie",
+    "vocabulary": [{"word": "dough", "definition": "mix of flour and water"},
+                   {"word": "sticky", "definition": "glue-like"}],
+    "topic": "food",
+    "user_facts": ["Is visiting Lisbon in May"],
+}, indent=2)
+# Share of the input price OpenAI charges for prompt tokens served from its cache
+CACHED_TOKEN_PRICE_RATIO = 0.5
+
+def build_user_context(user: Dict, email_history: List[Dict], memory: Optional[Dict] = None) -> Dict:
+    """
+    Build the user context dict used for prompt generation from a profile row,
+    its conversation summary (see Backend/conversation_memory.py) and any
+    history that was fetched (only when the summary had to be bootstrapped).
+    """
+    return {
+        "auth_user_id": user["auth_user_id"],
+        "email": user.get("email"),
+        "name": user["name"],
+        "target_language": user["target_language"],
+        "proficiency_level": user["proficiency_level"] or 1,
+        "topics_of_interest": user["topics_of_interest"] or "",
+        "learning_goal": user["learning_goal"] or "",
+        "email_history": email_history,
+        "memory": memory
     }
-    
-    # Convert to lowercase and remove any extra whitespace for robust matching
-    language_clean = user_language.lower().strip()
-    
-    if language_clean in language_subjects:
-        return language_subjects[language_clean]
-    else:
-        # General fallback case for unsupported languages
-        return f'Language Learning Email from Bennie! {user_language.title()} Learning Email'
 
 def get_user_context(user_email: str) -> Dict:
     """
@@ -85,80 +144,110 @@ def get_user_context(user_email: str) -> Dict:
         Dict: User context including profile and preferences
     """
     try:
-        # Get auth user first
-        auth_user = supabase.auth.admin.get_user_by_email(user_email)
+        # Get user profile through the profile cache shared with the API, loaded
+        # on a miss with the indexed lookup (see database/user_email_lookup.sql)
+        def load_profile():
+            user_response = supabase.rpc("get_user_by_email", {"p_email": user_email.lower()}).execute()
+            return user_response.data[0] if user_response.data else None
         
-        if not auth_user:
-            logger.error(f"User not found: {user_email}")
-            raise ValueError(f"User not found: {user_email}")
+        user = profile_cache.get_or_load(load_profile, email=user_email)
         
-        # Get user profile
-        user_response = supabase.table("users").select(
-            "auth_user_id, name, target_language, proficiency_level, topics_of_interest, learning_goal"
-        ).eq("auth_user_id", auth_user.id).execute()
-        
-        if not user_response.data:
-            logger.error(f"User profile not found for auth_user_id: {auth_user.id}")
+        if user is None:
+            logger.error(f"User profile not found for email: {user_email}")
             raise ValueError(f"User profile not found: {user_email}")
         
-        user = user_response.data[0]
+        memory = conversation_memory.load_summaries(supabase, [user["auth_user_id"]]).get(user["auth_user_id"])
+        if memory is not None:
+            return build_user_context(user, [], memory)
         
-        # Get recent email history (last 20 messages)
+        # No summary yet: bootstrap it from recent email history (last 20 messages)
         history_response = supabase.table("email_history").select(
-            "content, is_from_bennie, created_at"
-        ).eq("auth_user_id", user["auth_user_id"]).order("created_at", desc=True).limit(20).execute()
+            "content, is_from_bennie, created_at, topic, language"
+        ).eq("auth_user_id", user["auth_user_id"]).order("created_at", desc=True).limit(HISTORY_LIMIT).execute()
         
         email_history = history_response.data if history_response.data else []
+        memory = conversation_memory.bootstrap(email_history, user["target_language"])
+        conversation_memory.save_summary(supabase, user["auth_user_id"], memory)
         
-        return {
-            "auth_user_id": user["auth_user_id"],
-            "name": user["name"],
-            "target_language": user["target_language"],
-            "proficiency_level": user["proficiency_level"] or 1,
-            "topics_of_interest": user["topics_of_interest"] or "",
-            "learning_goal": user["learning_goal"] or "",
-            "email_history": email_history
-        }
+        return build_user_context(user, email_history, memory)
         
     except Exception as e:
         logger.error(f"Error fetching user context: {e}")
         raise
 
-def analyze_topic_diversity(email_history: List[Dict]) -> Tuple[List[str], bool, List[str]]:
+def load_user_contexts(auth_user_ids: List[str], users: Optional[List[Dict]] = None) -> Dict[str, Dict]:
+    """
+    Load user contexts for a whole page of users in at most three queries.
+    
+    Profiles come from one `in` select on public.users (skipped when the caller
+    already has the profile rows) and conversation summaries from one select on
+    conversation_summaries. Only users without a summary get their recent
+    history, from one call to the get_recent_email_history Postgres function;
+    their summaries are bootstrapped from it and saved.
+    
+    Args:
+        auth_user_ids (List[str]): Users to load
+        users (List[Dict]): Optional profile rows with USER_CONTEXT_COLUMNS already fetched
+        
+    Returns:
+        Dict[str, Dict]: User context keyed by auth_user_id. Users without a profile are left out.
+    """
+    if not auth_user_ids:
+        return {}
+    
+    if users is None:
+        users_response = supabase.table("users").select(
+            USER_CONTEXT_COLUMNS
+        ).in_("auth_user_id", auth_user_ids).execute()
+        users = users_response.data or []
+    
+    memories = conversation_memory.load_summaries(supabase, auth_user_ids)
+    
+    history_by_user: Dict[str, List[Dict]] = {}
+    missing = [user["auth_user_id"] for user in users if user["auth_user_id"] not in memories]
+    if missing:
+        history_response = supabase.rpc("get_recent_email_history", {
+            "p_auth_user_ids": missing,
+            "p_limit": HISTORY_LIMIT
+        }).execute()
+        for row in history_response.data or []:
+            history_by_user.setdefault(row["auth_user_id"], []).append(row)
+    
+    contexts = {}
+    for user in users:
+        history = sorted(history_by_user.get(user["auth_user_id"], []), key=lambda row: row["created_at"], reverse=True)
+        memory = memories.get(user["auth_user_id"])
+        if memory is None:
+            memory = conversation_memory.bootstrap(history, user["target_language"])
+            conversation_memory.save_summary(supabase, user["auth_user_id"], memory)
+        contexts[user["auth_user_id"]] = build_user_context(user, history, memory)
+    return contexts
+
+def analyze_topic_diversity(email_history: List[Dict], target_language: Optional[str] = None,
+                            memory: Optional[Dict] = None) -> Tuple[List[str], bool, List[str]]:
     """
     Analyze email history to determine topic diversity and suggest new vs repeated topics.
     Enhanced version that better tracks topics and enforces variety.
     
     Args:
         email_history (List[Dict]): List of recent email history
+        target_language (str): User's target language, to match only that language's keywords
+        memory (Dict): Optional conversation summary; its recent_topics are used instead of the history
         
     Returns:
         Tuple[List[str], bool, List[str]]: (recent_topics, should_use_new_topic, available_interests)
     """
-    # Extract topics from recent Bennie emails (last 10 messages)
-    recent_bennie_emails = [
-        email["content"] for email in email_history 
-        if email["is_from_bennie"] and email["content"]
-    ][:10]
-    
-    # Better topic extraction using keyword detection
-    recent_topics = []
-    topic_keywords = {
-        'food': ['comida', 'cocinar', 'restaurante', 'cena', 'almuerzo', 'desayuno', 'manger', 'cuisine', 'dîner', 'déjeuner', 'petit-déjeuner', '食物', '做饭', '餐厅', '晚餐', '午餐', '早餐', '食べ物', '料理', 'レストラン', '夕食', '昼食', '朝食', 'Essen', 'kochen', 'Restaurant', 'Abendessen', 'Mittagessen', 'Frühstück', 'cibo', 'cucinare', 'ristorante', 'cena', 'pranzo', 'colazione'],
-        'travel': ['viaje', 'vacaciones', 'turismo', 'ciudad', 'país', 'voyage', 'vacances', 'tourisme', 'ville', 'pays', '旅行', '假期', '旅游', '城市', '国家', '旅行', '休暇', '観光', '都市', '国', 'Reise', 'Urlaub', 'Tourismus', 'Stadt', 'Land', 'viaggio', 'vacanze', 'turismo', 'città', 'paese'],
-        'work': ['trabajo', 'oficina', 'proyecto', 'reunión', 'travail', 'bureau', 'projet', 'réunion', '工作', '办公室', '项目', '会议', '仕事', 'オフィス', 'プロジェクト', '会議', 'Arbeit', 'Büro', 'Projekt', 'Meeting', 'lavoro', 'ufficio', 'progetto', 'riunione'],
-        'family': ['familia', 'hijos', 'padres', 'hermanos', 'famille', 'enfants', 'parents', 'frères', '家庭', '孩子', '父母', '兄弟', '家族', '子供', '親', '兄弟', 'Familie', 'Kinder', 'Eltern', 'Geschwister', 'famiglia', 'figli', 'genitori', 'fratelli'],
-        'hobbies': ['hobby', 'deportes', 'música', 'arte', 'lectura', 'passe-temps', 'sports', 'musique', 'art', 'lecture', '爱好', '运动', '音乐', '艺术', '阅读', '趣味', 'スポーツ', '音楽', '芸術', '読書', 'Hobby', 'Sport', 'Musik', 'Kunst', 'Lesen', 'hobby', 'sport', 'musica', 'arte', 'lettura'],
-        'technology': ['tecnología', 'computadora', 'internet', 'aplicación', 'technologie', 'ordinateur', 'internet', 'application', '技术', '电脑', '互联网', '应用程序', '技術', 'コンピューター', 'インターネット', 'アプリケーション', 'Technologie', 'Computer', 'Internet', 'Anwendung', 'tecnologia', 'computer', 'internet', 'applicazione'],
-        'weather': ['clima', 'lluvia', 'sol', 'frío', 'calor', 'temps', 'pluie', 'soleil', 'froid', 'chaud', '天气', '雨', '太阳', '冷', '热', '天気', '雨', '太陽', '寒い', '暑い', 'Wetter', 'Regen', 'Sonne', 'kalt', 'warm', 'tempo', 'pioggia', 'sole', 'freddo', 'caldo']
-    }
-    
-    for email in recent_bennie_emails:
-        email_lower = email.lower()
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in email_lower for keyword in keywords):
+    # Topics of recent Bennie emails (last 10 messages): stored at send time,
+    # or the highest scoring topic from the keyword classifier for older rows
+    if memory is not None:
+        recent_topics = list(memory.get("recent_topics", []))[:10]
+    else:
+        classifier = get_classifier(target_language)
+        recent_topics = []
+        for email in [email for email in email_history if email["is_from_bennie"]][:10]:
+            topic = email.get("topic") if has_metadata(email) else classifier.classify(email.get("content"))
+            if topic:
                 recent_topics.append(topic)
-                break
     
     # Get user interests from the most recent email context
     user_interests = []
@@ -256,92 +345,105 @@ def get_next_topic(user_interests: List[str], recent_topics: List[str], should_u
         else:
             return random.choice(user_interests)
 
-# Map proficiency level (1-100) to college semester (1-8) and description
-def level_to_semester(level: int) -> tuple[int, str]:
-    """
-    Map a proficiency level (1-100) to a college semester (1-8) and provide a description for prompt context.
-    """
-    if level <= 12:
-        return 1, "Absolute beginner. Greetings, basic phrases, simple questions. Equivalent to first semester college language student."
-    elif level <= 25:
-        return 2, "Beginner. Simple present tense, basic questions, daily life topics. Equivalent to second semester."
-    elif level <= 37:
-        return 3, "Lower intermediate. Past/future tense, more vocabulary, short stories. Equivalent to third semester."
-    elif level <= 50:
-        return 4, "Intermediate. Complex sentences, opinions, short essays. Equivalent to fourth semester."
-    elif level <= 62:
-        return 5, "Upper intermediate. Argumentation, abstract topics, intro to literature. Equivalent to fifth semester."
-    elif level <= 75:
-        return 6, "Advanced. Advanced readings, idioms, cultural nuance. Equivalent to sixth semester."
-    elif level <= 87:
-        return 7, "Very advanced. Academic/professional topics, debates, research. Equivalent to seventh semester."
-    else:
-        return 8, "Near-native. Literature, advanced writing, slang, full fluency. Equivalent to eighth (final) semester."
-
-def get_vocabulary_guidance(proficiency_level: int, target_language: str) -> str:
-    """
-    Generate specific vocabulary guidance based on proficiency level.
-    This provides concrete examples without needing large vocab lists.
-    """
-    if proficiency_level <= 12:
-        return f"""
-VOCABULARY GUIDANCE FOR ABSOLUTE BEGINNER (Level {proficiency_level}/100):
-- Use only the most basic words: greetings, simple verbs (ser/estar, tener, hacer), basic nouns (casa, trabajo, familia)
-- Avoid complex vocabulary, idioms, or advanced grammar
-- Stick to present tense only
-- Use simple sentence structures: Subject + Verb + Object
-- Maximum 1-2 new vocabulary words per email
-- Focus on survival vocabulary: basic needs, simple questions, everyday objects
-"""
-    elif proficiency_level <= 25:
-        return f"""
-VOCABULARY GUIDANCE FOR BEGINNER (Level {proficiency_level}/100):
-- Use basic everyday vocabulary: daily activities, common objects, simple emotions
-- Include some basic adjectives and adverbs
-- Can use simple past tense occasionally
-- Avoid complex verb conjugations or subjunctive mood
-- Maximum 2-3 new vocabulary words per email
-- Focus on practical, frequently-used words
-"""
-    elif proficiency_level <= 37:
-        return f"""
-VOCABULARY GUIDANCE FOR LOWER INTERMEDIATE (Level {proficiency_level}/100):
-- Use intermediate vocabulary: hobbies, work-related terms, cultural topics
-- Can include some idiomatic expressions (but explain them)
-- Use past and future tenses
-- Include some compound sentences
-- Maximum 3-4 new vocabulary words per email
-- Can introduce abstract concepts but keep them simple
+def prompt_segment(target_language: str, proficiency_level: int) -> str:
+    """
+    Key of the prompt prefix shared by every user with this target language and
+    level bucket (their semester, see level_to_semester), e.g. "spanish:3".
+    """
+    return f"{normalize_language(target_language)}:{level_info(proficiency_level).semester}"
+
+_segment_prompts: Dict[str, PromptBuilder] = {}
+
+# Bennie's closing per language, listed in every segment's requirements
+CLOSING_LINES = "\n".join(f'  - {key.title()}: "{info.closing}"' for key, info in LANGUAGES.items())
+
+def build_segment_prompt(target_language: str, proficiency_level: int) -> PromptBuilder:
+    """
+    Assemble the system message shared by a prompt segment: Bennie's persona,
+    the writing guide, the output format with an example, the topic rules,
+    the requirements, and the vocabulary and semester guidance of the level
+    bucket. Nothing user-specific goes in, so every user of the
+    segment sends the same prefix and OpenAI can serve it from its prompt cache.
+    Built once per segment.
+    
+    Returns:
+        PromptBuilder: The segment's system message; .report() gives tokens per section
+    """
+    segment = prompt_segment(target_language, proficiency_level)
+    if segment in _segment_prompts:
+        return _segment_prompts[segment]
+    language = segment.split(":")[0].title()
+    semester, semester_desc = level_to_semester(proficiency_level)
+
+    # Language and content requirements
+    requirements = f"""
+REQUIREMENTS:
+- Write entirely in {language}
+- Keep message to 3-4 sentences
+- Include 2-3 new vocabulary words appropriate for their level
+- End with an engaging question that invites a response
+- Keep tone friendly, encouraging, and conversational
+- Put a culturally appropriate closing with Bennie's name, in the target language, in the closing field:
+{CLOSING_LINES}
+- List the new vocabulary words with English definitions in the vocabulary field, not in the body
+- Set topic to the main topic of the email
+- List up to 3 short facts in English that the user shared in their last reply in user_facts (empty if none)
+- DO NOT mention their learning goals or proficiency level in the email
+- Focus on natural conversation, not explicit teaching
+- IMPORTANT: Use vocabulary that matches their exact level - don't overestimate their abilities
 """
-    elif proficiency_level <= 50:
-        return f"""
-VOCABULARY GUIDANCE FOR INTERMEDIATE (Level {proficiency_level}/100):
-- Use intermediate-advanced vocabulary: opinions, preferences, experiences
-- Can include more complex sentence structures
-- Use subjunctive mood occasionally
-- Include cultural references and idioms
-- Maximum 4-5 new vocabulary words per email
-- Can discuss abstract topics but provide context
+
+    # Topic variety rules; the user's topics come in the user message
+    topic_rules = """
+TOPIC RULES:
+- Topic variety rule: If the same topic appears in 2+ recent emails, you MUST choose a different topic
+- If new topic: Chose a random topic that you are interested in!  Be creative!  Bennie is very adventurous and has a wide range of interesting experiences.  Be creative and make something fun and unique up that will expand our user's vocabulary!
+- If repeating topic: Choose a completely different angle or situation
+- Topic rotation: Cycle through their interests evenly over time
+- Avoid topic repetition: Don't discuss the same specific topic within 5 emails
 """
-    else:
-        return f"""
-VOCABULARY GUIDANCE FOR ADVANCED (Level {proficiency_level}/100):
-- Use advanced vocabulary: complex topics, nuanced expressions, cultural depth
-- Can include sophisticated grammar structures
-- Use idioms and cultural references freely
-- Maximum 5-6 new vocabulary words per email
-- Can discuss abstract, complex topics
+
+    # Enhanced vocabulary guidance
+    vocab_guidance = get_vocabulary_guidance(proficiency_level, language)
+
+    semester_context = f"""
+SEMESTER CONTEXT:
+- The user is equivalent to a college language learner in semester {semester} out of 8.
+- {semester_desc}
+- Tailor your vocabulary, grammar, and topics to what a student would be expected to handle at this semester.
 """
 
+    # Sections that are the same in every segment first, so they also form a
+    # prefix shared across segments; OpenAI caches from 1024 tokens
+    builder = PromptBuilder()
+    builder.add("persona", SYSTEM_MESSAGE)
+    builder.add("writing", WRITING_GUIDE, budget=PROMPT_SECTION_BUDGETS["writing"])
+    builder.add("format", OUTPUT_FORMAT, budget=PROMPT_SECTION_BUDGETS["format"])
+    builder.add("example", EXAMPLE_EMAIL, budget=PROMPT_SECTION_BUDGETS["example"])
+    builder.add("topic_rules", topic_rules, budget=PROMPT_SECTION_BUDGETS["topic_rules"])
+    builder.add("requirements", requirements, budget=PROMPT_SECTION_BUDGETS["requirements"])
+    builder.add("vocabulary", vocab_guidance, budget=PROMPT_SECTION_BUDGETS["vocabulary"])
+    builder.add("semester", semester_context, budget=PROMPT_SECTION_BUDGETS["semester"])
+    _segment_prompts[segment] = builder
+    return builder
+
 def create_enhanced_prompt(user_context: Dict, recent_topics: List[str], should_use_new_topic: bool, next_topic: str = None) -> str:
     """
     Create an enhanced prompt with comprehensive user context and better topic/vocabulary control.
+    This is the user message; it follows the segment's system message from build_segment_prompt.
     """
-    # Bennie's personality and purpose
-    bennie_identity = """You are Bennie, a warm, enthusiastic, and encouraging AI language learning friend. You have a playful personality and love sharing your daily experiences. You're genuinely excited about helping people learn languages and you treat each user like a close friend. You're curious about their lives and always ask engaging questions to keep the conversation flowing."""
+    return build_enhanced_prompt(user_context, recent_topics, should_use_new_topic, next_topic).build()
 
+def build_enhanced_prompt(user_context: Dict, recent_topics: List[str], should_use_new_topic: bool, next_topic: str = None) -> PromptBuilder:
+    """
+    Assemble the user-specific sections of the learning email prompt. They go
+    last, after the segment's shared system message, and nothing already in
+    that message is repeated. Each section is held to its PROMPT_SECTION_BUDGETS entry.
+    
+    Returns:
+        PromptBuilder: The assembled prompt; .report() gives tokens per section
+    """
     # User context section
-    semester, semester_desc = level_to_semester(user_context['proficiency_level'])
     user_info = f"""
 USER CONTEXT:
 - Name: {user_context['name']}
@@ -349,11 +451,6 @@ USER CONTEXT:
 - Proficiency Level: {user_context['proficiency_level']}/100
 - Learning Goal: {user_context['learning_goal']}
 - Interests: {user_context['topics_of_interest']}
-
-SEMESTER CONTEXT:
-- The user's proficiency level of {user_context['proficiency_level']}/100 is equivalent to a college language learner in semester {semester} out of 8.
-- {semester_desc}
-- Tailor your vocabulary, grammar, and topics to what a student would be expected to handle at this semester.
 """
 
     # Enhanced topic guidance with better variety control
@@ -362,80 +459,39 @@ TOPIC GUIDANCE:
 - Recent topics discussed: {', '.join(recent_topics) if recent_topics else 'None yet'}
 - Should introduce new topic: {'Yes' if should_use_new_topic else 'No'}
 - SELECTED TOPIC FOR THIS EMAIL: {next_topic if next_topic else 'Choose from interests'}
-- Topic variety rule: If the same topic appears in 2+ recent emails, you MUST choose a different topic
 - Available interests to choose from: {user_context['topics_of_interest']}
-- If new topic: Chose a random topic that you are interested in!  Be creative!  Bennie is very adventurous and has a wide range of interesting experiences.  Be creative and make something fun and unique up that will expand our user's vocabulary!
-- If repeating topic: Choose a completely different angle or situation
-- Topic rotation: Cycle through their interests evenly over time
-- Avoid topic repetition: Don't discuss the same specific topic within 5 emails
 - IMPORTANT: Focus your email content around the selected topic: {next_topic}
-"""
-
-    # Enhanced vocabulary guidance
-    vocab_guidance = get_vocabulary_guidance(user_context['proficiency_level'], user_context['target_language'])
-
-    # Language and content requirements
-    requirements = f"""
-REQUIREMENTS:
-- Write entirely in {user_context['target_language']}
-- {vocab_guidance}
-- Keep message to 3-4 sentences
-- Include 2-3 new vocabulary words appropriate for their level
-- End with an engaging question that invites a response
-- Keep tone friendly, encouraging, and conversational
-- End the email with a culturally appropriate closing and Bennie's name, in the target language:
-  - Spanish: "Con cariño, Bennie"
-  - French: "Avec amitié, Bennie"
-  - Mandarin: "祝好 (Zhù hǎo), Bennie"
-  - Japanese: "ベニーより (Bennie yori)"
-  - German: "Viele Grüße, Bennie"
-  - Italian: "Con affetto, Bennie"
-- Add vocabulary definitions at the bottom after signature
-- DO NOT mention their learning goals or proficiency level in the email
-- Focus on natural conversation, not explicit teaching
-- IMPORTANT: Use vocabulary that matches their exact level - don't overestimate their abilities
 """
 
     # Combine all sections
-    full_prompt = f"""{bennie_identity}
-
-{user_info}
-
-{topic_guidance}
-
-{vocab_guidance}
-
-{requirements}
-
-Write your email now:"""
-
-    return full_prompt
+    segment_prompt = build_segment_prompt(user_context['target_language'], user_context['proficiency_level'])
+    builder = PromptBuilder(exclude=[segment_prompt.build()])
+    builder.add("user", user_info, budget=PROMPT_SECTION_BUDGETS["user"])
+    builder.add("memory", conversation_memory.memory_block(user_context.get("memory")),
+                budget=PROMPT_SECTION_BUDGETS["memory"])
+    builder.add("topics", topic_guidance, budget=PROMPT_SECTION_BUDGETS["topics"])
+    builder.add("instruction", "Write your email now:")
+    return builder
 
 # ==========================================
-# Enhanced version with comprehensive user context
-def send_language_learning_email(user_email: str):
+# Masked API key logging
+def mask_key(key):
+    if not key or len(key) < 8:
+        return "(not set or too short)"
+    return f"{key[:4]}...{key[-4:]}"
+
+def get_api_keys() -> Tuple[str, str]:
     """
-    Enhanced version with comprehensive user context and topic diversity.
+    Load and validate the OpenAI and SendGrid API keys.
     
-    Args:
-        user_email (str): User's email address
+    Returns:
+        Tuple[str, str]: (openai_key, sendgrid_key)
     """
     load_dotenv()
     
-    # Check if API keys are loaded
     openai_key = os.getenv("OPENAI_API_KEY")
     sendgrid_key = os.getenv("SENDGRID_API_KEY")
     
-    # Masked API key logging
-    def mask_key(key):
-        if not key or len(key) < 8:
-            return "(not set or too short)"
-        return f"{key[:4]}...{key[-4:]}"
-    
-    logger.info(f"send_language_learning_email called for user_email={user_email}")
-    logger.info(f"OPENAI_API_KEY (masked): {mask_key(openai_key)}")
-    logger.info(f"SENDGRID_API_KEY (masked): {mask_key(sendgrid_key)}")
-    
     if not openai_key:
         logger.error("Error: OPENAI_API_KEY not found in .env file")
         raise RuntimeError("OPENAI_API_KEY not found in .env file")
@@ -444,104 +500,220 @@ def send_language_learning_email(user_email: str):
         logger.error("Error: SENDGRID_API_KEY not found in .env file")
         raise RuntimeError("SENDGRID_API_KEY not found in .env file")
     
-    try:
-        # Get comprehensive user context
-        logger.info("Fetching user context...")
-        user_context = get_user_context(user_email)
-        
-        # Analyze topic diversity and get user interests
-        logger.info("Analyzing topic diversity...")
-        recent_topics, should_use_new_topic, _ = analyze_topic_diversity(user_context["email_history"])
-        
-        # Parse user interests for better topic management
-        logger.info("Parsing user interests...")
-        user_interests = parse_user_interests(user_context['topics_of_interest'])
-        
-        # Get the next topic to use
-        next_topic = get_next_topic(user_interests, recent_topics, should_use_new_topic)
-        logger.info(f"Selected topic: {next_topic}")
-        
-        # Create enhanced prompt
-        logger.info("Creating enhanced prompt...")
-        enhanced_prompt = create_enhanced_prompt(user_context, recent_topics, should_use_new_topic, next_topic)
-        
-        # Log before OpenAI client initialization
-        import openai as openai_module
-        logger.info(f"OpenAI package version: {getattr(openai_module, '__version__', 'unknown')}")
-        logger.info("About to initialize OpenAI client...")
-        client = OpenAI(api_key=openai_key)
+    return openai_key, sendgrid_key
+
+def build_learning_email_request(user_context: Dict) -> Dict:
+    """
+    Pick the next topic for a user and build the chat completion request for their email.
+    
+    Args:
+        user_context (Dict): Context returned by get_user_context
         
-        # Get response from OpenAI with enhanced context
-        logger.info("Getting response from OpenAI with enhanced context...")
-        completion = client.chat.completions.create(
-            model="gpt-4o", 
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are Bennie, a warm and enthusiastic AI language learning friend. You write natural, conversational emails in the user's target language, sharing your daily experiences while helping them learn. You're encouraging, curious, and genuinely interested in their lives."
-                },
-                {
-                    "role": "user",
-                    "content": enhanced_prompt
-                }
-            ],
-            max_tokens=600,
-            temperature=0.8
-        )
+    Returns:
+        Dict: Arguments for chat.completions.create, also used as the body of
+        an OpenAI Batch API request (see Backend/openai_batch.py)
+    """
+    # Analyze topic diversity and get user interests
+    logger.info("Analyzing topic diversity...")
+    recent_topics, should_use_new_topic, _ = analyze_topic_diversity(
+        user_context["email_history"], user_context.get("target_language"), user_context.get("memory")
+    )
+    
+    # Parse user interests for better topic management
+    logger.info("Parsing user interests...")
+    user_interests = parse_user_interests(user_context['topics_of_interest'])
+    
+    # Get the next topic to use
+    next_topic = get_next_topic(user_interests, recent_topics, should_use_new_topic)
+    logger.info(f"Selected topic: {next_topic}")
+    
+    # Create enhanced prompt: the segment's shared prefix as system message, then the user's details
+    logger.info("Creating enhanced prompt...")
+    system_message = build_segment_prompt(user_context['target_language'], user_context['proficiency_level']).build()
+    enhanced_prompt = create_enhanced_prompt(user_context, recent_topics, should_use_new_topic, next_topic)
+    
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {
+                "role": "system",
+                "content": system_message
+            },
+            {
+                "role": "user",
+                "content": enhanced_prompt
+            }
+        ],
+        "max_tokens": 600,
+        "temperature": 0.8,
+        "response_format": RESPONSE_FORMAT
+    }
+
+def read_learning_email(completion, segment: str = None, price_ratio: float = 1.0) -> Tuple[str, Dict]:
+    """
+    Validate a learning email completion and log its token usage.
+    
+    Args:
+        completion: ChatCompletion for a request from build_learning_email_request
+        segment (str): Prompt segment, for the cache log line
+        price_ratio (float): Share of the list price paid (OPENAI_BATCH_PRICE_RATIO for batch results)
         
-        # Print usage information
-        model_rate = 0.0000025 # $/token
-        usage = completion.usage
-        total_usage = usage.total_tokens
-        estimated_cost = total_usage * model_rate
-        logger.info(f"📊 OpenAI Usage: {usage.prompt_tokens} prompt tokens, {usage.completion_tokens} completion tokens, {usage.total_tokens} total tokens. Estimated cost = ${estimated_cost}")
-
-        bennies_response = completion.choices[0].message.content
-        logger.info("✓ Got response from OpenAI")
-        logger.info(f"Response length: {len(bennies_response)} characters")
+    Returns:
+        Tuple[str, Dict]: (the email as validated JSON, token usage to save with it)
+    """
+    # Print usage information
+    model_rate = 0.0000025 * price_ratio # $/token
+    usage = completion.usage
+    total_usage = usage.total_tokens
+    estimated_cost = total_usage * model_rate
+    logger.info(f"📊 OpenAI Usage: {usage.prompt_tokens} prompt tokens, {usage.completion_tokens} completion tokens, {usage.total_tokens} total tokens. Estimated cost = ${estimated_cost}")
+    cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+    cache_saving = cached_tokens * model_rate * (1 - CACHED_TOKEN_PRICE_RATIO)
+    logger.info(f"📊 Prompt cache ({segment}): {cached_tokens}/{usage.prompt_tokens} prompt tokens cached, saved ${cache_saving:.6f}")
+    token_usage = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens,
+                   "cached_tokens": cached_tokens}
+
+    message = completion.choices[0].message
+    if getattr(message, "refusal", None):
+        raise RuntimeError(f"OpenAI refused to write the email: {message.refusal}")
+    bennies_response = message.content
+    # Raises on malformed output, so the send queue retries before anything is sent
+    parse_learning_email(bennies_response)
+    logger.info("✓ Got response from OpenAI")
+    logger.info(f"Response length: {len(bennies_response)} characters")
+    
+    return bennies_response, token_usage
+
+async def generate_learning_email(user_context: Dict) -> str:
+    """
+    Pick the next topic for a user and generate Bennie's email with OpenAI.
+    Uses the shared pooled AsyncOpenAI client.
+    
+    Args:
+        user_context (Dict): Context returned by get_user_context
         
-        # Convert to HTML
+    Returns:
+        str: The generated email as validated JSON (see Backend/learning_email.py).
+        Token usage is kept in user_context["usage"] and saved with the email by
+        deliver_learning_email.
+    """
+    request = build_learning_email_request(user_context)
+    
+    # Get response from OpenAI with enhanced context (pooled client, shared rate limit)
+    logger.info("Getting response from OpenAI with enhanced context...")
+    completion = await clients.create_chat_completion(**request)
+    
+    segment = prompt_segment(user_context['target_language'], user_context['proficiency_level'])
+    bennies_response, user_context["usage"] = read_learning_email(completion, segment)
+    return bennies_response
+
+async def deliver_learning_email(user_email: str, user_context: Dict, bennies_response: str):
+    """
+    Send a generated learning email through SendGrid and save it to email history.
+    Uses the shared pooled async SendGrid client.
+    
+    Args:
+        user_email (str): User's email address
+        user_context (Dict): Context returned by get_user_context
+        bennies_response (str): JSON email from generate_learning_email; plain text
+            generated before structured output is sent as is
+    """
+    try:
+        email = parse_learning_email(bennies_response)
+    except ValueError:
+        email = None
+    if email is not None:
+        plain_content = render_text(email)
+        html_content = render_html(email)
+    else:
+        plain_content = bennies_response
         html_content = text_to_html(bennies_response)
+    
+    # Create email
+    message = Mail(
+        from_email='Bennie@itsbennie.com',
+        to_emails=user_email,
+        subject=get_email_subject(user_language=user_context["target_language"]),
+        html_content=html_content,
+        plain_text_content=plain_content
+    )
+    
+    # Send email
+    logger.info(f"Sending email to {user_context['name']} <{user_email}>")
+    response = await clients.get_async_sendgrid().send(message)
+    
+    if response.status_code == 202:
+        logger.info(f"✓ Email sent to {user_context['name']} successfully!")
+        logger.info(f"Check your inbox for the {user_context['target_language']} learning email!")
         
-        # Create email
-        message = Mail(
-            from_email='Bennie@itsbennie.com',
-            to_emails=user_email,
-            subject=get_email_subject(user_language=user_context["target_language"]),
-            html_content=html_content,
-            plain_text_content=bennies_response
-        )
-        
-        # Send email
-        logger.info(f"Sending email to {user_context['name']} <{user_email}>")
-        sg = SendGridAPIClient(sendgrid_key)
-        response = sg.send(message)
+        # Save email to history, with its topic, vocabulary and token counts
+        metadata = build_email_metadata(plain_content, user_context["target_language"], user_context.get("usage"), email)
+        try:
+            history_response = await asyncio.to_thread(supabase.table("email_history").insert({
+                "auth_user_id": user_context["auth_user_id"],
+                "content": plain_content,
+                "is_from_bennie": True,
+                "difficulty_level": user_context["proficiency_level"],
+                **metadata
+            }).execute)
+            logger.info("✓ Email saved to history")
+        except Exception as e:
+            logger.error(f"Failed to save email to history: {e}")
+            return
         
-        if response.status_code == 202:
-            logger.info(f"✓ Email sent to {user_context['name']} successfully!")
-            logger.info(f"Check your inbox for the {user_context['target_language']} learning email!")
+        # Fold the email into the conversation summary
+        try:
+            saved = (history_response.data or [{}])[0]
+            memory = conversation_memory.record_email(
+                user_context.get("memory"), metadata["topic"], metadata["vocabulary"],
+                conversation_memory.extract_question(email.body if email is not None else plain_content),
+                email.user_facts if email is not None else (), saved.get("created_at"),
+            )
+            await asyncio.to_thread(conversation_memory.save_summary, supabase, user_context["auth_user_id"], memory)
+            user_context["memory"] = memory
+        except Exception as e:
+            logger.error(f"Failed to update conversation summary: {e}")
             
-            # Save email to history
-            try:
-                supabase.table("email_history").insert({
-                    "auth_user_id": user_context["auth_user_id"],
-                    "content": bennies_response,
-                    "is_from_bennie": True,
-                    "difficulty_level": user_context["proficiency_level"]
-                }).execute()
-                logger.info("✓ Email saved to history")
-            except Exception as e:
-                logger.error(f"Failed to save email to history: {e}")
-                
-        else:
-            logger.error(f"⚠ Unexpected status code: {response.status_code}")
-            logger.error(f"Response body: {response.body}")
-            raise RuntimeError(f"SendGrid error: {response.status_code} {response.body}")
+    else:
+        logger.error(f"⚠ Unexpected status code: {response.status_code}")
+        logger.error(f"Response body: {response.body}")
+        raise RuntimeError(f"SendGrid error: {response.status_code} {response.body}")
+
+# Enhanced version with comprehensive user context
+async def send_language_learning_email_async(user_email: str):
+    """
+    Enhanced version with comprehensive user context and topic diversity.
+    
+    Args:
+        user_email (str): User's email address
+    """
+    openai_key, sendgrid_key = get_api_keys()
+    
+    logger.info(f"send_language_learning_email called for user_email={user_email}")
+    logger.info(f"OPENAI_API_KEY (masked): {mask_key(openai_key)}")
+    logger.info(f"SENDGRID_API_KEY (masked): {mask_key(sendgrid_key)}")
+    
+    try:
+        # Get comprehensive user context
+        logger.info("Fetching user context...")
+        user_context = await asyncio.to_thread(get_user_context, user_email)
+        
+        bennies_response = await generate_learning_email(user_context)
+        await deliver_learning_email(user_email, user_context, bennies_response)
         
     except Exception as e:
         logger.error(f"Error in send_language_learning_email: {e}")
         raise
 
+def send_language_learning_email(user_email: str):
+    """
+    Sync entry point for send_language_learning_email_async (CLI, FastAPI background threads).
+    
+    Args:
+        user_email (str): User's email address
+    """
+    return clients.run(send_language_learning_email_async(user_email))
+
 # Legacy function for backward compatibility
 def send_language_learning_email_legacy(user_name: str, user_email: str, user_language: str, user_level: int):
     """
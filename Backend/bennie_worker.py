@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Long-running worker for Bennie emails.
+
+One persistent process replaces the per-slot cron invocations. It imports the
+senders once, keeps the pooled Supabase, OpenAI and SendGrid clients (and
+their connections) warm, and runs three loops on one event loop:
+
+- scheduler: every --poll-interval seconds, enqueues the learning emails of
+  users whose next_send_at has passed (see Backend/email_scheduler.py) and,
+  once the weekly evaluation time of the ISO week has passed, starts or
+  resumes that week's weekly_evaluation run in cron_runs
+- queue: drains the send queue continuously (instant_reply, batch and
+  weekly_evaluation rows), waiting --idle-interval seconds when it is empty
+- inbound: processes replies stored by the inbound webhook (see
+  Backend/inbound_emails.py), including any the API process left behind,
+  waiting --idle-interval seconds when there are none; their instant replies
+  go out through the queue loop
+
+Everything is enqueued under the same idempotency keys as the cron jobs, so
+running several workers, or a worker next to the cron jobs, never sends
+duplicates. SIGTERM or SIGINT stops claiming new rows, finishes the rows
+already claimed and exits; a second signal exits at once. Rows of a worker
+that is killed outright are picked up again when their lease expires.
+
+Usage:
+    python Backend/bennie_worker.py [--poll-interval SECONDS] [--idle-interval SECONDS] [--openai-concurrency N] [--sendgrid-concurrency N] [--weekly-day DAY] [--weekly-time HH:MM]
+
+- --poll-interval: seconds between scheduler cycles (default 60, env WORKER_POLL_INTERVAL)
+- --idle-interval: seconds to wait when the send queue or the inbound inbox is empty (default 5, env WORKER_IDLE_INTERVAL)
+- --openai-concurrency / --sendgrid-concurrency: as for the batch job (env BATCH_OPENAI_CONCURRENCY, BATCH_SENDGRID_CONCURRENCY)
+- --weekly-day / --weekly-time: when weekly evaluations start each ISO week, in UTC (default saturday 09:00)
+
+Set your SUPABASE_URL, SUPABASE_KEY, SENDGRID_API_KEY, and OPENAI_API_KEY in .env
+"""
+import os
+import sys
+import signal
+import asyncio
+import argparse
+import datetime
+import logging
+from typing import Dict, Optional
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from dotenv import load_dotenv
+
+from Backend import clients, cron_runs, email_scheduler, inbound_emails, send_queue
+from Backend import send_weekly_evaluation_cron as weekly
+from Backend.bennie_email_sender import USER_CONTEXT_COLUMNS
+from Backend.send_batch_learning_emails import (
+    DEFAULT_OPENAI_CONCURRENCY,
+    DEFAULT_SENDGRID_CONCURRENCY,
+    enqueue_due_batch,
+    make_batch_handlers,
+)
+
+logger = logging.getLogger(__name__)
+
+# Every kind the worker sends; claim_send_queue hands out the oldest available rows first
+QUEUE_KINDS = [send_queue.KIND_INSTANT_REPLY, send_queue.KIND_BATCH, send_queue.KIND_WEEKLY_EVALUATION]
+DEFAULT_POLL_INTERVAL = 60
+DEFAULT_IDLE_INTERVAL = 5
+
+def make_queue_handlers():
+    """
+    Build prepare/generate/deliver callables for every queue kind.
+    Batch and instant_reply rows are learning emails (payload {"email": ...});
+    weekly_evaluation rows are evaluations.
+    """
+    prepare_learning, generate_learning, deliver_learning = make_batch_handlers()
+
+    def is_evaluation(item):
+        return item["kind"] == send_queue.KIND_WEEKLY_EVALUATION
+
+    def prepare(items):
+        prepare_learning([item for item in items if not is_evaluation(item)])
+
+    async def generate(item):
+        if is_evaluation(item):
+            return await weekly.generate_from_queue(item)
+        return await generate_learning(item)
+
+    async def deliver(item, content):
+        if is_evaluation(item):
+            return await weekly.deliver_from_queue(item, content)
+        return await deliver_learning(item, content)
+
+    return prepare, generate, deliver
+
+def enqueue_due_learning_emails(supabase, now: datetime.datetime) -> int:
+    """
+    Give unscheduled users a slot, then enqueue every user due by `now` and
+    move them on to their next slot. The same selection as the --due batch
+    job, without a cron_runs row for every cycle.
+
+    Returns:
+        int: Number of users enqueued
+    """
+    email_scheduler.schedule_unscheduled(supabase, now)
+    total = 0
+    for page in email_scheduler.iter_due_users(supabase, USER_CONTEXT_COLUMNS, now):
+        enqueue_due_batch(supabase, page)
+        email_scheduler.advance(supabase, page, now)
+        total += len(page)
+    return total
+
+def weekly_start(now: datetime.datetime, weekday: int, start_time: datetime.time) -> datetime.datetime:
+    """Return when weekly evaluations start in the ISO week of `now` (UTC)."""
+    today = now.astimezone(datetime.timezone.utc).date()
+    monday = today - datetime.timedelta(days=today.weekday())
+    return datetime.datetime.combine(monday + datetime.timedelta(days=weekday), start_time,
+                                     tzinfo=datetime.timezone.utc)
+
+def enqueue_weekly_run(supabase, now: datetime.datetime, weekday: int,
+                       start_time: datetime.time) -> Optional[Dict]:
+    """
+    Start this ISO week's weekly evaluation run once its start time has passed,
+    or resume it if an earlier attempt stopped before everyone was enqueued.
+
+    Returns:
+        Dict: The week's cron_runs row, or None before the start time
+    """
+    if now < weekly_start(now, weekday, start_time):
+        return None
+    iso_week = weekly.current_iso_week(now)
+    run = cron_runs.find_run(supabase, cron_runs.JOB_WEEKLY_EVALUATION, {"iso_week": iso_week})
+    if run and run["state"] in ("enqueued", "completed"):
+        return run
+
+    if run is None:
+        run = cron_runs.start_run(supabase, cron_runs.JOB_WEEKLY_EVALUATION, {"iso_week": iso_week})
+        print(f"Started weekly evaluation run {run['id']} ({iso_week})")
+    else:
+        run = cron_runs.load_run(supabase, cron_runs.JOB_WEEKLY_EVALUATION, run["id"])
+        print(f"Resuming weekly evaluation run {run['id']} ({iso_week}, {run['state']})")
+    try:
+        total_users = weekly.enqueue_run(supabase, run)
+    except Exception as e:
+        cron_runs.finish_run(supabase, run, 0, 0, error=str(e))
+        raise
+    print(f"Enqueued {total_users} weekly evaluations ({iso_week})")
+    return run
+
+def finish_drained_run(supabase, run: Dict) -> bool:
+    """
+    Complete an enqueued run once none of its queue rows are pending or leased.
+    Its counts come from the queue, so they replace those of earlier attempts.
+    """
+    if run["state"] != "enqueued":
+        return False
+    if send_queue.count_run_rows(supabase, run["id"], ["pending", "leased"]):
+        return False
+    success_count = send_queue.count_run_rows(supabase, run["id"], ["done"])
+    error_count = send_queue.count_run_rows(supabase, run["id"], ["failed"])
+    run.update(success_count=0, error_count=0)
+    cron_runs.finish_run(supabase, run, success_count, error_count)
+    print(f"✓ Weekly evaluation run {run['id']} completed: {success_count} sent, {error_count} failed")
+    return True
+
+class BennieWorker:
+    """The scheduler and queue loops of one worker process."""
+
+    def __init__(self, supabase, args):
+        self.supabase = supabase
+        self.args = args
+        self.worker_id = send_queue.new_worker_id()
+        self.stopping = asyncio.Event()
+        self.success_count = 0
+        self.error_count = 0
+
+    def request_stop(self, signum: Optional[int] = None):
+        """Stop after the rows in flight; the next signal gets its default behaviour."""
+        if signum is not None:
+            print(f"Received {signal.Signals(signum).name}, finishing emails in flight...")
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(sig)
+        self.stopping.set()
+
+    async def sleep(self, seconds: float):
+        """Sleep, waking early when the worker is stopping."""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def scheduler_loop(self):
+        weekday = email_scheduler.WEEKDAYS.index(self.args.weekly_day)
+        while not self.stopping.is_set():
+            now = datetime.datetime.now(datetime.timezone.utc)
+            try:
+                enqueued = await asyncio.to_thread(enqueue_due_learning_emails, self.supabase, now)
+                if enqueued:
+                    print(f"Enqueued {enqueued} due learning emails")
+                run = await asyncio.to_thread(enqueue_weekly_run, self.supabase, now, weekday, self.args.weekly_time)
+                if run:
+                    await asyncio.to_thread(finish_drained_run, self.supabase, run)
+            except Exception as e:
+                print(f"✗ Scheduler cycle failed: {e}")
+            await self.sleep(self.args.poll_interval)
+
+    async def queue_loop(self):
+        prepare, generate, deliver = make_queue_handlers()
+        while not self.stopping.is_set():
+            try:
+                success_count, error_count = await send_queue.drain_queue(
+                    self.supabase,
+                    QUEUE_KINDS,
+                    generate,
+                    deliver,
+                    prepare=prepare,
+                    worker_id=self.worker_id,
+                    openai_concurrency=self.args.openai_concurrency,
+                    sendgrid_concurrency=self.args.sendgrid_concurrency,
+                    should_stop=self.stopping.is_set,
+                )
+            except Exception as e:
+                print(f"✗ Send queue drain failed: {e}")
+                success_count, error_count = 0, 0
+            self.success_count += success_count
+            self.error_count += error_count
+            if not (success_count or error_count):
+                await self.sleep(self.args.idle_interval)
+
+    async def inbound_loop(self):
+        while not self.stopping.is_set():
+            try:
+                processed_count, error_count = await asyncio.to_thread(
+                    inbound_emails.drain_inbound, self.supabase, self.worker_id,
+                    should_stop=self.stopping.is_set,
+                )
+                if processed_count or error_count:
+                    print(f"Processed {processed_count} inbound emails ({error_count} failed)")
+            except Exception as e:
+                print(f"✗ Inbound email drain failed: {e}")
+                processed_count, error_count = 0, 0
+            if not (processed_count or error_count):
+                await self.sleep(self.args.idle_interval)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.request_stop, sig)
+
+        print(f"🚀 Bennie worker {self.worker_id} started")
+        print(f"Scheduler every {self.args.poll_interval}s, queue idle wait {self.args.idle_interval}s")
+        print(f"Concurrency: {self.args.openai_concurrency} OpenAI, {self.args.sendgrid_concurrency} SendGrid")
+        await asyncio.gather(self.scheduler_loop(), self.queue_loop(), self.inbound_loop())
+
+        print(f"\n📊 Worker Summary:")
+        print(f"Worker id: {self.worker_id}")
+        print(f"Successful: {self.success_count}")
+        print(f"Failed: {self.error_count}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the long-running Bennie email worker.")
+    parser.add_argument("--poll-interval", type=float,
+                        default=float(os.getenv("WORKER_POLL_INTERVAL", DEFAULT_POLL_INTERVAL)),
+                        help="seconds between scheduler cycles")
+    parser.add_argument("--idle-interval", type=float,
+                        default=float(os.getenv("WORKER_IDLE_INTERVAL", DEFAULT_IDLE_INTERVAL)),
+                        help="seconds to wait when the send queue or the inbound inbox is empty")
+    parser.add_argument("--openai-concurrency", type=int,
+                        default=int(os.getenv("BATCH_OPENAI_CONCURRENCY", DEFAULT_OPENAI_CONCURRENCY)),
+                        help="max simultaneous OpenAI completions")
+    parser.add_argument("--sendgrid-concurrency", type=int,
+                        default=int(os.getenv("BATCH_SENDGRID_CONCURRENCY", DEFAULT_SENDGRID_CONCURRENCY)),
+                        help="max simultaneous SendGrid sends")
+    parser.add_argument("--weekly-day", type=str.lower, choices=email_scheduler.WEEKDAYS, default="saturday",
+                        help="UTC day weekly evaluations start")
+    parser.add_argument("--weekly-time", type=datetime.time.fromisoformat, default=datetime.time(9, 0),
+                        help="UTC time weekly evaluations start (HH:MM)")
+    args = parser.parse_args(argv)
+    args.openai_concurrency = max(1, args.openai_concurrency)
+    args.sendgrid_concurrency = max(1, args.sendgrid_concurrency)
+    return args
+
+def main():
+    load_dotenv()
+    # Railway collects stdout; flush each line rather than on exit
+    sys.stdout.reconfigure(line_buffering=True)
+    args = parse_args()
+    worker = BennieWorker(clients.get_supabase(), args)
+    clients.run(worker.run())
+
+if __name__ == "__main__":
+    main()
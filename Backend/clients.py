@@ -0,0 +1,288 @@
+"""
+Process-wide registry of pooled API clients for Bennie senders.
+
+Every sender in Backend/ gets its OpenAI, SendGrid and Supabase clients from here
+instead of building a new client (and a new TLS connection) per email. Clients are
+created on first use and kept alive with keep-alive connection pools, so a batch
+pays for one handshake per pooled connection rather than one per message.
+
+Async clients (AsyncOpenAI, an httpx-based SendGrid transport and the async
+Supabase client used by the FastAPI app) are bound to the event loop that
+created them, so they are cached per running loop. Sync
+clients, including the service-key Supabase client, are shared by the whole
+process; a long-running process (Backend/bennie_worker.py) keeps all of them warm.
+
+Pool sizes can be tuned with OPENAI_POOL_SIZE, SENDGRID_POOL_SIZE,
+SUPABASE_POOL_SIZE and HTTP_KEEPALIVE_EXPIRY (seconds).
+
+Every call goes through the shared per-upstream limiters in rate_limiter.py:
+SendGrid clients throttle and retry 429s inside send(), and OpenAI chat calls
+go through create_chat_completion.
+"""
+import os
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Dict, NamedTuple, Optional
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+from openai import APIConnectionError, InternalServerError, RateLimitError
+from supabase import AsyncClient, AsyncClientOptions, Client, create_async_client, create_client
+
+from Backend import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "20"))
+SENDGRID_POOL_SIZE = int(os.getenv("SENDGRID_POOL_SIZE", "20"))
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+SENDGRID_API_BASE = os.getenv("SENDGRID_API_BASE", "https://api.sendgrid.com")
+SENDGRID_TIMEOUT = float(os.getenv("SENDGRID_TIMEOUT", "30"))
+MAX_RATE_LIMIT_RETRIES = int(os.getenv("MAX_RATE_LIMIT_RETRIES", "5"))
+# Retries for connection errors and 5xx, which the pooled OpenAI client no longer retries itself
+MAX_SERVER_ERROR_RETRIES = 2
+
+class SendGridResponse(NamedTuple):
+    """The parts of a SendGrid response the senders look at."""
+    status_code: int
+    body: str
+    headers: Dict[str, str]
+
+def _message_payload(message: Any) -> Dict:
+    """Accept a sendgrid Mail helper or an already-built v3 JSON payload."""
+    return message.get() if hasattr(message, "get") and not isinstance(message, dict) else message
+
+class AsyncSendGridClient:
+    """Minimal async SendGrid v3 client on a pooled httpx.AsyncClient, throttled by the shared limiter."""
+
+    def __init__(self, http: httpx.AsyncClient, limiter: Optional[rate_limiter.RateLimiter] = None):
+        self.http = http
+        self.limiter = limiter or rate_limiter.get_limiter(rate_limiter.SENDGRID)
+
+    async def send(self, message: Any) -> SendGridResponse:
+        payload = _message_payload(message)
+        for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+            await self.limiter.acquire()
+            response = await self.http.post("/v3/mail/send", json=payload)
+            if response.status_code != 429:
+                self.limiter.record_success(response.headers)
+                break
+            self.limiter.record_rate_limited(response.headers)
+        return SendGridResponse(response.status_code, response.text, dict(response.headers))
+
+    async def aclose(self):
+        await self.http.aclose()
+
+class SendGridClient:
+    """Minimal sync SendGrid v3 client on a pooled httpx.Client, throttled by the shared limiter."""
+
+    def __init__(self, http: httpx.Client, limiter: Optional[rate_limiter.RateLimiter] = None):
+        self.http = http
+        self.limiter = limiter or rate_limiter.get_limiter(rate_limiter.SENDGRID)
+
+    def send(self, message: Any) -> SendGridResponse:
+        payload = _message_payload(message)
+        for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self.limiter.acquire_sync()
+            response = self.http.post("/v3/mail/send", json=payload)
+            if response.status_code != 429:
+                self.limiter.record_success(response.headers)
+                break
+            self.limiter.record_rate_limited(response.headers)
+        return SendGridResponse(response.status_code, response.text, dict(response.headers))
+
+    def close(self):
+        self.http.close()
+
+def _require_key(name: str) -> str:
+    key = os.getenv(name)
+    if not key:
+        logger.error(f"Error: {name} not found in .env file")
+        raise RuntimeError(f"{name} not found in .env file")
+    return key
+
+def _limits(pool_size: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+def _sendgrid_http_kwargs() -> Dict:
+    return {
+        "base_url": SENDGRID_API_BASE,
+        "headers": {"Authorization": f"Bearer {_require_key('SENDGRID_API_KEY')}"},
+        "timeout": SENDGRID_TIMEOUT,
+        "limits": _limits(SENDGRID_POOL_SIZE),
+    }
+
+# Async clients, one set per event loop
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+# Sync clients, shared by every thread
+_sync_clients: Dict[str, Any] = {}
+_sync_lock = threading.Lock()
+
+def _clients_for_running_loop() -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    clients = _loop_clients.get(loop)
+    if clients is None:
+        clients = _loop_clients[loop] = {}
+    return clients
+
+def register_async_client(name: str, client: Any):
+    """
+    Install a client ("openai", "sendgrid" or "supabase:<key variable>") for
+    the running event loop in place of the pooled one. Used by the offline
+    simulator and benchmarks to inject fakes.
+    """
+    _clients_for_running_loop()[name] = client
+
+def get_async_openai() -> AsyncOpenAI:
+    """Return the pooled AsyncOpenAI client for the running event loop."""
+    clients = _clients_for_running_loop()
+    if "openai" not in clients:
+        clients["openai"] = AsyncOpenAI(
+            api_key=_require_key("OPENAI_API_KEY"),
+            http_client=DefaultAsyncHttpxClient(limits=_limits(OPENAI_POOL_SIZE)),
+            # Retries are handled by create_chat_completion so the limiter sees every 429
+            max_retries=0,
+        )
+    return clients["openai"]
+
+def get_async_sendgrid() -> AsyncSendGridClient:
+    """Return the pooled async SendGrid client for the running event loop."""
+    clients = _clients_for_running_loop()
+    if "sendgrid" not in clients:
+        clients["sendgrid"] = AsyncSendGridClient(httpx.AsyncClient(**_sendgrid_http_kwargs()))
+    return clients["sendgrid"]
+
+async def get_async_supabase(key_name: str = "SUPABASE_KEY") -> AsyncClient:
+    """
+    Return the async Supabase client for the running event loop, authenticated
+    with the key in the `key_name` environment variable (the FastAPI app uses
+    SUPABASE_ANON_KEY). Its PostgREST and auth calls share one pooled
+    httpx.AsyncClient.
+    """
+    clients = _clients_for_running_loop()
+    name = f"supabase:{key_name}"
+    if name not in clients:
+        http = httpx.AsyncClient(timeout=SUPABASE_TIMEOUT, limits=_limits(SUPABASE_POOL_SIZE))
+        clients[name] = await create_async_client(
+            _require_key("SUPABASE_URL"), _require_key(key_name),
+            options=AsyncClientOptions(httpx_client=http),
+        )
+    return clients[name]
+
+def get_openai() -> OpenAI:
+    """Return the process-wide pooled sync OpenAI client."""
+    with _sync_lock:
+        if "openai" not in _sync_clients:
+            _sync_clients["openai"] = OpenAI(
+                api_key=_require_key("OPENAI_API_KEY"),
+                http_client=DefaultHttpxClient(limits=_limits(OPENAI_POOL_SIZE)),
+            )
+        return _sync_clients["openai"]
+
+def get_sendgrid() -> SendGridClient:
+    """Return the process-wide pooled sync SendGrid client."""
+    with _sync_lock:
+        if "sendgrid" not in _sync_clients:
+            _sync_clients["sendgrid"] = SendGridClient(httpx.Client(**_sendgrid_http_kwargs()))
+        return _sync_clients["sendgrid"]
+
+def get_supabase() -> Client:
+    """Return the process-wide Supabase client (SUPABASE_URL / SUPABASE_KEY)."""
+    with _sync_lock:
+        if "supabase" not in _sync_clients:
+            _sync_clients["supabase"] = create_client(_require_key("SUPABASE_URL"), _require_key("SUPABASE_KEY"))
+        return _sync_clients["supabase"]
+
+async def create_chat_completion(**kwargs):
+    """
+    Create a chat completion on the pooled client within the shared OpenAI rate limit.
+
+    Reserves the estimated tokens before the call, reconciles them with
+    completion.usage afterwards, and feeds the response's rate-limit headers
+    back to the limiter. 429s pause every caller until Retry-After and are
+    retried up to MAX_RATE_LIMIT_RETRIES times; quota errors are not retried.
+
+    Args:
+        **kwargs: Arguments for chat.completions.create
+
+    Returns:
+        ChatCompletion: The parsed completion
+    """
+    limiter = rate_limiter.get_limiter(rate_limiter.OPENAI)
+    estimated = rate_limiter.estimate_chat_tokens(kwargs.get("messages"), kwargs.get("max_tokens"))
+    rate_limit_retries = 0
+    server_error_retries = 0
+    while True:
+        await limiter.acquire(estimated)
+        try:
+            raw = await get_async_openai().chat.completions.with_raw_response.create(**kwargs)
+        except RateLimitError as e:
+            if e.code == "insufficient_quota" or rate_limit_retries >= MAX_RATE_LIMIT_RETRIES:
+                raise
+            rate_limit_retries += 1
+            limiter.record_rate_limited(e.response.headers)
+            continue
+        except (APIConnectionError, InternalServerError) as e:
+            if server_error_retries >= MAX_SERVER_ERROR_RETRIES:
+                raise
+            server_error_retries += 1
+            logger.warning(f"OpenAI request failed ({e}), retrying")
+            await asyncio.sleep(0.5 * 2 ** server_error_retries)
+            continue
+
+        completion = raw.parse()
+        limiter.record_success(raw.headers)
+        if completion.usage:
+            limiter.record_usage(estimated, completion.usage.total_tokens)
+        return completion
+
+async def aclose_async_clients():
+    """Close the async clients of the running event loop (call before the loop ends)."""
+    loop = asyncio.get_running_loop()
+    clients = _loop_clients.pop(loop, {})
+    for name, client in clients.items():
+        try:
+            if isinstance(client, AsyncClient):
+                await client.options.httpx_client.aclose()
+            elif hasattr(client, "aclose"):
+                await client.aclose()
+            else:
+                await client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close async {name} client: {e}")
+
+def close_sync_clients():
+    """Close the shared sync clients."""
+    with _sync_lock:
+        for name, client in _sync_clients.items():
+            if not hasattr(client, "close"):
+                continue
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Failed to close {name} client: {e}")
+        _sync_clients.clear()
+
+def run(coro):
+    """
+    Run a coroutine to completion from sync code, closing the loop's pooled clients afterwards.
+    Used by the sync entry points (CLI, FastAPI background threads).
+    """
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await aclose_async_clients()
+
+    return asyncio.run(runner())
@@ -0,0 +1,193 @@
+"""
+Rolling per-user conversation summary.
+
+Instead of fetching a user's last 20 email_history rows on every send, each
+user has one small summary in conversation_summaries (see
+database/conversation_summaries.sql) that is updated incrementally:
+
+- after every Bennie email (deliver_learning_email): its topic, the vocabulary
+  it taught, the question it ended with, and the facts the model picked out of
+  the user's last reply
+- after every inbound reply (the SendGrid webhook in main.py): an excerpt of
+  the reply, and the open question counts as answered
+
+Every list is bounded, so the summary and the MEMORY section of the prompt
+built from it stay the same size however long the conversation gets. Users
+without a summary yet get one bootstrapped from their recent history the first
+time their context is loaded, which is the last time that history is fetched.
+
+Usage:
+    summary = record_email(summary, "food", ["mercado - market"], "¿Te gusta cocinar?")
+    prompt_section = memory_block(summary)
+"""
+import copy
+import logging
+import re
+from typing import Dict, Iterable, List, Optional
+
+from Backend.email_metadata import extract_vocabulary, has_metadata
+from Backend.topic_classifier import get_classifier
+
+logger = logging.getLogger(__name__)
+
+SUMMARIES_TABLE = "conversation_summaries"
+# Bounds of the summary, newest entries kept
+MAX_TOPICS = 10
+MAX_FACTS = 8
+MAX_OPEN_QUESTIONS = 3
+MAX_VOCABULARY = 40
+# Characters of the user's last reply kept for the next email to respond to
+REPLY_EXCERPT_CHARS = 300
+# Taught words listed in the prompt (the summary keeps MAX_VOCABULARY)
+PROMPT_VOCABULARY_WORDS = 20
+
+def empty_summary() -> Dict:
+    """A summary for a user with no conversation yet."""
+    return {
+        "recent_topics": [],    # Topics of Bennie's emails, newest first
+        "facts": [],            # Short facts the user shared, newest first
+        "open_questions": [],   # Questions Bennie asked that the user hasn't replied to
+        "vocabulary": [],       # "word - definition" lines taught, newest first
+        "last_reply": None,     # Excerpt of the user's last reply, until Bennie answers it
+        "last_email_at": None,  # created_at of the newest email in the conversation
+    }
+
+def _merge(new: Iterable[str], old: List[str], limit: int, key=lambda item: item.lower()) -> List[str]:
+    """Newest-first list of distinct items (by key), at most `limit` long."""
+    merged, seen = [], set()
+    for item in list(new) + list(old):
+        item = (item or "").strip()
+        if item and key(item) not in seen:
+            seen.add(key(item))
+            merged.append(item)
+    return merged[:limit]
+
+def _word(vocabulary_line: str) -> str:
+    return vocabulary_line.split(" - ")[0].strip().lower()
+
+def extract_question(text: Optional[str]) -> Optional[str]:
+    """The last question in an email (the one the user is invited to answer), if any."""
+    if not text:
+        return None
+    questions = re.findall(r"[^.!?。！？\n]*[?？]", text)
+    return questions[-1].strip() if questions else None
+
+def excerpt(text: Optional[str], limit: int = REPLY_EXCERPT_CHARS) -> Optional[str]:
+    """The start of a reply, whitespace collapsed, cut at a word boundary."""
+    if not text:
+        return None
+    text = re.sub(r"\s+", " ", text).strip()
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+def record_reply(summary: Optional[Dict], content: Optional[str], created_at: Optional[str]) -> Dict:
+    """
+    Fold an inbound reply into a summary.
+
+    Returns:
+        Dict: The updated summary (the one passed in is not modified)
+    """
+    summary = copy.deepcopy(summary) if summary else empty_summary()
+    summary["last_reply"] = excerpt(content)
+    summary["open_questions"] = []
+    summary["last_email_at"] = created_at or summary["last_email_at"]
+    return summary
+
+def record_email(summary: Optional[Dict], topic: Optional[str], vocabulary: Iterable[str] = (),
+                 question: Optional[str] = None, facts: Iterable[str] = (),
+                 created_at: Optional[str] = None) -> Dict:
+    """
+    Fold a Bennie email into a summary.
+
+    Args:
+        summary (Dict): Current summary, or None
+        topic (str): Topic of the email
+        vocabulary (Iterable[str]): "word - definition" lines it taught
+        question (str): The question it ended with
+        facts (Iterable[str]): Facts from the user's last reply it picked up
+        created_at (str): created_at of its email_history row
+
+    Returns:
+        Dict: The updated summary (the one passed in is not modified)
+    """
+    summary = copy.deepcopy(summary) if summary else empty_summary()
+    if topic:
+        summary["recent_topics"] = ([topic] + summary["recent_topics"])[:MAX_TOPICS]
+    summary["vocabulary"] = _merge(vocabulary, summary["vocabulary"], MAX_VOCABULARY, key=_word)
+    summary["facts"] = _merge(facts, summary["facts"], MAX_FACTS)
+    summary["open_questions"] = ([question] if question else [])[:MAX_OPEN_QUESTIONS]
+    summary["last_reply"] = None
+    summary["last_email_at"] = created_at or summary["last_email_at"]
+    return summary
+
+def bootstrap(email_history: List[Dict], target_language: Optional[str] = None) -> Dict:
+    """
+    Build a summary from recent email_history rows (newest first, as returned by
+    get_recent_email_history), for users who don't have one yet. Topics come
+    from the stored metadata or the keyword classifier, as in analyze_topic_diversity.
+    """
+    classifier = get_classifier(target_language)
+    summary = empty_summary()
+    for row in sorted(email_history, key=lambda row: row["created_at"]):
+        content = row.get("content")
+        if row["is_from_bennie"]:
+            topic = row.get("topic") if has_metadata(row) else classifier.classify(content)
+            vocabulary = row.get("vocabulary") or extract_vocabulary(content)
+            summary = record_email(summary, topic, vocabulary, extract_question(content),
+                                   created_at=row["created_at"])
+        else:
+            summary = record_reply(summary, content, row["created_at"])
+    return summary
+
+def memory_block(summary: Optional[Dict]) -> str:
+    """
+    The MEMORY section of the learning email prompt. The most useful lines
+    come first, since an over-budget section is trimmed from the end.
+    """
+    if not summary:
+        return ""
+    lines = ["MEMORY OF YOUR CONVERSATION:"]
+    if summary.get("last_reply"):
+        lines.append(f'- Their last reply (respond to it naturally): "{summary["last_reply"]}"')
+    elif summary.get("open_questions"):
+        lines.append(f'- They haven\'t answered your last question yet: "{summary["open_questions"][0]}"')
+    if summary.get("facts"):
+        lines.append(f"- Things they've told you: {'; '.join(summary['facts'])}")
+    if summary.get("recent_topics"):
+        lines.append(f"- Topics of your recent emails: {', '.join(summary['recent_topics'])}")
+    words = [_word(line) for line in summary.get("vocabulary", [])[:PROMPT_VOCABULARY_WORDS]]
+    if words:
+        lines.append(f"- Words already taught (don't teach again): {', '.join(words)}")
+    return "\n" + "\n".join(lines) + "\n" if len(lines) > 1 else ""
+
+def load_summaries(supabase, auth_user_ids: List[str]) -> Dict[str, Dict]:
+    """Summaries of a page of users, keyed by auth_user_id, in one query."""
+    if not auth_user_ids:
+        return {}
+    response = supabase.table(SUMMARIES_TABLE).select(
+        "auth_user_id, summary"
+    ).in_("auth_user_id", list(auth_user_ids)).execute()
+    return {row["auth_user_id"]: row["summary"] for row in response.data or [] if row.get("summary")}
+
+def save_summary(supabase, auth_user_id: str, summary: Dict):
+    """Store (or replace) a user's summary."""
+    supabase.table(SUMMARIES_TABLE).upsert([{
+        "auth_user_id": auth_user_id,
+        "summary": summary,
+    }], on_conflict="auth_user_id").execute()
+
+def update_after_reply(supabase, auth_user_id: str, content: Optional[str], created_at: Optional[str]) -> Dict:
+    """
+    Fold an inbound reply into the user's stored summary. Users without one
+    are left for the next context load to bootstrap from their history.
+
+    Returns:
+        Dict: The updated summary, or None if the user had none
+    """
+    summary = load_summaries(supabase, [auth_user_id]).get(auth_user_id)
+    if summary is None:
+        return None
+    summary = record_reply(summary, content, created_at)
+    save_summary(supabase, auth_user_id, summary)
+    return summary
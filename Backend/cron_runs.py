@@ -0,0 +1,147 @@
+"""
+Checkpoint and resume for Bennie cron runs.
+
+A run records its job, its selection and period (shard, send date or ISO week)
+and, while it enqueues users, the keyset cursor of the last page it enqueued.
+A run that is killed part way can be resumed with `--resume <run_id>` (or
+`--resume latest`): it skips the users it already enqueued, keeps the original
+period so idempotency keys match, and the send queue skips every email that
+was already delivered.
+
+States: running (enqueuing) -> enqueued (draining) -> completed, or failed.
+
+See database/cron_runs.sql for the table.
+"""
+import datetime
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from Backend.send_queue import new_worker_id
+
+logger = logging.getLogger(__name__)
+
+RUNS_TABLE = "cron_runs"
+JOB_BATCH = "batch"
+JOB_WEEKLY_EVALUATION = "weekly_evaluation"
+RESUME_LATEST = "latest"
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+def start_run(supabase, job: str, params: Dict) -> Dict:
+    """
+    Record a new run.
+
+    Args:
+        job (str): Job name (batch, weekly_evaluation)
+        params (Dict): Selection and period, reused when the run is resumed
+
+    Returns:
+        Dict: The cron_runs row
+    """
+    response = supabase.table(RUNS_TABLE).insert({
+        "job": job,
+        "params": params,
+        "state": "running",
+        "worker_id": new_worker_id(),
+    }).execute()
+    return response.data[0]
+
+def load_run(supabase, job: str, run_id: str, match: Optional[Dict] = None) -> Dict:
+    """
+    Load a run to resume.
+
+    Args:
+        job (str): Job the run must belong to
+        run_id (str): Run id, or "latest" for the most recent unfinished run of the job
+        match (Dict): With "latest", only consider runs whose params contain these values
+
+    Raises:
+        ValueError: If no such run exists for this job
+    """
+    query = supabase.table(RUNS_TABLE).select("*").eq("job", job)
+    if run_id == RESUME_LATEST:
+        query = query.neq("state", "completed")
+        if match:
+            query = query.contains("params", match)
+        response = query.order("started_at", desc=True).limit(1).execute()
+    else:
+        response = query.eq("id", run_id).limit(1).execute()
+
+    if not response.data:
+        raise ValueError(f"No {job} run found for --resume {run_id}")
+    run = response.data[0]
+    supabase.table(RUNS_TABLE).update({"worker_id": new_worker_id()}).eq("id", run["id"]).execute()
+    return run
+
+def find_run(supabase, job: str, match: Dict) -> Optional[Dict]:
+    """Return the most recent run of the job whose params contain `match`, in any state."""
+    response = (
+        supabase.table(RUNS_TABLE)
+        .select("*")
+        .eq("job", job)
+        .contains("params", match)
+        .order("started_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return response.data[0] if response.data else None
+
+def run_cursor(run: Dict) -> Optional[Tuple[Any, Any]]:
+    """Return the keyset cursor to continue enqueuing after, if the run has one."""
+    cursor = run.get("cursor")
+    return tuple(cursor) if cursor else None
+
+def checkpoint(supabase, run: Dict, cursor: Tuple[Any, Any], enqueued_count: int):
+    """Record that every user up to `cursor` has been enqueued."""
+    run["cursor"] = list(cursor)
+    run["enqueued_count"] = enqueued_count
+    supabase.table(RUNS_TABLE).update({
+        "cursor": run["cursor"],
+        "enqueued_count": enqueued_count,
+    }).eq("id", run["id"]).execute()
+
+def mark_enqueued(supabase, run: Dict, enqueued_count: int):
+    """Record that every selected user is in the send queue; a resume only drains."""
+    run["state"] = "enqueued"
+    run["enqueued_count"] = enqueued_count
+    supabase.table(RUNS_TABLE).update({
+        "state": "enqueued",
+        "enqueued_count": enqueued_count,
+    }).eq("id", run["id"]).execute()
+
+def record_openai_batch(supabase, run: Dict, batch_id: str):
+    """
+    Save the id of the OpenAI batch generating the run's emails (see
+    Backend/openai_batch.py), so a resume waits for it instead of submitting another.
+    """
+    run["params"] = {**run["params"], "openai_batch_id": batch_id}
+    supabase.table(RUNS_TABLE).update({"params": run["params"]}).eq("id", run["id"]).execute()
+
+def finish_run(supabase, run: Dict, success_count: int, error_count: int,
+               error: Optional[str] = None):
+    """
+    Record the outcome of a run. Counts add to those of earlier attempts of the same run.
+    A run that raised is marked failed and can still be resumed.
+    """
+    run["success_count"] = (run.get("success_count") or 0) + success_count
+    run["error_count"] = (run.get("error_count") or 0) + error_count
+    run["state"] = "failed" if error else "completed"
+    try:
+        supabase.table(RUNS_TABLE).update({
+            "state": run["state"],
+            "success_count": run["success_count"],
+            "error_count": run["error_count"],
+            "last_error": str(error)[:1000] if error else None,
+            "finished_at": _now(),
+        }).eq("id", run["id"]).execute()
+    except Exception as e:
+        logger.error(f"Failed to record the end of run {run['id']}: {e}")
+
+def describe_run(run: Dict, resumed: bool) -> List[str]:
+    """Log lines describing the run, including how to resume it."""
+    lines = [f"Run id: {run['id']}" + (f" (resuming, {run['state']})" if resumed else "")]
+    if resumed and run.get("enqueued_count"):
+        lines.append(f"Already enqueued: {run['enqueued_count']} users")
+    lines.append(f"Resume with: --resume {run['id']}")
+    return lines
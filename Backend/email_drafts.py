@@ -0,0 +1,79 @@
+"""
+Pre-generated learning email drafts.
+
+Backend/pregenerate_learning_emails.py runs off-peak and writes the next
+learning email of every user due in the coming hours to email_drafts, together
+with the inputs it was generated from: the profile fields in the prompt and
+the newest email in the conversation. When the user's queue row is drained, the batch
+handlers use the draft instead of calling OpenAI, so sending is one SendGrid
+call. A draft is only used while its inputs still match the user's context:
+a reply, any other new email, or a profile change makes it stale and the
+email is generated inline as before. database/email_drafts.sql also deletes
+drafts on those writes.
+
+Usage:
+    drafts = load_drafts(supabase, auth_user_ids)
+    draft = usable_draft(drafts.get(auth_user_id), user_context)
+"""
+import datetime
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DRAFTS_TABLE = "email_drafts"
+# Profile fields that go into the learning email prompt
+INPUT_FIELDS = ("name", "target_language", "proficiency_level", "topics_of_interest", "learning_goal")
+# Drafts older than this are never used (their user stopped being due) and are deleted
+DRAFT_MAX_AGE_DAYS = 7
+
+def generation_inputs(user_context: Dict) -> Dict:
+    """The inputs a learning email is generated from, as stored with its draft."""
+    inputs = {field: user_context.get(field) for field in INPUT_FIELDS}
+    memory = user_context.get("memory")
+    if memory is not None:
+        # The conversation summary is updated with every email and reply
+        inputs["history_through"] = memory.get("last_email_at")
+    else:
+        history = user_context.get("email_history") or []
+        inputs["history_through"] = max((row["created_at"] for row in history), default=None)
+    return inputs
+
+def save_draft(supabase, user_context: Dict, content: str, usage: Optional[Dict] = None,
+               slot: Optional[str] = None):
+    """Store (or replace) a user's draft with the inputs it was generated from."""
+    supabase.table(DRAFTS_TABLE).upsert([{
+        "auth_user_id": user_context["auth_user_id"],
+        "content": content,
+        "inputs": generation_inputs(user_context),
+        "usage": usage,
+        "slot": slot,
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }], on_conflict="auth_user_id").execute()
+
+def load_drafts(supabase, auth_user_ids: List[str]) -> Dict[str, Dict]:
+    """Drafts of a page of users, keyed by auth_user_id, in one query."""
+    if not auth_user_ids:
+        return {}
+    response = supabase.table(DRAFTS_TABLE).select(
+        "auth_user_id, content, inputs, usage, slot"
+    ).in_("auth_user_id", list(auth_user_ids)).execute()
+    return {row["auth_user_id"]: row for row in response.data or []}
+
+def usable_draft(draft: Optional[Dict], user_context: Dict) -> Optional[Dict]:
+    """The draft if it was generated from the user's current inputs, otherwise None."""
+    if draft is None:
+        return None
+    if draft.get("inputs") != generation_inputs(user_context):
+        logger.info(f"Draft for {user_context['auth_user_id']} is stale, generating inline")
+        return None
+    return draft
+
+def discard_draft(supabase, auth_user_id: str):
+    """Delete a user's draft once it has been sent (or has gone stale)."""
+    supabase.table(DRAFTS_TABLE).delete().eq("auth_user_id", auth_user_id).execute()
+
+def prune_drafts(supabase, max_age_days: int = DRAFT_MAX_AGE_DAYS):
+    """Delete drafts that were never used."""
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=max_age_days)
+    supabase.table(DRAFTS_TABLE).delete().lte("generated_at", cutoff.isoformat()).execute()
@@ -0,0 +1,67 @@
+"""
+Structured metadata stored with every Bennie email in email_history.
+
+When an email is saved, its topic, vocabulary list, language and OpenAI token
+counts (prompt, completion, and prompt tokens served from OpenAI's prompt
+cache) are written next to the content (see database/email_metadata.sql and
+database/prompt_segments.sql). Topic rotation and the weekly recap then read
+these small columns instead of fetching the email bodies again and re-running
+the keyword classifier or the vocabulary parser over them.
+
+Rows saved before the columns existed have language NULL; readers fall back to
+the content for those, so no backfill is needed.
+
+Usage:
+    row.update(build_email_metadata(content, "spanish", usage))
+"""
+from typing import Dict, List, Optional
+
+from Backend.topic_classifier import get_classifier
+
+# Headings Bennie puts above the vocabulary definitions at the end of an email
+VOCABULARY_HEADINGS = ("Vocabulary:", "New words:")
+
+def extract_vocabulary(content: Optional[str]) -> List[str]:
+    """
+    Return the vocabulary lines after the last vocabulary heading of an email.
+
+    Returns:
+        List[str]: One "word - definition" line per entry, empty if the email has no vocabulary section
+    """
+    if not content or not any(heading in content for heading in VOCABULARY_HEADINGS):
+        return []
+    section = content
+    for heading in VOCABULARY_HEADINGS:
+        section = section.split(heading)[-1]
+    return [line.strip() for line in section.split("\n") if line.strip()]
+
+def build_email_metadata(content: str, language: Optional[str], usage=None, email=None) -> Dict:
+    """
+    Compute the metadata columns of an email_history row.
+
+    Args:
+        content (str): Email text as sent
+        language (str): Language the email is written in (users.target_language, or "english" for evaluations)
+        usage: Optional dict with prompt_tokens, completion_tokens and cached_tokens
+        email (LearningEmail): Optional structured email; its topic and vocabulary are used as is
+
+    Returns:
+        Dict: topic, vocabulary, language, prompt_tokens, completion_tokens and cached_tokens
+    """
+    usage = usage or {}
+    if email is not None:
+        topic, vocabulary = email.stored_topic, email.vocabulary_lines()
+    else:
+        topic, vocabulary = get_classifier(language).classify(content), extract_vocabulary(content)
+    return {
+        "topic": topic,
+        "vocabulary": vocabulary,
+        "language": language.strip().lower() if language else None,
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "cached_tokens": usage.get("cached_tokens"),
+    }
+
+def has_metadata(row: Dict) -> bool:
+    """True for rows saved with metadata; older rows only have their content."""
+    return row.get("language") is not None
@@ -0,0 +1,209 @@
+"""
+Per-user send scheduling for Bennie learning emails.
+
+Each user's next send instant is worked out from users.email_schedule and
+stored in users.next_send_at (see database/next_send_at.sql). A cron tick then
+selects only the users that are due, with one range scan over the partial
+index on next_send_at instead of a walk over every active user, and moves each
+selected user on to their following slot.
+
+email_schedule format:
+    {"frequency": "weekly", "preferred_days": ["monday", "wednesday", "friday"],
+     "preferred_time": "10:00", "timezone": "Europe/Madrid"}
+
+Missing or invalid keys fall back to Monday/Wednesday/Friday at 10:00 UTC, the
+schedule the welcome email promises; "daily" sends every day at preferred_time.
+Each user's slot is offset by a stable 0-29 minutes so users who share a
+preferred time don't all fall due in the same tick.
+
+Usage:
+    schedule_unscheduled(supabase)
+    for page in iter_due_users(supabase, "auth_user_id, email, email_schedule", now):
+        ...enqueue page...
+        advance(supabase, page, now)
+"""
+import json
+import logging
+import datetime
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from Backend.sharding import shard_for
+from Backend.user_iterator import iter_user_pages
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DEFAULT_DAYS = frozenset({0, 2, 4})  # Monday, Wednesday, Friday
+DEFAULT_TIME = datetime.time(10, 0)
+SPREAD_MINUTES = 30
+DUE_KEY = ("next_send_at", "id")
+SCHEDULE_COLUMNS = "id, auth_user_id, email_schedule"
+DEFAULT_PAGE_SIZE = 500
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def format_timestamp(value: datetime.datetime) -> str:
+    """Format an instant as a UTC ISO timestamp, to the second."""
+    return value.astimezone(datetime.timezone.utc).replace(microsecond=0).isoformat()
+
+def _parse_days(schedule: Dict) -> FrozenSet[int]:
+    if str(schedule.get("frequency", "")).lower() == "daily":
+        return frozenset(range(7))
+    days = schedule.get("preferred_days") or []
+    if isinstance(days, str):
+        days = days.split(",")
+    parsed = {WEEKDAYS.index(day.strip().lower()) for day in days
+              if isinstance(day, str) and day.strip().lower() in WEEKDAYS}
+    return frozenset(parsed) or DEFAULT_DAYS
+
+def _parse_time(value: Any) -> datetime.time:
+    try:
+        hour, minute = str(value).strip().split(":")[:2]
+        return datetime.time(int(hour), int(minute))
+    except (TypeError, ValueError):
+        return DEFAULT_TIME
+
+def _parse_timezone(value: Any) -> datetime.tzinfo:
+    if not value:
+        return datetime.timezone.utc
+    try:
+        return ZoneInfo(str(value))
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {value!r} in email_schedule, using UTC")
+        return datetime.timezone.utc
+
+def parse_schedule(email_schedule: Any) -> Tuple[FrozenSet[int], datetime.time, datetime.tzinfo]:
+    """
+    Read a users.email_schedule value.
+
+    Args:
+        email_schedule: The jsonb value (a dict, a JSON string or None)
+
+    Returns:
+        Tuple: (weekdays as 0=Monday..6=Sunday, local send time, timezone)
+    """
+    if isinstance(email_schedule, str):
+        try:
+            email_schedule = json.loads(email_schedule)
+        except ValueError:
+            email_schedule = None
+    schedule = email_schedule if isinstance(email_schedule, dict) else {}
+    return (
+        _parse_days(schedule),
+        _parse_time(schedule.get("preferred_time")),
+        _parse_timezone(schedule.get("timezone")),
+    )
+
+def next_send_at(email_schedule: Any, after: datetime.datetime,
+                 spread_key: Optional[str] = None) -> datetime.datetime:
+    """
+    Return the first scheduled send instant strictly after `after`.
+
+    Args:
+        email_schedule: The user's email_schedule value
+        after (datetime): Instant to schedule after (naive values are taken as UTC)
+        spread_key (str): Stable per-user key (auth_user_id) for the 0-29 minute offset
+
+    Returns:
+        datetime: The next send instant, in UTC
+    """
+    if after.tzinfo is None:
+        after = after.replace(tzinfo=datetime.timezone.utc)
+    days, send_time, tz = parse_schedule(email_schedule)
+    offset = datetime.timedelta(minutes=shard_for(spread_key, SPREAD_MINUTES) if spread_key else 0)
+
+    local_date = after.astimezone(tz).date()
+    # Eight days always reaches the next slot, even when today's has just passed
+    for day in range(8):
+        date = local_date + datetime.timedelta(days=day)
+        if date.weekday() not in days:
+            continue
+        candidate = (datetime.datetime.combine(date, send_time, tzinfo=tz) + offset).astimezone(datetime.timezone.utc)
+        if candidate > after:
+            return candidate
+    raise AssertionError("no send slot within eight days")  # unreachable: days is never empty
+
+def set_next_send_at(supabase, slots: Dict[str, datetime.datetime]) -> int:
+    """
+    Store next_send_at for many users in one round trip.
+
+    Args:
+        slots (Dict[str, datetime]): users.id -> next send instant
+
+    Returns:
+        int: Number of users updated
+    """
+    if not slots:
+        return 0
+    user_ids = list(slots)
+    supabase.rpc("set_next_send_at", {
+        "p_user_ids": user_ids,
+        "p_next_send_at": [format_timestamp(slots[user_id]) for user_id in user_ids],
+    }).execute()
+    return len(user_ids)
+
+def advance(supabase, users: List[Dict], now: Optional[datetime.datetime] = None) -> int:
+    """
+    Move each user on to their first slot after `now`.
+
+    Users need id, auth_user_id and email_schedule. A user who missed several
+    slots (e.g. while sending was down) gets one email, not one per slot.
+    """
+    now = now or _now()
+    return set_next_send_at(supabase, {
+        user["id"]: next_send_at(user.get("email_schedule"), now, user.get("auth_user_id"))
+        for user in users
+    })
+
+def schedule_unscheduled(supabase, now: Optional[datetime.datetime] = None,
+                         page_size: int = DEFAULT_PAGE_SIZE) -> int:
+    """
+    Give every active user without a next_send_at their first slot.
+    That covers new sign-ups, changed schedules and reactivated accounts,
+    which database/next_send_at.sql resets to NULL.
+
+    Returns:
+        int: Number of users scheduled
+    """
+    total = 0
+    seen = set()
+    while True:
+        response = (
+            supabase.table("users")
+            .select(SCHEDULE_COLUMNS)
+            .eq("is_active", True)
+            .is_("next_send_at", "null")
+            .limit(page_size)
+            .execute()
+        )
+        rows = [row for row in response.data or [] if row["id"] not in seen]
+        if not rows:
+            if response.data:
+                logger.warning(f"{len(response.data)} users still have no next_send_at after scheduling")
+            return total
+        seen.update(row["id"] for row in rows)
+        total += advance(supabase, rows, now)
+        if len(response.data) < page_size:
+            return total
+
+def iter_due_users(supabase, columns: str, due_before: datetime.datetime,
+                   page_size: int = DEFAULT_PAGE_SIZE,
+                   start_after: Optional[Tuple[Any, Any]] = None) -> Iterator[List[Dict]]:
+    """
+    Yield pages of active users whose next_send_at is at or before `due_before`,
+    in (next_send_at, id) order. The selected columns always include id,
+    auth_user_id, email_schedule and next_send_at, so pages can be passed to advance().
+    """
+    selected = [c.strip() for c in columns.split(",") if c.strip()]
+    for column in SCHEDULE_COLUMNS.split(", "):
+        if column not in selected:
+            selected.append(column)
+    due = format_timestamp(due_before)
+
+    def due_users(query):
+        return query.eq("is_active", True).lte("next_send_at", due)
+
+    yield from iter_user_pages(supabase, ", ".join(selected), filters=due_users,
+                               page_size=page_size, key=DUE_KEY, start_after=start_after)
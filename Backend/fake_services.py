@@ -0,0 +1,771 @@
+"""
+In-process stand-ins for Supabase, OpenAI and SendGrid.
+
+Used by Backend/simulate_batch.py to run the real batch and weekly evaluation
+code offline. Each fake has a configurable latency distribution, error rate
+and 429 rate, and records how long every call took:
+
+- FakeSupabase: the query builder (select/insert/update/upsert with eq, in_,
+  range filters, keyset or_, order, limit), the users.shard_key generated
+  column, the claim_send_queue, claim_inbound_emails, get_recent_email_history,
+  get_evaluation_history, set_next_send_at and get_user_by_email functions,
+  and auth.admin user lookups, on in-memory tables
+- FakeAsyncSupabase: the same tables behind the awaitable API of
+  supabase.AsyncClient, for the FastAPI app in main.py
+- FakeRedis: an in-memory Redis stand-in for the profile cache's RedisBackend
+- FakeOpenAI: an httpx transport serving /v1/chat/completions with usage and
+  x-ratelimit-* headers (and a JSON email when a json_schema response_format
+  is requested), wrapped in a real AsyncOpenAI client
+- FakeSendGrid: an httpx transport serving /v3/mail/send, wrapped in the
+  pooled AsyncSendGridClient
+
+None of these talk to the network.
+"""
+import re
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import fnmatch
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from Backend.clients import AsyncSendGridClient
+from Backend.profile_cache import PROFILE_FIELDS
+from Backend.sharding import shard_key
+
+# (a, b) > (x, y) as built by user_iterator.keyset_filter
+KEYSET_PATTERN = re.compile(r'^(\w+)\.gt\."(.*)",and\(\1\.eq\."(.*)",(\w+)\.gt\."(.*)"\)$')
+
+def _keyset_pair(value: Any, cursor: str):
+    """A row value and the cursor value from a keyset filter, compared numerically for integer columns."""
+    if isinstance(value, int):
+        return value, int(cursor)
+    return str(value), cursor
+
+class LatencyModel:
+    """Log-normal latency: `median` seconds, spread by `sigma` (0 for a fixed latency)."""
+
+    def __init__(self, median: float, sigma: float = 0.0, rng: Optional[random.Random] = None):
+        self.median = median
+        self.sigma = sigma
+        self.rng = rng or random.Random()
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        if not self.sigma:
+            return self.median
+        return self.median * math.exp(self.rng.gauss(0, self.sigma))
+
+class FaultModel:
+    """Random failures: `error_rate` of calls fail (5xx) and `rate_limit_rate` get a 429."""
+
+    def __init__(self, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, rng: Optional[random.Random] = None):
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.rng = rng or random.Random()
+
+    def draw(self) -> Optional[str]:
+        """Return "rate_limit", "error" or None for one call."""
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            return "rate_limit"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return "error"
+        return None
+
+class CallStats:
+    """Thread-safe record of call durations and outcomes per name."""
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self.durations.setdefault(name, []).append(seconds)
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def percentiles(self, name: str, points=(50, 95, 99)) -> Dict[int, float]:
+        values = sorted(self.durations.get(name, []))
+        if not values:
+            return {p: 0.0 for p in points}
+        return {p: values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))] for p in points}
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _parse_time(value: Any) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+class FakeAPIError(Exception):
+    """Raised by the fake Supabase for an injected failure."""
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class FakeQuery:
+    """The subset of the PostgREST query builder used by Bennie."""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table_name = table
+        self.action = ("select", "*")
+        self.filters: List[Callable[[Dict], bool]] = []
+        self.order_by: List = []
+        self.limit_count: Optional[int] = None
+        self.count_mode: Optional[str] = None
+
+    # Actions
+    def select(self, columns: str = "*", count=None):
+        self.action = ("select", columns)
+        self.count_mode = count
+        return self
+
+    def insert(self, rows):
+        self.action = ("insert", rows)
+        return self
+
+    def update(self, fields: Dict):
+        self.action = ("update", fields)
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id", ignore_duplicates: bool = False):
+        self.action = ("upsert", (rows, on_conflict, ignore_duplicates))
+        return self
+
+    def delete(self):
+        self.action = ("delete", None)
+        return self
+
+    # Filters
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] < value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] <= value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def is_(self, column, value):
+        expected = None if value in (None, "null") else value
+        self.filters.append(lambda row: row.get(column) is expected)
+        return self
+
+    def contains(self, column, value):
+        self.filters.append(lambda row: all((row.get(column) or {}).get(k) == v for k, v in value.items()))
+        return self
+
+    def or_(self, expression: str):
+        # Only the keyset filter built by Backend/user_iterator.py is supported
+        match = KEYSET_PATTERN.match(expression)
+        if not match:
+            raise NotImplementedError(f"Fake or_ filter not supported: {expression}")
+        first, first_value, _, second, second_value = match.groups()
+
+        def after_cursor(row):
+            value, cursor = _keyset_pair(row[first], first_value)
+            return (value, str(row[second])) > (cursor, second_value)
+
+        self.filters.append(after_cursor)
+        return self
+
+    def order(self, column, desc: bool = False):
+        self.order_by.append((column, desc))
+        return self
+
+    def limit(self, count: int):
+        self.limit_count = count
+        return self
+
+    def execute(self) -> FakeResponse:
+        return self.db._execute(self)
+
+class FakeRPC:
+    def __init__(self, db: "FakeSupabase", name: str, params: Dict):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def execute(self) -> FakeResponse:
+        return self.db._call_rpc(self.name, self.params)
+
+class FakeUser:
+    def __init__(self, row: Dict):
+        self.id = row["id"]
+        self.email = row["email"]
+        self.user_metadata = row.get("user_metadata", {})
+        self.email_confirmed_at = row.get("email_confirmed_at")
+
+class FakeAuthAdmin:
+    def __init__(self, db: "FakeSupabase"):
+        self.db = db
+
+    def get_user_by_id(self, user_id: str):
+        row = self.db.auth_users.get(user_id)
+        self.db._simulate("auth.get_user_by_id")
+        return type("UserResponse", (), {"user": FakeUser(row) if row else None})()
+
+    def get_user_by_email(self, email: str):
+        self.db._simulate("auth.get_user_by_email")
+        for row in self.db.auth_users.values():
+            if row["email"] == email.lower():
+                return FakeUser(row)
+        return None
+
+    def list_users(self, page: int = 1, per_page: int = 50):
+        self.db._simulate("auth.list_users")
+        rows = list(self.db.auth_users.values())[(page - 1) * per_page:page * per_page]
+        return [FakeUser(row) for row in rows]
+
+class FakeAuth:
+    def __init__(self, db: "FakeSupabase"):
+        self.admin = FakeAuthAdmin(db)
+
+# Column defaults applied on insert, like the table definitions in database/*.sql.
+# `now` is the statement's time: every row of one insert gets the same NOW(), as in Postgres
+TABLE_DEFAULTS = {
+    "send_queue": lambda now: {
+        "state": "pending", "generated_content": None, "generated_at": None,
+        "lease_owner": None, "lease_expires_at": None, "available_at": now.isoformat(),
+        "attempts": 0, "max_attempts": 5, "last_error": None, "completed_at": None,
+        "segment": None,
+    },
+    "cron_runs": lambda now: {
+        "state": "running", "cursor": None, "enqueued_count": 0,
+        "success_count": 0, "error_count": 0, "started_at": now.isoformat(),
+    },
+    "email_history": lambda now: {"is_evaluation": False},
+    "inbound_emails": lambda now: {
+        "state": "pending", "message_id": None, "auth_user_id": None, "email_history_id": None,
+        "lease_owner": None, "lease_expires_at": None, "available_at": now.isoformat(),
+        "attempts": 0, "max_attempts": 5, "last_error": None, "processed_at": None,
+    },
+}
+
+# Stored generated columns, filled in for rows that don't have them yet (however they were added)
+GENERATED_COLUMNS = {
+    "users": {"shard_key": lambda row: shard_key(row["auth_user_id"])},
+}
+
+class FakeSupabase:
+    """
+    In-memory Supabase client. Every call sleeps for a sampled latency (the
+    real client is blocking too) and may fail with FakeAPIError.
+    """
+
+    def __init__(self, latency: Optional[LatencyModel] = None, faults: Optional[FaultModel] = None,
+                 stats: Optional[CallStats] = None):
+        self.latency = latency or LatencyModel(0)
+        self.faults = faults or FaultModel()
+        self.stats = stats or CallStats()
+        self.tables: Dict[str, List[Dict]] = {}
+        self.auth_users: Dict[str, Dict] = {}
+        self.auth = FakeAuth(self)
+        self._lock = threading.Lock()
+        self.rpcs = {
+            "claim_send_queue": self._claim_send_queue,
+            "claim_inbound_emails": self._claim_inbound_emails,
+            "get_recent_email_history": self._get_recent_email_history,
+            "get_evaluation_history": self._get_evaluation_history,
+            "set_next_send_at": self._set_next_send_at,
+            "get_user_by_email": self._get_user_by_email,
+        }
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict) -> FakeRPC:
+        return FakeRPC(self, name, params)
+
+    def _simulate(self, name: str):
+        """Sleep for one call's latency, record it, and inject faults."""
+        delay = self.latency.sample()
+        if delay:
+            time.sleep(delay)
+        self.stats.record("supabase", delay)
+        self.stats.count(f"supabase.{name}")
+        if self.faults.draw():
+            self.stats.count("supabase.injected_errors")
+            raise FakeAPIError(f"Injected Supabase failure in {name}")
+
+    def _execute(self, query: FakeQuery) -> FakeResponse:
+        kind, arg = query.action
+        self._simulate(f"{query.table_name}.{kind}")
+        with self._lock:
+            rows = self.tables.setdefault(query.table_name, [])
+            self._fill_generated(query.table_name, rows)
+            count = None
+            now = _now()
+            if kind == "insert":
+                data = [self._insert_row(query.table_name, rows, row, now) for row in (arg if isinstance(arg, list) else [arg])]
+            elif kind == "upsert":
+                new_rows, key, ignore_duplicates = arg
+                existing = {row.get(key): row for row in rows}
+                data = []
+                for row in new_rows:
+                    if row.get(key) in existing:
+                        if not ignore_duplicates:
+                            existing[row[key]].update(row)
+                            data.append(dict(existing[row[key]]))
+                        continue
+                    data.append(self._insert_row(query.table_name, rows, row, now))
+                    existing[row.get(key)] = rows[-1]
+            else:
+                matching = [row for row in rows if all(f(row) for f in query.filters)]
+                if kind == "update":
+                    for row in matching:
+                        row.update(arg)
+                    data = [dict(row) for row in matching]
+                elif kind == "delete":
+                    self.tables[query.table_name] = [row for row in rows if row not in matching]
+                    data = [dict(row) for row in matching]
+                else:
+                    for column, desc in reversed(query.order_by):
+                        matching.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+                    if query.count_mode:
+                        count = len(matching)
+                    if query.limit_count is not None:
+                        matching = matching[:query.limit_count]
+                    data = [self._project(row, arg) for row in matching]
+        return FakeResponse(data, count)
+
+    @staticmethod
+    def _fill_generated(table: str, rows: List[Dict]):
+        for column, generate in GENERATED_COLUMNS.get(table, {}).items():
+            for row in rows:
+                if column not in row:
+                    row[column] = generate(row)
+
+    def _insert_row(self, table: str, rows: List[Dict], row: Dict, now: datetime.datetime) -> Dict:
+        defaults = TABLE_DEFAULTS[table](now) if table in TABLE_DEFAULTS else {}
+        stored = {"id": str(uuid.uuid4()), "created_at": now.isoformat(), **defaults, **row}
+        rows.append(stored)
+        return dict(stored)
+
+    @staticmethod
+    def _project(row: Dict, columns: str) -> Dict:
+        if columns.strip() == "*":
+            return dict(row)
+        return {c.strip(): row.get(c.strip()) for c in columns.split(",") if c.strip()}
+
+    def _call_rpc(self, name: str, params: Dict) -> FakeResponse:
+        self._simulate(f"rpc.{name}")
+        if name not in self.rpcs:
+            raise FakeAPIError(f"Function {name} does not exist")
+        with self._lock:
+            return FakeResponse(self.rpcs[name](**params))
+
+    def _claim_send_queue(self, p_worker_id, p_kinds, p_limit=10, p_lease_seconds=300):
+        """Python version of claim_send_queue in database/send_queue.sql."""
+        now = _now()
+        kinds = set(p_kinds)
+        claimed = []
+        queue = self.tables.setdefault("send_queue", [])
+        for row in queue:
+            if row["kind"] not in kinds:
+                continue
+            expired = row["state"] == "leased" and _parse_time(row["lease_expires_at"]) < now
+            if expired and row["attempts"] >= row["max_attempts"]:
+                row.update(state="failed", lease_owner=None, lease_expires_at=None,
+                           last_error=row.get("last_error") or "lease expired after final attempt")
+        candidates = [
+            row for row in queue
+            if row["kind"] in kinds and row["attempts"] < row["max_attempts"] and (
+                (row["state"] == "pending" and _parse_time(row["available_at"]) <= now)
+                or (row["state"] == "leased" and _parse_time(row["lease_expires_at"]) < now)
+            )
+        ]
+        candidates.sort(key=lambda row: (_parse_time(row["available_at"]), row.get("segment") is None,
+                                         row.get("segment") or ""))
+        for row in candidates[:p_limit]:
+            row.update(
+                state="leased",
+                lease_owner=p_worker_id,
+                lease_expires_at=(now + datetime.timedelta(seconds=p_lease_seconds)).isoformat(),
+                attempts=row["attempts"] + 1,
+            )
+            claimed.append(dict(row))
+        return claimed
+
+    def _claim_inbound_emails(self, p_worker_id, p_limit=20, p_lease_seconds=60):
+        """Python version of claim_inbound_emails in database/inbound_emails.sql."""
+        now = _now()
+        inbox = self.tables.setdefault("inbound_emails", [])
+        for row in inbox:
+            expired = row["state"] == "leased" and _parse_time(row["lease_expires_at"]) < now
+            if expired and row["attempts"] >= row["max_attempts"]:
+                row.update(state="failed", lease_owner=None, lease_expires_at=None,
+                           last_error=row.get("last_error") or "lease expired after final attempt")
+        candidates = sorted((
+            row for row in inbox
+            if row["attempts"] < row["max_attempts"] and (
+                (row["state"] == "pending" and _parse_time(row["available_at"]) <= now)
+                or (row["state"] == "leased" and _parse_time(row["lease_expires_at"]) < now)
+            )
+        ), key=lambda row: _parse_time(row["available_at"]))
+        claimed = []
+        for row in candidates[:p_limit]:
+            row.update(
+                state="leased",
+                lease_owner=p_worker_id,
+                lease_expires_at=(now + datetime.timedelta(seconds=p_lease_seconds)).isoformat(),
+                attempts=row["attempts"] + 1,
+            )
+            claimed.append(dict(row))
+        return claimed
+
+    def _get_recent_email_history(self, p_auth_user_ids, p_limit=20):
+        """Python version of get_recent_email_history in database/email_metadata.sql."""
+        wanted = set(p_auth_user_ids)
+        by_user: Dict[str, List[Dict]] = {}
+        for row in self.tables.get("email_history", []):
+            if row["auth_user_id"] in wanted:
+                by_user.setdefault(row["auth_user_id"], []).append(row)
+        result = []
+        for rows in by_user.values():
+            rows = sorted(rows, key=lambda row: row["created_at"], reverse=True)[:p_limit]
+            for row in rows:
+                out = {k: row.get(k) for k in ("auth_user_id", "is_from_bennie", "created_at", "topic", "language")}
+                # As in database/email_metadata.sql: bodies only for Bennie emails without metadata
+                out["content"] = row.get("content") if row["is_from_bennie"] and row.get("language") is None else None
+                result.append(out)
+        return result
+
+    def _get_evaluation_history(self, p_auth_user_ids, p_limit=3):
+        """Python version of get_evaluation_history in database/evaluation_history.sql."""
+        wanted = set(p_auth_user_ids)
+        by_user: Dict[tuple, List[Dict]] = {}
+        for row in self.tables.get("email_history", []):
+            if row["auth_user_id"] in wanted:
+                by_user.setdefault((row["auth_user_id"], row["is_from_bennie"]), []).append(row)
+        result = []
+        for rows in by_user.values():
+            rows = sorted(rows, key=lambda row: row["created_at"], reverse=True)[:p_limit]
+            result.extend({k: row.get(k) for k in ("auth_user_id", "content", "is_from_bennie", "created_at",
+                                                   "vocabulary", "language")} for row in rows)
+        return result
+
+    def _get_user_by_email(self, p_email):
+        """Python version of get_user_by_email in database/user_email_lookup.sql."""
+        matches = sorted((row for row in self.tables.get("users", []) if str(row.get("email", "")).lower() == p_email.lower()),
+                         key=lambda row: row.get("created_at") or "")
+        return [{column: row.get(column) for column in PROFILE_FIELDS} for row in matches[:1]]
+
+    def _set_next_send_at(self, p_user_ids, p_next_send_at):
+        """Python version of set_next_send_at in database/next_send_at.sql."""
+        slots = dict(zip(p_user_ids, p_next_send_at))
+        updated = 0
+        for row in self.tables.get("users", []):
+            if row["id"] in slots:
+                row["next_send_at"] = slots[row["id"]]
+                updated += 1
+        return updated
+
+class _AsyncFakeQuery:
+    """A FakeQuery or FakeRPC whose execute() is awaited, as with supabase.AsyncClient."""
+
+    def __init__(self, client: "FakeAsyncSupabase", query):
+        self.client = client
+        self.query = query
+
+    def __getattr__(self, name):
+        method = getattr(self.query, name)
+
+        def chain(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+        return chain
+
+    async def execute(self) -> FakeResponse:
+        return await self.client._call(self.query.execute)
+
+class _AsyncFakeAuth:
+    """Awaitable versions of the fake auth calls (auth.* and auth.admin.*)."""
+
+    def __init__(self, client: "FakeAsyncSupabase", target):
+        self.client = client
+        self.target = target
+
+    def __getattr__(self, name):
+        attribute = getattr(self.target, name)
+        if not callable(attribute):
+            return _AsyncFakeAuth(self.client, attribute)
+
+        async def call(*args, **kwargs):
+            return await self.client._call(attribute, *args, **kwargs)
+        return call
+
+class FakeAsyncSupabase:
+    """
+    The async Supabase client over a FakeSupabase's tables, for the FastAPI app.
+
+    Each call takes `latency`: awaited with asyncio.sleep, so concurrent
+    requests overlap as they do with supabase.AsyncClient, or with `blocking`
+    a time.sleep inside the coroutine, which is what calling the sync client
+    from an async endpoint does to the event loop. The wrapped FakeSupabase
+    should have no latency of its own.
+    """
+
+    def __init__(self, db: FakeSupabase, latency: Optional[LatencyModel] = None, blocking: bool = False):
+        self.db = db
+        self.latency = latency or LatencyModel(0)
+        self.blocking = blocking
+        self.auth = _AsyncFakeAuth(self, db.auth)
+
+    def table(self, name: str) -> _AsyncFakeQuery:
+        return _AsyncFakeQuery(self, self.db.table(name))
+
+    def rpc(self, name: str, params: Dict) -> _AsyncFakeQuery:
+        return _AsyncFakeQuery(self, self.db.rpc(name, params))
+
+    async def aclose(self):
+        """Nothing to close; lets clients.aclose_async_clients treat it like a pooled client."""
+
+    async def _call(self, function, *args, **kwargs):
+        delay = self.latency.sample()
+        if self.blocking:
+            time.sleep(delay)
+        else:
+            await asyncio.sleep(delay)
+        return function(*args, **kwargs)
+
+class FakeRedis:
+    """
+    In-memory stand-in for a Redis server, with the redis-py calls the
+    profile cache uses (get, set with px/ex, delete, scan_iter).
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            value, expires_at = self.data.get(name, (None, None))
+            if expires_at is not None and expires_at <= self.clock():
+                del self.data[name]
+                return None
+            return value
+
+    def set(self, name: str, value, px: Optional[int] = None, ex: Optional[int] = None):
+        ttl = px / 1000 if px is not None else ex
+        with self._lock:
+            self.data[name] = (str(value).encode(), self.clock() + ttl if ttl is not None else None)
+        return True
+
+    def delete(self, *names) -> int:
+        names = [name.decode() if isinstance(name, bytes) else name for name in names]
+        with self._lock:
+            return sum(self.data.pop(name, None) is not None for name in names)
+
+    def scan_iter(self, match: str = "*"):
+        names = [name for name in list(self.data) if fnmatch.fnmatchcase(name, match)]
+        return [name.encode() for name in names if self.get(name) is not None]
+
+class _FakeUpstream:
+    """Shared latency/fault handling for the fake HTTP upstreams."""
+
+    name = "upstream"
+
+    def __init__(self, latency: Optional[LatencyModel] = None, faults: Optional[FaultModel] = None,
+                 stats: Optional[CallStats] = None):
+        self.latency = latency or LatencyModel(0)
+        self.faults = faults or FaultModel()
+        self.stats = stats or CallStats()
+
+    async def _simulate(self) -> Optional[httpx.Response]:
+        """Wait one call's latency; return an injected failure response, if any."""
+        delay = self.latency.sample()
+        if delay:
+            await asyncio.sleep(delay)
+        self.stats.record(self.name, delay)
+        self.stats.count(f"{self.name}.requests")
+        fault = self.faults.draw()
+        if fault == "rate_limit":
+            self.stats.count(f"{self.name}.injected_429")
+            return httpx.Response(429, headers={"retry-after": str(self.faults.retry_after)},
+                                  json={"error": {"message": "Rate limit reached (simulated)",
+                                                  "type": "requests", "code": "rate_limit_exceeded"}})
+        if fault == "error":
+            self.stats.count(f"{self.name}.injected_errors")
+            return httpx.Response(500, json={"error": {"message": "Internal error (simulated)",
+                                                       "type": "server_error", "code": None}})
+        return None
+
+class FakeOpenAI(_FakeUpstream):
+    """
+    Chat completions endpoint returning a canned email and token usage.
+    Prompt caching is modelled on the system message: once a system message of
+    at least PROMPT_CACHE_MIN_TOKENS has been seen, later requests starting
+    with it report its tokens (in 128-token steps) as cached_tokens.
+    """
+
+    name = "openai"
+    PROMPT_CACHE_MIN_TOKENS = 1024
+
+    def __init__(self, latency: Optional[LatencyModel] = None, faults: Optional[FaultModel] = None,
+                 stats: Optional[CallStats] = None, completion_tokens: int = 350,
+                 requests_per_minute: int = 10000, tokens_per_minute: int = 2000000):
+        super().__init__(latency, faults, stats)
+        self.completion_tokens = completion_tokens
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.cached_prefixes = set()
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        failure = await self._simulate()
+        if failure is not None:
+            return failure
+        return httpx.Response(200, headers={
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+        }, json=self.completion(json.loads(request.content)))
+
+    def completion(self, body: Dict) -> Dict:
+        """The chat completion answering a request body (also used by Backend/openai_batch_stub.py)."""
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // 4
+        completion_tokens = min(self.completion_tokens, body.get("max_tokens") or self.completion_tokens)
+        self.stats.count("openai.tokens", prompt_tokens + completion_tokens)
+        cached_tokens = self._cached_tokens(body.get("messages", []))
+        self.stats.count("openai.cached_tokens", cached_tokens)
+        content = ("¡Hola! Hoy fui al mercado y compré frutas frescas. " * (completion_tokens // 12 + 1))[:completion_tokens * 4]
+        if (body.get("response_format") or {}).get("type") == "json_schema":
+            # Structured learning emails (Backend/learning_email.py)
+            content = json.dumps({
+                "body": content,
+                "closing": "Con cariño, Bennie",
+                "vocabulary": [{"word": "mercado", "definition": "market"},
+                               {"word": "fruta", "definition": "fruit"}],
+                "topic": "food",
+                "user_facts": [],
+            }, ensure_ascii=False)
+        return {
+            "id": f"chatcmpl-sim-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+        }
+
+    def _cached_tokens(self, messages: List[Dict]) -> int:
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        prefix = str(messages[0].get("content") or "")
+        prefix_tokens = len(prefix) // 4
+        if prefix_tokens < self.PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        if prefix not in self.cached_prefixes:
+            self.cached_prefixes.add(prefix)
+            return 0
+        return prefix_tokens - prefix_tokens % 128
+
+    def client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            api_key="sk-simulated",
+            base_url="http://openai.sim/v1",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.handle)),
+            max_retries=0,
+        )
+
+class FakeSendGrid(_FakeUpstream):
+    """mail/send endpoint that accepts every well-formed message."""
+
+    name = "sendgrid"
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        failure = await self._simulate()
+        if failure is not None:
+            return failure
+        self.stats.count("sendgrid.accepted")
+        return httpx.Response(202)
+
+    def client(self) -> AsyncSendGridClient:
+        return AsyncSendGridClient(httpx.AsyncClient(base_url="http://sendgrid.sim",
+                                                     transport=httpx.MockTransport(self.handle)))
+
+LANGUAGES = ["spanish", "french", "italian", "german", "japanese", "mandarin"]
+TOPICS = ["travel", "food", "music", "sports", "technology", "movies", "books", "nature"]
+
+def seed_users(db: FakeSupabase, count: int, history_per_user: int = 6, seed: int = 0):
+    """
+    Fill the fake database with `count` active, verified users, each with
+    `history_per_user` email_history rows alternating Bennie emails and replies.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    users = db.tables.setdefault("users", [])
+    history = db.tables.setdefault("email_history", [])
+    for i in range(count):
+        auth_user_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        email = f"sim{i}@example.com"
+        created_at = (start + datetime.timedelta(seconds=i)).isoformat()
+        db.auth_users[auth_user_id] = {"id": auth_user_id, "email": email}
+        users.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "auth_user_id": auth_user_id,
+            "email": email,
+            "name": f"Learner {i}",
+            "target_language": rng.choice(LANGUAGES),
+            "proficiency_level": rng.randint(1, 100),
+            "topics_of_interest": ", ".join(rng.sample(TOPICS, 3)),
+            "learning_goal": "Travel confidently",
+            "is_active": True,
+            "is_verified": True,
+            "created_at": created_at,
+        })
+        for n in range(history_per_user):
+            from_bennie = n % 2 == 0
+            history.append({
+                "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "auth_user_id": auth_user_id,
+                "content": ("Hola, ¿qué tal tu semana? Vocabulary:\nmercado - market\nfruta - fruit" if from_bennie
+                            else "Mi semana fue muy buena, gracias. Fui a la playa con mis amigos."),
+                "is_from_bennie": from_bennie,
+                "is_evaluation": False,
+                "difficulty_level": 10,
+                "created_at": (start + datetime.timedelta(days=30, hours=n)).isoformat(),
+            })
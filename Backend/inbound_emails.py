@@ -0,0 +1,234 @@
+"""
+Durable inbox for replies posted by the SendGrid Inbound Parse webhook.
+
+/api/sendgrid-inbound only stores the raw form payload here and answers, so a
+burst of replies never keeps SendGrid waiting (it retries slow or failed posts).
+The stored rows are processed afterwards, by the API process right after it
+answers and by the worker (Backend/bennie_worker.py):
+
+- the sender is resolved to a profile through the profile cache
+- the reply is saved in email_history and folded into the conversation summary
+- users with instant_reply get a send_queue row (one per inbound email), which
+  the API or the worker then sends
+
+Rows are leased through the claim_inbound_emails Postgres function (FOR UPDATE
+SKIP LOCKED), so the API and any number of workers share the inbox without
+processing a reply twice; a failed row is retried with the send queue's backoff.
+A redelivered email (same Message-ID) is stored once.
+
+See database/inbound_emails.sql for the table and claim function.
+"""
+import re
+import logging
+import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from Backend import conversation_memory, send_queue
+from Backend.profile_cache import profile_cache
+
+logger = logging.getLogger(__name__)
+
+INBOUND_TABLE = "inbound_emails"
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_CLAIM_SIZE = 20
+
+MESSAGE_ID_PATTERN = re.compile(r"^message-id:\s*(\S+)", re.IGNORECASE | re.MULTILINE)
+
+def parse_sender(value: Optional[str]) -> Optional[str]:
+    """Return the bare, lowercased address of a From value ('Name <email@example.com>' or 'email@example.com')."""
+    if not value:
+        return None
+    match = re.search(r'<(.+?)>', value)
+    return (match.group(1) if match else value).strip().lower()
+
+def build_row(form: Dict) -> Dict:
+    """
+    Build the inbound_emails row for one webhook post.
+    The payload keeps every text field SendGrid sent; attachments are dropped.
+    """
+    payload = {key: value for key, value in form.items() if isinstance(value, str)}
+    match = MESSAGE_ID_PATTERN.search(payload.get("headers", ""))
+    return {
+        "sender": parse_sender(payload.get("from")),
+        "message_id": match.group(1) if match else None,
+        "payload": payload,
+    }
+
+async def store(supabase, row: Dict) -> Optional[Dict]:
+    """
+    Store an inbound email with the async Supabase client.
+
+    Returns:
+        Dict: The stored row, or None if this Message-ID was already stored
+    """
+    query = supabase.table(INBOUND_TABLE)
+    if row.get("message_id"):
+        query = query.upsert([row], on_conflict="message_id", ignore_duplicates=True)
+    else:
+        query = query.insert(row)
+    response = await query.execute()
+    return response.data[0] if response.data else None
+
+def claim(supabase, worker_id: str, limit: int = DEFAULT_CLAIM_SIZE,
+          lease_seconds: int = DEFAULT_LEASE_SECONDS) -> List[Dict]:
+    """Lease up to `limit` claimable inbound emails for this worker."""
+    response = supabase.rpc("claim_inbound_emails", {
+        "p_worker_id": worker_id,
+        "p_limit": limit,
+        "p_lease_seconds": lease_seconds,
+    }).execute()
+    return response.data or []
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+def _update_leased(supabase, item: Dict, worker_id: str, fields: Dict) -> bool:
+    """Update a row only while this worker still holds its lease."""
+    response = supabase.table(INBOUND_TABLE).update(fields).eq(
+        "id", item["id"]
+    ).eq("lease_owner", worker_id).eq("state", "leased").execute()
+    return bool(response.data)
+
+def finish(supabase, item: Dict, worker_id: str, state: str = "done", note: Optional[str] = None) -> bool:
+    """Mark a row processed: done, or ignored (with a note) when there is nothing to do."""
+    return _update_leased(supabase, item, worker_id, {
+        "state": state,
+        "processed_at": _now(),
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": note,
+    })
+
+def release_failed(supabase, item: Dict, worker_id: str, error: str) -> bool:
+    """Put a row back with the send queue's exponential backoff, or fail it once it is out of attempts."""
+    attempts = item.get("attempts", 1)
+    retry_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        seconds=send_queue.RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return _update_leased(supabase, item, worker_id, {
+        "state": "failed" if attempts >= item.get("max_attempts", 5) else "pending",
+        "available_at": retry_at.isoformat(),
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": str(error)[:1000],
+    })
+
+def load_profile(supabase, email: str) -> Optional[Dict]:
+    """The sender's profile (see get_user_by_email in database/user_email_lookup.sql), or None."""
+    response = supabase.rpc("get_user_by_email", {"p_email": email}).execute()
+    return response.data[0] if response.data else None
+
+def process(supabase, item: Dict, worker_id: str) -> str:
+    """
+    Process one leased inbound email.
+    A retry after a failure does not save the reply to email_history again.
+
+    Returns:
+        str: "ignored" (unknown sender or empty body), "stored" or "instant_reply"
+    """
+    payload = item.get("payload") or {}
+    text_content = payload.get("text")
+    if not item.get("sender") or not text_content:
+        finish(supabase, item, worker_id, "ignored", "Missing sender or content")
+        return "ignored"
+
+    user = profile_cache.get_or_load(lambda: load_profile(supabase, item["sender"]), email=item["sender"])
+    if user is None:
+        logger.warning(f"Inbound email {item['id']}: user not found for {item['sender']}")
+        finish(supabase, item, worker_id, "ignored", "User not found")
+        return "ignored"
+
+    if not item.get("email_history_id"):
+        email_resp = supabase.table("email_history").insert({
+            "auth_user_id": user["auth_user_id"],
+            "content": text_content,
+            "is_from_bennie": False,
+            "difficulty_level": user.get("proficiency_level", 1),
+        }).execute()
+        if not email_resp.data:
+            raise RuntimeError("Failed to save email to history")
+        history = email_resp.data[0]
+        if not _update_leased(supabase, item, worker_id, {"auth_user_id": user["auth_user_id"],
+                                                           "email_history_id": history["id"]}):
+            raise RuntimeError("lease lost after saving the reply")
+
+        # Fold the reply into the user's conversation summary for Bennie's next email
+        try:
+            conversation_memory.update_after_reply(supabase, user["auth_user_id"], text_content,
+                                                   history.get("created_at"))
+        except Exception as e:
+            logger.error(f"Failed to update conversation summary: {e}")
+
+    outcome = "stored"
+    if user.get("instant_reply"):
+        send_queue.enqueue(supabase, [{
+            "kind": send_queue.KIND_INSTANT_REPLY,
+            "auth_user_id": user["auth_user_id"],
+            "idempotency_key": send_queue.make_idempotency_key(
+                send_queue.KIND_INSTANT_REPLY, user["auth_user_id"], f"inbound:{item['id']}"
+            ),
+            "payload": {"email": user["email"]},
+        }])
+        outcome = "instant_reply"
+
+    if not finish(supabase, item, worker_id):
+        raise RuntimeError("lease lost before completing")
+    return outcome
+
+def drain_inbound(supabase, worker_id: Optional[str] = None, limit: int = DEFAULT_CLAIM_SIZE,
+                  lease_seconds: int = DEFAULT_LEASE_SECONDS,
+                  should_stop: Optional[Callable[[], bool]] = None) -> Tuple[int, int]:
+    """
+    Claim and process inbound emails until none are claimable.
+    Each row is isolated: a failure releases it for a retry and the drain goes on.
+
+    Returns:
+        Tuple[int, int]: (processed_count, error_count)
+    """
+    worker_id = worker_id or send_queue.new_worker_id()
+    processed_count = 0
+    error_count = 0
+    while not (should_stop and should_stop()):
+        items = claim(supabase, worker_id, limit, lease_seconds)
+        if not items:
+            break
+        for item in items:
+            try:
+                process(supabase, item, worker_id)
+                processed_count += 1
+            except Exception as e:
+                logger.error(f"Failed to process inbound email {item['id']}: {e}")
+                error_count += 1
+                try:
+                    release_failed(supabase, item, worker_id, str(e))
+                except Exception as release_error:
+                    logger.error(f"Failed to release inbound email {item['id']}: {release_error}")
+    return processed_count, error_count
+
+class DrainTrigger:
+    """
+    Runs `drain` in the background of the API, one drain per process at a time.
+    A trigger while a drain is running makes it run once more when it finishes,
+    so a burst of webhook posts costs a few drains rather than one per post.
+    """
+
+    def __init__(self, drain: Callable[[], Awaitable[None]]):
+        self.drain = drain
+        self.running = False
+        self.again = False
+
+    async def __call__(self):
+        if self.running:
+            self.again = True
+            return
+        self.running = True
+        try:
+            while True:
+                self.again = False
+                try:
+                    await self.drain()
+                except Exception as e:
+                    logger.error(f"Inbound email drain failed: {e}")
+                if not self.again:
+                    break
+        finally:
+            self.running = False
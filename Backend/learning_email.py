@@ -0,0 +1,150 @@
+"""
+Structured output for Bennie's learning emails.
+
+generate_learning_email asks gpt-4o for a response matching
+RESPONSE_FORMAT (a strict JSON schema), so the email comes back as separate
+fields instead of free text:
+
+    {"body": "...", "closing": "Con cariño, Bennie",
+     "vocabulary": [{"word": "mercado", "definition": "market"}],
+     "topic": "food", "user_facts": ["Has a dog called Luna"]}
+
+The response is validated with the pydantic models below, and both the HTML
+and plain-text emails are rendered from the fields. Nothing downstream has to
+find the signature or the vocabulary section by splitting the text, whatever
+language the model writes in.
+
+Usage:
+    email = parse_learning_email(completion.choices[0].message.content)
+    html, text = render_html(email), render_text(email)
+"""
+import html
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from Backend.topic_classifier import TOPICS
+
+# Heading above the vocabulary list in the rendered emails
+VOCABULARY_HEADING = "Vocabulary:"
+# Topic the model picks when the email fits none of TOPICS
+OTHER_TOPIC = "other"
+
+class VocabularyEntry(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    word: str = Field(min_length=1)
+    definition: str = Field(min_length=1)
+
+class LearningEmail(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    body: str = Field(min_length=1)
+    closing: str
+    vocabulary: List[VocabularyEntry]
+    topic: str
+    # Facts from the user's last reply, kept in their conversation memory
+    user_facts: List[str] = []
+
+    @property
+    def stored_topic(self) -> Optional[str]:
+        """The topic as saved in email_history.topic: one of TOPICS, or None."""
+        topic = self.topic.strip().lower()
+        return topic if topic in TOPICS else None
+
+    def vocabulary_lines(self) -> List[str]:
+        """Vocabulary as "word - definition" lines, the format of email_history.vocabulary."""
+        return [f"{entry.word} - {entry.definition}" for entry in self.vocabulary]
+
+# Written out rather than generated from the models: strict mode needs every
+# property required and additionalProperties false at every level
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "learning_email",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "body": {
+                    "type": "string",
+                    "description": "The email in the target language, without the closing or vocabulary",
+                },
+                "closing": {
+                    "type": "string",
+                    "description": "Culturally appropriate closing with Bennie's name, in the target language",
+                },
+                "vocabulary": {
+                    "type": "array",
+                    "description": "New vocabulary words used in the body",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "word": {"type": "string"},
+                            "definition": {"type": "string", "description": "Definition in English"},
+                        },
+                        "required": ["word", "definition"],
+                        "additionalProperties": False,
+                    },
+                },
+                "topic": {
+                    "type": "string",
+                    "enum": TOPICS + [OTHER_TOPIC],
+                    "description": "Main topic of the email",
+                },
+                "user_facts": {
+                    "type": "array",
+                    "description": "Up to 3 short facts in English the user shared in their last reply",
+                    "items": {"type": "string"},
+                },
+            },
+            "required": ["body", "closing", "vocabulary", "topic", "user_facts"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+def parse_learning_email(content: Optional[str]) -> LearningEmail:
+    """
+    Validate a structured response from the model.
+
+    Raises:
+        ValueError: If the content isn't JSON matching LearningEmail
+    """
+    if not content:
+        raise ValueError("Empty learning email response")
+    return LearningEmail.model_validate_json(content)
+
+def render_text(email: LearningEmail) -> str:
+    """Plain-text email: body, closing, then the vocabulary list."""
+    parts = [email.body.strip()]
+    if email.closing.strip():
+        parts.append(email.closing.strip())
+    if email.vocabulary:
+        parts.append("\n".join([VOCABULARY_HEADING] + email.vocabulary_lines()))
+    return "\n\n".join(parts)
+
+def _paragraphs(text: str) -> str:
+    return "\n".join(
+        f"<p>{html.escape(paragraph.strip()).replace(chr(10), '<br>')}</p>"
+        for paragraph in text.split("\n\n") if paragraph.strip()
+    )
+
+def render_html(email: LearningEmail) -> str:
+    """HTML email with the same content as render_text, fields escaped."""
+    vocabulary = ""
+    if email.vocabulary:
+        items = "\n".join(
+            f"<li><strong>{html.escape(entry.word)}</strong> - {html.escape(entry.definition)}</li>"
+            for entry in email.vocabulary
+        )
+        vocabulary = f"<p><strong>{VOCABULARY_HEADING}</strong></p>\n<ul>\n{items}\n</ul>"
+    return f"""
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        {_paragraphs(email.body)}
+        {_paragraphs(email.closing)}
+        {vocabulary}
+    </body>
+    </html>
+    """
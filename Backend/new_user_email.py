@@ -1,8 +1,8 @@
 import os
 from dotenv import load_dotenv
-import sendgrid
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, TrackingSettings, ClickTracking
+from Backend import clients
+from Backend.proficiency import language_info
 
 load_dotenv()
 
@@ -16,39 +16,13 @@ def get_language_greeting(user_language: str) -> str:
     Returns:
         str: A greeting in the target language
     """
-    language_greetings = {
-        'spanish': '¡Hola! ¿Cómo estás?',
-        'french': 'Salut ! Comment ça va ?',
-        'mandarin': '你好！你最近好吗？',  # Changed from 'chinese' to 'mandarin'
-        'japanese': 'こんにちは！お元気ですか？',
-        'german': 'Hallo! Wie geht es dir?',
-        'italian': 'Ciao! Come stai?'
-    }
-    
-    language_clean = user_language.lower().strip()
-    # Handle both 'mandarin' and 'chinese' for backward compatibility
-    if language_clean == 'chinese':
-        language_clean = 'mandarin'
-    return language_greetings.get(language_clean, f'Hello! How are you? (Learning {user_language.title()})')
+    return language_info(user_language).greeting
 
 def get_language_name(user_language: str) -> str:
     """
     Returns the proper name of the language.
     """
-    language_names = {
-        'spanish': 'Spanish',
-        'french': 'French',
-        'mandarin': 'Mandarin Chinese',  # Changed from 'chinese' to 'mandarin'
-        'japanese': 'Japanese',
-        'german': 'German',
-        'italian': 'Italian'
-    }
-    
-    language_clean = user_language.lower().strip()
-    # Handle both 'mandarin' and 'chinese' for backward compatibility
-    if language_clean == 'chinese':
-        language_clean = 'mandarin'
-    return language_names.get(language_clean, user_language.title())
+    return language_info(user_language).name
 
 def create_welcome_email_html(user_name: str, user_language: str, user_token: str = None) -> str:
     """
@@ -152,6 +126,42 @@ def create_welcome_email_html(user_name: str, user_language: str, user_token: st
     
     return html_content
 
+def create_welcome_email_text(user_name: str, user_language: str) -> str:
+    """
+    Creates the plain text version of the welcome email for email clients that don't support HTML.
+    """
+    return f"""
+Welcome to Bennie!
+
+{get_language_greeting(user_language)}
+
+Hi {user_name}! I'm Bennie, your new AI language learning friend. I'm so excited to help you on your journey to fluency in {get_language_name(user_language)}!
+
+HOW OUR LANGUAGE JOURNEY WORKS:
+I'll be sending you friendly emails every Monday, Wednesday, and Friday in {get_language_name(user_language)}. Each email will include:
+- Natural conversations about my day and interesting topics
+- 2-3 new vocabulary words with definitions to expand your knowledge
+- Questions that encourage you to respond and practice
+
+Pro tip: Don't worry if you don't understand every word! Use my friends ChatGPT, Gemini, or Claude to look up words and ask questions. My goal is to help you be consistent in engaging with {get_language_name(user_language)} on steady rhythms.
+
+I absolutely love helping engaged learners like you grow fluent through consistent practice and engagement. Every response you send helps me understand your progress and tailor our conversations to your level.
+
+When you reply to my emails, I'll review your responses to track your improvements over time and adjust our conversations accordingly. It's like having a personal language coach who remembers everything about your learning journey!
+
+I can't wait to start chatting with you! Your first {get_language_name(user_language)} email will arrive soon. Get ready for some fun conversations!
+
+With love and excitement,
+Bennie
+Your AI Language Learning Friend
+        """
+
+def create_welcome_email_subject(user_language: str) -> str:
+    """
+    Creates the welcome email subject line.
+    """
+    return language_info(user_language).welcome_subject
+
 def send_welcome_email(user_name: str, user_email: str, user_language: str, user_token: str = None):
     """
     Sends a personalized welcome email to new users.
@@ -179,37 +189,13 @@ def send_welcome_email(user_name: str, user_email: str, user_language: str, user
         html_content = create_welcome_email_html(user_name, user_language, user_token)
         
         # Create plain text version for email clients that don't support HTML
-        plain_text_content = f"""
-Welcome to Bennie!
-
-{get_language_greeting(user_language)}
-
-Hi {user_name}! I'm Bennie, your new AI language learning friend. I'm so excited to help you on your journey to fluency in {get_language_name(user_language)}!
-
-HOW OUR LANGUAGE JOURNEY WORKS:
-I'll be sending you friendly emails every Monday, Wednesday, and Friday in {get_language_name(user_language)}. Each email will include:
-- Natural conversations about my day and interesting topics
-- 2-3 new vocabulary words with definitions to expand your knowledge
-- Questions that encourage you to respond and practice
-
-Pro tip: Don't worry if you don't understand every word! Use my friends ChatGPT, Gemini, or Claude to look up words and ask questions. My goal is to help you be consistent in engaging with {get_language_name(user_language)} on steady rhythms.
-
-I absolutely love helping engaged learners like you grow fluent through consistent practice and engagement. Every response you send helps me understand your progress and tailor our conversations to your level.
-
-When you reply to my emails, I'll review your responses to track your improvements over time and adjust our conversations accordingly. It's like having a personal language coach who remembers everything about your learning journey!
-
-I can't wait to start chatting with you! Your first {get_language_name(user_language)} email will arrive soon. Get ready for some fun conversations!
-
-With love and excitement,
-Bennie
-Your AI Language Learning Friend
-        """
+        plain_text_content = create_welcome_email_text(user_name, user_language)
         
         # Create email
         message = Mail(
             from_email='Bennie@itsbennie.com',
             to_emails=user_email,
-            subject=f'Welcome to Bennie! Your {get_language_name(user_language)} Learning Journey Begins 🌟',
+            subject=create_welcome_email_subject(user_language),
             html_content=html_content,
             plain_text_content=plain_text_content
         )
@@ -221,8 +207,7 @@ Your AI Language Learning Friend
         
         # Send email
         print(f"Sending welcome email to {user_name} ({user_email})")
-        sg = SendGridAPIClient(sendgrid_key)
-        response = sg.send(message)
+        response = clients.get_sendgrid().send(message)
         
         if response.status_code == 202:
             print(f"✓ Welcome email sent to {user_name} successfully!")
@@ -0,0 +1,221 @@
+"""
+OpenAI Batch API mode for the scheduled jobs.
+
+Scheduled learning emails and weekly evaluations aren't latency sensitive, so
+a cron run can generate all of its emails through the Batch API instead of
+one synchronous chat completion per queue row. Batch requests cost half the
+synchronous price and don't count against the synchronous rate limits.
+
+1. every queue row of the run without a stored body becomes one line of a
+   JSONL file (custom_id = queue row id, body = the chat completion request)
+2. the file is uploaded and a batch is created; its id is saved in the run's
+   params (cron_runs.record_openai_batch) so --resume waits for the same batch
+   instead of submitting another
+3. the batch is polled until it finishes
+4. each result is validated and stored on its row as generated_content
+
+While the batch runs, its rows are held (send_queue.hold_pending pushes their
+available_at past the wait), so a concurrent drain - the next cron tick or the
+worker - doesn't generate them synchronously and pay for them twice. They are
+released once the results are stored, or when the wait times out or fails.
+
+The run then drains the queue as usual: rows with a stored body are sent
+without calling OpenAI, and rows whose request failed in the batch are
+generated synchronously.
+
+Backend/openai_batch_stub.py mimics the files and batches endpoints for tests.
+
+Usage:
+    stored, failed = pregenerate_run(supabase, run, build_requests, read_completion)
+"""
+import os
+import json
+import time
+import logging
+import tempfile
+import itertools
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from openai.types.chat import ChatCompletion
+
+from Backend import clients, cron_runs, send_queue
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+# Most requests the Batch API accepts in one batch; rows past it are generated synchronously
+MAX_BATCH_REQUESTS = 50000
+# Batch API price as a share of the synchronous price
+OPENAI_BATCH_PRICE_RATIO = 0.5
+DEFAULT_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", "30"))
+DEFAULT_WAIT_SECONDS = float(os.getenv("OPENAI_BATCH_WAIT_SECONDS", "7200"))
+# Extra time rows are held past the wait, covering the upload and storing the results
+HOLD_MARGIN_SECONDS = 600
+
+def batch_line(custom_id: str, body: Dict) -> Dict:
+    """One request line of a batch input file."""
+    return {"custom_id": str(custom_id), "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+def write_batch_file(requests: Iterable[Tuple[str, Dict]], path: str) -> int:
+    """
+    Write (custom_id, chat completion request) pairs as a batch input file.
+
+    Returns:
+        int: Number of requests written, at most MAX_BATCH_REQUESTS
+    """
+    count = 0
+    with open(path, "w") as f:
+        for custom_id, body in itertools.islice(requests, MAX_BATCH_REQUESTS):
+            f.write(json.dumps(batch_line(custom_id, body), ensure_ascii=False) + "\n")
+            count += 1
+    if count == MAX_BATCH_REQUESTS:
+        logger.warning(f"Batch file full at {MAX_BATCH_REQUESTS} requests, later rows are generated synchronously")
+    return count
+
+def submit_batch(client, path: str, metadata: Optional[Dict] = None):
+    """Upload a batch input file and create the batch."""
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+        metadata=metadata,
+    )
+
+def wait_for_batch(client, batch_id: str, poll_seconds: float = DEFAULT_POLL_SECONDS,
+                   wait_seconds: float = DEFAULT_WAIT_SECONDS, sleep: Callable[[float], None] = time.sleep):
+    """
+    Poll a batch until it has finished.
+
+    Raises:
+        TimeoutError: The batch is still running after `wait_seconds`
+    """
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in FINISHED_STATUSES:
+            return batch
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"OpenAI batch {batch_id} still {batch.status} after {wait_seconds:.0f}s")
+        counts = batch.request_counts
+        if counts:
+            logger.info(f"OpenAI batch {batch_id} {batch.status}: {counts.completed}/{counts.total} done")
+        sleep(poll_seconds)
+
+def _read_jsonl(client, file_id: Optional[str]) -> List[Dict]:
+    if not file_id:
+        return []
+    text = client.files.content(file_id).text
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def read_results(client, batch) -> Tuple[Dict[str, ChatCompletion], Dict[str, str]]:
+    """
+    Download a finished batch's output and error files.
+
+    Returns:
+        Tuple[Dict[str, ChatCompletion], Dict[str, str]]: (completions, error messages), keyed by custom_id
+    """
+    completions, errors = {}, {}
+    for line in _read_jsonl(client, batch.output_file_id) + _read_jsonl(client, batch.error_file_id):
+        response = line.get("response") or {}
+        if response.get("status_code") == 200:
+            completions[line["custom_id"]] = ChatCompletion.model_validate(response["body"])
+        else:
+            error = line.get("error") or (response.get("body") or {}).get("error") or {}
+            errors[line["custom_id"]] = error.get("message") or f"status {response.get('status_code')}"
+    return completions, errors
+
+def _hold_run(supabase, run: Dict, hold_seconds: float, held: List[str]) -> Iterator[List[Dict]]:
+    """Yield pages of the run's ungenerated rows, holding each page (ids added to `held`) first."""
+    for page in send_queue.iter_ungenerated(supabase, run["id"]):
+        page_held = set(send_queue.hold_pending(supabase, [item["id"] for item in page], hold_seconds))
+        held.extend(page_held)
+        page = [item for item in page if item["id"] in page_held]
+        if page:
+            yield page
+
+def _iter_requests(pages: Iterable[List[Dict]], build_requests: Callable[[List[Dict]], Dict[str, Dict]]) -> Iterator[Tuple[str, Dict]]:
+    for page in pages:
+        yield from build_requests(page).items()
+
+def pregenerate_run(supabase, run: Dict,
+                    build_requests: Callable[[List[Dict]], Dict[str, Dict]],
+                    read_completion: Callable[[Dict, ChatCompletion], Tuple[str, Optional[Dict]]],
+                    client=None, workdir: Optional[str] = None,
+                    poll_seconds: float = DEFAULT_POLL_SECONDS, wait_seconds: float = DEFAULT_WAIT_SECONDS,
+                    sleep: Callable[[float], None] = time.sleep) -> Tuple[int, int]:
+    """
+    Generate the emails of a cron run's queue rows with one OpenAI batch and
+    store them on the rows. A run that already submitted a batch waits for it.
+
+    Args:
+        supabase: Supabase client
+        run (Dict): The cron run (see Backend/cron_runs.py)
+        build_requests: Takes a page of queue rows and returns {row id: chat completion request};
+            rows it leaves out are generated synchronously when the queue is drained
+        read_completion: Takes (queue row, ChatCompletion) and returns (body, token usage);
+            raises ValueError or RuntimeError for unusable output
+        client: Sync OpenAI client (default: the pooled one)
+        workdir (str): Directory for the batch input file (default: the temp directory)
+
+    Returns:
+        Tuple[int, int]: (rows given a body, rows whose request failed)
+
+    Raises:
+        TimeoutError: The batch hasn't finished within `wait_seconds`; resume the run to keep waiting
+    """
+    client = client or clients.get_openai()
+    # The rows stay pending while the batch runs; hold them so that no drain
+    # (the next cron tick, the worker) generates them synchronously meanwhile
+    held: List[str] = []
+    hold_seconds = wait_seconds + poll_seconds + HOLD_MARGIN_SECONDS
+    try:
+        return _pregenerate(supabase, run, build_requests, read_completion, client, workdir,
+                            poll_seconds, wait_seconds, sleep, hold_seconds, held)
+    finally:
+        # Results stored, timed out or failed: the run's drain (or a resume) takes over
+        send_queue.release_held(supabase, held)
+
+def _pregenerate(supabase, run, build_requests, read_completion, client, workdir,
+                 poll_seconds, wait_seconds, sleep, hold_seconds, held) -> Tuple[int, int]:
+    batch_id = run["params"].get("openai_batch_id")
+    if not batch_id:
+        path = os.path.join(workdir or tempfile.gettempdir(), f"openai-batch-{run['id']}.jsonl")
+        count = write_batch_file(_iter_requests(_hold_run(supabase, run, hold_seconds, held), build_requests), path)
+        if not count:
+            return 0, 0
+        batch = submit_batch(client, path, metadata={"job": run["job"], "run_id": str(run["id"])})
+        cron_runs.record_openai_batch(supabase, run, batch.id)
+        batch_id = batch.id
+        logger.info(f"Submitted OpenAI batch {batch_id} with {count} requests")
+    else:
+        # Resuming: hold the rows again for this wait
+        for _ in _hold_run(supabase, run, hold_seconds, held):
+            pass
+
+    batch = wait_for_batch(client, batch_id, poll_seconds, wait_seconds, sleep)
+    if batch.status != "completed":
+        logger.warning(f"OpenAI batch {batch_id} {batch.status}, using the results it has")
+    completions, errors = read_results(client, batch)
+
+    stored = failed = 0
+    for page in send_queue.iter_ungenerated(supabase, run["id"]):
+        for item in page:
+            completion = completions.get(str(item["id"]))
+            if completion is None:
+                if str(item["id"]) in errors:
+                    failed += 1
+                    logger.warning(f"Batch request for {send_queue.describe(item)} failed: {errors[str(item['id'])]}")
+                continue
+            try:
+                content, usage = read_completion(item, completion)
+            except (ValueError, RuntimeError) as e:
+                failed += 1
+                logger.warning(f"Unusable batch result for {send_queue.describe(item)}: {e}")
+                continue
+            if send_queue.record_pregenerated(supabase, item, content, usage):
+                stored += 1
+    return stored, failed
@@ -0,0 +1,192 @@
+"""
+Local stand-in for the OpenAI files and batches endpoints used by the Batch API mode.
+
+Accepts batch input uploads, creates batches that finish after a set number of
+polls, and answers every request line with a canned chat completion
+(FakeOpenAI.completion by default), so Backend/openai_batch.py can be exercised
+offline. Use it in-process through an httpx transport:
+
+    stub = StubOpenAIBatch(polls_to_complete=2)
+    openai_batch.pregenerate_run(supabase, run, build_requests, read_completion, client=stub.client())
+    assert len(stub.requests) == 3
+
+or run it as a server and point the OpenAI client at it:
+
+    python Backend/openai_batch_stub.py --port 8026
+    OPENAI_BASE_URL=http://127.0.0.1:8026/v1 python Backend/send_batch_learning_emails.py --openai-batch
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from openai import OpenAI
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from Backend.fake_services import FakeOpenAI
+
+def _multipart_file(content_type: str, body: bytes) -> Tuple[str, bytes]:
+    """Filename and content of the `file` field of a multipart/form-data upload."""
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+    )
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_filename() or "upload.jsonl", part.get_payload(decode=True)
+    raise ValueError("no file field in upload")
+
+class StubOpenAIBatch:
+    """Files and batches endpoints; each batch completes after `polls_to_complete` retrievals."""
+
+    def __init__(self, responder: Optional[Callable[[Dict], Dict]] = None, polls_to_complete: int = 1,
+                 fail_custom_ids: Iterable[str] = ()):
+        self.responder = responder or FakeOpenAI().completion
+        self.polls_to_complete = polls_to_complete
+        self.fail_custom_ids = set(fail_custom_ids)
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict] = {}
+        self.requests: List[Dict] = []
+        self._polls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _add_file(self, content: bytes, filename: str, purpose: str) -> Dict:
+        file_id = f"file-stub-{uuid.uuid4().hex[:12]}"
+        self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def _run_batch(self, batch: Dict):
+        output, errors = [], []
+        lines = self.files[batch["input_file_id"]].decode().splitlines()
+        for line in (json.loads(line) for line in lines if line.strip()):
+            self.requests.append(line)
+            result = {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": line["custom_id"]}
+            if line["custom_id"] in self.fail_custom_ids:
+                errors.append(dict(result, response=None,
+                                   error={"code": "server_error", "message": "stub failure"}))
+            else:
+                output.append(dict(result, error=None, response={
+                    "status_code": 200, "request_id": uuid.uuid4().hex, "body": self.responder(line["body"]),
+                }))
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+        batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+        if output:
+            batch["output_file_id"] = self._add_file(
+                "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in output).encode(),
+                "output.jsonl", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self._add_file(
+                "".join(json.dumps(r) + "\n" for r in errors).encode(), "errors.jsonl", "batch_output")["id"]
+
+    def handle(self, method: str, path: str, content_type: str, body: bytes) -> Tuple[int, bytes, str]:
+        """Answer one request with (status code, body, content type)."""
+        def reply(status, payload):
+            return status, json.dumps(payload, ensure_ascii=False).encode(), "application/json"
+
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if parts[:1] == ["v1"]:
+            parts = parts[1:]
+        with self._lock:
+            if method == "POST" and parts == ["files"]:
+                try:
+                    filename, content = _multipart_file(content_type, body)
+                except ValueError as e:
+                    return reply(400, {"error": {"message": str(e)}})
+                return reply(200, self._add_file(content, filename, "batch"))
+
+            if method == "GET" and len(parts) == 3 and parts[0] == "files" and parts[2] == "content":
+                if parts[1] not in self.files:
+                    return reply(404, {"error": {"message": "No such file"}})
+                return 200, self.files[parts[1]], "application/octet-stream"
+
+            if method == "POST" and parts == ["batches"]:
+                request = json.loads(body or b"{}")
+                if request.get("input_file_id") not in self.files:
+                    return reply(400, {"error": {"message": "No such input file"}})
+                batch_id = f"batch_stub_{uuid.uuid4().hex[:12]}"
+                self.batches[batch_id] = {
+                    "id": batch_id, "object": "batch", "endpoint": request.get("endpoint"),
+                    "input_file_id": request["input_file_id"], "completion_window": request.get("completion_window"),
+                    "status": "validating", "output_file_id": None, "error_file_id": None,
+                    "created_at": int(time.time()), "metadata": request.get("metadata"),
+                    "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                }
+                self._polls[batch_id] = 0
+                return reply(200, self.batches[batch_id])
+
+            if method == "GET" and len(parts) == 2 and parts[0] == "batches":
+                batch = self.batches.get(parts[1])
+                if batch is None:
+                    return reply(404, {"error": {"message": "No such batch"}})
+                self._polls[batch["id"]] += 1
+                if batch["status"] != "completed":
+                    if self._polls[batch["id"]] >= self.polls_to_complete:
+                        self._run_batch(batch)
+                    else:
+                        batch["status"] = "in_progress"
+                return reply(200, batch)
+
+        return reply(404, {"error": {"message": f"Stub has no {method} {path}"}})
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        status, body, content_type = self.handle(request.method, request.url.path,
+                                                 request.headers.get("content-type", ""), request.read())
+        return httpx.Response(status, content=body, headers={"content-type": content_type})
+
+    def client(self) -> OpenAI:
+        """A sync OpenAI client served by this stub."""
+        return OpenAI(api_key="sk-stub", base_url="http://openai.stub/v1", max_retries=0,
+                      http_client=httpx.Client(transport=httpx.MockTransport(self._handle)))
+
+def make_server(stub: StubOpenAIBatch, host: str = "127.0.0.1", port: int = 8026) -> ThreadingHTTPServer:
+    """Build an HTTP server answering from `stub` (port 0 picks a free port)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _serve(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            status, body, content_type = stub.handle(self.command, self.path,
+                                                     self.headers.get("Content-Type", ""), self.rfile.read(length))
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = _serve
+        do_POST = _serve
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the OpenAI files and batches endpoints locally")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8026)
+    parser.add_argument("--polls", type=int, default=1, help="Retrievals before a batch completes")
+    args = parser.parse_args()
+
+    stub = StubOpenAIBatch(polls_to_complete=args.polls)
+    server = make_server(stub, args.host, args.port)
+    print(f"OpenAI batch stub listening on http://{args.host}:{server.server_port}")
+    print(f"Set OPENAI_BASE_URL=http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"📊 {len(stub.batches)} batches, {len(stub.requests)} requests answered")
+
+if __name__ == "__main__":
+    main()
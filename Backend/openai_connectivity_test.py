@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 import os
-from openai import OpenAI
+from Backend import clients
 from fastapi.responses import JSONResponse
 
 app = FastAPI()
@@ -11,7 +11,7 @@ def test_openai():
     if not api_key:
         return JSONResponse(status_code=500, content={"error": "OPENAI_API_KEY not set in environment"})
     try:
-        client = OpenAI(api_key=api_key)
+        client = clients.get_openai()
         models = client.models.list()
         # Just return the first model's id to avoid huge payloads
         first_model = models.data[0].id if hasattr(models, 'data') and models.data else None
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Off-peak pre-generation of learning emails - for use with Railway cron jobs.
+
+Generates the next learning email of every active user whose next_send_at
+falls within the coming --hours and stores it in email_drafts with the inputs
+it was generated from (see Backend/email_drafts.py). When the due tick later
+sends to those users, the batch handlers use the draft instead of calling
+OpenAI, so the send itself is a single SendGrid call. Users who already have
+a draft matching their current context are skipped, so reruns only generate
+what is missing or stale. Drafts that were never used are pruned.
+
+Generation runs with a low concurrency by default, so the job can spread its
+OpenAI usage over a quiet window instead of competing with sends.
+
+Usage:
+    python Backend/pregenerate_learning_emails.py [--hours 24] [--concurrency 2]
+
+- --hours: generate for users due within this many hours (default 24, env PREGENERATE_HOURS)
+- --concurrency: max simultaneous OpenAI completions (default 2, env PREGENERATE_CONCURRENCY)
+
+Set your SUPABASE_URL, SUPABASE_KEY and OPENAI_API_KEY in .env
+"""
+import os
+import sys
+import argparse
+import asyncio
+import datetime
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+from supabase import create_client
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from Backend.bennie_email_sender import USER_CONTEXT_COLUMNS, load_user_contexts, generate_learning_email
+from Backend import clients, email_drafts, email_scheduler
+
+DEFAULT_HOURS = 24
+DEFAULT_CONCURRENCY = 2
+
+async def pregenerate_page(supabase, page: List[Dict], concurrency: int = DEFAULT_CONCURRENCY) -> Tuple[int, int, int]:
+    """
+    Generate and store drafts for a page of due users.
+
+    Returns:
+        Tuple[int, int, int]: (generated, skipped because a usable draft exists, failed)
+    """
+    auth_user_ids = [user["auth_user_id"] for user in page]
+    contexts = await asyncio.to_thread(load_user_contexts, auth_user_ids, page)
+    drafts = await asyncio.to_thread(email_drafts.load_drafts, supabase, auth_user_ids)
+    slots = {user["auth_user_id"]: user.get("next_send_at") for user in page}
+    openai_slots = asyncio.Semaphore(concurrency)
+
+    async def pregenerate(user_context):
+        try:
+            async with openai_slots:
+                content = await generate_learning_email(user_context)
+            await asyncio.to_thread(email_drafts.save_draft, supabase, user_context, content,
+                                    user_context.get("usage"), slots.get(user_context["auth_user_id"]))
+            return True
+        except Exception as e:
+            print(f"✗ Failed to pre-generate for {user_context['email']}: {e}")
+            return False
+
+    pending = [context for auth_user_id, context in contexts.items()
+               if email_drafts.usable_draft(drafts.get(auth_user_id), context) is None]
+    results = await asyncio.gather(*(pregenerate(context) for context in pending))
+    generated = sum(1 for ok in results if ok)
+    return generated, len(contexts) - len(pending), len(results) - generated
+
+async def pregenerate_due(supabase, due_before: datetime.datetime,
+                          concurrency: int = DEFAULT_CONCURRENCY) -> Tuple[int, int, int]:
+    """
+    Pre-generate drafts for every active user due by `due_before`, page by page.
+
+    Returns:
+        Tuple[int, int, int]: (generated, skipped, failed)
+    """
+    totals = [0, 0, 0]
+    for page in email_scheduler.iter_due_users(supabase, USER_CONTEXT_COLUMNS, due_before):
+        counts = await pregenerate_page(supabase, page, concurrency)
+        totals = [total + count for total, count in zip(totals, counts)]
+        print(f"Page of {len(page)} users: {counts[0]} generated, {counts[1]} already drafted, {counts[2]} failed")
+    return tuple(totals)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate Bennie learning emails for users due soon.")
+    parser.add_argument("--hours", type=float, default=float(os.getenv("PREGENERATE_HOURS", DEFAULT_HOURS)),
+                        help="generate for users due within this many hours")
+    parser.add_argument("--concurrency", type=int,
+                        default=int(os.getenv("PREGENERATE_CONCURRENCY", DEFAULT_CONCURRENCY)),
+                        help="max simultaneous OpenAI completions")
+    args = parser.parse_args(argv)
+    args.concurrency = max(1, args.concurrency)
+    return args
+
+def main():
+    load_dotenv()
+    SUPABASE_URL = os.getenv("SUPABASE_URL")
+    SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        print("Missing SUPABASE_URL or SUPABASE_KEY in environment.")
+        sys.exit(1)
+    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    args = parse_args()
+
+    due_before = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=args.hours)
+    print(f"🚀 Pre-generating learning emails for users due by {email_scheduler.format_timestamp(due_before)}")
+    email_drafts.prune_drafts(supabase)
+    generated, skipped, failed = clients.run(pregenerate_due(supabase, due_before, args.concurrency))
+
+    print(f"\n📊 Pre-generation Summary:")
+    print(f"Generated: {generated}")
+    print(f"Already drafted: {skipped}")
+    print(f"Failed: {failed}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Proficiency levels and target languages: the fixed text every email uses.
+
+Two tables are built once, at import:
+- LEVELS: one entry per proficiency level 0-100 with its college semester,
+  the semester description and the vocabulary guidance of its level band
+- LANGUAGES: one entry per target language with its display name, greeting,
+  farewell, Bennie's closing and the learning, welcome and exit subjects
+
+The learning email sender, the weekly evaluation and the welcome and exit
+emails all read from here, so each text has one source and a lookup is a
+list index or a dict get.
+
+Usage:
+    level_info(37).semester             # 3
+    language_info("Chinese").subject    # the Mandarin learning email subject
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# (highest level, semester, description), in level order
+SEMESTER_BANDS = [
+    (12, 1, "Absolute beginner. Greetings, basic phrases, simple questions. Equivalent to first semester college language student."),
+    (25, 2, "Beginner. Simple present tense, basic questions, daily life topics. Equivalent to second semester."),
+    (37, 3, "Lower intermediate. Past/future tense, more vocabulary, short stories. Equivalent to third semester."),
+    (50, 4, "Intermediate. Complex sentences, opinions, short essays. Equivalent to fourth semester."),
+    (62, 5, "Upper intermediate. Argumentation, abstract topics, intro to literature. Equivalent to fifth semester."),
+    (75, 6, "Advanced. Advanced readings, idioms, cultural nuance. Equivalent to sixth semester."),
+    (87, 7, "Very advanced. Academic/professional topics, debates, research. Equivalent to seventh semester."),
+    (100, 8, "Near-native. Literature, advanced writing, slang, full fluency. Equivalent to eighth (final) semester."),
+]
+
+# (highest level, vocabulary guidance), in level order; every band ends on a semester boundary
+VOCABULARY_BANDS = [
+    (12, """
+VOCABULARY GUIDANCE FOR ABSOLUTE BEGINNER (Levels 1-12):
+- Use only the most basic words: greetings, simple verbs (ser/estar, tener, hacer), basic nouns (casa, trabajo, familia)
+- Avoid complex vocabulary, idioms, or advanced grammar
+- Stick to present tense only
+- Use simple sentence structures: Subject + Verb + Object
+- Maximum 1-2 new vocabulary words per email
+- Focus on survival vocabulary: basic needs, simple questions, everyday objects
+"""),
+    (25, """
+VOCABULARY GUIDANCE FOR BEGINNER (Levels 13-25):
+- Use basic everyday vocabulary: daily activities, common objects, simple emotions
+- Include some basic adjectives and adverbs
+- Can use simple past tense occasionally
+- Avoid complex verb conjugations or subjunctive mood
+- Maximum 2-3 new vocabulary words per email
+- Focus on practical, frequently-used words
+"""),
+    (37, """
+VOCABULARY GUIDANCE FOR LOWER INTERMEDIATE (Levels 26-37):
+- Use intermediate vocabulary: hobbies, work-related terms, cultural topics
+- Can include some idiomatic expressions (but explain them)
+- Use past and future tenses
+- Include some compound sentences
+- Maximum 3-4 new vocabulary words per email
+- Can introduce abstract concepts but keep them simple
+"""),
+    (50, """
+VOCABULARY GUIDANCE FOR INTERMEDIATE (Levels 38-50):
+- Use intermediate-advanced vocabulary: opinions, preferences, experiences
+- Can include more complex sentence structures
+- Use subjunctive mood occasionally
+- Include cultural references and idioms
+- Maximum 4-5 new vocabulary words per email
+- Can discuss abstract topics but provide context
+"""),
+    (100, """
+VOCABULARY GUIDANCE FOR ADVANCED (Levels 51-100):
+- Use advanced vocabulary: complex topics, nuanced expressions, cultural depth
+- Can include sophisticated grammar structures
+- Use idioms and cultural references freely
+- Maximum 5-6 new vocabulary words per email
+- Can discuss abstract, complex topics
+"""),
+]
+
+MIN_LEVEL = 0
+MAX_LEVEL = 100
+
+class LevelInfo(NamedTuple):
+    level: int
+    semester: int
+    description: str
+    vocabulary_guidance: str
+
+def _build_levels() -> List[LevelInfo]:
+    levels = []
+    for level in range(MIN_LEVEL, MAX_LEVEL + 1):
+        semester, description = next((s, d) for top, s, d in SEMESTER_BANDS if level <= top)
+        guidance = next(g for top, g in VOCABULARY_BANDS if level <= top)
+        levels.append(LevelInfo(level, semester, description, guidance))
+    return levels
+
+LEVELS: List[LevelInfo] = _build_levels()
+
+def level_info(level: Optional[int]) -> LevelInfo:
+    """Table entry of a proficiency level; levels outside 0-100 use the nearest end, a missing level is 1."""
+    level = 1 if level is None else int(level)
+    return LEVELS[min(max(level, MIN_LEVEL), MAX_LEVEL)]
+
+def level_to_semester(level: int) -> Tuple[int, str]:
+    """(semester out of 8, description) for a proficiency level."""
+    info = level_info(level)
+    return info.semester, info.description
+
+def get_vocabulary_guidance(proficiency_level: int, target_language: Optional[str] = None) -> str:
+    """
+    Vocabulary guidance for a proficiency level's band.
+    This provides concrete examples without needing large vocab lists.
+    """
+    return level_info(proficiency_level).vocabulary_guidance
+
+class LanguageInfo(NamedTuple):
+    key: str
+    name: str
+    greeting: str
+    farewell: str
+    closing: str
+    subject: str
+    welcome_subject: str
+    exit_subject: str
+
+LANGUAGE_ALIASES = {"chinese": "mandarin"}
+
+def _language(key: str, name: str, greeting: str, farewell: str, closing: str, subject: str) -> LanguageInfo:
+    return LanguageInfo(
+        key=key,
+        name=name,
+        greeting=greeting,
+        farewell=farewell,
+        closing=closing,
+        subject=subject,
+        welcome_subject=f"Welcome to Bennie! Your {name} Learning Journey Begins 🌟",
+        exit_subject=f"Goodbye from Bennie - Thank You for Learning {name} With Me 💛",
+    )
+
+LANGUAGES: Dict[str, LanguageInfo] = {info.key: info for info in [
+    _language("spanish", "Spanish", "¡Hola! ¿Cómo estás?", "¡Hasta luego y gracias por todo!",
+              "Con cariño, Bennie",
+              "Spanish Learning Email from Bennie! - Correo de aprendizaje de español"),
+    _language("french", "French", "Salut ! Comment ça va ?", "Au revoir et merci pour tout !",
+              "Avec amitié, Bennie",
+              "French Learning Email from Bennie! - E-mail d'apprentissage du français"),
+    _language("mandarin", "Mandarin Chinese", "你好！你最近好吗？", "再见，谢谢你的一切！",
+              "祝好 (Zhù hǎo), Bennie",
+              "Chinese Learning Email from Bennie! - 中文学习邮件"),
+    _language("japanese", "Japanese", "こんにちは！お元気ですか？", "さようなら、すべてに感謝します！",
+              "ベニーより (Bennie yori)",
+              "Japanese Learning Email from Bennie! - 日本語学習メール"),
+    _language("german", "German", "Hallo! Wie geht es dir?", "Auf Wiedersehen und danke für alles!",
+              "Viele Grüße, Bennie",
+              "German Learning Email from Bennie! - Deutsch-Lern-E-Mail"),
+    _language("italian", "Italian", "Ciao! Come stai?", "Arrivederci e grazie di tutto!",
+              "Con affetto, Bennie",
+              "Italian Learning Email from Bennie! - E-mail di apprendimento dell'italiano"),
+]}
+
+def normalize_language(language: Optional[str]) -> str:
+    """Lowercase, trimmed language key with aliases resolved ('chinese' -> 'mandarin')."""
+    language = (language or "").lower().strip()
+    return LANGUAGE_ALIASES.get(language, language)
+
+def language_info(language: Optional[str]) -> LanguageInfo:
+    """Table entry of a target language; unsupported languages get English fallbacks."""
+    key = normalize_language(language)
+    if key in LANGUAGES:
+        return LANGUAGES[key]
+    name = (language or "").strip().title()
+    return _language(
+        key, name,
+        greeting=f"Hello! How are you? (Learning {name})",
+        farewell="Goodbye and thank you for everything!",
+        closing="Bennie",
+        subject=f"Language Learning Email from Bennie! {name} Learning Email",
+    )
@@ -0,0 +1,225 @@
+"""
+Read-through cache of user profiles for the API and the senders.
+
+Sign-in, GET /api/users/{email}, token verification, the inbound webhook and
+get_user_context all read the same public.users profile (PROFILE_COLUMNS).
+They go through this cache instead: a profile is looked up by auth_user_id or
+by email, loaded from Supabase on a miss, and kept for PROFILE_CACHE_TTL
+seconds. Writes invalidate it: onboarding, user creation and deactivation
+drop the user's entry.
+
+The storage is pluggable:
+- MemoryBackend (default): in-process, LRU-bounded to PROFILE_CACHE_SIZE
+  entries. Each process has its own, so writes from another process are only
+  seen once the TTL expires.
+- RedisBackend: any Redis-compatible client (redis-py API: get, set with px,
+  delete, scan_iter), shared by the API and the senders so invalidations
+  reach every process. Set PROFILE_CACHE_BACKEND=redis and
+  PROFILE_CACHE_REDIS_URL; needs the optional `redis` package and falls back
+  to MemoryBackend without it. Backend/fake_services.py has a FakeRedis
+  stand-in.
+
+Profiles are stored under their auth_user_id, with an email -> auth_user_id
+pointer, as JSON, so callers always get a copy. stats() reports hits, misses,
+evictions, invalidations and size.
+
+Usage:
+    profile = profile_cache.get_or_load(lambda: load_profile(email), email=email)
+    profile = await profile_cache.aget_or_load(lambda: aload_profile(email), email=email)
+    profile_cache.invalidate(auth_user_id=auth_user_id)
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "30"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_BACKEND = os.getenv("PROFILE_CACHE_BACKEND", "memory")
+PROFILE_CACHE_REDIS_URL = os.getenv("PROFILE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# The profile columns every cached reader needs (see get_user_by_email in database/user_email_lookup.sql)
+PROFILE_FIELDS = (
+    "auth_user_id", "email", "name", "target_language", "proficiency_level", "learning_goal",
+    "motivation_goal", "target_proficiency", "current_level", "current_skill_rating",
+    "topics_of_interest", "email_schedule", "is_active", "instant_reply", "created_at", "updated_at",
+)
+PROFILE_COLUMNS = ", ".join(PROFILE_FIELDS)
+
+class MemoryBackend:
+    """In-process storage: at most `max_entries` keys, least recently used evicted first."""
+
+    def __init__(self, max_entries: int = PROFILE_CACHE_SIZE, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, self.clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class RedisBackend:
+    """Storage in a Redis-compatible server, under `prefix`; expiry and eviction are the server's."""
+
+    evictions = None
+
+    def __init__(self, client: Any, prefix: str = "bennie:profile:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def size(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+class ProfileCache:
+    """Profiles by auth_user_id and by email, kept for `ttl` seconds in `backend`."""
+
+    def __init__(self, backend=None, ttl: float = PROFILE_CACHE_TTL):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, email: Optional[str] = None, auth_user_id: Optional[str] = None) -> Optional[Dict]:
+        """The cached profile, by auth_user_id or email, or None (counted as a miss)."""
+        if auth_user_id is None and email is not None:
+            auth_user_id = self.backend.get(f"email:{email.lower()}")
+        value = self.backend.get(f"id:{auth_user_id}") if auth_user_id is not None else None
+        profile = json.loads(value) if value is not None else None
+        # A stale email pointer (the user's email changed) is a miss
+        if profile is not None and email is not None and str(profile.get("email", "")).lower() != email.lower():
+            profile = None
+        self._count("hits" if profile is not None else "misses")
+        return profile
+
+    def set(self, profile: Dict):
+        """Cache a profile under its auth_user_id and email (a ttl of 0 disables the cache)."""
+        if self.ttl <= 0 or not profile.get("auth_user_id"):
+            return
+        auth_user_id = str(profile["auth_user_id"])
+        self.backend.set(f"id:{auth_user_id}", json.dumps(profile, default=str), self.ttl)
+        if profile.get("email"):
+            self.backend.set(f"email:{str(profile['email']).lower()}", auth_user_id, self.ttl)
+
+    def invalidate(self, email: Optional[str] = None, auth_user_id: Optional[str] = None):
+        """Drop a user's profile after a write, found by email or by auth_user_id."""
+        keys = []
+        if email is not None:
+            keys.append(f"email:{email.lower()}")
+            if auth_user_id is None:
+                auth_user_id = self.backend.get(f"email:{email.lower()}")
+        if auth_user_id is not None:
+            keys.append(f"id:{auth_user_id}")
+            # Found by id: drop its email pointer too
+            value = self.backend.get(f"id:{auth_user_id}") if email is None else None
+            cached_email = json.loads(value).get("email") if value is not None else None
+            if cached_email:
+                keys.append(f"email:{str(cached_email).lower()}")
+        self.backend.delete(*keys)
+        self._count("invalidations")
+
+    def get_or_load(self, load: Callable[[], Optional[Dict]], email: Optional[str] = None,
+                    auth_user_id: Optional[str] = None) -> Optional[Dict]:
+        """Read through: the cached profile, or `load()`'s result, cached. None is not cached."""
+        profile = self.get(email=email, auth_user_id=auth_user_id)
+        if profile is None:
+            profile = load()
+            if profile is not None:
+                self.set(profile)
+        return profile
+
+    async def aget_or_load(self, load: Callable[[], Awaitable[Optional[Dict]]], email: Optional[str] = None,
+                           auth_user_id: Optional[str] = None) -> Optional[Dict]:
+        """get_or_load with an async loader, for the FastAPI endpoints."""
+        profile = self.get(email=email, auth_user_id=auth_user_id)
+        if profile is None:
+            profile = await load()
+            if profile is not None:
+                self.set(profile)
+        return profile
+
+    def stats(self) -> Dict:
+        """Hits, misses, hit rate, invalidations, LRU evictions and cached keys."""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "invalidations": self.invalidations,
+            "evictions": self.backend.evictions,
+            "size": self.backend.size(),
+        }
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = self.misses = self.invalidations = 0
+
+def create_profile_cache() -> ProfileCache:
+    """The cache configured by PROFILE_CACHE_BACKEND, PROFILE_CACHE_TTL and PROFILE_CACHE_SIZE."""
+    if PROFILE_CACHE_BACKEND == "redis":
+        try:
+            import redis
+            return ProfileCache(RedisBackend(redis.Redis.from_url(PROFILE_CACHE_REDIS_URL)))
+        except ImportError as e:
+            logger.warning(f"Redis profile cache unavailable ({e}), caching profiles in process")
+    return ProfileCache(MemoryBackend(PROFILE_CACHE_SIZE))
+
+# Shared by everything in the process
+profile_cache = create_profile_cache()
@@ -0,0 +1,111 @@
+"""
+Prompt assembly with deduplication and per-section token budgets.
+
+A prompt is built from named sections. The builder:
+- drops a section whose text was already added (or is part of the text
+  passed as `exclude`, e.g. the system message), and drops lines that
+  already appeared in an earlier section, so the same guidance is never
+  paid for twice
+- counts each section's tokens with a local tokenizer and trims sections
+  over their budget, whole lines from the end, logging what was cut
+
+Token counts use tiktoken's o200k_base encoding (gpt-4o) when tiktoken is
+installed, and a characters-per-token estimate otherwise.
+
+Usage:
+    builder = PromptBuilder(exclude=[SYSTEM_MESSAGE])
+    builder.add("user", user_info, budget=200)
+    builder.add("requirements", requirements, budget=300)
+    prompt = builder.build()
+    builder.report()   # [{"section": "user", "tokens": 112, "budget": 200, ...}, ...]
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TIKTOKEN_ENCODING = "o200k_base"
+# Estimate used without tiktoken; the same ratio as rate_limiter.estimate_chat_tokens
+CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TIKTOKEN_ENCODING)
+    except Exception as e:  # not installed, or the encoding can't be loaded offline
+        logger.info(f"tiktoken unavailable ({e}), estimating {CHARS_PER_TOKEN} characters per token")
+        return None
+
+def tokenizer_name() -> str:
+    """Name of the tokenizer count_tokens uses, for reports."""
+    return f"tiktoken:{TIKTOKEN_ENCODING}" if _encoding() else f"estimate:{CHARS_PER_TOKEN}-chars"
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text for gpt-4o (estimated when tiktoken isn't installed)."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _normalize(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+class PromptBuilder:
+    """Collects prompt sections in order, without repeated text and within token budgets."""
+
+    def __init__(self, exclude: Iterable[str] = (), separator: str = "\n\n"):
+        self.separator = separator
+        self.sections: List[Dict] = []
+        self.seen_lines = {_normalize(line) for text in exclude for line in text.splitlines() if line.strip()}
+        self.seen_sections = {_normalize(text) for text in exclude if text.strip()}
+
+    def add(self, name: str, text: str, budget: Optional[int] = None) -> "PromptBuilder":
+        """
+        Add a section. Lines seen earlier are removed, and the section is trimmed
+        to `budget` tokens by dropping whole lines from the end.
+
+        Args:
+            name (str): Section name, used in the report
+            text (str): Section text
+            budget (int): Optional token budget for the section
+        """
+        entry = {"section": name, "text": "", "tokens": 0, "budget": budget,
+                 "duplicate_lines": 0, "trimmed_lines": 0}
+        self.sections.append(entry)
+        if not text or not text.strip() or _normalize(text) in self.seen_sections:
+            return self
+
+        lines = []
+        for line in text.strip("\n").splitlines():
+            key = _normalize(line)
+            if key and key in self.seen_lines:
+                entry["duplicate_lines"] += 1
+                continue
+            lines.append(line)
+
+        body = "\n".join(lines)
+        while budget is not None and lines and count_tokens(body) > budget:
+            lines.pop()
+            entry["trimmed_lines"] += 1
+            body = "\n".join(lines)
+        if entry["trimmed_lines"]:
+            logger.warning(f"Prompt section '{name}' over its {budget} token budget, "
+                           f"dropped its last {entry['trimmed_lines']} lines")
+
+        entry.update(text=body, tokens=count_tokens(body))
+        self.seen_sections.add(_normalize(text))
+        self.seen_lines.update(_normalize(line) for line in lines if line.strip())
+        return self
+
+    def build(self) -> str:
+        """The prompt: every non-empty section, in the order added."""
+        return self.separator.join(entry["text"] for entry in self.sections if entry["text"])
+
+    def report(self) -> List[Dict]:
+        """Tokens, budget and removed lines per section."""
+        return [{k: v for k, v in entry.items() if k != "text"} for entry in self.sections]
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Prompt token report: tokens of the learning email prompt per user segment.
+
+Builds the prompt generate_learning_email sends (the segment's shared system
+message + the user prompt) for a synthetic user in every target language x
+level bucket and reports its tokens, per section and in total. "prefix" is
+the shared system message; OpenAI only caches prefixes of at least 1024
+tokens. "billed" is the prompt priced in full-rate tokens once the segment's
+prefix is served from the cache (CACHED_TOKEN_PRICE_RATIO of its tokens). "before" is the prompt as laid out before Backend/prompt_builder.py
+(persona repeated in the prompt and the vocabulary guidance inserted twice)
+plus the same conversation memory section, or the counts saved with --save by an earlier run when --baseline is given, so
+any prompt change can be measured:
+
+    python Backend/prompt_report.py --save before.json
+    # ... edit the prompt ...
+    python Backend/prompt_report.py --baseline before.json
+
+Token counts use tiktoken (o200k_base) when it is installed and an estimate
+otherwise; the tokenizer is named in the report. No credentials are needed.
+
+Usage:
+    python Backend/prompt_report.py [--baseline PATH] [--save PATH] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+from typing import Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Prompts are built locally; dummy credentials only let the sender module import
+for name, value in {
+    "SUPABASE_URL": "https://report.supabase.co",
+    "SUPABASE_KEY": "report",
+    "OPENAI_API_KEY": "sk-report",
+    "SENDGRID_API_KEY": "SG.report",
+}.items():
+    os.environ.setdefault(name, value)
+
+from Backend.prompt_builder import count_tokens, tokenizer_name
+from Backend.bennie_email_sender import (
+    CACHED_TOKEN_PRICE_RATIO,
+    PROMPT_SECTION_BUDGETS,
+    build_enhanced_prompt,
+    build_segment_prompt,
+    get_vocabulary_guidance,
+    level_to_semester,
+)
+
+LANGUAGES = ["spanish", "french", "italian", "german", "japanese", "mandarin"]
+# One level per prompt segment level bucket (the semesters of level_to_semester)
+LEVEL_BUCKETS = {"1-12": 6, "13-25": 18, "26-37": 31, "38-50": 44,
+                 "51-62": 56, "63-75": 70, "76-87": 80, "88-100": 95}
+# Shortest prompt prefix OpenAI caches
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+LEGACY_SYSTEM_MESSAGE = "You are Bennie, a warm and enthusiastic AI language learning friend. You write natural, conversational emails in the user's target language, sharing your daily experiences while helping them learn. You're encouraging, curious, and genuinely interested in their lives."
+
+# A conversation summary as it looks a few weeks in (see Backend/conversation_memory.py)
+SAMPLE_MEMORY = {
+    "recent_topics": ["food", "travel", "music", "hiking", "food", "work", "family", "weather", "travel", "hobbies"],
+    "facts": ["Has a dog called Luna", "Works as a nurse", "Is planning a trip to Lisbon in May",
+              "Plays the guitar", "Has two sisters"],
+    "open_questions": [],
+    "vocabulary": [f"word{i} - definition {i}" for i in range(40)],
+    "last_reply": "I went hiking with Luna on Saturday and it rained the whole time, but we loved it!",
+    "last_email_at": "2025-08-01T09:00:00+00:00",
+}
+
+def sample_context(language: str, level: int) -> Dict:
+    return {
+        "auth_user_id": "report",
+        "email": "learner@example.com",
+        "name": "Alex",
+        "target_language": language,
+        "proficiency_level": level,
+        "topics_of_interest": "travel, cooking, music, hiking",
+        "learning_goal": "Travel confidently",
+        "email_history": [],
+        "memory": SAMPLE_MEMORY,
+    }
+
+def legacy_prompt(user_context: Dict, recent_topics: List[str], should_use_new_topic: bool, next_topic: str) -> str:
+    """create_enhanced_prompt as it was before the prompt builder."""
+    bennie_identity = """You are Bennie, a warm, enthusiastic, and encouraging AI language learning friend. You have a playful personality and love sharing your daily experiences. You're genuinely excited about helping people learn languages and you treat each user like a close friend. You're curious about their lives and always ask engaging questions to keep the conversation flowing."""
+    semester, semester_desc = level_to_semester(user_context['proficiency_level'])
+    user_info = f"""
+USER CONTEXT:
+- Name: {user_context['name']}
+- Target Language: {user_context['target_language']}
+- Proficiency Level: {user_context['proficiency_level']}/100
+- Learning Goal: {user_context['learning_goal']}
+- Interests: {user_context['topics_of_interest']}
+
+SEMESTER CONTEXT:
+- The user's proficiency level of {user_context['proficiency_level']}/100 is equivalent to a college language learner in semester {semester} out of 8.
+- {semester_desc}
+- Tailor your vocabulary, grammar, and topics to what a student would be expected to handle at this semester.
+"""
+    topic_guidance = f"""
+TOPIC GUIDANCE:
+- Recent topics discussed: {', '.join(recent_topics) if recent_topics else 'None yet'}
+- Should introduce new topic: {'Yes' if should_use_new_topic else 'No'}
+- SELECTED TOPIC FOR THIS EMAIL: {next_topic if next_topic else 'Choose from interests'}
+- Topic variety rule: If the same topic appears in 2+ recent emails, you MUST choose a different topic
+- Available interests to choose from: {user_context['topics_of_interest']}
+- If new topic: Chose a random topic that you are interested in!  Be creative!  Bennie is very adventurous and has a wide range of interesting experiences.  Be creative and make something fun and unique up that will expand our user's vocabulary!
+- If repeating topic: Choose a completely different angle or situation
+- Topic rotation: Cycle through their interests evenly over time
+- Avoid topic repetition: Don't discuss the same specific topic within 5 emails
+- IMPORTANT: Focus your email content around the selected topic: {next_topic}
+"""
+    vocab_guidance = get_vocabulary_guidance(user_context['proficiency_level'], user_context['target_language'])
+    requirements = f"""
+REQUIREMENTS:
+- Write entirely in {user_context['target_language']}
+- {vocab_guidance}
+- Keep message to 3-4 sentences
+- Include 2-3 new vocabulary words appropriate for their level
+- End with an engaging question that invites a response
+- Keep tone friendly, encouraging, and conversational
+- End the email with a culturally appropriate closing and Bennie's name, in the target language:
+  - Spanish: "Con cariño, Bennie"
+  - French: "Avec amitié, Bennie"
+  - Mandarin: "祝好 (Zhù hǎo), Bennie"
+  - Japanese: "ベニーより (Bennie yori)"
+  - German: "Viele Grüße, Bennie"
+  - Italian: "Con affetto, Bennie"
+- Add vocabulary definitions at the bottom after signature
+- DO NOT mention their learning goals or proficiency level in the email
+- Focus on natural conversation, not explicit teaching
+- IMPORTANT: Use vocabulary that matches their exact level - don't overestimate their abilities
+"""
+    return f"""{bennie_identity}
+
+{user_info}
+
+{topic_guidance}
+
+{vocab_guidance}
+
+{requirements}
+
+Write your email now:"""
+
+def run(baseline: Dict[str, int] = None) -> List[Dict]:
+    """Token counts per segment; `baseline` maps segment -> earlier total tokens."""
+    results = []
+    recent_topics, next_topic = ["food", "travel"], "music"
+    for language in LANGUAGES:
+        for bucket, level in LEVEL_BUCKETS.items():
+            segment = f"{language}/{bucket}"
+            context = sample_context(language, level)
+            prefix = build_segment_prompt(language, level)
+            builder = build_enhanced_prompt(context, recent_topics, True, next_topic)
+            report = prefix.report() + builder.report()
+            sections = {entry["section"]: entry["tokens"] for entry in report}
+            prefix_tokens = count_tokens(prefix.build())
+            after = prefix_tokens + count_tokens(builder.build())
+            if baseline is not None:
+                before = baseline.get(segment)
+            else:
+                # The memory section came later than the layout change, so it counts on both sides
+                before = (count_tokens(LEGACY_SYSTEM_MESSAGE)
+                          + count_tokens(legacy_prompt(context, recent_topics, True, next_topic))
+                          + sections.get("memory", 0))
+            cacheable = prefix_tokens >= PROMPT_CACHE_MIN_TOKENS
+            results.append({
+                "segment": segment,
+                "language": language,
+                "level": level,
+                "before": before,
+                "after": after,
+                "billed": round(after - prefix_tokens * (1 - CACHED_TOKEN_PRICE_RATIO)) if cacheable else after,
+                "prefix": prefix_tokens,
+                "cacheable": cacheable,
+                "sections": sections,
+                "over_budget": [entry["section"] for entry in report if entry["trimmed_lines"]],
+            })
+    return results
+
+def print_report(results: List[Dict]):
+    names = ["persona"] + list(PROMPT_SECTION_BUDGETS) + ["instruction"]
+    print(f"\n📊 Learning email prompt tokens per segment ({tokenizer_name()})")
+    print(f"{'segment':<18}{'before':>8}{'after':>7}{'saved':>7}{'billed':>8}{'prefix':>8}" + "".join(f"{n:>13}" for n in names))
+    for r in results:
+        saved = f"{r['before'] - r['after']:>7}" if r["before"] is not None else f"{'-':>7}"
+        before = f"{r['before']:>8}" if r["before"] is not None else f"{'-':>8}"
+        print(f"{r['segment']:<18}{before}{r['after']:>7}{saved}{r['billed']:>8}{r['prefix']:>8}"
+              + "".join(f"{r['sections'].get(n, 0):>13}" for n in names))
+    print("Budgets: " + ", ".join(f"{name} {budget}" for name, budget in PROMPT_SECTION_BUDGETS.items()))
+    short = [r["segment"] for r in results if not r["cacheable"]]
+    if short:
+        print(f"Shared prefix below the {PROMPT_CACHE_MIN_TOKENS} tokens OpenAI caches in {len(short)} of {len(results)} segments")
+    trimmed = [r["segment"] for r in results if r["over_budget"]]
+    if trimmed:
+        print(f"⚠️ Sections trimmed to their budget in: {', '.join(trimmed)}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Report learning email prompt tokens per language and level.")
+    parser.add_argument("--baseline", help="JSON file from --save to compare against instead of the legacy prompt")
+    parser.add_argument("--save", help="write {segment: total tokens} to this JSON file")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = run(baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({r["segment"]: r["after"] for r in results}, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_report(results)
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Adaptive token-bucket rate limiting for Bennie's upstream APIs.
+
+One limiter per upstream (OpenAI, SendGrid) is shared by every sender in the
+process. Each limiter budgets requests and, for OpenAI, tokens: callers
+reserve an estimate before a call and reconcile it with `completion.usage`
+afterwards.
+
+The limiter adjusts itself from what the upstream reports:
+- x-ratelimit-limit-* headers set the ceiling (the account's real RPM/TPM)
+- x-ratelimit-remaining-* headers cap the local budget, so other processes
+  sharing the same account are accounted for
+- a 429 pauses every caller until Retry-After (or the reset header) and halves
+  the rate; each success then recovers a little of it (AIMD). A burst of 429s
+  turns into one short pause instead of a failure storm
+
+State is guarded by a threading lock and never bound to an event loop, so
+async senders, sync senders and FastAPI worker threads can share a limiter.
+
+Limits can be seeded with OPENAI_RPM, OPENAI_TPM and SENDGRID_RPM; the
+upstream's headers take over once the first response arrives.
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Mapping, Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+OPENAI = "openai"
+SENDGRID = "sendgrid"
+
+# Fraction of a minute's budget that may be spent in one burst
+BURST_FRACTION = 1 / 6
+MIN_RATE_FACTOR = 0.1
+RATE_DECREASE = 0.5
+RATE_RECOVERY = 0.05
+DEFAULT_RETRY_AFTER = 1.0
+MAX_RETRY_AFTER = 120.0
+
+class TokenBucket:
+    """
+    A refilling budget of `rate` units per second, holding at most `capacity`.
+
+    Requests larger than the capacity are let through once the bucket is full
+    and leave it in debt, so a single large call can never wait forever.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if it can be taken now). Call refill first."""
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+class RateLimiter:
+    """Request and token budgets for one upstream, adjusted from its responses."""
+
+    def __init__(self, name: str, requests_per_minute: float,
+                 tokens_per_minute: Optional[float] = None):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self.rate_limited_count = 0
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(0, 0)
+        self.tokens = TokenBucket(0, 0) if tokens_per_minute else None
+        self._apply_rates()
+        # Start with a full burst budget
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.level = bucket.capacity
+
+    def _apply_rates(self):
+        """Recompute bucket rates from the per-minute ceilings and the AIMD factor."""
+        self._set_bucket(self.requests, self.requests_per_minute)
+        if self.tokens is not None:
+            self._set_bucket(self.tokens, self.tokens_per_minute)
+
+    def _set_bucket(self, bucket: TokenBucket, per_minute: float):
+        bucket.refill(time.monotonic())
+        bucket.rate = per_minute * self.factor / 60
+        bucket.capacity = max(1.0, per_minute * BURST_FRACTION)
+        bucket.level = min(bucket.level, bucket.capacity)
+
+    def _reserve(self, tokens: float) -> float:
+        """Take the budget for one call, or return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+
+            buckets = [(self.requests, 1)]
+            if self.tokens is not None and tokens:
+                buckets.append((self.tokens, tokens))
+            for bucket, _ in buckets:
+                bucket.refill(now)
+            wait = max(bucket.wait_time(amount) for bucket, amount in buckets)
+            if wait > 0:
+                return wait
+            for bucket, amount in buckets:
+                bucket.take(amount)
+            return 0.0
+
+    async def acquire(self, tokens: float = 0):
+        """Wait until one request (and `tokens` tokens) fit the budget, then take them."""
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens: float = 0):
+        """Blocking variant of acquire for sync senders."""
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def record_usage(self, estimated_tokens: float, actual_tokens: float):
+        """Reconcile a reservation with the tokens the call actually used."""
+        if self.tokens is None:
+            return
+        with self._lock:
+            self.tokens.take(actual_tokens - estimated_tokens)
+
+    def record_success(self, headers: Optional[Mapping[str, str]] = None):
+        """Recover some of the rate after a throttle and apply any rate-limit headers."""
+        with self._lock:
+            if self.factor < 1.0:
+                self.factor = min(1.0, self.factor + RATE_RECOVERY)
+                self._apply_rates()
+            if headers:
+                self._apply_headers(parse_rate_limit_headers(headers))
+
+    def record_rate_limited(self, headers: Optional[Mapping[str, str]] = None) -> float:
+        """
+        Handle a 429: pause every caller and halve the rate.
+
+        Returns:
+            float: Seconds the limiter is paused for
+        """
+        info = parse_rate_limit_headers(headers or {})
+        with self._lock:
+            self.rate_limited_count += 1
+            delay = info.get("retry_after")
+            if delay is None:
+                resets = [info[k] for k in ("reset_requests", "reset_tokens") if info.get(k)]
+                delay = max(resets) if resets else DEFAULT_RETRY_AFTER
+            delay = min(max(delay, 0.0), MAX_RETRY_AFTER)
+            now = time.monotonic()
+            # Calls already in flight when the first 429 arrived fail together;
+            # count them as one throttle rather than halving the rate for each
+            if now >= self.paused_until:
+                self.factor = max(MIN_RATE_FACTOR, self.factor * RATE_DECREASE)
+            self.paused_until = max(self.paused_until, now + delay)
+            self._apply_headers(info)
+            self._apply_rates()
+        logger.warning(f"{self.name} rate limited, pausing {delay:.1f}s at {self.factor:.0%} of the limit")
+        return delay
+
+    def _apply_headers(self, info: Dict[str, float]):
+        """Adopt the upstream's limits and cap the local budget at what it says remains."""
+        changed = False
+        if info.get("limit_requests") and info["limit_requests"] != self.requests_per_minute:
+            self.requests_per_minute = info["limit_requests"]
+            changed = True
+        if self.tokens is not None and info.get("limit_tokens") and info["limit_tokens"] != self.tokens_per_minute:
+            self.tokens_per_minute = info["limit_tokens"]
+            changed = True
+        if changed:
+            self._apply_rates()
+
+        if info.get("remaining_requests") is not None:
+            self.requests.level = min(self.requests.level, info["remaining_requests"])
+        if self.tokens is not None and info.get("remaining_tokens") is not None:
+            self.tokens.level = min(self.tokens.level, info["remaining_tokens"])
+
+    def stats(self) -> Dict:
+        """Current limits for log lines and reports."""
+        with self._lock:
+            return {
+                "name": self.name,
+                "requests_per_minute": self.requests_per_minute * self.factor,
+                "tokens_per_minute": self.tokens_per_minute * self.factor if self.tokens_per_minute else None,
+                "rate_limited_count": self.rate_limited_count,
+            }
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_duration(value: str) -> Optional[float]:
+    """Parse OpenAI reset durations such as '20ms', '1s' or '6m0s' into seconds."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> Dict[str, float]:
+    """
+    Read the rate-limit headers of an OpenAI or SendGrid response.
+
+    OpenAI sends x-ratelimit-{limit,remaining,reset}-{requests,tokens} per
+    minute. SendGrid sends X-RateLimit-{Limit,Remaining} per minute and
+    X-RateLimit-Reset as a Unix timestamp. Both may send Retry-After.
+
+    Returns:
+        Dict: Any of retry_after, limit_requests, remaining_requests,
+            reset_requests, limit_tokens, remaining_tokens, reset_tokens
+            (resets and retry_after in seconds from now)
+    """
+    h = {k.lower(): v for k, v in headers.items()}
+    info: Dict[str, float] = {}
+
+    if h.get("retry-after-ms") is not None and _number(h["retry-after-ms"]) is not None:
+        info["retry_after"] = _number(h["retry-after-ms"]) / 1000
+    elif h.get("retry-after") is not None and _number(h["retry-after"]) is not None:
+        info["retry_after"] = _number(h["retry-after"])
+
+    for kind in ("requests", "tokens"):
+        for field in ("limit", "remaining"):
+            value = _number(h.get(f"x-ratelimit-{field}-{kind}"))
+            if value is not None:
+                info[f"{field}_{kind}"] = value
+        reset = h.get(f"x-ratelimit-reset-{kind}")
+        if reset:
+            seconds = parse_duration(reset)
+            if seconds is not None:
+                info[f"reset_{kind}"] = seconds
+
+    # SendGrid style
+    for field in ("limit", "remaining"):
+        value = _number(h.get(f"x-ratelimit-{field}"))
+        if value is not None:
+            info.setdefault(f"{field}_requests", value)
+    reset_at = _number(h.get("x-ratelimit-reset"))
+    if reset_at is not None:
+        info.setdefault("reset_requests", max(0.0, reset_at - time.time()))
+
+    return info
+
+def estimate_chat_tokens(messages: List[Dict], max_tokens: Optional[int]) -> int:
+    """Rough token cost of a chat completion before it runs (about 4 characters per token)."""
+    prompt_chars = sum(len(str(m.get("content") or "")) for m in messages or [])
+    return prompt_chars // 4 + (max_tokens or 0)
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def _default_limiter(name: str) -> RateLimiter:
+    if name == OPENAI:
+        return RateLimiter(OPENAI,
+                           requests_per_minute=float(os.getenv("OPENAI_RPM", "500")),
+                           tokens_per_minute=float(os.getenv("OPENAI_TPM", "30000")))
+    if name == SENDGRID:
+        return RateLimiter(SENDGRID, requests_per_minute=float(os.getenv("SENDGRID_RPM", "3000")))
+    raise ValueError(f"Unknown upstream: {name}")
+
+def get_limiter(name: str) -> RateLimiter:
+    """Return the process-wide limiter for an upstream (openai or sendgrid)."""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = _default_limiter(name)
+        return _limiters[name]
+
+def reset(limiters: Optional[Dict[str, RateLimiter]] = None):
+    """Drop the process-wide limiters, keeping `limiters` if given; get_limiter builds the others afresh."""
+    with _limiters_lock:
+        _limiters.clear()
+        _limiters.update(limiters or {})
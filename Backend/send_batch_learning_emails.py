@@ -3,51 +3,289 @@
 Batch email sender for Bennie - for use with Railway cron jobs.
 Sends up to 100 learning emails per run, starting from a given offset.
 
+In shard mode the run instead sends to every active user in one hash shard
+(see Backend/sharding.py), so the nine daily cron slots split all active users
+between them instead of all reaching the first 100.
+
+In due mode (--due, what the cron tick runs) the run sends to the users whose
+next_send_at has passed, found with one range scan, and moves each of them on
+to their next slot from users.email_schedule (see Backend/email_scheduler.py).
+Users are only ever read when they are due, and sends follow each user's
+preferred days, time and timezone instead of fixed UTC slots.
+
+Selected users are enqueued in the send queue (one row per user per UTC day, or
+per scheduled slot in due mode, see Backend/send_queue.py) and the run then drains the queue. Each user's context
+fetch, OpenAI generation and SendGrid delivery run as an independent task, with
+separate concurrency limits for OpenAI and SendGrid. A failure for one user
+never stops the batch, and rerunning the same day never sends duplicates.
+
+Each run is recorded in cron_runs with a checkpoint after every enqueued page
+(see Backend/cron_runs.py). A run that was killed can be resumed with
+--resume: it keeps its shard, send date or due instant, continues after the last
+checkpoint and only sends emails that were not delivered yet.
+
 Usage:
-    python send_batch_learning_emails.py [offset]
+    python send_batch_learning_emails.py [offset] [--due] [--shard INDEX/COUNT|auto] [--openai-concurrency N] [--sendgrid-concurrency N] [--resume RUN_ID|latest] [--openai-batch]
 
-- offset: (optional) start index for batch (default 0)
+- offset: (optional) start index for batch (default 0, ignored in shard and due mode)
+- --due: send to every active user whose next_send_at has passed (combine with --shard to split a tick)
+- --shard: send to every active user in this shard (env BATCH_SHARD); "auto" picks the shard from the cron slot
+- --openai-concurrency: max simultaneous OpenAI completions (default 8, env BATCH_OPENAI_CONCURRENCY)
+- --sendgrid-concurrency: max simultaneous SendGrid sends (default 16, env BATCH_SENDGRID_CONCURRENCY)
+- --resume: resume a previous run by id, or "latest" for the most recent unfinished run (of the same shard if --shard is given)
+- --openai-batch: generate every email of the run with one OpenAI batch (half price, outside the
+  synchronous rate limits) and then send them (env BATCH_OPENAI_BATCH, see Backend/openai_batch.py).
+  If the batch isn't finished within OPENAI_BATCH_WAIT_SECONDS the run stops; --resume waits for it again
 
 Set your SUPABASE_URL, SUPABASE_KEY, SENDGRID_API_KEY, and OPENAI_API_KEY in .env
 """
 import os
 import sys
+import argparse
+import asyncio
+import datetime
+import itertools
 from dotenv import load_dotenv
 from supabase import create_client
-from Backend.bennie_email_sender import send_language_learning_email
+from Backend.bennie_email_sender import (
+    USER_CONTEXT_COLUMNS,
+    prompt_segment,
+    get_user_context,
+    load_user_contexts,
+    generate_learning_email,
+    deliver_learning_email,
+    build_learning_email_request,
+    read_learning_email,
+)
+from Backend.sharding import in_shard, parse_shard, resolve_shard, shard_range
+from Backend.user_iterator import iter_users, iter_user_pages, page_cursor
+from Backend import bennie_email_sender, send_queue, clients, cron_runs, email_drafts, email_scheduler, openai_batch
 
 BATCH_SIZE = 100
+USER_PAGE_SIZE = 500
+DEFAULT_OPENAI_CONCURRENCY = 8
+DEFAULT_SENDGRID_CONCURRENCY = 16
+# Keyset order of a shard walk, served by idx_users_shard_key (database/shard_key.sql)
+SHARD_KEY = ("shard_key", "id")
+
+def active_users(query):
+    """Filter a users query down to active users."""
+    return query.eq("is_active", True)
 
 def get_users_to_email(supabase, offset=0, limit=BATCH_SIZE):
     """
-    Get active users from auth.users and public.users for batch emailing.
+    Get active users from public.users for batch emailing.
     Only returns users who have completed onboarding (have a profile in public.users).
     """
-    # Get active users from public.users
-    response = supabase.table("users").select(
-        "auth_user_id"
-    ).eq("is_active", True).range(offset, offset+limit-1).execute()
-    
-    if not response.data:
-        return []
-    
-    # Get corresponding auth users
-    auth_user_ids = [user["auth_user_id"] for user in response.data]
-    auth_users = []
-    
-    # Fetch users in batches of 10 to avoid rate limits
-    for i in range(0, len(auth_user_ids), 10):
-        batch_ids = auth_user_ids[i:i+10]
-        for auth_user_id in batch_ids:
-            try:
-                user = supabase.auth.admin.get_user(auth_user_id)
-                if user:
-                    auth_users.append({"email": user.email})
-            except Exception as e:
-                print(f"Error fetching auth user {auth_user_id}: {e}")
-                continue
-    
-    return auth_users
+    # Stream active users from public.users in keyset order
+    stream = iter_users(supabase, USER_CONTEXT_COLUMNS, filters=active_users, page_size=min(limit, USER_PAGE_SIZE))
+    return list(itertools.islice(stream, offset, offset + limit))
+
+def iter_users_in_shard(supabase, shard_index, shard_count, page_size=USER_PAGE_SIZE, start_after=None):
+    """
+    Yield pages of active users whose auth_user_id hashes into the given shard.
+    Walks only the shard's own shard_key range, in (shard_key, id) order, one
+    page in memory at a time, starting after the `start_after` cursor if given.
+    """
+    low, high = shard_range(shard_index, shard_count)
+
+    def shard_users(query):
+        query = active_users(query).gte("shard_key", low)
+        return query.lt("shard_key", high) if high is not None else query
+
+    yield from iter_user_pages(supabase, USER_CONTEXT_COLUMNS, filters=shard_users,
+                               page_size=page_size, key=SHARD_KEY, start_after=start_after)
+
+def current_send_date():
+    """Return the UTC day used in batch idempotency keys."""
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+def iter_run_pages(supabase, run):
+    """
+    Yield the pages of users a run still has to enqueue.
+    Shard runs continue after the run's checkpoint; due runs scan again for
+    users still due at the run's due instant (enqueued users have moved on to
+    their next slot); offset runs are a single page that is re-enqueued in
+    full on resume (duplicates are skipped by key).
+    """
+    params = run["params"]
+    if params.get("due_before"):
+        due_before = datetime.datetime.fromisoformat(params["due_before"])
+        shard = parse_shard(params["shard"]) if params.get("shard") else None
+        for page in email_scheduler.iter_due_users(supabase, USER_CONTEXT_COLUMNS, due_before):
+            if shard:
+                page = [row for row in page if in_shard(row["auth_user_id"], *shard)]
+            if page:
+                yield page
+    elif params.get("shard"):
+        shard_index, shard_count = parse_shard(params["shard"])
+        yield from iter_users_in_shard(supabase, shard_index, shard_count,
+                                       start_after=cron_runs.run_cursor(run))
+    else:
+        yield get_users_to_email(supabase, offset=params.get("offset", 0), limit=BATCH_SIZE)
+
+def batch_item(user, period, run_id=None):
+    """
+    Build the send queue row for one user's batch email in the given period.
+    Its prompt segment orders the claims, so users sharing a prompt prefix are
+    generated together.
+    """
+    return {
+        "kind": send_queue.KIND_BATCH,
+        "auth_user_id": user["auth_user_id"],
+        "idempotency_key": send_queue.make_idempotency_key(
+            send_queue.KIND_BATCH, user["auth_user_id"], period
+        ),
+        "payload": {"email": user["email"]},
+        "run_id": run_id,
+        "segment": prompt_segment(user.get("target_language"), user.get("proficiency_level") or 1),
+    }
+
+def enqueue_batch(supabase, users, send_date=None, run_id=None):
+    """
+    Enqueue one batch learning email per user for the given UTC day.
+    Users already queued for that day are skipped by their idempotency key.
+    """
+    send_date = send_date or current_send_date()
+    return send_queue.enqueue(supabase, (batch_item(user, send_date, run_id) for user in users))
+
+def enqueue_due_batch(supabase, users, run_id=None):
+    """
+    Enqueue one batch learning email per due user for the slot they fell due in
+    (their current next_send_at). A user already queued for that slot is skipped.
+    """
+    return send_queue.enqueue(supabase, (batch_item(user, user["next_send_at"], run_id) for user in users))
+
+def make_batch_handlers(supabase=None):
+    """
+    Build the prepare/generate/deliver callables for batch queue rows.
+    Contexts and pre-generated drafts (see Backend/email_drafts.py) for a whole
+    claimed chunk are bulk-loaded in prepare and reused for generation and
+    delivery; a row missing from the bulk load falls back to get_user_context.
+    A draft still matching the user's context is sent instead of generating.
+    Rows of earlier chunks may still be in flight when prepare runs, so each
+    row's entries are dropped when it is delivered or fails to generate.
+    """
+    contexts = {}
+    drafts = {}
+
+    def database():
+        # The sender module's client unless one is given (the simulator swaps it for a fake)
+        return supabase or bennie_email_sender.supabase
+
+    def prepare(items):
+        auth_user_ids = list({item["auth_user_id"] for item in items})
+        contexts.update(load_user_contexts(auth_user_ids))
+        drafts.update(email_drafts.load_drafts(database(), auth_user_ids))
+
+    async def context_for(item):
+        user_context = contexts.get(item["auth_user_id"])
+        if user_context is None:
+            user_context = await asyncio.to_thread(get_user_context, item["payload"]["email"])
+            contexts[item["auth_user_id"]] = user_context
+        return user_context
+
+    async def generate(item):
+        try:
+            user_context = await context_for(item)
+            draft = email_drafts.usable_draft(drafts.get(item["auth_user_id"]), user_context)
+            if draft is not None:
+                print(f"↻ Using pre-generated draft for {send_queue.describe(item)}")
+                user_context["usage"] = draft.get("usage")
+                return draft["content"]
+            return await generate_learning_email(user_context)
+        except Exception:
+            # The row is released for a retry, which loads its user again
+            contexts.pop(item["auth_user_id"], None)
+            drafts.pop(item["auth_user_id"], None)
+            raise
+
+    async def deliver(item, bennies_response):
+        user_context = await context_for(item)
+        # Token usage of a body generated by an OpenAI batch
+        if (item.get("payload") or {}).get("usage"):
+            user_context["usage"] = item["payload"]["usage"]
+        draft = drafts.pop(item["auth_user_id"], None)
+        try:
+            await deliver_learning_email(item["payload"]["email"], user_context, bennies_response)
+        finally:
+            contexts.pop(item["auth_user_id"], None)
+        # Sent, or made stale by this email: either way the draft is done
+        if draft is not None:
+            await asyncio.to_thread(email_drafts.discard_draft, database(), item["auth_user_id"])
+
+    return prepare, generate, deliver
+
+def build_batch_requests(items):
+    """
+    Build the OpenAI batch requests for a page of queue rows, keyed by row id.
+    Contexts are bulk-loaded; a user without a profile is left out and handled
+    by the synchronous drain.
+    """
+    contexts = load_user_contexts(list({item["auth_user_id"] for item in items}))
+    return {
+        item["id"]: build_learning_email_request(contexts[item["auth_user_id"]])
+        for item in items if item["auth_user_id"] in contexts
+    }
+
+def read_batch_completion(item, completion):
+    """Validate a batch result; returns (email JSON, token usage)."""
+    return read_learning_email(completion, item.get("segment"), openai_batch.OPENAI_BATCH_PRICE_RATIO)
+
+async def send_batch_concurrently(supabase, openai_concurrency=DEFAULT_OPENAI_CONCURRENCY,
+                                  sendgrid_concurrency=DEFAULT_SENDGRID_CONCURRENCY):
+    """
+    Drain queued batch emails concurrently.
+
+    Returns:
+        tuple[int, int]: (success_count, error_count)
+    """
+    prepare, generate, deliver = make_batch_handlers(supabase)
+    return await send_queue.drain_queue(
+        supabase,
+        [send_queue.KIND_BATCH],
+        generate,
+        deliver,
+        prepare=prepare,
+        openai_concurrency=openai_concurrency,
+        sendgrid_concurrency=sendgrid_concurrency,
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Send a batch of Bennie learning emails.")
+    parser.add_argument("offset", nargs="?", default="0",
+                        help="start index for batch (default 0, ignored in shard mode)")
+    parser.add_argument("--shard",
+                        help="send to every active user in shard INDEX/COUNT, or 'auto' for the current cron slot")
+    parser.add_argument("--due", action="store_true",
+                        help="send to every active user whose next_send_at has passed")
+    parser.add_argument("--openai-concurrency", type=int,
+                        default=int(os.getenv("BATCH_OPENAI_CONCURRENCY", DEFAULT_OPENAI_CONCURRENCY)),
+                        help="max simultaneous OpenAI completions")
+    parser.add_argument("--sendgrid-concurrency", type=int,
+                        default=int(os.getenv("BATCH_SENDGRID_CONCURRENCY", DEFAULT_SENDGRID_CONCURRENCY)),
+                        help="max simultaneous SendGrid sends")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                        help="resume a previous run by id, or 'latest' for the most recent unfinished one")
+    parser.add_argument("--openai-batch", action="store_true",
+                        default=os.getenv("BATCH_OPENAI_BATCH", "").lower() in ("1", "true", "yes"),
+                        help="generate the run's emails with the OpenAI Batch API before sending")
+    args = parser.parse_args(argv)
+
+    try:
+        args.offset = int(args.offset)
+    except ValueError:
+        print("Invalid offset argument, using 0.")
+        args.offset = 0
+
+    try:
+        args.shard = resolve_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+
+    args.openai_concurrency = max(1, args.openai_concurrency)
+    args.sendgrid_concurrency = max(1, args.sendgrid_concurrency)
+    return args
 
 def main():
     load_dotenv()
@@ -58,35 +296,96 @@ def main():
         sys.exit(1)
     supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-    # Parse offset from CLI
-    offset = 0
-    if len(sys.argv) > 1:
-        try:
-            offset = int(sys.argv[1])
-        except Exception:
-            print("Invalid offset argument, using 0.")
-            offset = 0
-
-    users = get_users_to_email(supabase, offset=offset, limit=BATCH_SIZE)
-    print(f"Found {len(users)} users to email (offset {offset})")
-    
-    success_count = 0
-    error_count = 0
-    
-    for user in users:
+    args = parse_args()
+
+    if args.resume:
+        match = {"shard": "{}/{}".format(*args.shard)} if args.shard else {}
+        if args.due:
+            match["mode"] = "due"
         try:
-            print(f"Sending email to {user['email']}...")
-            send_language_learning_email(user["email"])
-            success_count += 1
-            print(f"✓ Successfully sent to {user['email']}")
-        except Exception as e:
-            error_count += 1
-            print(f"✗ Failed to send to {user['email']}: {e}")
-    
+            run = cron_runs.load_run(supabase, cron_runs.JOB_BATCH, args.resume, match=match or None)
+        except ValueError as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+        resumed = True
+    else:
+        params = {"send_date": current_send_date()}
+        if args.due:
+            params["mode"] = "due"
+            params["due_before"] = email_scheduler.format_timestamp(datetime.datetime.now(datetime.timezone.utc))
+        if args.shard:
+            params["shard"] = "{}/{}".format(*args.shard)
+        elif not args.due:
+            params["offset"] = args.offset
+        run = cron_runs.start_run(supabase, cron_runs.JOB_BATCH, params)
+        resumed = False
+    for line in cron_runs.describe_run(run, resumed):
+        print(line)
+
+    if run["state"] == "completed":
+        print("Run already completed, nothing to do.")
+        return
+
+    params = run["params"]
+    send_date = params["send_date"]
+    due = params.get("mode") == "due"
+    selection = f"shard {params['shard']}" if params.get("shard") else f"offset {params.get('offset', 0)}"
+    if due:
+        selection = f"due by {params['due_before']}" + (f", shard {params['shard']}" if params.get("shard") else "")
+
+    try:
+        if run["state"] != "enqueued":
+            if due:
+                scheduled = email_scheduler.schedule_unscheduled(supabase)
+                if scheduled:
+                    print(f"Scheduled {scheduled} users without a next send time")
+            # Enqueue page by page so memory stays flat however many users there
+            # are, checkpointing after each page
+            total_users = (run.get("enqueued_count") or 0) if params.get("shard") or due else 0
+            for page in iter_run_pages(supabase, run):
+                if not page:
+                    continue
+                if due:
+                    enqueue_due_batch(supabase, page, run_id=run["id"])
+                    email_scheduler.advance(supabase, page, datetime.datetime.fromisoformat(params["due_before"]))
+                    cursor = page_cursor(page, email_scheduler.DUE_KEY)
+                else:
+                    enqueue_batch(supabase, page, send_date, run_id=run["id"])
+                    cursor = page_cursor(page)
+                total_users += len(page)
+                cron_runs.checkpoint(supabase, run, cursor, total_users)
+            cron_runs.mark_enqueued(supabase, run, total_users)
+        else:
+            total_users = run.get("enqueued_count") or 0
+        print(f"Found {total_users} users to email ({selection}, {send_date})")
+
+        if args.openai_batch or params.get("openai_batch_id"):
+            try:
+                stored, failed = openai_batch.pregenerate_run(supabase, run, build_batch_requests, read_batch_completion)
+            except TimeoutError as e:
+                print(f"⏳ {e}")
+                print(f"Resume with: --resume {run['id']}")
+                return
+            print(f"OpenAI batch: {stored} emails generated, {failed} failed (generated synchronously)")
+        print(f"Concurrency: {args.openai_concurrency} OpenAI, {args.sendgrid_concurrency} SendGrid")
+
+        success_count, error_count = clients.run(send_batch_concurrently(
+            supabase,
+            openai_concurrency=args.openai_concurrency,
+            sendgrid_concurrency=args.sendgrid_concurrency,
+        ))
+    except Exception as e:
+        cron_runs.finish_run(supabase, run, 0, 0, error=str(e))
+        print(f"✗ Batch run failed: {e}")
+        print(f"Resume with: --resume {run['id']}")
+        sys.exit(1)
+    cron_runs.finish_run(supabase, run, success_count, error_count)
+
     print(f"\n📊 Batch Summary:")
-    print(f"Total users: {len(users)}")
+    print(f"Run id: {run['id']}")
+    print(f"Total users: {total_users}")
     print(f"Successful: {success_count}")
     print(f"Failed: {error_count}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
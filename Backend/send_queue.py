@@ -0,0 +1,384 @@
+"""
+Durable send queue (outbox) for Bennie emails.
+
+Producers enqueue one row per email under an idempotency key, so reruns never
+enqueue the same email twice. Workers lease rows through the claim_send_queue
+Postgres function (FOR UPDATE SKIP LOCKED), store the generated body before
+sending, and mark the row done once the email has been delivered. A worker that
+crashes leaves its lease to expire and another worker picks the row up again,
+reusing the stored body instead of paying for a second generation.
+
+See database/send_queue.sql for the table and claim function.
+"""
+import os
+import uuid
+import socket
+import asyncio
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUEUE_TABLE = "send_queue"
+KIND_BATCH = "batch"
+KIND_WEEKLY_EVALUATION = "weekly_evaluation"
+KIND_INSTANT_REPLY = "instant_reply"
+
+DEFAULT_LEASE_SECONDS = 300
+RETRY_BACKOFF_SECONDS = 60
+DEFAULT_OPENAI_CONCURRENCY = 8
+DEFAULT_SENDGRID_CONCURRENCY = 16
+# Tries to mark a delivered row done; it is never released, or it would be sent again
+COMPLETE_ATTEMPTS = 3
+COMPLETE_RETRY_SECONDS = 1
+
+def new_worker_id() -> str:
+    """Return a unique id for this worker process, used as the lease owner."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def make_idempotency_key(kind: str, auth_user_id: str, period: str) -> str:
+    """
+    Build the idempotency key for one email.
+
+    Args:
+        kind (str): Queue kind (batch, weekly_evaluation, instant_reply)
+        auth_user_id (str): Recipient's auth user id
+        period (str): What makes this email unique for the user, e.g. the send date,
+            the ISO week, or the id of the reply being answered
+    """
+    return f"{kind}:{auth_user_id}:{period}"
+
+def enqueue(supabase, items: Iterable[Dict]) -> int:
+    """
+    Enqueue emails, skipping any whose idempotency key is already queued.
+
+    Args:
+        items: Dicts with kind, auth_user_id, idempotency_key and optional payload,
+            run_id (the cron run enqueuing them, see Backend/cron_runs.py) and
+            segment (prompt segment; rows enqueued together are claimed in segment order)
+
+    Returns:
+        int: Number of rows submitted
+    """
+    rows = []
+    for item in items:
+        row = {
+            "kind": item["kind"],
+            "auth_user_id": item["auth_user_id"],
+            "idempotency_key": item["idempotency_key"],
+            "payload": item.get("payload") or {},
+        }
+        if item.get("run_id"):
+            row["run_id"] = item["run_id"]
+        if item.get("segment"):
+            row["segment"] = item["segment"]
+        rows.append(row)
+    if not rows:
+        return 0
+
+    supabase.table(QUEUE_TABLE).upsert(
+        rows, on_conflict="idempotency_key", ignore_duplicates=True
+    ).execute()
+    return len(rows)
+
+def claim(supabase, worker_id: str, kinds: List[str], limit: int = 10,
+          lease_seconds: int = DEFAULT_LEASE_SECONDS) -> List[Dict]:
+    """Lease up to `limit` claimable rows of the given kinds for this worker."""
+    response = supabase.rpc("claim_send_queue", {
+        "p_worker_id": worker_id,
+        "p_kinds": list(kinds),
+        "p_limit": limit,
+        "p_lease_seconds": lease_seconds,
+    }).execute()
+    return response.data or []
+
+def _seconds_from_now(seconds: int) -> str:
+    moment = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=seconds)
+    return moment.isoformat()
+
+def _update_leased(supabase, item: Dict, worker_id: str, fields: Dict) -> bool:
+    """Update a row only while this worker still holds its lease."""
+    response = supabase.table(QUEUE_TABLE).update(fields).eq(
+        "id", item["id"]
+    ).eq("lease_owner", worker_id).eq("state", "leased").execute()
+    return bool(response.data)
+
+def record_generated(supabase, item: Dict, worker_id: str, content: str,
+                     lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+    """
+    Store the generated body and extend the lease before sending.
+
+    Returns:
+        bool: False if the lease was lost, in which case the caller must not send
+    """
+    return _update_leased(supabase, item, worker_id, {
+        "generated_content": content,
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "lease_expires_at": _seconds_from_now(lease_seconds),
+    })
+
+def iter_ungenerated(supabase, run_id: str, page_size: int = 500) -> Iterator[List[Dict]]:
+    """Yield pages of a cron run's pending rows that have no stored body yet, in id order."""
+    last_id = None
+    while True:
+        query = (
+            supabase.table(QUEUE_TABLE)
+            .select("id, kind, auth_user_id, payload, segment")
+            .eq("run_id", run_id)
+            .eq("state", "pending")
+            .is_("generated_content", "null")
+        )
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(page_size).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+def record_pregenerated(supabase, item: Dict, content: str, usage: Optional[Dict] = None) -> bool:
+    """
+    Store a body generated ahead of the drain (by an OpenAI batch) on a pending row.
+    drain_queue then sends it without generating again. Token usage is kept in
+    the payload so it can be saved with the email.
+
+    Returns:
+        bool: False if the row was claimed or already had a body
+    """
+    fields = {
+        "generated_content": content,
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    if usage:
+        fields["payload"] = {**(item.get("payload") or {}), "usage": usage}
+    response = supabase.table(QUEUE_TABLE).update(fields).eq(
+        "id", item["id"]
+    ).eq("state", "pending").is_("generated_content", "null").execute()
+    return bool(response.data)
+
+def hold_pending(supabase, ids: List[str], seconds: float, page_size: int = 200) -> List[str]:
+    """
+    Make pending rows without a body unclaimable for `seconds`, by pushing their
+    available_at back, while their bodies are generated elsewhere (an OpenAI
+    batch). A worker that dies holding them only delays them by `seconds`.
+
+    Returns:
+        List[str]: Ids of the rows held; rows already claimed or generated are left out
+    """
+    held = []
+    for start in range(0, len(ids), page_size):
+        response = supabase.table(QUEUE_TABLE).update({
+            "available_at": _seconds_from_now(seconds),
+        }).in_("id", ids[start:start + page_size]).eq("state", "pending").is_("generated_content", "null").execute()
+        held.extend(row["id"] for row in response.data or [])
+    return held
+
+def release_held(supabase, ids: List[str], page_size: int = 200) -> int:
+    """Make rows held by hold_pending claimable again at once. Returns the number released."""
+    released = 0
+    for start in range(0, len(ids), page_size):
+        response = supabase.table(QUEUE_TABLE).update({
+            "available_at": _seconds_from_now(0),
+        }).in_("id", ids[start:start + page_size]).eq("state", "pending").execute()
+        released += len(response.data or [])
+    return released
+
+def renew_lease(supabase, item: Dict, worker_id: str,
+                lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+    """Extend the lease on a row. Returns False if the lease was lost."""
+    return _update_leased(supabase, item, worker_id, {"lease_expires_at": _seconds_from_now(lease_seconds)})
+
+def complete(supabase, item: Dict, worker_id: str) -> bool:
+    """Mark a row done after its email has been delivered."""
+    return _update_leased(supabase, item, worker_id, {
+        "state": "done",
+        "completed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": None,
+    })
+
+def mark_delivered(supabase, item: Dict, note: str) -> bool:
+    """
+    Mark a row done after its email was delivered by a worker that lost the
+    lease meanwhile, so the row's new owner doesn't send the email again.
+    """
+    response = supabase.table(QUEUE_TABLE).update({
+        "state": "done",
+        "completed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": note,
+    }).eq("id", item["id"]).neq("state", "done").execute()
+    return bool(response.data)
+
+def release_failed(supabase, item: Dict, worker_id: str, error: str) -> bool:
+    """
+    Release a row after a failed attempt.
+    The row goes back to pending with an exponential backoff before it can be
+    retried, or to failed once it is out of attempts.
+    """
+    attempts = item.get("attempts", 1)
+    out_of_attempts = attempts >= item.get("max_attempts", 5)
+    return _update_leased(supabase, item, worker_id, {
+        "state": "failed" if out_of_attempts else "pending",
+        "available_at": _seconds_from_now(RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)),
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": str(error)[:1000],
+    })
+
+def count_run_rows(supabase, run_id: str, states: List[str]) -> int:
+    """Count the queue rows a cron run enqueued that are in one of `states`."""
+    response = (
+        supabase.table(QUEUE_TABLE)
+        .select("id", count="exact")
+        .eq("run_id", run_id)
+        .in_("state", states)
+        .limit(1)
+        .execute()
+    )
+    return response.count or 0
+
+def describe(item: Dict) -> str:
+    """Human readable recipient for log lines."""
+    return (item.get("payload") or {}).get("email") or item["auth_user_id"]
+
+async def drain_queue(supabase, kinds: List[str],
+                      generate: Callable[[Dict], str],
+                      deliver: Callable[[Dict, str], None],
+                      prepare: Optional[Callable[[List[Dict]], None]] = None,
+                      worker_id: Optional[str] = None,
+                      openai_concurrency: int = DEFAULT_OPENAI_CONCURRENCY,
+                      sendgrid_concurrency: int = DEFAULT_SENDGRID_CONCURRENCY,
+                      lease_seconds: int = DEFAULT_LEASE_SECONDS,
+                      should_stop: Optional[Callable[[], bool]] = None) -> Tuple[int, int]:
+    """
+    Claim and process queued emails until no claimable rows are left.
+
+    Each row is isolated: generate(item) produces the body (skipped when a
+    previous attempt already stored one), the body is stored, deliver(item, body)
+    sends it, and the row is marked done. A delivered row is never released
+    for a retry: marking it done is retried, and a row whose lease expired
+    during delivery is marked done anyway. If given, prepare(items) runs once per
+    claimed chunk so handlers can bulk-load what they need in a few queries
+    instead of one round trip per row. The blocking calls run on a thread
+    pool; semaphores keep at most `openai_concurrency` generations and
+    `sendgrid_concurrency` deliveries in flight. Handlers may be plain functions
+    or coroutine functions; coroutines run directly on the event loop.
+
+    At most openai_concurrency + sendgrid_concurrency rows are in flight. As
+    rows finish, more are claimed to fill the freed slots (once at least
+    half of them are free, so prepare still loads rows in bulk), so one
+    slow row never holds the rest of its chunk's slots idle.
+    If should_stop() returns True, no further rows are claimed and the
+    call returns once the rows already claimed are finished.
+
+    Returns:
+        Tuple[int, int]: (success_count, error_count)
+    """
+    worker_id = worker_id or new_worker_id()
+    openai_slots = asyncio.Semaphore(openai_concurrency)
+    sendgrid_slots = asyncio.Semaphore(sendgrid_concurrency)
+    window = openai_concurrency + sendgrid_concurrency
+    refill_size = max(1, window // 2)
+
+    loop = asyncio.get_running_loop()
+    # One thread per row in flight, plus one for claims
+    executor = ThreadPoolExecutor(max_workers=window + 1)
+
+    async def run_blocking(func, *args):
+        return await loop.run_in_executor(executor, func, *args)
+
+    async def call(func, *args):
+        # Handlers may be coroutines (pooled async clients) or blocking functions
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args)
+        return await run_blocking(func, *args)
+
+    async def process(item):
+        label = describe(item)
+        try:
+            print(f"Sending {item['kind']} email to {label}...")
+            content = item.get("generated_content")
+            if content:
+                print(f"↻ Reusing stored content for {label} (attempt {item.get('attempts')})")
+                still_leased = await run_blocking(renew_lease, supabase, item, worker_id, lease_seconds)
+            else:
+                async with openai_slots:
+                    content = await call(generate, item)
+                still_leased = await run_blocking(record_generated, supabase, item, worker_id, content, lease_seconds)
+            if not still_leased:
+                raise RuntimeError("lease lost before sending, leaving row to its new owner")
+
+            async with sendgrid_slots:
+                await call(deliver, item, content)
+        except Exception as e:
+            print(f"✗ Failed to send to {label}: {e}")
+            try:
+                await run_blocking(release_failed, supabase, item, worker_id, str(e))
+            except Exception as release_error:
+                logger.error(f"Failed to release queue row {item['id']}: {release_error}")
+            return False
+
+        if not await record_delivered(item):
+            return False
+        print(f"✓ Successfully sent to {label}")
+        return True
+
+    async def record_delivered(item):
+        # Sent: the row is never released from here on, or the next drain would send it again
+        for attempt in range(COMPLETE_ATTEMPTS):
+            try:
+                if await run_blocking(complete, supabase, item, worker_id):
+                    return True
+                logger.warning(f"Lease on queue row {item['id']} lost during delivery, marking it done")
+                await run_blocking(mark_delivered, supabase, item, "lease lost during delivery")
+                return True
+            except Exception as e:
+                logger.warning(f"Failed to mark queue row {item['id']} done (attempt {attempt + 1}): {e}")
+                if attempt + 1 < COMPLETE_ATTEMPTS:
+                    await asyncio.sleep(COMPLETE_RETRY_SECONDS * 2 ** attempt)
+        logger.error(f"Queue row {item['id']} was delivered but could not be marked done")
+        return False
+
+    success_count = 0
+    error_count = 0
+    running = set()
+    exhausted = False
+    try:
+        while True:
+            free = window - len(running)
+            if not exhausted and (free >= refill_size or not running):
+                if should_stop and should_stop():
+                    exhausted = True
+                else:
+                    # Failed rows are pushed back by their retry backoff, so they don't
+                    # come straight back into this loop
+                    items = await run_blocking(claim, supabase, worker_id, kinds, free, lease_seconds)
+                    exhausted = not items
+                    if items and prepare:
+                        try:
+                            await call(prepare, items)
+                        except Exception as e:
+                            # Handlers fall back to loading rows one at a time
+                            logger.error(f"Failed to prepare {len(items)} queue rows: {e}")
+                    running.update(asyncio.ensure_future(process(item)) for item in items)
+            if not running:
+                break
+
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result():
+                    success_count += 1
+                else:
+                    error_count += 1
+    finally:
+        for task in running:
+            task.cancel()
+        executor.shutdown(wait=False)
+
+    return success_count, error_count
@@ -3,16 +3,132 @@
 Weekly evaluation email cron job for Railway.
 This script sends weekly evaluation emails to all active users.
 
+Users are enqueued in the send queue with one row per user per ISO week
+(see Backend/send_queue.py), then the queue is drained concurrently. Rerunning
+the job in the same week only retries emails that have not been sent yet.
+
+Each run is recorded in cron_runs with a checkpoint after every enqueued page
+(see Backend/cron_runs.py), so a killed run can be resumed with --resume and
+continues in its original ISO week from the last checkpoint.
+
+With --openai-batch (or BATCH_OPENAI_BATCH=1) the evaluations are generated
+with one OpenAI batch before they are sent, at half price and outside the
+synchronous rate limits (see Backend/openai_batch.py). A batch that isn't
+finished within OPENAI_BATCH_WAIT_SECONDS stops the run; --resume waits for it again.
+
 Usage:
-    python Backend/send_weekly_evaluation_cron.py
+    python Backend/send_weekly_evaluation_cron.py [--resume RUN_ID|latest] [--openai-batch]
 
 Set your SUPABASE_URL, SUPABASE_KEY, SENDGRID_API_KEY, and OPENAI_API_KEY in environment variables.
 """
 import os
 import sys
+import argparse
+import asyncio
+import datetime
 from dotenv import load_dotenv
 from supabase import create_client
-from Backend.send_weekly_evaluation_email import send_weekly_evaluation_email
+from Backend.send_weekly_evaluation_email import (
+    get_user_context,
+    load_evaluation_contexts,
+    build_weekly_evaluation_request,
+    generate_weekly_evaluation,
+    deliver_weekly_evaluation,
+)
+from Backend import send_queue, clients, cron_runs, openai_batch
+from Backend.user_iterator import iter_user_pages, page_cursor
+
+USER_PAGE_SIZE = 500
+
+def active_verified_users(query):
+    """Filter a users query down to active, verified users."""
+    return query.eq("is_active", True).eq("is_verified", True)
+
+def current_iso_week(now=None) -> str:
+    """Return the ISO week (e.g. 2025-W31) used in weekly evaluation idempotency keys."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    year, week, _ = now.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def enqueue_weekly_evaluations(supabase, users, iso_week=None, run_id=None):
+    """Enqueue one weekly evaluation per user for the given ISO week."""
+    iso_week = iso_week or current_iso_week()
+    return send_queue.enqueue(supabase, (
+        {
+            "kind": send_queue.KIND_WEEKLY_EVALUATION,
+            "auth_user_id": user["auth_user_id"],
+            "idempotency_key": send_queue.make_idempotency_key(
+                send_queue.KIND_WEEKLY_EVALUATION, user["auth_user_id"], iso_week
+            ),
+            "payload": {"email": user["email"]},
+            "run_id": run_id,
+        }
+        for user in users
+    ))
+
+def enqueue_run(supabase, run) -> int:
+    """
+    Stream all active, verified users and enqueue them page by page in the
+    run's ISO week, continuing after the run's last checkpoint and
+    checkpointing after each page, then mark the run enqueued.
+
+    Returns:
+        int: Users enqueued by the run, including earlier attempts
+    """
+    total_users = run.get("enqueued_count") or 0
+    for page in iter_user_pages(supabase, "auth_user_id, email", filters=active_verified_users,
+                                page_size=USER_PAGE_SIZE, start_after=cron_runs.run_cursor(run)):
+        enqueue_weekly_evaluations(supabase, page, run["params"]["iso_week"], run_id=run["id"])
+        total_users += len(page)
+        cron_runs.checkpoint(supabase, run, page_cursor(page), total_users)
+    cron_runs.mark_enqueued(supabase, run, total_users)
+    return total_users
+
+async def generate_from_queue(item):
+    user = await asyncio.to_thread(get_user_context, item["payload"]["email"])
+    return await generate_weekly_evaluation(user)
+
+async def deliver_from_queue(item, email_text):
+    await deliver_weekly_evaluation(item["payload"]["email"], email_text, auth_user_id=item["auth_user_id"])
+
+def build_batch_requests(items):
+    """
+    Build the OpenAI batch requests for a page of queue rows, keyed by row id.
+    Profiles and history are bulk-loaded for the page. A row that can't be
+    built, for any reason, is logged and left out: the synchronous drain
+    generates it and records any failure on the row.
+    """
+    try:
+        users = load_evaluation_contexts(list({item["auth_user_id"] for item in items}))
+    except Exception as e:
+        print(f"⚠️ Failed to load evaluation contexts for a page of {len(items)} rows: {e}")
+        return {}
+    requests = {}
+    for item in items:
+        try:
+            user = users.get(item["auth_user_id"])
+            if user is None:
+                raise ValueError(f"User profile not found: {item['payload']['email']}")
+            requests[item["id"]] = build_weekly_evaluation_request(user)
+        except Exception as e:
+            print(f"⚠️ Skipping {send_queue.describe(item)} in the OpenAI batch: {e}")
+    return requests
+
+def read_batch_completion(item, completion):
+    """The evaluation text of a batch result (evaluations save no token usage)."""
+    content = completion.choices[0].message.content
+    if not content:
+        raise ValueError("empty evaluation")
+    return content, None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Send Bennie weekly evaluation emails.")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                        help="resume a previous run by id, or 'latest' for the most recent unfinished one")
+    parser.add_argument("--openai-batch", action="store_true",
+                        default=os.getenv("BATCH_OPENAI_BATCH", "").lower() in ("1", "true", "yes"),
+                        help="generate the evaluations with the OpenAI Batch API before sending")
+    return parser.parse_args(argv)
 
 def main():
     load_dotenv()
@@ -23,40 +139,68 @@ def main():
         sys.exit(1)
     
     supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    args = parse_args()
     
     print("🚀 Starting weekly evaluation email job...")
     
+    if args.resume:
+        try:
+            run = cron_runs.load_run(supabase, cron_runs.JOB_WEEKLY_EVALUATION, args.resume)
+        except ValueError as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+        resumed = True
+    else:
+        run = cron_runs.start_run(supabase, cron_runs.JOB_WEEKLY_EVALUATION, {"iso_week": current_iso_week()})
+        resumed = False
+    for line in cron_runs.describe_run(run, resumed):
+        print(line)
+    
+    if run["state"] == "completed":
+        print("Run already completed, nothing to do.")
+        return
+    
+    iso_week = run["params"]["iso_week"]
+    
     try:
-        # Get all active, verified users
-        users_resp = supabase.table("users").select("email").eq("is_active", True).eq("is_verified", True).execute()
+        total_users = run.get("enqueued_count") or 0
+        if run["state"] != "enqueued":
+            total_users = enqueue_run(supabase, run)
         
-        if not users_resp.data:
+        if not total_users:
             print("No active/verified users found for weekly evals.")
+            cron_runs.finish_run(supabase, run, 0, 0)
             return
         
-        print(f"Found {len(users_resp.data)} users for weekly evaluations")
+        print(f"Found {total_users} users for weekly evaluations ({iso_week})")
         
-        success_count = 0
-        error_count = 0
-        
-        for user in users_resp.data:
-            email = user["email"]
+        if args.openai_batch or run["params"].get("openai_batch_id"):
             try:
-                print(f"Sending weekly evaluation to {email}...")
-                send_weekly_evaluation_email(email)
-                success_count += 1
-                print(f"✓ Weekly evaluation email sent to {email}")
-            except Exception as e:
-                error_count += 1
-                print(f"✗ Failed to send weekly evaluation to {email}: {e}")
+                stored, failed = openai_batch.pregenerate_run(supabase, run, build_batch_requests, read_batch_completion)
+            except TimeoutError as e:
+                print(f"⏳ {e}")
+                print(f"Resume with: --resume {run['id']}")
+                return
+            print(f"OpenAI batch: {stored} evaluations generated, {failed} failed (generated synchronously)")
+        
+        success_count, error_count = clients.run(send_queue.drain_queue(
+            supabase,
+            [send_queue.KIND_WEEKLY_EVALUATION],
+            generate_from_queue,
+            deliver_from_queue,
+        ))
+        cron_runs.finish_run(supabase, run, success_count, error_count)
         
         print(f"\n📊 Weekly Evaluation Summary:")
-        print(f"Total users: {len(users_resp.data)}")
+        print(f"Run id: {run['id']}")
+        print(f"Total users: {total_users}")
         print(f"Successful: {success_count}")
         print(f"Failed: {error_count}")
         
     except Exception as e:
+        cron_runs.finish_run(supabase, run, 0, 0, error=str(e))
         print(f"Weekly evaluation job failed: {e}")
+        print(f"Resume with: --resume {run['id']}")
         sys.exit(1)
 
 if __name__ == "__main__":
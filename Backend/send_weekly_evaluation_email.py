@@ -1,13 +1,15 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client
-from openai import OpenAI
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 import logging
 from typing import List, Dict
 import sys
+import asyncio
 import datetime
+from Backend import clients
+from Backend.email_metadata import build_email_metadata, extract_vocabulary, has_metadata
+from Backend.proficiency import level_to_semester
+from Backend.profile_cache import profile_cache
 
 # --- CONFIG ---
 load_dotenv()
@@ -20,44 +22,52 @@ if not (SUPABASE_URL and SUPABASE_KEY and OPENAI_API_KEY and SENDGRID_API_KEY):
     print("Missing required environment variables.")
     sys.exit(1)
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+supabase = clients.get_supabase()
 logger = logging.getLogger(__name__)
 
-# --- LEVEL TO SEMESTER MAPPING ---
-def level_to_semester(level: int) -> tuple[int, str]:
-    if level <= 12:
-        return 1, "Absolute beginner. Greetings, basic phrases, simple questions. Equivalent to first semester college language student."
-    elif level <= 25:
-        return 2, "Beginner. Simple present tense, basic questions, daily life topics. Equivalent to second semester."
-    elif level <= 37:
-        return 3, "Lower intermediate. Past/future tense, more vocabulary, short stories. Equivalent to third semester."
-    elif level <= 50:
-        return 4, "Intermediate. Complex sentences, opinions, short essays. Equivalent to fourth semester."
-    elif level <= 62:
-        return 5, "Upper intermediate. Argumentation, abstract topics, intro to literature. Equivalent to fifth semester."
-    elif level <= 75:
-        return 6, "Advanced. Advanced readings, idioms, cultural nuance. Equivalent to sixth semester."
-    elif level <= 87:
-        return 7, "Very advanced. Academic/professional topics, debates, research. Equivalent to seventh semester."
-    else:
-        return 8, "Near-native. Literature, advanced writing, slang, full fluency. Equivalent to eighth (final) semester."
+# Bennie emails and user replies each evaluation looks at
+EVALUATION_HISTORY_LIMIT = 3
 
 # --- FETCH USER DATA ---
 def get_user_context(user_email: str) -> Dict:
-    # Get auth user first
-    auth_user = supabase.auth.admin.get_user_by_email(user_email)
-    if not auth_user:
-        raise ValueError(f"User not found: {user_email}")
-    
-    # Get user profile
-    resp = supabase.table("users").select("auth_user_id, name, target_language, proficiency_level").eq("auth_user_id", auth_user.id).execute()
-    if not resp.data:
+    # Get user profile through the profile cache shared with the API, loaded on a
+    # miss with the case-insensitive lookup (see database/user_email_lookup.sql)
+    def load_profile():
+        resp = supabase.rpc("get_user_by_email", {"p_email": user_email}).execute()
+        return resp.data[0] if resp.data else None
+
+    user = profile_cache.get_or_load(load_profile, email=user_email)
+    if user is None:
         raise ValueError(f"User profile not found: {user_email}")
-    return resp.data[0]
+    return user
+
+def load_evaluation_contexts(auth_user_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Load the evaluation inputs of a whole page of users in two queries: the
+    profiles from one `in` select on public.users, and their last
+    EVALUATION_HISTORY_LIMIT Bennie emails and replies from one call to the
+    get_evaluation_history Postgres function (database/evaluation_history.sql).
+
+    Returns:
+        Dict[str, Dict]: Profile with its "bennie_emails" and "user_replies", keyed by
+        auth_user_id, for build_weekly_evaluation_request. Users without a profile are left out.
+    """
+    if not auth_user_ids:
+        return {}
+    users_resp = supabase.table("users").select("auth_user_id, name, target_language, proficiency_level").in_("auth_user_id", auth_user_ids).execute()
+    users = {user["auth_user_id"]: dict(user, bennie_emails=[], user_replies=[]) for user in users_resp.data or []}
+    history_resp = supabase.rpc("get_evaluation_history", {
+        "p_auth_user_ids": list(users),
+        "p_limit": EVALUATION_HISTORY_LIMIT
+    }).execute() if users else None
+    for row in sorted(history_resp.data if history_resp else [], key=lambda row: row["created_at"], reverse=True):
+        user = users.get(row["auth_user_id"])
+        if user is not None:
+            user["bennie_emails" if row["is_from_bennie"] else "user_replies"].append(row)
+    return users
 
 def get_last_n_bennie_emails(auth_user_id: str, n: int = 3) -> List[Dict]:
-    resp = supabase.table("email_history").select("id, content, created_at").eq("auth_user_id", auth_user_id).eq("is_from_bennie", True).order("created_at", desc=True).limit(n).execute()
+    resp = supabase.table("email_history").select("id, content, created_at, vocabulary, language").eq("auth_user_id", auth_user_id).eq("is_from_bennie", True).order("created_at", desc=True).limit(n).execute()
     return resp.data or []
 
 def get_last_n_user_replies(auth_user_id: str, n: int = 3) -> List[Dict]:
@@ -102,14 +112,13 @@ def estimate_reply_level(replies: List[Dict]) -> tuple[int, int, str]:
     return level, semester, desc
 
 def get_vocab_from_bennie_emails(bennie_emails: List[Dict]) -> List[str]:
-    """Extract vocabulary words from Bennie's emails."""
+    """Vocabulary words of Bennie's emails, stored at send time or parsed from older emails."""
     vocab = []
     for email in bennie_emails:
-        content = email["content"]
-        # Look for vocabulary sections at the end of emails
-        if "Vocabulary:" in content or "New words:" in content:
-            vocab_section = content.split("Vocabulary:")[-1].split("New words:")[-1]
-            vocab.extend([line.strip() for line in vocab_section.split("\n") if line.strip()])
+        if has_metadata(email):
+            vocab.extend(email.get("vocabulary") or [])
+        else:
+            vocab.extend(extract_vocabulary(email["content"]))
     return vocab
 
 def get_progress_tracker(auth_user_id: str, user_replies: List[Dict], bennie_emails: List[Dict]) -> str:
@@ -177,7 +186,7 @@ Vocabulary recap:
 """
 
 # --- SEND EMAIL ---
-def send_evaluation_email(user_email: str, subject: str, html_content: str, plain_content: str, auth_user_id: str = None):
+async def send_evaluation_email(user_email: str, subject: str, html_content: str, plain_content: str, auth_user_id: str = None):
     message = Mail(
         from_email='Bennie@itsbennie.com',
         to_emails=user_email,
@@ -185,48 +194,76 @@ def send_evaluation_email(user_email: str, subject: str, html_content: str, plai
         html_content=html_content,
         plain_text_content=plain_content
     )
-    sg = SendGridAPIClient(SENDGRID_API_KEY)
-    response = sg.send(message)
+    response = await clients.get_async_sendgrid().send(message)
     if response.status_code == 202:
         print(f"✓ Evaluation email sent to {user_email}")
         # Log to email_history with is_evaluation=True if auth_user_id is provided
         if auth_user_id is not None:
             try:
-                supabase.table("email_history").insert({
+                await asyncio.to_thread(supabase.table("email_history").insert({
                     "auth_user_id": auth_user_id,
                     "content": plain_content,
                     "is_from_bennie": True,
                     "is_evaluation": True,
-                    "difficulty_level": 1  # Evaluation emails are in English
-                }).execute()
+                    "difficulty_level": 1,  # Evaluation emails are in English
+                    **build_email_metadata(plain_content, "english")
+                }).execute)
             except Exception as e:
                 print(f"⚠️ Failed to log evaluation email to history: {e}")
     else:
         print(f"⚠️ Failed to send email: {response.status_code}")
         print(response.body)
+        raise RuntimeError(f"SendGrid error: {response.status_code} {response.body}")
 
-# --- MAIN FUNCTION FOR SCHEDULER/IMPORT ---
-def send_weekly_evaluation_email(user_email: str):
-    user = get_user_context(user_email)
+# --- GENERATE AND DELIVER (used by the send queue) ---
+def build_weekly_evaluation_request(user: Dict) -> Dict:
+    """
+    Build the evaluation prompt for a user (from get_user_context, or from
+    load_evaluation_contexts with the user's history already loaded).
+
+    Returns:
+        Dict: Arguments for chat.completions.create, also used as the body of
+        an OpenAI Batch API request (see Backend/openai_batch.py)
+    """
     auth_user_id = user["auth_user_id"]
-    bennie_emails = get_last_n_bennie_emails(auth_user_id, 3)
-    user_replies = get_last_n_user_replies(auth_user_id, 3)
+    if "bennie_emails" in user:
+        bennie_emails, user_replies = user["bennie_emails"], user["user_replies"]
+    else:
+        bennie_emails = get_last_n_bennie_emails(auth_user_id, EVALUATION_HISTORY_LIMIT)
+        user_replies = get_last_n_user_replies(auth_user_id, EVALUATION_HISTORY_LIMIT)
     avg_len, len_feedback = analyze_reply_length(user_replies)
     reply_level, semester, semester_desc = estimate_reply_level(user_replies)
     vocab = get_vocab_from_bennie_emails(bennie_emails)
     progress_tracker = get_progress_tracker(auth_user_id, user_replies, bennie_emails)
     prompt = build_evaluation_prompt(user, bennie_emails, user_replies, avg_len, len_feedback, reply_level, semester, semester_desc, vocab, progress_tracker)
+    return {
+        "model": "gpt-4o",
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": 700,
+        "temperature": 0.7
+    }
+
+async def generate_weekly_evaluation(user: Dict) -> str:
+    """Build the evaluation prompt for a user (from get_user_context) and generate the email text with OpenAI."""
+    request = await asyncio.to_thread(build_weekly_evaluation_request, user)
 
     # Get response from OpenAI
-    resp = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=700,
-        temperature=0.7
-    )
-    email_text = resp.choices[0].message.content
+    resp = await clients.create_chat_completion(**request)
+    return resp.choices[0].message.content
+
+async def deliver_weekly_evaluation(user_email: str, email_text: str, auth_user_id: str = None):
+    """Send a generated evaluation email and log it to email history."""
     html_content = f"<html><body style='font-family: Arial, sans-serif; line-height: 1.6;'>{email_text.replace(chr(10), '<br>')}</body></html>"
-    send_evaluation_email(user_email, "Your Weekly Language Progress with Bennie!", html_content, email_text, auth_user_id=auth_user_id)
+    await send_evaluation_email(user_email, "Your Weekly Language Progress with Bennie!", html_content, email_text, auth_user_id=auth_user_id)
+
+# --- MAIN FUNCTION FOR SCHEDULER/IMPORT ---
+async def send_weekly_evaluation_email_async(user_email: str):
+    user = await asyncio.to_thread(get_user_context, user_email)
+    email_text = await generate_weekly_evaluation(user)
+    await deliver_weekly_evaluation(user_email, email_text, auth_user_id=user["auth_user_id"])
+
+def send_weekly_evaluation_email(user_email: str):
+    clients.run(send_weekly_evaluation_email_async(user_email))
 
 # --- CLI ENTRY POINT ---
 def main():
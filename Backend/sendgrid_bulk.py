@@ -0,0 +1,192 @@
+"""
+Bulk sends of templated (non-LLM) emails through SendGrid v3 personalizations.
+
+Instead of one Mail and one HTTP call per recipient, recipients that share a
+template are grouped into a single /v3/mail/send request: the body is rendered
+once with substitution tags (e.g. -name-) and every recipient gets their own
+personalization carrying the values for those tags. SendGrid accepts up to
+1000 personalizations per request, so thousands of emails take a few dozen
+calls.
+
+Broadcasts (announcements to every active user, or to the learners of one
+language) go out this way: send_broadcast streams the users one page of 1000
+at a time and sends each page as one request, with -name- substituted per
+recipient. Welcome and exit emails are sent one at a time, when a user signs
+up or unsubscribes (Backend/new_user_email.py, Backend/user_exit_email.py).
+
+Usage:
+    python Backend/sendgrid_bulk.py --subject "Bennie news, -name-!" --html news.html --text news.txt [--language spanish] [--dry-run]
+
+Set SENDGRID_API_BASE to point at Backend/sendgrid_stub.py to record payloads offline.
+"""
+import os
+import sys
+import argparse
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from Backend import clients
+from Backend.proficiency import LANGUAGE_ALIASES, normalize_language
+from Backend.user_iterator import iter_user_pages
+
+logger = logging.getLogger(__name__)
+
+FROM_EMAIL = "Bennie@itsbennie.com"
+# SendGrid v3 limit on personalizations (and total recipients) per request
+MAX_PERSONALIZATIONS_PER_REQUEST = 1000
+
+NAME_TAG = "-name-"
+
+def chunked(items: List, size: int) -> Iterator[List]:
+    """Yield consecutive slices of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def build_bulk_payload(recipients: List[Dict], subject: str, html_content: str,
+                       plain_text_content: str, from_email: str = FROM_EMAIL,
+                       click_tracking: bool = True) -> Dict:
+    """
+    Build one v3 mail/send payload with a personalization per recipient.
+
+    Args:
+        recipients (List[Dict]): Dicts with email, optional name and optional
+            substitutions ({tag: value}) applied to the subject and content
+        subject (str): Subject line, may contain substitution tags
+        html_content (str): HTML body, may contain substitution tags
+        plain_text_content (str): Plain text body, may contain substitution tags
+        from_email (str): Sender address
+        click_tracking (bool): Whether SendGrid may rewrite links for click tracking
+
+    Returns:
+        Dict: JSON payload for POST /v3/mail/send
+    """
+    if len(recipients) > MAX_PERSONALIZATIONS_PER_REQUEST:
+        raise ValueError(
+            f"{len(recipients)} recipients exceeds the SendGrid limit of "
+            f"{MAX_PERSONALIZATIONS_PER_REQUEST} per request"
+        )
+
+    personalizations = []
+    for recipient in recipients:
+        to = {"email": recipient["email"]}
+        if recipient.get("name"):
+            to["name"] = recipient["name"]
+        personalization = {"to": [to]}
+        substitutions = recipient.get("substitutions")
+        if substitutions:
+            personalization["substitutions"] = {tag: str(value) for tag, value in substitutions.items()}
+        personalizations.append(personalization)
+
+    payload = {
+        "personalizations": personalizations,
+        "from": {"email": from_email},
+        "subject": subject,
+        # text/plain must come before text/html
+        "content": [
+            {"type": "text/plain", "value": plain_text_content},
+            {"type": "text/html", "value": html_content},
+        ],
+    }
+    if not click_tracking:
+        payload["tracking_settings"] = {"click_tracking": {"enable": False, "enable_text": False}}
+    return payload
+
+def send_bulk(recipients: Iterable[Dict], subject: str, html_content: str,
+              plain_text_content: str, client=None,
+              chunk_size: int = MAX_PERSONALIZATIONS_PER_REQUEST,
+              from_email: str = FROM_EMAIL, click_tracking: bool = True) -> Tuple[int, int]:
+    """
+    Send one templated email to many recipients, one request per chunk.
+
+    A chunk is accepted or rejected as a whole, so a failed request counts all
+    of its recipients as failed.
+
+    Args:
+        recipients: Dicts as accepted by build_bulk_payload
+        client: SendGrid client with a send(payload) method; defaults to the pooled client
+        chunk_size (int): Personalizations per request, at most 1000
+
+    Returns:
+        Tuple[int, int]: (recipients_accepted, recipients_failed)
+    """
+    recipients = list(recipients)
+    client = client or clients.get_sendgrid()
+    chunk_size = min(chunk_size, MAX_PERSONALIZATIONS_PER_REQUEST)
+
+    sent_count = 0
+    failed_count = 0
+    for chunk in chunked(recipients, chunk_size):
+        payload = build_bulk_payload(chunk, subject, html_content, plain_text_content,
+                                     from_email=from_email, click_tracking=click_tracking)
+        try:
+            response = client.send(payload)
+            if response.status_code != 202:
+                raise RuntimeError(f"Unexpected status code {response.status_code}: {response.body}")
+            sent_count += len(chunk)
+            print(f"✓ Bulk request accepted for {len(chunk)} recipients")
+        except Exception as e:
+            failed_count += len(chunk)
+            print(f"✗ Bulk request failed for {len(chunk)} recipients: {e}")
+    return sent_count, failed_count
+
+def language_values(language: str) -> List[str]:
+    """The target_language values stored for a language, aliases included ('mandarin' -> ['mandarin', 'chinese'])."""
+    language = normalize_language(language)
+    return [language] + [alias for alias, key in LANGUAGE_ALIASES.items() if key == language]
+
+def send_broadcast(supabase, subject: str, html_content: str, plain_text_content: str,
+                   language: Optional[str] = None, client=None, dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Send one templated email to every active, verified user (or only the
+    learners of `language`), one request per page of 1000 users. NAME_TAG in
+    the subject and content is replaced by each user's name.
+
+    Returns:
+        Tuple[int, int]: (recipients_accepted, recipients_failed); with dry_run, (recipients, 0) and nothing is sent
+    """
+    def audience(query):
+        query = query.eq("is_active", True).eq("is_verified", True)
+        return query.in_("target_language", language_values(language)) if language else query
+
+    sent_count = 0
+    failed_count = 0
+    for page in iter_user_pages(supabase, "name, email", filters=audience,
+                                page_size=MAX_PERSONALIZATIONS_PER_REQUEST):
+        recipients = [
+            {"email": user["email"], "substitutions": {NAME_TAG: user.get("name") or "there"}}
+            for user in page if user.get("email")
+        ]
+        if dry_run:
+            sent_count += len(recipients)
+            continue
+        sent, failed = send_bulk(recipients, subject, html_content, plain_text_content, client=client)
+        sent_count += sent
+        failed_count += failed
+    return sent_count, failed_count
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Send a templated broadcast email to Bennie users in bulk.")
+    parser.add_argument("--subject", required=True, help=f"subject line; {NAME_TAG} is replaced by each user's name")
+    parser.add_argument("--html", required=True, metavar="PATH", help="HTML body file")
+    parser.add_argument("--text", required=True, metavar="PATH", help="plain text body file")
+    parser.add_argument("--language", help="only send to learners of this language")
+    parser.add_argument("--dry-run", action="store_true", help="count the recipients without sending")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    load_dotenv()
+    with open(args.html) as f:
+        html_content = f.read()
+    with open(args.text) as f:
+        plain_text_content = f.read()
+    sent, failed = send_broadcast(clients.get_supabase(), args.subject, html_content, plain_text_content,
+                                  language=args.language, dry_run=args.dry_run)
+    print(f"📊 Broadcast {'would reach' if args.dry_run else 'accepted for'} {sent} recipients, {failed} failed")
+    return sent, failed
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Local stand-in for the SendGrid v3 mail/send endpoint.
+
+Records every payload it receives and answers 202, so senders can be exercised
+offline. Use it in-process through an httpx transport:
+
+    stub = RecordingSendGrid()
+    send_broadcast(supabase, subject, html, text, client=stub.client())
+    assert len(stub.payloads) == 3
+
+or run it as a server and point the pooled clients at it:
+
+    python Backend/sendgrid_stub.py --port 8025 --record sent.jsonl
+    SENDGRID_API_BASE=http://127.0.0.1:8025 python Backend/send_batch_learning_emails.py
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from Backend.clients import AsyncSendGridClient, SendGridClient
+
+MAIL_SEND_PATH = "/v3/mail/send"
+
+class RecordingSendGrid:
+    """Records mail/send payloads and replies with a fixed status code."""
+
+    def __init__(self, status_code: int = 202, record_path: Optional[str] = None):
+        self.status_code = status_code
+        self.record_path = record_path
+        self.payloads: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, path: str, body: bytes) -> int:
+        """Record one request and return the status code to answer with."""
+        if path != MAIL_SEND_PATH:
+            return 404
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return 400
+        with self._lock:
+            self.payloads.append(payload)
+            if self.record_path:
+                with open(self.record_path, "a") as f:
+                    f.write(json.dumps(payload) + "\n")
+        return self.status_code
+
+    @property
+    def personalizations(self) -> List[Dict]:
+        """Every personalization received, across all requests."""
+        return [p for payload in self.payloads for p in payload.get("personalizations", [])]
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        status = self.record(request.url.path, request.content)
+        return httpx.Response(status, text="" if status == 202 else "stub error")
+
+    def client(self) -> SendGridClient:
+        """A sync SendGrid client that delivers to this recorder."""
+        return SendGridClient(httpx.Client(base_url="http://sendgrid.stub",
+                                           transport=httpx.MockTransport(self._handle)))
+
+    def async_client(self) -> AsyncSendGridClient:
+        """An async SendGrid client that delivers to this recorder."""
+        return AsyncSendGridClient(httpx.AsyncClient(base_url="http://sendgrid.stub",
+                                                     transport=httpx.MockTransport(self._handle)))
+
+def make_server(recorder: RecordingSendGrid, host: str = "127.0.0.1", port: int = 8025) -> ThreadingHTTPServer:
+    """Build an HTTP server that records into `recorder` (port 0 picks a free port)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            status = recorder.record(self.path, self.rfile.read(length))
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Record SendGrid mail/send payloads locally")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--status", type=int, default=202, help="Status code to answer with")
+    parser.add_argument("--record", help="Append each payload as a JSON line to this file")
+    args = parser.parse_args()
+
+    recorder = RecordingSendGrid(status_code=args.status, record_path=args.record)
+    server = make_server(recorder, args.host, args.port)
+    print(f"SendGrid stub listening on http://{args.host}:{server.server_port}")
+    print(f"Set SENDGRID_API_BASE=http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"📊 Recorded {len(recorder.payloads)} requests, "
+              f"{len(recorder.personalizations)} personalizations")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Stable hash sharding for Bennie batch runs.
+
+Each batch invocation owns one shard out of `shard_count`, and a user belongs to
+the shard given by a stable hash of their auth_user_id. Running every shard once
+covers every active user exactly once, no matter how many users there are.
+
+The hash is users.shard_key, a stored column (database/shard_key.sql), and
+shard i of n is the i-th of n equal ranges of shard_key. A shard run selects
+its users with one range scan over idx_users_shard_key instead of reading
+every active user and hashing them itself.
+
+A shard is written as "index/count" (e.g. "3/9"). It can come from the --shard
+CLI option, the BATCH_SHARD env var, or "auto", which maps the current UTC hour
+onto the fixed daily cron slots the batch job used before per-user scheduling
+(see Backend/email_scheduler.py).
+"""
+import os
+import hashlib
+import datetime
+from typing import Optional, Tuple
+
+# UTC hours of the fixed daily batch-emails-* cron slots
+CRON_SLOT_HOURS = (6, 8, 10, 12, 14, 16, 18, 20, 22)
+
+# shard_key is a signed 64-bit integer, like the bigint column
+SHARD_KEY_MIN = -2 ** 63
+SHARD_KEY_SPAN = 2 ** 64
+
+def shard_key(auth_user_id: str) -> int:
+    """
+    Return the shard key of a user: the first 8 bytes of the SHA-256 of their
+    lowercased auth_user_id, as a signed integer. Matches users.shard_key.
+
+    Uses SHA-256 rather than hash() so the result is the same in every process.
+    """
+    digest = hashlib.sha256(str(auth_user_id).lower().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+def shard_range(shard_index: int, shard_count: int) -> Tuple[int, Optional[int]]:
+    """
+    Return the shard_key range [low, high) of a shard. high is None for the
+    last shard, whose range runs to the end of the bigint range.
+    """
+    # Ceiling division, so a key on a boundary belongs to exactly one shard
+    low = SHARD_KEY_MIN - (-shard_index * SHARD_KEY_SPAN // shard_count)
+    if shard_index == shard_count - 1:
+        return low, None
+    return low, SHARD_KEY_MIN - (-(shard_index + 1) * SHARD_KEY_SPAN // shard_count)
+
+def shard_for(auth_user_id: str, shard_count: int) -> int:
+    """Return the shard index (0..shard_count-1) for a user."""
+    return (shard_key(auth_user_id) - SHARD_KEY_MIN) * shard_count // SHARD_KEY_SPAN
+
+def in_shard(auth_user_id: str, shard_index: int, shard_count: int) -> bool:
+    """Check whether a user belongs to the given shard."""
+    return shard_for(auth_user_id, shard_count) == shard_index
+
+def shard_from_time_slot(now: Optional[datetime.datetime] = None) -> Tuple[int, int]:
+    """
+    Map the current UTC hour to a cron slot shard.
+
+    Picks the latest slot that has started, so a job that starts a few minutes
+    late still gets its own shard. Hours before the first slot map to the last one.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    hour = now.astimezone(datetime.timezone.utc).hour
+    started = [i for i, slot_hour in enumerate(CRON_SLOT_HOURS) if slot_hour <= hour]
+    index = started[-1] if started else len(CRON_SLOT_HOURS) - 1
+    return index, len(CRON_SLOT_HOURS)
+
+def parse_shard(value: str, now: Optional[datetime.datetime] = None) -> Tuple[int, int]:
+    """
+    Parse an "index/count" shard spec, or "auto" for the current time slot.
+
+    Raises:
+        ValueError: If the spec is malformed or the index is out of range
+    """
+    value = value.strip().lower()
+    if value == "auto":
+        return shard_from_time_slot(now)
+
+    try:
+        index_str, count_str = value.split("/")
+        index, count = int(index_str), int(count_str)
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected 'index/count' or 'auto'")
+
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{value}', index must be in 0..{count - 1}")
+    return index, count
+
+def resolve_shard(cli_value: Optional[str] = None) -> Optional[Tuple[int, int]]:
+    """
+    Resolve the shard for this run from the CLI option or the BATCH_SHARD env var.
+
+    Returns:
+        Optional[Tuple[int, int]]: (index, count), or None when sharding is not requested
+    """
+    value = cli_value or os.getenv("BATCH_SHARD")
+    if not value:
+        return None
+    return parse_shard(value)
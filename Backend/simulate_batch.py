@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Offline throughput simulator for the Bennie batch and weekly evaluation jobs.
+
+Runs the real enqueue and send-queue pipeline (send_batch_learning_emails or
+send_weekly_evaluation_cron handlers, send_queue.drain_queue, the pooled
+clients and the shared rate limiter) against N synthetic users, with the
+in-process fakes from Backend/fake_services.py standing in for Supabase,
+OpenAI and SendGrid. Nothing leaves the machine: dummy credentials are set
+before the senders are imported and the fakes are injected into the client
+registry.
+
+Reports emails/sec, p50/p95/p99 per pipeline stage and per upstream call,
+injected faults and 429s, and peak memory, so pipeline changes can be measured
+on a laptop.
+
+Usage:
+    python Backend/simulate_batch.py --users 2000
+    python Backend/simulate_batch.py --job weekly --users 500 --openai-latency 2.0 --openai-429-rate 0.05
+    python Backend/simulate_batch.py --users 5000 --time-scale 0.1 --json results.json
+
+Latencies are log-normal with the given median (seconds) and --latency-sigma
+spread; --time-scale multiplies every latency and Retry-After to speed up runs.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+import contextlib
+from typing import Dict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Dummy credentials so the sender modules import; every client they use is replaced by a fake
+for name, value in {
+    "SUPABASE_URL": "https://simulated.supabase.co",
+    "SUPABASE_KEY": "simulated",
+    "OPENAI_API_KEY": "sk-simulated",
+    "SENDGRID_API_KEY": "SG.simulated",
+}.items():
+    os.environ[name] = value
+
+from Backend.fake_services import (
+    CallStats,
+    FakeOpenAI,
+    FakeSendGrid,
+    FakeSupabase,
+    FaultModel,
+    LatencyModel,
+    seed_users,
+)
+from Backend import clients, rate_limiter, send_queue
+
+STAGES = ["enqueue", "prepare", "generate", "deliver"]
+UPSTREAMS = ["supabase", "openai", "sendgrid"]
+
+def timed(stats: CallStats, stage: str, func):
+    """Wrap a queue handler so each call's duration is recorded under `stage`."""
+    if asyncio.iscoroutinefunction(func):
+        async def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return await func(*args)
+            finally:
+                stats.record(stage, time.perf_counter() - start)
+    else:
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                stats.record(stage, time.perf_counter() - start)
+    return wrapper
+
+def install_database(db: FakeSupabase):
+    """Point the sender modules' Supabase clients at the fake database."""
+    from Backend import bennie_email_sender, send_weekly_evaluation_email
+    bennie_email_sender.supabase = db
+    send_weekly_evaluation_email.supabase = db
+
+def enqueue_users(db: FakeSupabase, job: str, stats: CallStats) -> int:
+    """Enqueue every synthetic user the way the cron job does, page by page."""
+    total = 0
+    if job == "batch":
+        from Backend.send_batch_learning_emails import iter_users_in_shard, enqueue_batch
+        for page in iter_users_in_shard(db, 0, 1):
+            start = time.perf_counter()
+            enqueue_batch(db, page)
+            stats.record("enqueue", time.perf_counter() - start)
+            total += len(page)
+    else:
+        from Backend.send_weekly_evaluation_cron import active_verified_users, enqueue_weekly_evaluations
+        from Backend.user_iterator import iter_user_pages
+        for page in iter_user_pages(db, "auth_user_id, email", filters=active_verified_users):
+            start = time.perf_counter()
+            enqueue_weekly_evaluations(db, page)
+            stats.record("enqueue", time.perf_counter() - start)
+            total += len(page)
+    return total
+
+def queue_handlers(job: str, stats: CallStats):
+    """The job's real prepare/generate/deliver handlers, wrapped with stage timers."""
+    if job == "batch":
+        from Backend.send_batch_learning_emails import make_batch_handlers
+        prepare, generate, deliver = make_batch_handlers()
+        kinds = [send_queue.KIND_BATCH]
+    else:
+        from Backend.send_weekly_evaluation_cron import generate_from_queue, deliver_from_queue
+        prepare, generate, deliver = None, generate_from_queue, deliver_from_queue
+        kinds = [send_queue.KIND_WEEKLY_EVALUATION]
+    return (
+        kinds,
+        timed(stats, "prepare", prepare) if prepare else None,
+        timed(stats, "generate", generate),
+        timed(stats, "deliver", deliver),
+    )
+
+async def drain(db: FakeSupabase, fake_openai: FakeOpenAI, fake_sendgrid: FakeSendGrid,
+                job: str, stats: CallStats, openai_concurrency: int, sendgrid_concurrency: int):
+    clients.register_async_client("openai", fake_openai.client())
+    clients.register_async_client("sendgrid", fake_sendgrid.client())
+    kinds, prepare, generate, deliver = queue_handlers(job, stats)
+    return await send_queue.drain_queue(
+        db, kinds, generate, deliver,
+        prepare=prepare,
+        openai_concurrency=openai_concurrency,
+        sendgrid_concurrency=sendgrid_concurrency,
+    )
+
+def simulate(args) -> Dict:
+    """Run one simulation and return its results."""
+    rng = random.Random(args.seed)
+    scale = args.time_scale
+    stats = CallStats()
+
+    def latency(median):
+        return LatencyModel(median * scale, args.latency_sigma, random.Random(rng.random()))
+
+    def faults(error_rate, rate_limit_rate):
+        return FaultModel(error_rate, rate_limit_rate, retry_after=args.retry_after * scale,
+                          rng=random.Random(rng.random()))
+
+    db = FakeSupabase(latency(args.supabase_latency), faults(args.supabase_error_rate, 0), stats)
+    fake_openai = FakeOpenAI(latency(args.openai_latency), faults(args.openai_error_rate, args.openai_429_rate), stats,
+                             requests_per_minute=args.openai_rpm, tokens_per_minute=args.openai_tpm)
+    fake_sendgrid = FakeSendGrid(latency(args.sendgrid_latency), faults(args.sendgrid_error_rate, args.sendgrid_429_rate), stats)
+
+    send_queue.RETRY_BACKOFF_SECONDS = args.retry_backoff
+    # Fresh limiters for every simulation, the OpenAI one seeded with the simulated
+    # account's limits as OPENAI_RPM/OPENAI_TPM would in production
+    rate_limiter.reset({rate_limiter.OPENAI: rate_limiter.RateLimiter(
+        rate_limiter.OPENAI, requests_per_minute=args.openai_rpm, tokens_per_minute=args.openai_tpm)})
+    install_database(db)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    seed_users(db, args.users, history_per_user=args.history, seed=args.seed)
+    dataset_bytes = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+    if args.trace_memory:
+        tracemalloc.reset_peak()
+
+    started = time.perf_counter()
+    with contextlib.ExitStack() as output:
+        if not args.verbose:
+            output.enter_context(contextlib.redirect_stdout(output.enter_context(open(os.devnull, "w"))))
+        enqueued = enqueue_users(db, args.job, stats)
+        enqueued_at = time.perf_counter()
+        success_count, error_count = clients.run(drain(
+            db, fake_openai, fake_sendgrid, args.job, stats,
+            args.openai_concurrency, args.sendgrid_concurrency,
+        ))
+    finished = time.perf_counter()
+
+    peak_bytes = 0
+    if args.trace_memory:
+        peak_bytes = tracemalloc.get_traced_memory()[1] - dataset_bytes
+        tracemalloc.stop()
+
+    elapsed = finished - started
+    return {
+        "job": args.job,
+        "users": args.users,
+        "enqueued": enqueued,
+        "sent": success_count,
+        "failed": error_count,
+        "elapsed_seconds": elapsed,
+        "enqueue_seconds": enqueued_at - started,
+        "emails_per_second": success_count / elapsed if elapsed else 0.0,
+        "stages": {name: stats.percentiles(name) for name in STAGES if name in stats.durations},
+        "upstreams": {name: stats.percentiles(name) for name in UPSTREAMS if name in stats.durations},
+        "counts": dict(sorted(stats.counts.items())),
+        "rate_limited": {name: rate_limiter.get_limiter(name).rate_limited_count
+                         for name in (rate_limiter.OPENAI, rate_limiter.SENDGRID)},
+        "dataset_mb": dataset_bytes / 2 ** 20,
+        "peak_pipeline_mb": peak_bytes / 2 ** 20,
+    }
+
+def print_report(result: Dict):
+    def ms(value):
+        return f"{value * 1000:9.1f}"
+
+    print(f"\n📊 Simulated {result['job']} run: {result['users']} users")
+    print(f"Sent: {result['sent']}  Failed: {result['failed']}  Enqueued: {result['enqueued']}")
+    print(f"Elapsed: {result['elapsed_seconds']:.2f}s (enqueue {result['enqueue_seconds']:.2f}s)")
+    print(f"Throughput: {result['emails_per_second']:.1f} emails/sec")
+    print(f"\n{'stage (ms)':<16}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for section in ("stages", "upstreams"):
+        for name, p in result[section].items():
+            label = name if section == "stages" else f"{name} call"
+            print(f"{label:<16}{ms(p[50])}{ms(p[95])}{ms(p[99])}")
+    print(f"\nRate limiter 429s: openai {result['rate_limited']['openai']}, sendgrid {result['rate_limited']['sendgrid']}")
+    injected = {k: v for k, v in result["counts"].items() if "injected" in k}
+    if injected:
+        print("Injected faults: " + ", ".join(f"{k} {v}" for k, v in injected.items()))
+    if result["dataset_mb"] or result["peak_pipeline_mb"]:
+        print(f"Memory: dataset {result['dataset_mb']:.1f} MB, peak pipeline {result['peak_pipeline_mb']:.1f} MB")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a Bennie batch or weekly run offline.")
+    parser.add_argument("--job", choices=["batch", "weekly"], default="batch")
+    parser.add_argument("--users", type=int, default=1000, help="number of synthetic users")
+    parser.add_argument("--history", type=int, default=6, help="email_history rows per user")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--openai-concurrency", type=int, default=send_queue.DEFAULT_OPENAI_CONCURRENCY)
+    parser.add_argument("--sendgrid-concurrency", type=int, default=send_queue.DEFAULT_SENDGRID_CONCURRENCY)
+    parser.add_argument("--supabase-latency", type=float, default=0.02, help="median seconds per Supabase call")
+    parser.add_argument("--openai-latency", type=float, default=1.5, help="median seconds per completion")
+    parser.add_argument("--sendgrid-latency", type=float, default=0.15, help="median seconds per send")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="log-normal spread of every latency (0 = fixed)")
+    parser.add_argument("--supabase-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-429-rate", type=float, default=0.0)
+    parser.add_argument("--sendgrid-error-rate", type=float, default=0.0)
+    parser.add_argument("--sendgrid-429-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--openai-rpm", type=int, default=10000, help="account limit reported in x-ratelimit headers")
+    parser.add_argument("--openai-tpm", type=int, default=2000000, help="account limit reported in x-ratelimit headers")
+    parser.add_argument("--retry-backoff", type=float, default=0.0,
+                        help="send queue retry backoff in seconds (0 retries failed rows within the run)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply every latency by this factor")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+                        help="skip tracemalloc (faster, no memory report)")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's per-email output")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    result = simulate(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
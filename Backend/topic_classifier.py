@@ -0,0 +1,253 @@
+"""
+Multilingual topic classifier for Bennie emails.
+
+The topic keywords of each target language are compiled once, at first use,
+into a keyword trie rendered as a regular expression. Classifying an email is
+then a single left-to-right scan in the regex engine instead of one substring
+search per keyword, so the cost grows with the length of the email, not with
+the number of keywords. Every match is counted, so each email gets a score per
+topic rather than the first topic that happened to match.
+
+Keywords in Latin script match at the start of a word ("viaje" matches
+"viajes"), and keywords of three letters or fewer only match whole words
+("sol" doesn't match "solo"). Keywords in other scripts match anywhere, since
+Chinese and Japanese text has no spaces between words.
+
+classify_batch and scores_batch scan a whole batch at once: the texts are
+joined and each compiled pattern runs over the joined text once, instead of
+once per text.
+
+Usage:
+    classifier = get_classifier("spanish")
+    scores = classifier.scores(email_text)            # {"food": 3, "travel": 1}
+    topics = classifier.classify_batch(email_texts)   # ["food", None, ...]
+"""
+import re
+import bisect
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from Backend import proficiency
+
+TOPICS = ["food", "travel", "work", "family", "hobbies", "technology", "weather"]
+
+TOPIC_KEYWORDS: Dict[str, Dict[str, List[str]]] = {
+    "spanish": {
+        "food": ["comida", "cocinar", "restaurante", "cena", "almuerzo", "desayuno"],
+        "travel": ["viaje", "vacaciones", "turismo", "ciudad", "país"],
+        "work": ["trabajo", "oficina", "proyecto", "reunión"],
+        "family": ["familia", "hijos", "padres", "hermanos"],
+        "hobbies": ["hobby", "deportes", "música", "arte", "lectura"],
+        "technology": ["tecnología", "computadora", "internet", "aplicación"],
+        "weather": ["clima", "lluvia", "sol", "frío", "calor"],
+    },
+    "french": {
+        "food": ["manger", "cuisine", "dîner", "déjeuner", "petit-déjeuner"],
+        "travel": ["voyage", "vacances", "tourisme", "ville", "pays"],
+        "work": ["travail", "bureau", "projet", "réunion"],
+        "family": ["famille", "enfants", "parents", "frères"],
+        "hobbies": ["passe-temps", "sports", "musique", "art", "lecture"],
+        "technology": ["technologie", "ordinateur", "internet", "application"],
+        "weather": ["temps", "pluie", "soleil", "froid", "chaud"],
+    },
+    "mandarin": {
+        "food": ["食物", "做饭", "餐厅", "晚餐", "午餐", "早餐"],
+        "travel": ["旅行", "假期", "旅游", "城市", "国家"],
+        "work": ["工作", "办公室", "项目", "会议"],
+        "family": ["家庭", "孩子", "父母", "兄弟"],
+        "hobbies": ["爱好", "运动", "音乐", "艺术", "阅读"],
+        "technology": ["技术", "电脑", "互联网", "应用程序"],
+        "weather": ["天气", "雨", "太阳", "冷", "热"],
+    },
+    "japanese": {
+        "food": ["食べ物", "料理", "レストラン", "夕食", "昼食", "朝食"],
+        "travel": ["旅行", "休暇", "観光", "都市", "国"],
+        "work": ["仕事", "オフィス", "プロジェクト", "会議"],
+        "family": ["家族", "子供", "親", "兄弟"],
+        "hobbies": ["趣味", "スポーツ", "音楽", "芸術", "読書"],
+        "technology": ["技術", "コンピューター", "インターネット", "アプリケーション"],
+        "weather": ["天気", "雨", "太陽", "寒い", "暑い"],
+    },
+    "german": {
+        "food": ["essen", "kochen", "restaurant", "abendessen", "mittagessen", "frühstück"],
+        "travel": ["reise", "urlaub", "tourismus", "stadt", "land"],
+        "work": ["arbeit", "büro", "projekt", "meeting"],
+        "family": ["familie", "kinder", "eltern", "geschwister"],
+        "hobbies": ["hobby", "sport", "musik", "kunst", "lesen"],
+        "technology": ["technologie", "computer", "internet", "anwendung"],
+        "weather": ["wetter", "regen", "sonne", "kalt", "warm"],
+    },
+    "italian": {
+        "food": ["cibo", "cucinare", "ristorante", "cena", "pranzo", "colazione"],
+        "travel": ["viaggio", "vacanze", "turismo", "città", "paese"],
+        "work": ["lavoro", "ufficio", "progetto", "riunione"],
+        "family": ["famiglia", "figli", "genitori", "fratelli"],
+        "hobbies": ["hobby", "sport", "musica", "arte", "lettura"],
+        "technology": ["tecnologia", "computer", "internet", "applicazione"],
+        "weather": ["tempo", "pioggia", "sole", "freddo", "caldo"],
+    },
+}
+
+# Latin-script keywords this short only match whole words
+SHORT_KEYWORD_LENGTH = 3
+# Joins the texts of a batch into one scan; not a word character, so it ends words like a space
+BATCH_SEPARATOR = "\x00"
+
+def _is_spaced(keyword: str) -> bool:
+    """True for keywords in a script that separates words with spaces (Latin)."""
+    return all(
+        not ch.isalpha() or unicodedata.name(ch, "").startswith("LATIN")
+        for ch in keyword
+    )
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Render keywords as a regex that follows a trie: shared prefixes are matched
+    once and the longest keyword at a position wins.
+    """
+    trie: Dict = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def render(node: Dict) -> str:
+        branches = [re.escape(ch) + render(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # A keyword ends here; longer keywords through this node are optional
+            return body + "?" if len(branches) == 1 and len(branches[0]) == 1 else "(?:" + body + ")?"
+        return body
+
+    return render(trie)
+
+class TopicClassifier:
+    """Scores text against a fixed set of topic keywords compiled once."""
+
+    def __init__(self, topic_keywords: Dict[str, Iterable[str]]):
+        self.keyword_topics: Dict[str, List[str]] = {}
+        for topic, keywords in topic_keywords.items():
+            for keyword in keywords:
+                topics = self.keyword_topics.setdefault(keyword.lower(), [])
+                if topic not in topics:
+                    topics.append(topic)
+
+        spaced = [k for k in self.keyword_topics if _is_spaced(k)]
+        unspaced = [k for k in self.keyword_topics if not _is_spaced(k)]
+        # Two scans: \b anchors the Latin keywords to word starts, which would
+        # be wrong inside Chinese or Japanese text
+        self.patterns = []
+        if spaced:
+            self.patterns.append(re.compile(r"\b" + _trie_pattern(spaced)))
+        if unspaced:
+            self.patterns.append(re.compile(_trie_pattern(unspaced)))
+
+    def _matches(self, text: str):
+        for pattern in self.patterns:
+            for match in pattern.finditer(text):
+                keyword = match.group()
+                end = match.end()
+                if (len(keyword) <= SHORT_KEYWORD_LENGTH and end < len(text)
+                        and text[end].isalnum() and _is_spaced(keyword)):
+                    continue
+                yield match.start(), keyword
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """
+        Count keyword matches per topic.
+
+        Returns:
+            Dict[str, int]: Topic -> number of matches, only for topics that matched
+        """
+        scores: Dict[str, int] = {}
+        if not text:
+            return scores
+        for _, keyword in self._matches(text.lower()):
+            for topic in self.keyword_topics[keyword]:
+                scores[topic] = scores.get(topic, 0) + 1
+        return scores
+
+    def _tally(self, scores: Dict[str, int], first_seen: Dict[str, int], position: int, keyword: str):
+        for topic in self.keyword_topics[keyword]:
+            scores[topic] = scores.get(topic, 0) + 1
+            first_seen.setdefault(topic, position)
+
+    @staticmethod
+    def _best(scores: Dict[str, int], first_seen: Dict[str, int]) -> Optional[str]:
+        if not scores:
+            return None
+        # Ties go to the topic mentioned first
+        return max(scores, key=lambda topic: (scores[topic], -first_seen[topic]))
+
+    def classify(self, text: str) -> Optional[str]:
+        """Return the highest scoring topic of the text, or None if no keyword matched."""
+        scores: Dict[str, int] = {}
+        first_seen: Dict[str, int] = {}
+        if not text:
+            return None
+        for position, keyword in self._matches(text.lower()):
+            self._tally(scores, first_seen, position, keyword)
+        return self._best(scores, first_seen)
+
+    def _batch_matches(self, texts: Iterable[str]):
+        """
+        Match every text with one scan of the whole batch per pattern: the texts
+        are joined with BATCH_SEPARATOR and each match is mapped back to its text.
+
+        Returns:
+            Tuple[int, List]: (number of texts, [(text index, position in the text, keyword)])
+        """
+        texts = [(text or "").lower().replace(BATCH_SEPARATOR, " ") for text in texts]
+        starts, offset = [], 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + len(BATCH_SEPARATOR)
+        matches = []
+        for position, keyword in self._matches(BATCH_SEPARATOR.join(texts)):
+            index = bisect.bisect_right(starts, position) - 1
+            matches.append((index, position - starts[index], keyword))
+        return len(texts), matches
+
+    def classify_batch(self, texts: Iterable[str]) -> List[Optional[str]]:
+        """Classify every text, scanning the batch once per pattern; same results as classify."""
+        count, matches = self._batch_matches(texts)
+        scores: List[Dict[str, int]] = [{} for _ in range(count)]
+        first_seen: List[Dict[str, int]] = [{} for _ in range(count)]
+        for index, position, keyword in matches:
+            self._tally(scores[index], first_seen[index], position, keyword)
+        return [self._best(text_scores, seen) for text_scores, seen in zip(scores, first_seen)]
+
+    def scores_batch(self, texts: Iterable[str]) -> List[Dict[str, int]]:
+        """Score every text, scanning the batch once per pattern; same results as scores."""
+        count, matches = self._batch_matches(texts)
+        scores: List[Dict[str, int]] = [{} for _ in range(count)]
+        for index, _, keyword in matches:
+            for topic in self.keyword_topics[keyword]:
+                scores[index][topic] = scores[index].get(topic, 0) + 1
+        return scores
+
+def normalize_language(language: Optional[str]) -> Optional[str]:
+    """Map a users.target_language value onto a TOPIC_KEYWORDS key, or None if unknown."""
+    language = proficiency.normalize_language(language)
+    return language if language in TOPIC_KEYWORDS else None
+
+@lru_cache(maxsize=None)
+def _classifier_for(language: Optional[str]) -> TopicClassifier:
+    if language:
+        return TopicClassifier(TOPIC_KEYWORDS[language])
+    merged: Dict[str, List[str]] = {}
+    for topics in TOPIC_KEYWORDS.values():
+        for topic, keywords in topics.items():
+            merged.setdefault(topic, []).extend(keywords)
+    return TopicClassifier(merged)
+
+def get_classifier(language: Optional[str] = None) -> TopicClassifier:
+    """
+    Return the compiled classifier for a target language.
+    Unknown or missing languages get a classifier over every language's keywords.
+    """
+    return _classifier_for(normalize_language(language))
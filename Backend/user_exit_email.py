@@ -1,8 +1,9 @@
 import os
 from dotenv import load_dotenv
-import sendgrid
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
+from Backend import clients
+from Backend.proficiency import language_info
+from Backend.profile_cache import profile_cache
 from supabase import create_client
 
 load_dotenv()
@@ -17,16 +18,7 @@ def get_language_name(language_code: str) -> str:
     Returns:
         str: The proper name of the language
     """
-    language_names = {
-        'spanish': 'Spanish',
-        'french': 'French',
-        'mandarin': 'Mandarin Chinese',
-        'chinese': 'Mandarin Chinese',  # For backward compatibility
-        'japanese': 'Japanese',
-        'german': 'German',
-        'italian': 'Italian'
-    }
-    return language_names.get(language_code.lower().strip(), language_code.title())
+    return language_info(language_code).name
 
 def get_language_greeting(language_code: str) -> str:
     """
@@ -38,16 +30,7 @@ def get_language_greeting(language_code: str) -> str:
     Returns:
         str: A farewell greeting in the target language
     """
-    greetings = {
-        'spanish': '¡Hasta luego y gracias por todo!',
-        'french': 'Au revoir et merci pour tout !',
-        'mandarin': '再见，谢谢你的一切！',
-        'chinese': '再见，谢谢你的一切！',  # For backward compatibility
-        'japanese': 'さようなら、すべてに感謝します！',
-        'german': 'Auf Wiedersehen und danke für alles!',
-        'italian': 'Arrivederci e grazie di tutto!'
-    }
-    return greetings.get(language_code.lower().strip(), 'Goodbye and thank you for everything!')
+    return language_info(language_code).farewell
 
 def create_exit_email_html(user_name: str, language: str) -> str:
     """Create HTML content for exit email."""
@@ -94,30 +77,9 @@ def create_exit_email_html(user_name: str, language: str) -> str:
     </html>
     """
 
-def send_exit_email(user_name: str, user_email: str, user_language: str):
-    """
-    Sends a personalized exit email to users who unsubscribe.
-    
-    Args:
-        user_name (str): The user's name
-        user_email (str): The user's email address
-        user_language (str): The language they were learning
-    """
-    load_dotenv()
-    
-    # Check if SendGrid API key is loaded
-    sendgrid_key = os.getenv("SENDGRID_API_KEY")
-    
-    if not sendgrid_key:
-        print("Error: SENDGRID_API_KEY not found in .env file")
-        return False
-    
-    try:
-        # Create HTML content
-        html_content = create_exit_email_html(user_name, user_language)
-        
-        # Create plain text version for email clients that don't support HTML
-        plain_text_content = f"""
+def create_exit_email_text(user_name: str, user_language: str) -> str:
+    """Create plain text content for exit email."""
+    return f"""
 Goodbye from Bennie
 
 {get_language_greeting(user_language)}
@@ -148,20 +110,48 @@ Your AI Language Learning Friend
 
 P.S. You can always reach out to us at hello@itsbennie.com if you have any questions or just want to say hi!
         """
+
+def create_exit_email_subject(language: str) -> str:
+    """Create the exit email subject line."""
+    return language_info(language).exit_subject
+
+def send_exit_email(user_name: str, user_email: str, user_language: str):
+    """
+    Sends a personalized exit email to users who unsubscribe.
+    
+    Args:
+        user_name (str): The user's name
+        user_email (str): The user's email address
+        user_language (str): The language they were learning
+    """
+    load_dotenv()
+    
+    # Check if SendGrid API key is loaded
+    sendgrid_key = os.getenv("SENDGRID_API_KEY")
+    
+    if not sendgrid_key:
+        print("Error: SENDGRID_API_KEY not found in .env file")
+        return False
+    
+    try:
+        # Create HTML content
+        html_content = create_exit_email_html(user_name, user_language)
+        
+        # Create plain text version for email clients that don't support HTML
+        plain_text_content = create_exit_email_text(user_name, user_language)
         
         # Create email
         message = Mail(
             from_email='Bennie@itsbennie.com',
             to_emails=user_email,
-            subject=f'Goodbye from Bennie - Thank You for Learning {get_language_name(user_language)} With Me 💛',
+            subject=create_exit_email_subject(user_language),
             html_content=html_content,
             plain_text_content=plain_text_content
         )
         
         # Send email
         print(f"Sending exit email to {user_name} ({user_email})")
-        sg = SendGridAPIClient(sendgrid_key)
-        response = sg.send(message)
+        response = clients.get_sendgrid().send(message)
         
         if response.status_code == 202:
             print(f"✓ Exit email sent to {user_name} successfully!")
@@ -185,6 +175,7 @@ P.S. You can always reach out to us at hello@itsbennie.com if you have any quest
                         "is_active": False,
                         "updated_at": "now()"
                     }).eq("auth_user_id", auth_user.id).execute()
+                    profile_cache.invalidate(auth_user_id=auth_user.id)
                     print(f"✓ User {user_name} marked as inactive")
             except Exception as e:
                 print(f"⚠️ Failed to mark user as inactive: {e}")
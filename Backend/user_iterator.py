@@ -0,0 +1,88 @@
+"""
+Keyset-paginated streaming over public.users for Bennie cron jobs.
+
+Walks the users table in (created_at, id) order, fetching one page at a time
+with `WHERE (created_at, id) > (last_created_at, last_id)` instead of an
+OFFSET. Every page costs the same index range scan no matter how deep the walk
+is, rows inserted or deleted mid-run can't shift later pages, and only one page
+is held in memory at a time.
+
+Usage:
+    for user in iter_users(supabase, "auth_user_id, email",
+                           filters=lambda q: q.eq("is_active", True)):
+        ...
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_KEY = ("created_at", "id")
+
+def _quote(value: Any) -> str:
+    """Quote a value for a PostgREST logic filter (timestamps contain reserved characters)."""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def keyset_filter(key: Tuple[str, str], cursor: Tuple[Any, Any]) -> str:
+    """
+    Build the PostgREST `or` filter for rows strictly after `cursor` in `key` order.
+
+    (a, b) > (x, y)  ==  a > x OR (a = x AND b > y)
+    """
+    first, second = key
+    first_value, second_value = (_quote(v) for v in cursor)
+    return f"{first}.gt.{first_value},and({first}.eq.{first_value},{second}.gt.{second_value})"
+
+def iter_user_pages(supabase, columns: str = "auth_user_id, email",
+                    filters: Optional[Callable[[Any], Any]] = None,
+                    page_size: int = DEFAULT_PAGE_SIZE,
+                    key: Tuple[str, str] = DEFAULT_KEY,
+                    start_after: Optional[Tuple[Any, Any]] = None,
+                    table: str = "users") -> Iterator[List[Dict]]:
+    """
+    Yield pages of user rows in keyset order.
+
+    Args:
+        supabase: Supabase client
+        columns (str): Columns to select; the key columns are added if missing
+        filters: Optional callable that adds filters to the query builder
+        page_size (int): Rows per page
+        key (Tuple[str, str]): Two columns forming a unique sort key
+        start_after (Tuple): Cursor to resume after, as (first_value, second_value)
+        table (str): Table to walk
+
+    Yields:
+        List[Dict]: One page of rows. The last row of each page is the cursor for the next.
+    """
+    selected = [c.strip() for c in columns.split(",") if c.strip()]
+    for column in key:
+        if column not in selected:
+            selected.append(column)
+    select_clause = ", ".join(selected)
+
+    cursor = start_after
+    while True:
+        query = supabase.table(table).select(select_clause)
+        if filters:
+            query = filters(query)
+        if cursor is not None:
+            query = query.or_(keyset_filter(key, cursor))
+        response = query.order(key[0]).order(key[1]).limit(page_size).execute()
+
+        rows = response.data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        cursor = page_cursor(rows, key)
+
+def page_cursor(rows: List[Dict], key: Tuple[str, str] = DEFAULT_KEY) -> Tuple[Any, Any]:
+    """Return the keyset cursor after the last row of a page."""
+    return rows[-1][key[0]], rows[-1][key[1]]
+
+def iter_users(supabase, columns: str = "auth_user_id, email",
+               filters: Optional[Callable[[Any], Any]] = None,
+               page_size: int = DEFAULT_PAGE_SIZE,
+               key: Tuple[str, str] = DEFAULT_KEY,
+               start_after: Optional[Tuple[Any, Any]] = None) -> Iterator[Dict]:
+    """Yield user rows one at a time in keyset order. See iter_user_pages for arguments."""
+    for page in iter_user_pages(supabase, columns, filters, page_size, key, start_after):
+        yield from page
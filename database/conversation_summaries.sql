@@ -0,0 +1,29 @@
+-- Rolling per-user conversation summary
+-- Run this in your Supabase SQL editor after schema.sql
+--
+-- One small summary per user replaces fetching their recent email_history on
+-- every send (see Backend/conversation_memory.py). It holds bounded lists of
+-- recent topics, facts the user shared, open questions and vocabulary taught,
+-- plus an excerpt of the last reply, and is updated after every Bennie email
+-- (deliver_learning_email) and every inbound reply (/api/sendgrid-inbound).
+-- Users without a row get one bootstrapped from get_recent_email_history the
+-- next time their context is loaded.
+
+CREATE TABLE IF NOT EXISTS public.conversation_summaries (
+    auth_user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+    summary jsonb not null,                -- See empty_summary() in Backend/conversation_memory.py
+    created_at timestamp with time zone not null default TIMEZONE('utc', NOW()),
+    updated_at timestamp with time zone not null default TIMEZONE('utc', NOW())
+) TABLESPACE pg_default;
+
+ALTER TABLE public.conversation_summaries ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role has full access to conversation summaries" ON public.conversation_summaries
+    FOR ALL TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+CREATE TRIGGER update_conversation_summaries_updated_at
+    BEFORE UPDATE ON public.conversation_summaries
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
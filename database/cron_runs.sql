@@ -0,0 +1,45 @@
+-- Checkpointed cron runs for Bennie batch and weekly evaluation jobs
+-- Run this in your Supabase SQL editor after send_queue.sql
+--
+-- Each run of send_batch_learning_emails.py or send_weekly_evaluation_cron.py
+-- records a row here. While users are enqueued the run stores the keyset
+-- cursor of the last enqueued page, and every send_queue row it enqueues
+-- carries its run_id. A killed run can be resumed with --resume <run_id>: it
+-- continues enqueuing after the cursor, with the run's original send date or
+-- ISO week, and only drains rows that are not done yet.
+
+CREATE TABLE IF NOT EXISTS public.cron_runs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    job text not null check (job in ('batch', 'weekly_evaluation')),
+    params jsonb not null default '{}'::jsonb,   -- Selection and period, e.g. {"shard": "3/9", "send_date": "2025-08-01"}
+    state text not null default 'running' check (state in ('running', 'enqueued', 'completed', 'failed')),
+    cursor jsonb null,                           -- [created_at, id] of the last enqueued user
+    enqueued_count integer not null default 0,
+    success_count integer not null default 0,
+    error_count integer not null default 0,
+    worker_id text null,
+    last_error text null,
+    started_at timestamp with time zone not null default TIMEZONE('utc', NOW()),
+    updated_at timestamp with time zone not null default TIMEZONE('utc', NOW()),
+    finished_at timestamp with time zone null
+) TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS idx_cron_runs_job_started_at ON public.cron_runs(job, started_at DESC);
+
+ALTER TABLE public.cron_runs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role has full access to cron runs" ON public.cron_runs
+    FOR ALL TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+CREATE TRIGGER update_cron_runs_updated_at
+    BEFORE UPDATE ON public.cron_runs
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- The run that first enqueued each email (reruns keep the original run)
+ALTER TABLE public.send_queue
+    ADD COLUMN IF NOT EXISTS run_id UUID NULL REFERENCES public.cron_runs(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_send_queue_run_id ON public.send_queue(run_id, state);
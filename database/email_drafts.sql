@@ -0,0 +1,63 @@
+-- Pre-generated learning email drafts
+-- Run this in your Supabase SQL editor after schema.sql
+--
+-- Backend/pregenerate_learning_emails.py writes each due user's next learning
+-- email here hours ahead, with the inputs it was generated from (the profile
+-- fields in the prompt and the created_at of the newest email_history row).
+-- The batch send handlers use a draft instead of calling OpenAI while its
+-- inputs still match the user's context, and delete it once it is sent.
+-- The triggers below delete a draft as soon as the user replies (or any other
+-- email is saved) or changes a profile field the prompt uses.
+
+CREATE TABLE IF NOT EXISTS public.email_drafts (
+    auth_user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+    content text not null,                 -- Generated email (JSON, see Backend/learning_email.py)
+    inputs jsonb not null,                 -- Profile fields and history_through the draft was generated from
+    usage jsonb null,                      -- OpenAI token counts, saved with the email when it is sent
+    slot timestamp with time zone null,    -- next_send_at the draft was generated for
+    generated_at timestamp with time zone not null default TIMEZONE('utc', NOW())
+) TABLESPACE pg_default;
+
+-- Pruning of drafts that were never used
+CREATE INDEX IF NOT EXISTS idx_email_drafts_generated_at ON public.email_drafts(generated_at);
+
+ALTER TABLE public.email_drafts ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role has full access to email drafts" ON public.email_drafts
+    FOR ALL TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+-- A new email in the conversation makes the draft stale
+CREATE OR REPLACE FUNCTION public.discard_draft_on_email()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM public.email_drafts WHERE auth_user_id = NEW.auth_user_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER discard_draft_on_email_history
+    AFTER INSERT ON public.email_history
+    FOR EACH ROW
+    EXECUTE FUNCTION public.discard_draft_on_email();
+
+-- So does a change to a profile field the prompt uses
+CREATE OR REPLACE FUNCTION public.discard_draft_on_profile()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.name IS DISTINCT FROM OLD.name
+       OR NEW.target_language IS DISTINCT FROM OLD.target_language
+       OR NEW.proficiency_level IS DISTINCT FROM OLD.proficiency_level
+       OR NEW.topics_of_interest IS DISTINCT FROM OLD.topics_of_interest
+       OR NEW.learning_goal IS DISTINCT FROM OLD.learning_goal THEN
+        DELETE FROM public.email_drafts WHERE auth_user_id = NEW.auth_user_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER discard_draft_on_users
+    AFTER UPDATE OF name, target_language, proficiency_level, topics_of_interest, learning_goal ON public.users
+    FOR EACH ROW
+    EXECUTE FUNCTION public.discard_draft_on_profile();
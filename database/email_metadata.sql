@@ -0,0 +1,61 @@
+-- Structured metadata for Bennie emails in email_history
+-- Run this in your Supabase SQL editor after schema.sql and recent_email_history.sql
+--
+-- Each Bennie email is saved with its topic, vocabulary, language and OpenAI
+-- token counts (Backend/email_metadata.py). Topic rotation reads the topic
+-- column through get_recent_email_history instead of every email body, and the
+-- weekly recap reads the vocabulary column instead of re-parsing the text.
+-- Rows saved before this migration have language NULL; their content is still
+-- returned so the sender can classify them, so existing rows need no backfill.
+
+ALTER TABLE public.email_history
+    ADD COLUMN IF NOT EXISTS topic text NULL,
+    ADD COLUMN IF NOT EXISTS vocabulary jsonb NULL,
+    ADD COLUMN IF NOT EXISTS language text NULL,
+    ADD COLUMN IF NOT EXISTS prompt_tokens integer NULL,
+    ADD COLUMN IF NOT EXISTS completion_tokens integer NULL;
+
+-- Last N Bennie emails of a user (weekly recap), with the topic readable from the index
+CREATE INDEX IF NOT EXISTS idx_email_history_bennie_recent
+    ON public.email_history(auth_user_id, created_at DESC)
+    INCLUDE (topic, language)
+    WHERE is_from_bennie = true;
+
+-- The result columns change, so the function from recent_email_history.sql is replaced
+DROP FUNCTION IF EXISTS public.get_recent_email_history(uuid[], integer);
+
+-- content is only returned for Bennie emails saved without metadata
+CREATE OR REPLACE FUNCTION public.get_recent_email_history(
+    p_auth_user_ids uuid[],
+    p_limit integer DEFAULT 20
+)
+RETURNS TABLE (
+    auth_user_id uuid,
+    content text,
+    is_from_bennie boolean,
+    created_at timestamp with time zone,
+    topic text,
+    language text
+) AS $$
+    SELECT
+        ranked.auth_user_id,
+        CASE WHEN ranked.is_from_bennie AND ranked.language IS NULL THEN ranked.content END,
+        ranked.is_from_bennie,
+        ranked.created_at,
+        ranked.topic,
+        ranked.language
+    FROM (
+        SELECT
+            h.auth_user_id,
+            h.content,
+            h.is_from_bennie,
+            h.created_at,
+            h.topic,
+            h.language,
+            ROW_NUMBER() OVER (PARTITION BY h.auth_user_id ORDER BY h.created_at DESC) AS rn
+        FROM public.email_history h
+        WHERE h.auth_user_id = ANY(p_auth_user_ids)
+    ) ranked
+    WHERE ranked.rn <= p_limit
+    ORDER BY ranked.auth_user_id, ranked.created_at DESC;
+$$ LANGUAGE sql STABLE;
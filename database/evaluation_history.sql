@@ -0,0 +1,43 @@
+-- Bulk history loader for weekly evaluation batches
+-- Run this in your Supabase SQL editor after schema.sql and email_metadata.sql
+--
+-- Returns the last p_limit Bennie emails and the last p_limit user replies of
+-- every user in p_auth_user_ids in a single query, so building the OpenAI
+-- batch requests for a page of evaluations needs one round trip for history
+-- instead of two per user (see load_evaluation_contexts in
+-- Backend/send_weekly_evaluation_email.py).
+
+CREATE OR REPLACE FUNCTION public.get_evaluation_history(
+    p_auth_user_ids uuid[],
+    p_limit integer DEFAULT 3
+)
+RETURNS TABLE (
+    auth_user_id uuid,
+    content text,
+    is_from_bennie boolean,
+    created_at timestamp with time zone,
+    vocabulary jsonb,
+    language text
+) AS $$
+    SELECT
+        ranked.auth_user_id,
+        ranked.content,
+        ranked.is_from_bennie,
+        ranked.created_at,
+        ranked.vocabulary,
+        ranked.language
+    FROM (
+        SELECT
+            h.auth_user_id,
+            h.content,
+            h.is_from_bennie,
+            h.created_at,
+            h.vocabulary,
+            h.language,
+            ROW_NUMBER() OVER (PARTITION BY h.auth_user_id, h.is_from_bennie ORDER BY h.created_at DESC) AS rn
+        FROM public.email_history h
+        WHERE h.auth_user_id = ANY(p_auth_user_ids)
+    ) ranked
+    WHERE ranked.rn <= p_limit
+    ORDER BY ranked.auth_user_id, ranked.created_at DESC;
+$$ LANGUAGE sql STABLE;
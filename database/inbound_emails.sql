@@ -0,0 +1,87 @@
+-- Bennie inbound email inbox
+-- Run this in your Supabase SQL editor after schema.sql, send_queue.sql and user_email_lookup.sql
+--
+-- /api/sendgrid-inbound stores each reply SendGrid posts here, unprocessed, and
+-- answers at once. The API (right after answering) and the worker lease rows
+-- with FOR UPDATE SKIP LOCKED, resolve the sender, save the reply in
+-- email_history and enqueue an instant reply in send_queue when the user has
+-- instant_reply (see Backend/inbound_emails.py).
+
+CREATE TABLE IF NOT EXISTS public.inbound_emails (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    sender text null,                      -- Bare lowercased From address
+    message_id text null,                  -- From the Message-ID header; a redelivered email is stored once
+    payload jsonb not null default '{}'::jsonb,  -- Every text field of the SendGrid post (text, subject, headers, ...)
+    state text not null default 'pending' check (state in ('pending', 'leased', 'done', 'ignored', 'failed')),
+    auth_user_id UUID null REFERENCES auth.users(id) ON DELETE SET NULL,
+    email_history_id UUID null REFERENCES public.email_history(id) ON DELETE SET NULL,  -- Set once the reply is saved, so a retry doesn't save it again
+    lease_owner text null,
+    lease_expires_at timestamp with time zone null,
+    available_at timestamp with time zone not null default TIMEZONE('utc', NOW()),
+    attempts integer not null default 0,
+    max_attempts integer not null default 5,
+    last_error text null,                  -- Also why an ignored row was ignored
+    created_at timestamp with time zone not null default TIMEZONE('utc', NOW()),
+    updated_at timestamp with time zone not null default TIMEZONE('utc', NOW()),
+    processed_at timestamp with time zone null,
+    CONSTRAINT inbound_emails_message_id_key UNIQUE (message_id)
+) TABLESPACE pg_default;
+
+-- Claimable rows only, as for send_queue
+CREATE INDEX IF NOT EXISTS idx_inbound_emails_claimable ON public.inbound_emails(available_at)
+    WHERE state IN ('pending', 'leased');
+
+ALTER TABLE public.inbound_emails ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role has full access to inbound emails" ON public.inbound_emails
+    FOR ALL TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+CREATE TRIGGER update_inbound_emails_updated_at
+    BEFORE UPDATE ON public.inbound_emails
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- Lease up to p_limit claimable inbound emails, oldest first.
+-- Same rules as claim_send_queue: pending and past available_at, or leased
+-- with an expired lease; rows out of attempts are failed instead.
+CREATE OR REPLACE FUNCTION public.claim_inbound_emails(
+    p_worker_id text,
+    p_limit integer DEFAULT 20,
+    p_lease_seconds integer DEFAULT 60
+)
+RETURNS SETOF public.inbound_emails AS $$
+BEGIN
+    UPDATE public.inbound_emails
+    SET state = 'failed',
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        last_error = COALESCE(last_error, 'lease expired after final attempt')
+    WHERE state = 'leased'
+      AND lease_expires_at < NOW()
+      AND attempts >= max_attempts;
+
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT id
+        FROM public.inbound_emails
+        WHERE ((state = 'pending' AND available_at <= NOW())
+               OR (state = 'leased' AND lease_expires_at < NOW()))
+          AND attempts < max_attempts
+        ORDER BY available_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ), claimed AS (
+        UPDATE public.inbound_emails q
+        SET state = 'leased',
+            lease_owner = p_worker_id,
+            lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+            attempts = q.attempts + 1
+        FROM candidates c
+        WHERE q.id = c.id
+        RETURNING q.*
+    )
+    SELECT * FROM claimed;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,57 @@
+-- Per-user send scheduling for Bennie learning emails
+-- Run this in your Supabase SQL editor after schema.sql
+--
+-- next_send_at is each user's next send instant, worked out from
+-- email_schedule (preferred_days, preferred_time, timezone) by
+-- Backend/email_scheduler.py. Every tick of send_batch_learning_emails.py --due
+-- selects the due users with one range scan over idx_users_next_send_at and
+-- moves each of them on to their following slot. Users without a
+-- next_send_at (new sign-ups, changed schedules, reactivated accounts) are
+-- scheduled at the start of the next tick, so existing users need no backfill.
+
+ALTER TABLE public.users
+    ADD COLUMN IF NOT EXISTS next_send_at timestamp with time zone NULL;
+
+-- Due scan: is_active AND next_send_at <= now ORDER BY next_send_at, id
+CREATE INDEX IF NOT EXISTS idx_users_next_send_at
+    ON public.users(next_send_at, id)
+    WHERE is_active = true AND next_send_at IS NOT NULL;
+
+-- Users still waiting for their first slot
+CREATE INDEX IF NOT EXISTS idx_users_unscheduled
+    ON public.users(id)
+    WHERE is_active = true AND next_send_at IS NULL;
+
+-- Clear the slot when the schedule changes or an account is reactivated,
+-- so the next tick works it out again
+CREATE OR REPLACE FUNCTION public.reset_next_send_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.email_schedule IS DISTINCT FROM OLD.email_schedule
+       OR (NEW.is_active AND NOT COALESCE(OLD.is_active, false)) THEN
+        NEW.next_send_at = NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER reset_users_next_send_at
+    BEFORE UPDATE OF email_schedule, is_active ON public.users
+    FOR EACH ROW
+    EXECUTE FUNCTION public.reset_next_send_at();
+
+-- Store the next slot of many users in one round trip
+CREATE OR REPLACE FUNCTION public.set_next_send_at(
+    p_user_ids uuid[],
+    p_next_send_at timestamp with time zone[]
+)
+RETURNS integer AS $$
+    WITH updated AS (
+        UPDATE public.users u
+        SET next_send_at = slots.next_send_at
+        FROM unnest(p_user_ids, p_next_send_at) AS slots(id, next_send_at)
+        WHERE u.id = slots.id
+        RETURNING u.id
+    )
+    SELECT count(*)::integer FROM updated;
+$$ LANGUAGE sql;
@@ -0,0 +1,60 @@
+-- Prompt-cache friendly ordering of learning emails
+-- Run this in your Supabase SQL editor after send_queue.sql and email_metadata.sql
+--
+-- Learning email prompts start with a system message shared by every user of
+-- a segment (target language and level bucket, e.g. 'spanish:3'; see
+-- build_segment_prompt in Backend/bennie_email_sender.py). Batch rows record
+-- their segment and claim_send_queue hands out rows enqueued together in
+-- segment order, so concurrent generations share their prefix and OpenAI can
+-- serve it from its prompt cache. email_history.cached_tokens records how many
+-- prompt tokens of each email came from the cache.
+
+ALTER TABLE public.send_queue
+    ADD COLUMN IF NOT EXISTS segment text NULL;
+
+ALTER TABLE public.email_history
+    ADD COLUMN IF NOT EXISTS cached_tokens integer NULL;
+
+-- Same as send_queue.sql, with rows of equal available_at ordered by segment
+CREATE OR REPLACE FUNCTION public.claim_send_queue(
+    p_worker_id text,
+    p_kinds text[],
+    p_limit integer DEFAULT 10,
+    p_lease_seconds integer DEFAULT 300
+)
+RETURNS SETOF public.send_queue AS $$
+BEGIN
+    UPDATE public.send_queue
+    SET state = 'failed',
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        last_error = COALESCE(last_error, 'lease expired after final attempt')
+    WHERE kind = ANY(p_kinds)
+      AND state = 'leased'
+      AND lease_expires_at < NOW()
+      AND attempts >= max_attempts;
+
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT id
+        FROM public.send_queue
+        WHERE kind = ANY(p_kinds)
+          AND ((state = 'pending' AND available_at <= NOW())
+               OR (state = 'leased' AND lease_expires_at < NOW()))
+          AND attempts < max_attempts
+        ORDER BY available_at, segment
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ), claimed AS (
+        UPDATE public.send_queue q
+        SET state = 'leased',
+            lease_owner = p_worker_id,
+            lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+            attempts = q.attempts + 1
+        FROM candidates c
+        WHERE q.id = c.id
+        RETURNING q.*
+    )
+    SELECT * FROM claimed;
+END;
+$$ LANGUAGE plpgsql;
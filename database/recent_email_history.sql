@@ -0,0 +1,34 @@
+-- Bulk recent-history loader for Bennie batch sends
+-- Run this in your Supabase SQL editor after schema.sql
+--
+-- Returns the last p_limit email_history rows for every user in
+-- p_auth_user_ids in a single query, so a batch page of users needs one round
+-- trip for history instead of one per user.
+
+CREATE INDEX IF NOT EXISTS idx_email_history_user_created_at
+    ON public.email_history(auth_user_id, created_at DESC);
+
+CREATE OR REPLACE FUNCTION public.get_recent_email_history(
+    p_auth_user_ids uuid[],
+    p_limit integer DEFAULT 20
+)
+RETURNS TABLE (
+    auth_user_id uuid,
+    content text,
+    is_from_bennie boolean,
+    created_at timestamp with time zone
+) AS $$
+    SELECT ranked.auth_user_id, ranked.content, ranked.is_from_bennie, ranked.created_at
+    FROM (
+        SELECT
+            h.auth_user_id,
+            h.content,
+            h.is_from_bennie,
+            h.created_at,
+            ROW_NUMBER() OVER (PARTITION BY h.auth_user_id ORDER BY h.created_at DESC) AS rn
+        FROM public.email_history h
+        WHERE h.auth_user_id = ANY(p_auth_user_ids)
+    ) ranked
+    WHERE ranked.rn <= p_limit
+    ORDER BY ranked.auth_user_id, ranked.created_at DESC;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,92 @@
+-- Bennie send queue (outbox)
+-- Run this in your Supabase SQL editor after schema.sql
+--
+-- Every outgoing email (batch learning email, weekly evaluation, instant reply)
+-- is first enqueued here under an idempotency key. Workers lease rows with
+-- FOR UPDATE SKIP LOCKED, store the generated body before sending, and mark the
+-- row done once SendGrid accepts it. A crash never loses a generated email and
+-- a rerun never enqueues the same email twice.
+
+CREATE TABLE IF NOT EXISTS public.send_queue (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    auth_user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    kind text not null check (kind in ('batch', 'weekly_evaluation', 'instant_reply')),
+    idempotency_key text not null,
+    state text not null default 'pending' check (state in ('pending', 'leased', 'done', 'failed')),
+    payload jsonb not null default '{}'::jsonb,
+    generated_content text null,           -- Stored before sending so a retry never regenerates
+    generated_at timestamp with time zone null,
+    lease_owner text null,                 -- Worker id holding the lease
+    lease_expires_at timestamp with time zone null,
+    available_at timestamp with time zone not null default TIMEZONE('utc', NOW()),  -- Not claimable before this (retry backoff)
+    attempts integer not null default 0,
+    max_attempts integer not null default 5,
+    last_error text null,
+    created_at timestamp with time zone not null default TIMEZONE('utc', NOW()),
+    updated_at timestamp with time zone not null default TIMEZONE('utc', NOW()),
+    completed_at timestamp with time zone null,
+    CONSTRAINT send_queue_idempotency_key_key UNIQUE (idempotency_key)
+) TABLESPACE pg_default;
+
+-- Claimable rows only: keeps the claim scan small however large the history grows
+CREATE INDEX IF NOT EXISTS idx_send_queue_claimable ON public.send_queue(kind, available_at)
+    WHERE state IN ('pending', 'leased');
+CREATE INDEX IF NOT EXISTS idx_send_queue_auth_user_id ON public.send_queue(auth_user_id);
+
+ALTER TABLE public.send_queue ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role has full access to send queue" ON public.send_queue
+    FOR ALL TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+CREATE TRIGGER update_send_queue_updated_at
+    BEFORE UPDATE ON public.send_queue
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- Lease up to p_limit claimable rows for a worker.
+-- A row is claimable when it is pending and past its available_at, or leased
+-- with an expired lease (its worker died). Rows that have used up their attempts are failed instead.
+CREATE OR REPLACE FUNCTION public.claim_send_queue(
+    p_worker_id text,
+    p_kinds text[],
+    p_limit integer DEFAULT 10,
+    p_lease_seconds integer DEFAULT 300
+)
+RETURNS SETOF public.send_queue AS $$
+BEGIN
+    UPDATE public.send_queue
+    SET state = 'failed',
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        last_error = COALESCE(last_error, 'lease expired after final attempt')
+    WHERE kind = ANY(p_kinds)
+      AND state = 'leased'
+      AND lease_expires_at < NOW()
+      AND attempts >= max_attempts;
+
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT id
+        FROM public.send_queue
+        WHERE kind = ANY(p_kinds)
+          AND ((state = 'pending' AND available_at <= NOW())
+               OR (state = 'leased' AND lease_expires_at < NOW()))
+          AND attempts < max_attempts
+        ORDER BY available_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ), claimed AS (
+        UPDATE public.send_queue q
+        SET state = 'leased',
+            lease_owner = p_worker_id,
+            lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+            attempts = q.attempts + 1
+        FROM candidates c
+        WHERE q.id = c.id
+        RETURNING q.*
+    )
+    SELECT * FROM claimed;
+END;
+$$ LANGUAGE plpgsql;
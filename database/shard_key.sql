@@ -0,0 +1,22 @@
+-- Stored shard key for hash-sharded batch runs
+-- Run this in your Supabase SQL editor after schema.sql
+--
+-- send_batch_learning_emails.py --shard INDEX/COUNT used to page through every
+-- active user and keep the ones whose auth_user_id hashed into its shard, so
+-- each of the nine daily slots read all users. shard_key is the first 8 bytes
+-- of the SHA-256 of the lowercased auth_user_id as a signed bigint (the same
+-- value as shard_key() in Backend/sharding.py), and shard i of n is the i-th
+-- of n equal shard_key ranges. A shard run walks its range in (shard_key, id)
+-- order, one range scan over idx_users_shard_key per page.
+--
+-- Adding the column rewrites the table once to fill it for existing users.
+
+ALTER TABLE public.users
+    ADD COLUMN IF NOT EXISTS shard_key bigint GENERATED ALWAYS AS (
+        ('x' || substr(encode(sha256(lower(auth_user_id::text)::bytea), 'hex'), 1, 16))::bit(64)::bigint
+    ) STORED;
+
+-- Shard scan: is_active AND shard_key in [low, high) ORDER BY shard_key, id
+CREATE INDEX IF NOT EXISTS idx_users_shard_key
+    ON public.users(shard_key, id)
+    WHERE is_active = true;
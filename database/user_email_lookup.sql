@@ -0,0 +1,54 @@
+-- Case-insensitive user lookup by email
+-- Run this in your Supabase SQL editor after schema.sql
+--
+-- GET /api/users/{email} used to list every auth user and scan the result in
+-- Python (only the first page, so later users were never found). It now calls
+-- get_user_by_email, an index lookup on lower(email) in public.users.
+-- It returns the profile columns Backend/profile_cache.py caches.
+
+CREATE INDEX IF NOT EXISTS idx_users_lower_email ON public.users (lower(email));
+
+-- The result columns changed (instant_reply), so an earlier version is replaced
+DROP FUNCTION IF EXISTS public.get_user_by_email(text);
+
+CREATE OR REPLACE FUNCTION public.get_user_by_email(p_email text)
+RETURNS TABLE (
+    auth_user_id uuid,
+    email text,
+    name text,
+    target_language text,
+    proficiency_level integer,
+    learning_goal text,
+    motivation_goal text,
+    target_proficiency integer,
+    current_level text,
+    current_skill_rating text,
+    topics_of_interest text[],
+    email_schedule jsonb,
+    is_active boolean,
+    instant_reply boolean,
+    created_at timestamp with time zone,
+    updated_at timestamp with time zone
+) AS $$
+    SELECT
+        u.auth_user_id,
+        u.email,
+        u.name,
+        u.target_language,
+        u.proficiency_level,
+        u.learning_goal,
+        u.motivation_goal,
+        u.target_proficiency,
+        u.current_level,
+        u.current_skill_rating,
+        u.topics_of_interest,
+        u.email_schedule,
+        u.is_active,
+        u.instant_reply,
+        u.created_at,
+        u.updated_at
+    FROM public.users u
+    WHERE lower(u.email) = lower(p_email)
+    ORDER BY u.created_at
+    LIMIT 1;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,8 @@
+-- Keyset pagination index for Bennie cron jobs
+-- Run this in your Supabase SQL editor after schema.sql
+--
+-- Backend/user_iterator.py walks public.users in (created_at, id) order with
+-- WHERE (created_at, id) > (cursor) instead of OFFSET. This index turns every
+-- page into a short range scan, whatever the page depth.
+
+CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON public.users(created_at, id);
@@ -15,15 +15,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import uvicorn
 from pydantic import BaseModel, EmailStr, Field
-from supabase import create_client, Client
-from typing import Optional
+from supabase import AsyncClient
+from typing import Dict, Optional
 import sys
+import asyncio
 import datetime
+from contextlib import asynccontextmanager
 from urllib.parse import quote, unquote
 sys.path.append('./Backend')
 from new_user_email import send_welcome_email
-from Backend.bennie_email_sender import send_language_learning_email
 from Backend.openai_connectivity_test import test_openai
+from Backend import clients, inbound_emails, send_queue
+from Backend.send_batch_learning_emails import make_batch_handlers
+from Backend.profile_cache import PROFILE_COLUMNS, profile_cache
 
 # Configure logging with more detail
 logging.basicConfig(
@@ -46,41 +50,69 @@ if not all([SUPABASE_URL, SUPABASE_ANON_KEY]):
     logger.error("Missing required environment variables")
     raise ValueError("Missing required environment variables")
 
-# Initialize Supabase client with anon key
-try:
-    logger.info("Initializing Supabase client...")
-    
-    # Initialize Supabase client
-    supabase: Client = create_client(
-        supabase_url=SUPABASE_URL,
-        supabase_key=SUPABASE_ANON_KEY
-    )
-    
-    logger.info("Supabase client initialized successfully")
-    
-    # Test connection with proper error handling
+# Async Supabase client (anon key), created at startup on the running event
+# loop and shared by every request; see lifespan below
+supabase: AsyncClient = None
+
+async def check_supabase_connection():
+    """Test the Supabase database connection, falling back to the auth service."""
     try:
         # Test database connection
-        test_response = supabase.table("users").select("count", count="exact").limit(1).execute()
+        await supabase.table("users").select("count", count="exact").limit(1).execute()
         logger.info("Successfully tested Supabase database connection")
     except Exception as db_e:
         logger.error(f"Database test failed: {db_e}")
         # Try auth connection instead
         try:
-            test_response = supabase.auth.get_session()
+            await supabase.auth.get_session()
             logger.info("Successfully tested Supabase auth connection")
         except Exception as auth_e:
             logger.error(f"Auth test failed: {auth_e}")
             raise RuntimeError("Failed to connect to Supabase services")
+
+async def get_profile(email: Optional[str] = None, auth_user_id: Optional[str] = None) -> Optional[Dict]:
+    """
+    A user's profile (PROFILE_COLUMNS) by email or auth_user_id, read through
+    the profile cache. By email it is the indexed get_user_by_email lookup.
     
-except Exception as e:
-    logger.error(f"Failed to initialize Supabase client: {str(e)}")
-    raise RuntimeError(f"Supabase initialization failed: {str(e)}")
+    Returns:
+        Dict: The profile (a copy the caller may change), or None if there is no such user
+    """
+    async def load():
+        if auth_user_id is not None:
+            response = await supabase.table("users").select(PROFILE_COLUMNS).eq("auth_user_id", auth_user_id).execute()
+        else:
+            response = await supabase.rpc("get_user_by_email", {"p_email": email.lower()}).execute()
+        return response.data[0] if response.data else None
+    
+    return await profile_cache.aget_or_load(load, email=email, auth_user_id=auth_user_id)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the async Supabase client once per worker, on its event loop, so
+    endpoints await Supabase instead of blocking the loop for every round
+    trip, and close its connection pool on shutdown.
+    """
+    global supabase
+    try:
+        logger.info("Initializing Supabase client...")
+        supabase = await clients.get_async_supabase("SUPABASE_ANON_KEY")
+        logger.info("Supabase client initialized successfully")
+        await check_supabase_connection()
+    except Exception as e:
+        logger.error(f"Failed to initialize Supabase client: {str(e)}")
+        raise RuntimeError(f"Supabase initialization failed: {str(e)}")
+    try:
+        yield
+    finally:
+        await clients.aclose_async_clients()
 
 # Create FastAPI app
 app = FastAPI(
     title="Bennie API",
     description="Backend API for Bennie language learning platform",
+    lifespan=lifespan,
     # Remove root_path as Railway handles this
 )
 
@@ -230,7 +262,7 @@ async def signin(signin_data: SignInRequest):
         
         try:
             # Attempt to sign in with email/password
-            auth_response = supabase.auth.sign_in_with_password({
+            auth_response = await supabase.auth.sign_in_with_password({
                 "email": email,
                 "password": signin_data.password
             })
@@ -242,31 +274,18 @@ async def signin(signin_data: SignInRequest):
                     detail="Invalid email or password"
                 )
             
-            # Get user profile data (excluding problematic confirmation_token column)
-            user_data = supabase.table("users").select("""
-                auth_user_id,
-                email,
-                name,
-                target_language,
-                proficiency_level,
-                learning_goal,
-                motivation_goal,
-                target_proficiency,
-                current_level,
-                current_skill_rating,
-                topics_of_interest,
-                email_schedule,
-                is_active,
-                created_at,
-                updated_at
-            """).eq("email", email).single().execute()
+            # Get user profile data (cached, see Backend/profile_cache.py)
+            user = await get_profile(email=email)
+            if user is None:
+                raise ValueError(f"User profile not found: {email}")
+            user.pop("instant_reply", None)
             
             logger.info(f"[SIGNIN] User {email} signed in successfully")
             
             return {
                 "success": True,
                 "session": auth_response.session,
-                "user": user_data.data if user_data else None
+                "user": user
             }
             
         except Exception as auth_e:
@@ -304,7 +323,7 @@ async def verify_token(token: str):
         
         # Verify the magic link token
         try:
-            verify_response = supabase.auth.verify_otp({
+            verify_response = await supabase.auth.verify_otp({
                 "token_hash": token,
                 "type": "magiclink"
             })
@@ -320,15 +339,13 @@ async def verify_token(token: str):
             logger.error(f"Token verification failed: {e}")
             raise HTTPException(status_code=404, detail="Invalid or expired token")
         
-        # Get user profile from public.users
-        user_response = supabase.table("users").select("auth_user_id, name, target_language").eq("auth_user_id", user_id).execute()
+        # Get user profile from public.users (cached)
+        user = await get_profile(auth_user_id=user_id)
         
-        if not user_response.data:
+        if user is None:
             logger.error(f"User profile not found for auth_user_id: {user_id}")
             raise HTTPException(status_code=404, detail="User profile not found")
         
-        user = user_response.data[0]
-        
         return {
             "success": True,
             "user": {
@@ -366,7 +383,7 @@ async def complete_onboarding(onboarding_data: OnboardingData):
         logger.info(f"Received onboarding data: {log_data}")
         
         # First verify the token and get user
-        auth_response = supabase.auth.verify_otp(onboarding_data.token)
+        auth_response = await supabase.auth.verify_otp(onboarding_data.token)
         
         if not auth_response or not auth_response.user:
             logger.warning(f"Invalid token attempted: {onboarding_data.token[:10]}...")
@@ -386,11 +403,12 @@ async def complete_onboarding(onboarding_data: OnboardingData):
         }
         
         logger.info(f"Updating user {auth_user_id} with data: {update_data}")
-        update_response = supabase.table("users").update(update_data).eq("auth_user_id", auth_user_id).execute()
+        update_response = await supabase.table("users").update(update_data).eq("auth_user_id", auth_user_id).execute()
         
         if not update_response.data:
             logger.error(f"Failed to update user: {update_response.error}")
             raise HTTPException(status_code=500, detail="Failed to update user profile")
+        profile_cache.invalidate(auth_user_id=auth_user_id)
         
         return {
             "success": True,
@@ -408,7 +426,7 @@ async def health_check():
     """Health check endpoint for Railway."""
     try:
         # Test Supabase connection using admin client
-        response = supabase.table("users").select("count", count="exact").limit(1).execute()
+        response = await supabase.table("users").select("count", count="exact").limit(1).execute()
         if hasattr(response, 'status_code') and response.status_code >= 400:
             logger.error(f"Health check failed: Supabase error {response.status_code}")
             raise Exception(f"Supabase error: {response.status_code}")
@@ -424,7 +442,8 @@ async def health_check():
             "service": "bennie",
             "database": "connected",
             "timestamp": current_time,
-            "database_response": "success"
+            "database_response": "success",
+            "profile_cache": profile_cache.stats()
         }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -452,7 +471,7 @@ async def create_user(user_data: UserCreate, background_tasks: BackgroundTasks):
         }
         
         # Create user using service role key
-        auth_response = supabase.auth.admin.create_user(signup_data)
+        auth_response = await supabase.auth.admin.create_user(signup_data)
         
         if not auth_response or not auth_response.user:
             logger.error("Failed to create user in Supabase Auth")
@@ -470,24 +489,25 @@ async def create_user(user_data: UserCreate, background_tasks: BackgroundTasks):
             }
             
             logger.info(f"Inserting user into users table: {user_insert_data}")
-            user_insert_response = supabase.table("users").insert(user_insert_data).execute()
+            user_insert_response = await supabase.table("users").insert(user_insert_data).execute()
             
             if not user_insert_response.data:
                 logger.error("Failed to insert user into users table")
                 raise HTTPException(status_code=500, detail="Failed to create user profile")
                 
             logger.info("Successfully created user in both auth and users tables")
+            profile_cache.invalidate(email=user_data.email)
         except Exception as e:
             logger.error(f"Failed to insert user into users table: {e}")
             # Try to clean up auth user if users table insert fails
             try:
-                supabase.auth.admin.delete_user(auth_response.user.id)
+                await supabase.auth.admin.delete_user(auth_response.user.id)
             except:
                 pass
             raise HTTPException(status_code=500, detail="Failed to create user profile")
         
         # Generate magic link
-        sign_in_token = supabase.auth.admin.generate_link(
+        sign_in_token = await supabase.auth.admin.generate_link(
             {
                 "email": user_data.email,
                 "type": "magiclink",
@@ -538,41 +558,15 @@ async def get_user(email: str):
     try:
         logger.info(f"Getting user: {email}")
         
-        # Get auth user
-        users = supabase.auth.admin.list_users()
-        auth_user = next(
-            (user for user in users if user.email == email.lower()),
-            None
-        )
+        # Indexed lower(email) lookup (database/user_email_lookup.sql), cached briefly
+        user = await get_profile(email=email)
         
-        if not auth_user:
+        if user is None:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Get user profile from public.users (excluding problematic confirmation_token column)
-        response = supabase.table("users").select("""
-            auth_user_id,
-            email,
-            name,
-            target_language,
-            proficiency_level,
-            learning_goal,
-            motivation_goal,
-            target_proficiency,
-            current_level,
-            current_skill_rating,
-            topics_of_interest,
-            email_schedule,
-            is_active,
-            created_at,
-            updated_at
-        """).eq("auth_user_id", auth_user.id).execute()
-        
-        if not response.data:
-            raise HTTPException(status_code=404, detail="User profile not found")
-        
-        user = response.data[0]
         # Remove sensitive fields
         user.pop("auth_user_id", None)
+        user.pop("instant_reply", None)
         
         return {"success": True, "user": user}
         
@@ -582,78 +576,51 @@ async def get_user(email: str):
         logger.error(f"Unexpected error in get_user: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def drain_inbound_emails():
+    """
+    Process the stored inbound emails (Backend/inbound_emails.py), then send
+    the instant replies they enqueued. Runs after the webhook has answered;
+    rows are claimed, so it can run next to the worker.
+    """
+    service = clients.get_supabase()
+    processed_count, error_count = await asyncio.to_thread(inbound_emails.drain_inbound, service)
+    logger.info(f"Processed {processed_count} inbound emails ({error_count} failed)")
+    if processed_count:
+        prepare, generate, deliver = make_batch_handlers()
+        await send_queue.drain_queue(service, [send_queue.KIND_INSTANT_REPLY], generate, deliver, prepare=prepare)
+
+process_inbound_emails = inbound_emails.DrainTrigger(drain_inbound_emails)
+
 @app.post("/api/sendgrid-inbound")
-async def sendgrid_inbound(request: Request, secret: Optional[str] = Query(None)):
-    """Handle inbound emails from SendGrid."""
+async def sendgrid_inbound(request: Request, background_tasks: BackgroundTasks, secret: Optional[str] = Query(None)):
+    """
+    Handle inbound emails from SendGrid.
+    
+    Only stores the raw email and answers; the reply is processed after the
+    response (and by the worker), see Backend/inbound_emails.py. A post that
+    could not be stored gets a 503 so SendGrid retries it.
+    """
+    form = await request.form()
+    row = inbound_emails.build_row(form)
+    
+    if not row["sender"] or not row["payload"].get("text"):
+        logger.error("Missing sender or content in webhook")
+        return {"success": False, "error": "Missing sender or content"}
+    
     try:
-        # Log all form data for debugging
-        form = await request.form()
-        logger.info(f"Form data received: {dict(form)}")
-        
-        sender_email = form.get('from')
-        text_content = form.get('text')
-        subject = form.get('subject', 'No subject')
-        
-        logger.info(f"Sender: {sender_email}")
-        logger.info(f"Subject: {subject}")
-        logger.info(f"Content length: {len(text_content) if text_content else 0}")
-
-        if not sender_email or not text_content:
-            logger.error("Missing sender or content in webhook")
-            return {"success": False, "error": "Missing sender or content"}
-
-        # Extract just the email address (in case it's 'Name <email@example.com>')
-        import re
-        match = re.search(r'<(.+?)>', sender_email)
-        if match:
-            sender_email = match.group(1)
-        else:
-            sender_email = sender_email.strip()
-            
-        logger.info(f"Cleaned sender email: {sender_email}")
-
-        # Get auth user first
-        auth_user = supabase.auth.admin.get_user_by_email(sender_email.lower())
-        
-        if not auth_user:
-            logger.error(f"User not found for email: {sender_email}")
-            return {"success": False, "error": "User not found"}
-        
-        # Find user profile
-        user_resp = supabase.table("users").select(
-            "auth_user_id, name, target_language, proficiency_level, instant_reply"
-        ).eq("auth_user_id", auth_user.id).execute()
-        
-        if not user_resp.data:
-            logger.error(f"User profile not found for auth_user_id: {auth_user.id}")
-            return {"success": False, "error": "User profile not found"}
-        
-        user = user_resp.data[0]
-        instant_reply = user.get("instant_reply", False)
-        
-        # Save the email in history
-        email_data = {
-            "auth_user_id": user["auth_user_id"],
-            "content": text_content,
-            "is_from_bennie": False,
-            "difficulty_level": user.get("proficiency_level", 1)
-        }
-        
-        email_resp = supabase.table("email_history").insert(email_data).execute()
-        
-        if not email_resp.data:
-            logger.error("Failed to save email to history")
-            return {"success": False, "error": "Failed to save email"}
-        
-        # If instant reply is enabled, send a response
-        if instant_reply:
-            background_tasks.add_task(send_language_learning_email, sender_email)
-        
-        return {"success": True}
-        
+        # inbound_emails is only writable with the service role key
+        service = await clients.get_async_supabase()
+        stored = await inbound_emails.store(service, row)
     except Exception as e:
-        logger.error(f"Error processing inbound email: {e}")
-        return {"success": False, "error": str(e)}
+        logger.error(f"Failed to store inbound email from {row['sender']}: {e}")
+        raise HTTPException(status_code=503, detail="Failed to store inbound email")
+    
+    if stored is None:
+        logger.info(f"Inbound email {row['message_id']} from {row['sender']} was already stored")
+    else:
+        logger.info(f"Stored inbound email {stored['id']} from {row['sender']}")
+    background_tasks.add_task(process_inbound_emails)
+    return {"success": True}
 
 @app.post("/api/auth/reset-password")
 async def reset_password(reset_data: dict):
@@ -674,7 +641,7 @@ async def reset_password(reset_data: dict):
         logger.info(f"[PASSWORD RESET] Sending reset email to: {email}")
         
         # Send password reset email
-        auth_response = supabase.auth.reset_password_email(email)
+        auth_response = await supabase.auth.reset_password_email(email)
         
         logger.info(f"[PASSWORD RESET] Reset email sent successfully to: {email}")
         
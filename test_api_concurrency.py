@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Tests for the API's async Supabase access, using the throughput benchmark.
+These run offline - the app is driven in process against the fake Supabase.
+
+Usage:
+    python -m pytest test_api_concurrency.py
+"""
+
+import pytest
+from Backend.benchmark_api_concurrency import parse_args, run
+
+def test_async_client_serves_parallel_requests_concurrently():
+    results = run(parse_args(["--requests", "40", "--concurrency", "10", "--latency-ms", "10", "--users", "5"]))
+    by_key = {(r["path"], r["mode"]): r for r in results}
+
+    assert all(r["statuses"] == {200: 40} for r in results)
+    for path in ("/health", "/api/users/{email}"):
+        # Blocking calls serialize the requests; awaited ones overlap
+        assert by_key[(path, "async")]["rps"] > 3 * by_key[(path, "blocking")]["rps"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the rolling conversation summary that replaces fetching history on every send.
+These run offline.
+
+Usage:
+    python -m pytest test_conversation_memory.py
+"""
+
+import pytest
+from Backend.simulate_batch import install_database
+from Backend.fake_services import FakeOpenAI, FakeSendGrid, FakeSupabase, seed_users
+from Backend import bennie_email_sender, clients, conversation_memory, send_queue
+from Backend.conversation_memory import (
+    MAX_FACTS, MAX_TOPICS, MAX_VOCABULARY, REPLY_EXCERPT_CHARS,
+    extract_question, memory_block, record_email, record_reply,
+)
+from Backend.send_batch_learning_emails import enqueue_batch, make_batch_handlers
+
+def test_summary_stays_bounded():
+    summary = None
+    for i in range(50):
+        summary = record_email(summary, f"topic{i}", [f"word{i} - meaning", f"Word{i} - again"],
+                               f"¿Pregunta {i}?", [f"fact {i}"], f"2025-08-{i % 28 + 1:02d}")
+    assert summary["recent_topics"][:2] == ["topic49", "topic48"] and len(summary["recent_topics"]) == MAX_TOPICS
+    assert len(summary["facts"]) == MAX_FACTS and len(summary["vocabulary"]) == MAX_VOCABULARY
+    assert summary["vocabulary"][0] == "word49 - meaning"
+    assert summary["open_questions"] == ["¿Pregunta 49?"]
+
+    replied = record_reply(summary, "Sí " * 500, "2025-09-01")
+    assert len(replied["last_reply"]) <= REPLY_EXCERPT_CHARS + 1
+    assert replied["open_questions"] == [] and summary["open_questions"]  # the input is left alone
+    block = memory_block(replied)
+    assert block.index("last reply") < block.index("Words already taught")
+
+    assert extract_question("Hoy llovió. ¿Te gusta la lluvia? ¡Hasta pronto!") == "¿Te gusta la lluvia?"
+    assert extract_question("今日は雨でした。雨が好きですか？") == "雨が好きですか？"
+    assert extract_question("No question here.") is None
+
+def test_history_is_fetched_once_and_the_summary_follows_the_conversation():
+    db = FakeSupabase()
+    seed_users(db, 3, history_per_user=2)
+    install_database(db)
+
+    contexts = bennie_email_sender.load_user_contexts([user["auth_user_id"] for user in db.tables["users"]])
+    assert db.stats.counts["supabase.rpc.get_recent_email_history"] == 1
+    assert len(db.tables["conversation_summaries"]) == 3
+    assert all(context["memory"]["last_email_at"] for context in contexts.values())
+
+    enqueue_batch(db, db.tables["users"], "2025-08-01")
+
+    async def drain():
+        clients.register_async_client("openai", FakeOpenAI().client())
+        clients.register_async_client("sendgrid", FakeSendGrid().client())
+        prepare, generate, deliver = make_batch_handlers(db)
+        return await send_queue.drain_queue(db, [send_queue.KIND_BATCH], generate, deliver, prepare=prepare)
+
+    assert clients.run(drain()) == (3, 0)
+    # Contexts now come from the summaries alone
+    assert db.stats.counts["supabase.rpc.get_recent_email_history"] == 1
+    user = db.tables["users"][0]
+    summary = conversation_memory.load_summaries(db, [user["auth_user_id"]])[user["auth_user_id"]]
+    assert summary["recent_topics"][0] == "food"
+    assert summary["vocabulary"][:2] == ["mercado - market", "fruta - fruit"]
+    assert summary["last_reply"] is None
+
+    summary = conversation_memory.update_after_reply(db, user["auth_user_id"], "Me encanta la fruta.", "2025-08-02T08:00:00+00:00")
+    context = bennie_email_sender.get_user_context(user["email"])
+    assert context["memory"] == summary and context["email_history"] == []
+    assert "Me encanta la fruta." in bennie_email_sender.create_enhanced_prompt(context, [], True, "food")
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Tests for cron run checkpoints and --resume.
+These run offline against a small in-memory stand-in for the Supabase query builder.
+
+Usage:
+    python -m pytest test_cron_runs.py
+"""
+
+import re
+import uuid
+import pytest
+from Backend import cron_runs, send_queue
+from Backend.user_iterator import iter_user_pages, page_cursor
+
+KEYSET = re.compile(r'^(\w+)\.gt\."(.*)",and\(\1\.eq\."(.*)",(\w+)\.gt\."(.*)"\)$')
+
+class FakeQuery:
+    """Just enough of the PostgREST builder for cron_runs, send_queue.enqueue and iter_user_pages."""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.rows = db.tables.setdefault(name, [])
+        self.filters = []
+        self.order_by = []
+        self.limit_count = None
+        self.action = None
+
+    def select(self, columns):
+        self.action = ("select", columns)
+        return self
+
+    def insert(self, row):
+        self.action = ("insert", row)
+        return self
+
+    def update(self, fields):
+        self.action = ("update", fields)
+        return self
+
+    def upsert(self, rows, on_conflict, ignore_duplicates):
+        self.action = ("upsert", (rows, on_conflict))
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def contains(self, column, value):
+        self.filters.append(lambda row: all(row.get(column, {}).get(k) == v for k, v in value.items()))
+        return self
+
+    def or_(self, expression):
+        first, after, _, second, after_second = KEYSET.match(expression).groups()
+        self.filters.append(lambda row: (row[first], row[second]) > (after, after_second))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def execute(self):
+        kind, arg = self.action
+        matching = [r for r in self.rows if all(f(r) for f in self.filters)]
+        if kind == "insert":
+            row = dict(arg, id=str(uuid.uuid4()), started_at=f"{len(self.rows):05d}",
+                       enqueued_count=0, success_count=0, error_count=0, cursor=None)
+            self.rows.append(row)
+            data = [dict(row)]
+        elif kind == "update":
+            for row in matching:
+                row.update(arg)
+            data = [dict(r) for r in matching]
+        elif kind == "upsert":
+            rows, key = arg
+            existing = {r[key] for r in self.rows}
+            data = [dict(r) for r in rows if r[key] not in existing]
+            self.rows.extend(data)
+        else:
+            for column, desc in reversed(self.order_by):
+                matching.sort(key=lambda r: r[column], reverse=desc)
+            data = [dict(r) for r in matching[:self.limit_count]]
+
+        class Response:
+            pass
+        response = Response()
+        response.data = data
+        return response
+
+class FakeSupabase:
+    def __init__(self, users=()):
+        self.tables = {"users": list(users)}
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+def make_users(count):
+    return [
+        {"id": f"{i:05d}", "created_at": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}+00:00",
+         "auth_user_id": f"auth-{i}", "email": f"user{i}@example.com"}
+        for i in range(count)
+    ]
+
+def enqueue_pages(supabase, run, stop_after=None):
+    """The enqueue loop of the cron jobs, optionally killed after `stop_after` pages."""
+    total = run.get("enqueued_count") or 0
+    pages = iter_user_pages(supabase, "auth_user_id, email", page_size=10, start_after=cron_runs.run_cursor(run))
+    for number, page in enumerate(pages):
+        if number == stop_after:
+            return
+        send_queue.enqueue(supabase, (
+            {"kind": send_queue.KIND_BATCH, "auth_user_id": user["auth_user_id"],
+             "idempotency_key": send_queue.make_idempotency_key(
+                 send_queue.KIND_BATCH, user["auth_user_id"], run["params"]["send_date"]),
+             "run_id": run["id"]}
+            for user in page
+        ))
+        total += len(page)
+        cron_runs.checkpoint(supabase, run, page_cursor(page), total)
+    cron_runs.mark_enqueued(supabase, run, total)
+
+def test_killed_run_resumes_after_last_checkpoint():
+    supabase = FakeSupabase(make_users(45))
+    run = cron_runs.start_run(supabase, cron_runs.JOB_BATCH, {"shard": "0/1", "send_date": "2025-08-01"})
+    enqueue_pages(supabase, run, stop_after=2)  # killed after two pages
+
+    resumed = cron_runs.load_run(supabase, cron_runs.JOB_BATCH, "latest", match={"shard": "0/1"})
+    assert resumed["id"] == run["id"]
+    assert resumed["enqueued_count"] == 20
+    assert cron_runs.run_cursor(resumed) == ("2025-01-01T00:00:19+00:00", "00019")
+
+    enqueue_pages(supabase, resumed)
+    queue = supabase.tables["send_queue"]
+    assert len(queue) == 45
+    assert len({row["idempotency_key"] for row in queue}) == 45
+    assert all(row["run_id"] == run["id"] for row in queue)
+    assert all(row["idempotency_key"].endswith(":2025-08-01") for row in queue)
+    assert resumed["state"] == "enqueued" and resumed["enqueued_count"] == 45
+
+def test_latest_skips_completed_and_other_shards():
+    supabase = FakeSupabase()
+    other = cron_runs.start_run(supabase, cron_runs.JOB_BATCH, {"shard": "1/9", "send_date": "2025-08-01"})
+    done = cron_runs.start_run(supabase, cron_runs.JOB_BATCH, {"shard": "0/9", "send_date": "2025-08-01"})
+    cron_runs.finish_run(supabase, done, 10, 0)
+
+    with pytest.raises(ValueError):
+        cron_runs.load_run(supabase, cron_runs.JOB_BATCH, "latest", match={"shard": "0/9"})
+    assert cron_runs.load_run(supabase, cron_runs.JOB_BATCH, "latest")["id"] == other["id"]
+    with pytest.raises(ValueError):
+        cron_runs.load_run(supabase, cron_runs.JOB_WEEKLY_EVALUATION, other["id"])
+
+def test_finish_run_accumulates_attempts():
+    supabase = FakeSupabase()
+    run = cron_runs.start_run(supabase, cron_runs.JOB_WEEKLY_EVALUATION, {"iso_week": "2025-W31"})
+    cron_runs.finish_run(supabase, run, 7, 1, error="killed")
+    assert run["state"] == "failed"
+
+    resumed = cron_runs.load_run(supabase, cron_runs.JOB_WEEKLY_EVALUATION, run["id"])
+    cron_runs.finish_run(supabase, resumed, 5, 0)
+    row = supabase.tables["cron_runs"][0]
+    assert (row["state"], row["success_count"], row["error_count"]) == ("completed", 12, 1)
+    assert row["last_error"] is None
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for off-peak pre-generation: drafts are sent without calling OpenAI
+and are not used once the user replies or changes their profile.
+These run offline.
+
+Usage:
+    python -m pytest test_email_drafts.py
+"""
+
+import datetime
+import pytest
+from Backend.simulate_batch import install_database
+from Backend.fake_services import FakeOpenAI, FakeSendGrid, FakeSupabase, seed_users
+from Backend.pregenerate_learning_emails import pregenerate_due
+from Backend.send_batch_learning_emails import enqueue_batch, make_batch_handlers
+from Backend import clients, conversation_memory, send_queue
+
+SOON = datetime.datetime(2025, 8, 1, 10, tzinfo=datetime.timezone.utc)
+
+def seeded(users=3):
+    db = FakeSupabase()
+    seed_users(db, users, history_per_user=2)
+    install_database(db)
+    for user in db.tables["users"]:
+        user["next_send_at"] = SOON.isoformat()
+    return db
+
+def pregenerate(db, openai):
+    async def scenario():
+        clients.register_async_client("openai", openai.client())
+        return await pregenerate_due(db, SOON)
+    return clients.run(scenario())
+
+def send_all(db, openai):
+    enqueue_batch(db, db.tables["users"], "2025-08-01")
+    prepare, generate, deliver = make_batch_handlers(db)
+
+    async def drain():
+        clients.register_async_client("openai", openai.client())
+        clients.register_async_client("sendgrid", FakeSendGrid().client())
+        return await send_queue.drain_queue(db, [send_queue.KIND_BATCH], generate, deliver, prepare=prepare)
+    return clients.run(drain())
+
+def test_drafts_are_sent_without_generating_again():
+    db = seeded()
+    assert pregenerate(db, FakeOpenAI()) == (3, 0, 0)
+    assert pregenerate(db, FakeOpenAI()) == (0, 3, 0)
+    assert all(draft["slot"] == SOON.isoformat() for draft in db.tables["email_drafts"])
+
+    send_openai = FakeOpenAI()
+    assert send_all(db, send_openai) == (3, 0)
+    assert "openai.requests" not in send_openai.stats.counts
+    assert db.tables["email_drafts"] == []
+    sent = [row for row in db.tables["email_history"] if row.get("language") is not None]
+    assert len(sent) == 3 and all(row["prompt_tokens"] for row in sent)
+
+def test_reply_or_profile_change_makes_the_draft_stale():
+    db = seeded()
+    pregenerate(db, FakeOpenAI())
+    replier, changed, unchanged = db.tables["users"]
+    # What the inbound webhook does with a reply
+    reply = db.table("email_history").insert({
+        "auth_user_id": replier["auth_user_id"], "content": "¡Gracias!", "is_from_bennie": False,
+        "created_at": "2025-08-01T09:00:00+00:00",
+    }).execute().data[0]
+    conversation_memory.update_after_reply(db, replier["auth_user_id"], reply["content"], reply["created_at"])
+    changed["proficiency_level"] = changed["proficiency_level"] % 100 + 1
+
+    send_openai = FakeOpenAI()
+    assert send_all(db, send_openai) == (3, 0)
+    # The replier's and the changed user's emails were generated again at send time
+    assert send_openai.stats.counts["openai.requests"] == 2
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the topic, vocabulary and token metadata saved with Bennie emails.
+These run offline - emails are sent through the fakes from Backend/fake_services.py.
+
+Usage:
+    python -m pytest test_email_metadata.py
+"""
+
+import pytest
+from collections import Counter
+from Backend.simulate_batch import install_database
+from Backend.fake_services import FakeOpenAI, FakeSendGrid, FakeSupabase, seed_users
+from Backend import bennie_email_sender, clients, send_queue
+from Backend.email_metadata import build_email_metadata, extract_vocabulary
+from Backend.send_batch_learning_emails import enqueue_batch, iter_users_in_shard, make_batch_handlers
+from Backend.send_weekly_evaluation_email import get_vocab_from_bennie_emails
+
+def test_metadata_of_an_email():
+    email = "Hoy fui a un restaurante para la cena. Con cariño, Bennie\nVocabulary:\ncena - dinner\n\nrestaurante - restaurant\n"
+    assert extract_vocabulary(email) == ["cena - dinner", "restaurante - restaurant"]
+    assert extract_vocabulary("Sin vocabulario") == []
+    assert extract_vocabulary(None) == []
+
+    metadata = build_email_metadata(email, "Spanish", {"prompt_tokens": 900, "completion_tokens": 120})
+    assert metadata == {
+        "topic": "food",
+        "vocabulary": ["cena - dinner", "restaurante - restaurant"],
+        "language": "spanish",
+        "prompt_tokens": 900,
+        "completion_tokens": 120,
+        "cached_tokens": None,
+    }
+    assert build_email_metadata("Hello", "english")["prompt_tokens"] is None
+
+def test_sent_emails_store_metadata_and_history_skips_their_bodies():
+    db = FakeSupabase()
+    seed_users(db, 6, history_per_user=2)
+    install_database(db)
+    for page in iter_users_in_shard(db, 0, 1):
+        enqueue_batch(db, page)
+
+    async def scenario():
+        clients.register_async_client("openai", FakeOpenAI().client())
+        clients.register_async_client("sendgrid", FakeSendGrid().client())
+        prepare, generate, deliver = make_batch_handlers()
+        return await send_queue.drain_queue(db, [send_queue.KIND_BATCH], generate, deliver, prepare=prepare)
+
+    assert clients.run(scenario()) == (6, 0)
+    users = {user["auth_user_id"]: user for user in db.tables["users"]}
+    sent = [row for row in db.tables["email_history"] if row.get("language")]
+    assert len(sent) == 6
+    sent_per_segment, cached_per_segment = Counter(), Counter()
+    for row in sent:
+        user = users[row["auth_user_id"]]
+        assert row["language"] == user["target_language"]
+        assert row["prompt_tokens"] > 0 and row["completion_tokens"] > 0
+        segment = bennie_email_sender.prompt_segment(user["target_language"], user["proficiency_level"])
+        sent_per_segment[segment] += 1
+        cached_per_segment[segment] += row["cached_tokens"] >= 1024
+        assert row["vocabulary"] == ["mercado - market", "fruta - fruit"] and row["topic"] == "food"
+    # The shared prefix is served from the cache for every email of a segment but the first
+    assert all(cached_per_segment[segment] == count - 1 for segment, count in sent_per_segment.items())
+
+    history = db.rpc("get_recent_email_history", {"p_auth_user_ids": list(users)}).execute().data
+    for auth_user_id in users:
+        new, old_reply, old_bennie = [row for row in history if row["auth_user_id"] == auth_user_id]
+        assert new["content"] is None and new["language"]
+        assert old_bennie["content"] and old_bennie["language"] is None
+        assert old_reply["content"] is None
+
+def test_topic_rotation_and_vocabulary_prefer_stored_metadata():
+    history = [
+        {"is_from_bennie": True, "content": None, "topic": "travel", "language": "spanish"},
+        {"is_from_bennie": True, "content": None, "topic": None, "language": "spanish"},
+        {"is_from_bennie": False, "content": None},
+        {"is_from_bennie": True, "content": "Mucha lluvia hoy", "topic": None, "language": None},
+    ]
+    recent_topics, _, _ = bennie_email_sender.analyze_topic_diversity(history, "spanish")
+    assert recent_topics == ["travel", "weather"]
+
+    bennie_emails = [
+        {"content": "Vocabulary:\nignored - parsed", "vocabulary": ["viaje - trip"], "language": "spanish"},
+        {"content": "New words:\nlluvia - rain", "vocabulary": None, "language": None},
+    ]
+    assert get_vocab_from_bennie_emails(bennie_emails) == ["viaje - trip", "lluvia - rain"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for per-user send scheduling from users.email_schedule.
+These run offline against the in-memory FakeSupabase from Backend/fake_services.py.
+
+Usage:
+    python -m pytest test_email_scheduler.py
+"""
+
+import datetime
+import pytest
+from Backend import email_scheduler
+from Backend.fake_services import FakeSupabase
+
+UTC = datetime.timezone.utc
+
+def at(*args):
+    return datetime.datetime(*args, tzinfo=UTC)
+
+def test_default_schedule_is_monday_wednesday_friday_at_ten_utc():
+    # Tuesday 2025-08-05 12:00 UTC -> Wednesday 10:00
+    assert email_scheduler.next_send_at({"frequency": "weekly"}, at(2025, 8, 5, 12)) == at(2025, 8, 6, 10)
+    # Friday after the slot -> next Monday
+    assert email_scheduler.next_send_at(None, at(2025, 8, 8, 10)) == at(2025, 8, 11, 10)
+    # Invalid values fall back instead of failing
+    assert email_scheduler.next_send_at(
+        '{"preferred_days": ["someday"], "preferred_time": "late", "timezone": "Mars/Base"}',
+        at(2025, 8, 5, 12),
+    ) == at(2025, 8, 6, 10)
+
+def test_preferred_days_time_and_timezone_follow_dst():
+    schedule = {"preferred_days": ["sunday"], "preferred_time": "09:30", "timezone": "America/New_York"}
+    # EDT (UTC-4) before the change on 2025-11-02, EST (UTC-5) on the day
+    assert email_scheduler.next_send_at(schedule, at(2025, 10, 20)) == at(2025, 10, 26, 13, 30)
+    assert email_scheduler.next_send_at(schedule, at(2025, 10, 26, 13, 30)) == at(2025, 11, 2, 14, 30)
+
+    daily = {"frequency": "daily", "preferred_time": "7:15", "timezone": "Asia/Tokyo"}
+    assert email_scheduler.next_send_at(daily, at(2025, 8, 5, 23)) == at(2025, 8, 5, 22, 15) + datetime.timedelta(days=1)
+
+def test_spread_offset_is_stable_and_bounded():
+    after = at(2025, 8, 5, 12)
+    slots = [email_scheduler.next_send_at(None, after, f"user-{i}") for i in range(200)]
+    offsets = {(slot - at(2025, 8, 6, 10)).total_seconds() / 60 for slot in slots}
+    assert offsets <= set(range(email_scheduler.SPREAD_MINUTES))
+    assert len(offsets) > 20
+    assert slots[7] == email_scheduler.next_send_at(None, after, "user-7")
+
+def test_due_tick_reads_only_due_users_and_moves_them_on():
+    db = FakeSupabase()
+    now = at(2025, 8, 6, 10, 45)
+    past = email_scheduler.format_timestamp(now - datetime.timedelta(hours=1))
+    future = email_scheduler.format_timestamp(now + datetime.timedelta(days=1))
+    db.tables["users"] = [
+        {"id": f"{i:03d}", "auth_user_id": f"auth-{i}", "email": f"user{i}@example.com",
+         "is_active": i != 3, "email_schedule": {"frequency": "daily", "preferred_time": "10:00"},
+         "next_send_at": [past, future, None, past][i % 4]}
+        for i in range(40)
+    ]
+
+    assert email_scheduler.schedule_unscheduled(db, now) == 10
+    due = [user for page in email_scheduler.iter_due_users(db, "auth_user_id, email", now, page_size=4)
+           for user in page]
+    # Past slots only; users 2, 6, ... were just scheduled into the future and user 3 is inactive
+    assert sorted(user["id"] for user in due) == [f"{i:03d}" for i in range(40) if i % 4 in (0, 3) and i != 3]
+    assert all({"id", "auth_user_id", "email_schedule", "next_send_at"} <= set(user) for user in due)
+
+    email_scheduler.advance(db, due, now)
+    assert list(email_scheduler.iter_due_users(db, "auth_user_id", now)) == []
+    assert all(user["next_send_at"] > email_scheduler.format_timestamp(now)
+               for user in db.tables["users"] if user["is_active"])
+
+if __name__ == "__main__":
+    pytest.main([__file__])
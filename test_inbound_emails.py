@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for the fast-ack inbound webhook and the processing of stored replies.
+These run offline - the app is driven in process against the fake Supabase.
+
+Usage:
+    python -m pytest test_inbound_emails.py
+"""
+
+import os
+import asyncio
+import datetime
+import pytest
+
+for name, value in {"SUPABASE_URL": "https://test.supabase.co", "SUPABASE_KEY": "test",
+                    "SUPABASE_ANON_KEY": "test", "OPENAI_API_KEY": "sk-test", "SENDGRID_API_KEY": "SG.test"}.items():
+    os.environ.setdefault(name, value)
+
+import httpx
+from Backend import clients, conversation_memory, inbound_emails, send_queue
+from Backend.simulate_batch import install_database
+from Backend.profile_cache import profile_cache
+from Backend.fake_services import FakeAsyncSupabase, FakeOpenAI, FakeSendGrid, FakeSupabase, FaultModel, seed_users
+
+def inbound_form(sender, text="¡Hola Bennie! Hoy fui al mercado.", message_id="<reply-1@mail.example.com>"):
+    return {"from": sender, "subject": "Re: Bennie", "text": text,
+            "headers": f"Subject: Re: Bennie\nMessage-ID: {message_id}\n"}
+
+def post_inbound(db, forms, sendgrid=None, service_db=None):
+    """POST each form to /api/sendgrid-inbound; background processing finishes before a response returns."""
+    import main
+
+    async def scenario():
+        clients.register_async_client("supabase:SUPABASE_ANON_KEY", FakeAsyncSupabase(db))
+        clients.register_async_client("supabase:SUPABASE_KEY", FakeAsyncSupabase(service_db or db))
+        clients.register_async_client("openai", FakeOpenAI().client())
+        clients.register_async_client("sendgrid", (sendgrid or FakeSendGrid()).client())
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return [await http.post("/api/sendgrid-inbound", data=form) for form in forms]
+
+    return asyncio.run(scenario())
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeSupabase()
+    seed_users(db, 3, history_per_user=0)
+    install_database(db)
+    # Processing uses the service role client
+    monkeypatch.setitem(clients._sync_clients, "supabase", db)
+    profile_cache.clear()
+    yield db
+    profile_cache.clear()
+
+def test_reply_is_stored_then_processed_and_answered(db):
+    user = db.tables["users"][0]
+    user["instant_reply"] = True
+    other = db.tables["users"][1]
+    conversation_memory.save_summary(db, other["auth_user_id"], conversation_memory.empty_summary())
+    sendgrid = FakeSendGrid()
+
+    responses = post_inbound(db, [inbound_form(f"Learner <{user['email'].upper()}>"),
+                                  inbound_form(user["email"]),  # SendGrid redelivering the same email
+                                  inbound_form(other["email"], message_id="<reply-2@mail.example.com>"),
+                                  inbound_form("stranger@example.com", message_id="<spam@mail.example.com>")],
+                             sendgrid=sendgrid)
+
+    assert [response.json() for response in responses] == [{"success": True}] * 4
+    inbox = db.tables["inbound_emails"]
+    assert [row["state"] for row in inbox] == ["done", "done", "ignored"]
+    assert inbox[0]["sender"] == user["email"] and inbox[0]["payload"]["subject"] == "Re: Bennie"
+    assert inbox[2]["last_error"] == "User not found"
+
+    replies = [row for row in db.tables["email_history"] if not row["is_from_bennie"]]
+    assert [row["auth_user_id"] for row in replies] == [user["auth_user_id"], other["auth_user_id"]]
+    assert inbox[0]["email_history_id"] == replies[0]["id"]
+    summary = conversation_memory.load_summaries(db, [other["auth_user_id"]])[other["auth_user_id"]]
+    assert "mercado" in summary["last_reply"]
+
+    # Only the instant_reply user got an answer, sent by the API after it acknowledged the email
+    [queued] = db.tables["send_queue"]
+    assert queued["idempotency_key"] == f"instant_reply:{user['auth_user_id']}:inbound:{inbox[0]['id']}"
+    assert queued["state"] == "done" and sendgrid.stats.counts["sendgrid.accepted"] == 1
+
+def test_unusable_posts_are_rejected_or_retried_by_sendgrid(db):
+    failing = FakeSupabase(faults=FaultModel(error_rate=1.0))
+    [missing] = post_inbound(db, [{"from": "sim0@example.com", "subject": "(no text)"}])
+    [unstored] = post_inbound(db, [inbound_form("sim0@example.com")], service_db=failing)
+
+    assert missing.status_code == 200 and missing.json()["success"] is False
+    # A non-2xx answer makes SendGrid post the email again later
+    assert unstored.status_code == 503
+    assert "inbound_emails" not in db.tables
+
+def test_failed_row_is_retried_without_saving_the_reply_twice(db, monkeypatch):
+    user = db.tables["users"][0]
+    user["instant_reply"] = True
+    db.tables["inbound_emails"] = []
+    db.table("inbound_emails").insert(inbound_emails.build_row(inbound_form(user["email"]))).execute()
+
+    def unavailable(supabase, items):
+        raise RuntimeError("send queue unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(send_queue, "enqueue", unavailable)
+        assert inbound_emails.drain_inbound(db) == (0, 1)
+    [row] = db.tables["inbound_emails"]
+    assert row["state"] == "pending" and row["last_error"] == "send queue unavailable"
+
+    row["available_at"] = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)).isoformat()
+    assert inbound_emails.drain_inbound(db) == (1, 0)
+    assert row["state"] == "done" and row["attempts"] == 2
+    assert sum(not entry["is_from_bennie"] for entry in db.tables["email_history"]) == 1
+    assert len(db.tables["send_queue"]) == 1
+
+def test_a_burst_of_triggers_shares_one_drain():
+    drains = []
+
+    async def drain():
+        drains.append(len(drains))
+        await asyncio.sleep(0.01)
+
+    async def burst():
+        trigger = inbound_emails.DrainTrigger(drain)
+        await asyncio.gather(*(trigger() for _ in range(20)))
+        return trigger
+
+    trigger = asyncio.run(burst())
+    # The first drain, then one more for every email that arrived while it ran
+    assert drains == [0, 1] and not trigger.running
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for structured learning emails: schema, validation and rendering.
+These run offline.
+
+Usage:
+    python -m pytest test_learning_email.py
+"""
+
+import json
+import pytest
+from Backend.simulate_batch import install_database
+from Backend.fake_services import FakeSendGrid, FakeSupabase, seed_users
+from Backend import bennie_email_sender, clients
+from Backend.learning_email import (
+    RESPONSE_FORMAT, LearningEmail, parse_learning_email, render_html, render_text,
+)
+
+RESPONSE = json.dumps({
+    "body": "Hoy fui al mercado.\n\n¿Y tú? <3",
+    "closing": "Con cariño, Bennie",
+    "vocabulary": [{"word": "mercado", "definition": "market"}],
+    "topic": "Food",
+}, ensure_ascii=False)
+
+def test_schema_matches_the_model():
+    schema = RESPONSE_FORMAT["json_schema"]["schema"]
+    assert set(schema["properties"]) == set(schema["required"]) == set(LearningEmail.model_fields)
+    assert "other" in schema["properties"]["topic"]["enum"]
+
+def test_parse_rejects_malformed_responses():
+    email = parse_learning_email(RESPONSE)
+    assert email.stored_topic == "food"
+    assert email.vocabulary_lines() == ["mercado - market"]
+    assert parse_learning_email(RESPONSE.replace('"Food"', '"other"')).stored_topic is None
+    for bad in ("", "Hola, Bennie", '{"body": "Hola"}', RESPONSE.replace('"word"', '"palabra"')):
+        with pytest.raises(ValueError):
+            parse_learning_email(bad)
+
+def test_text_and_html_are_rendered_from_the_fields():
+    email = parse_learning_email(RESPONSE)
+    assert render_text(email) == "Hoy fui al mercado.\n\n¿Y tú? <3\n\nCon cariño, Bennie\n\nVocabulary:\nmercado - market"
+    html = render_html(email)
+    assert "<p>¿Y tú? &lt;3</p>" in html
+    assert "<li><strong>mercado</strong> - market</li>" in html
+
+def test_deliver_saves_rendered_text_and_sends_legacy_text_as_is():
+    db = FakeSupabase()
+    seed_users(db, 1, history_per_user=0)
+    install_database(db)
+    user = db.tables["users"][0]
+    context = bennie_email_sender.build_user_context(user, [])
+
+    async def scenario():
+        clients.register_async_client("sendgrid", FakeSendGrid().client())
+        await bennie_email_sender.deliver_learning_email(user["email"], context, RESPONSE)
+        await bennie_email_sender.deliver_learning_email(user["email"], context, "Hola\nVocabulary:\nsol - sun")
+
+    clients.run(scenario())
+    structured, legacy = db.tables["email_history"]
+    assert structured["content"] == render_text(parse_learning_email(RESPONSE))
+    assert (structured["topic"], structured["vocabulary"]) == ("food", ["mercado - market"])
+    assert legacy["content"] == "Hola\nVocabulary:\nsol - sun"
+    assert legacy["vocabulary"] == ["sol - sun"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
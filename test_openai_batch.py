@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for the OpenAI Batch API mode of the scheduled jobs, against the local batch stub.
+These run offline.
+
+Usage:
+    python -m pytest test_openai_batch.py
+"""
+
+import datetime
+import pytest
+from Backend.simulate_batch import install_database
+from Backend.fake_services import FakeOpenAI, FakeSendGrid, FakeSupabase, seed_users
+from Backend.openai_batch_stub import StubOpenAIBatch
+from Backend.profile_cache import profile_cache
+from Backend import clients, cron_runs, openai_batch, send_queue, send_weekly_evaluation_cron
+from Backend.send_batch_learning_emails import (
+    build_batch_requests, enqueue_batch, make_batch_handlers, read_batch_completion,
+)
+
+def start_batch_run(users=4):
+    db = FakeSupabase()
+    seed_users(db, users, history_per_user=2)
+    install_database(db)
+    run = cron_runs.start_run(db, cron_runs.JOB_BATCH, {"send_date": "2025-08-01"})
+    enqueue_batch(db, db.tables["users"], "2025-08-01", run_id=run["id"])
+    return db, run
+
+def pregenerate(db, run, stub, **kwargs):
+    return openai_batch.pregenerate_run(db, run, build_batch_requests, read_batch_completion,
+                                        client=stub.client(), sleep=lambda seconds: None, **kwargs)
+
+def test_batch_results_are_sent_without_synchronous_generation(tmp_path):
+    db, run = start_batch_run()
+    stub = StubOpenAIBatch(polls_to_complete=3)
+
+    assert pregenerate(db, run, stub, workdir=str(tmp_path)) == (4, 0)
+    assert run["params"]["openai_batch_id"] in stub.batches
+    assert {line["custom_id"] for line in stub.requests} == {row["id"] for row in db.tables["send_queue"]}
+    assert all(line["body"]["response_format"]["type"] == "json_schema" for line in stub.requests)
+
+    sync_openai = FakeOpenAI()
+    prepare, generate, deliver = make_batch_handlers()
+
+    async def drain():
+        clients.register_async_client("openai", sync_openai.client())
+        clients.register_async_client("sendgrid", FakeSendGrid().client())
+        return await send_queue.drain_queue(db, [send_queue.KIND_BATCH], generate, deliver, prepare=prepare)
+
+    assert clients.run(drain()) == (4, 0)
+    assert "openai.tokens" not in sync_openai.stats.counts
+    sent = [row for row in db.tables["email_history"] if row.get("language") is not None]
+    assert len(sent) == 4 and all(row["prompt_tokens"] for row in sent)
+
+def test_rows_waiting_on_the_batch_are_not_generated_by_a_concurrent_drain(tmp_path):
+    db, run = start_batch_run()
+    stub = StubOpenAIBatch(polls_to_complete=3)
+    sync_openai = FakeOpenAI()
+    prepare, generate, deliver = make_batch_handlers()
+
+    async def drain():
+        clients.register_async_client("openai", sync_openai.client())
+        clients.register_async_client("sendgrid", FakeSendGrid().client())
+        return await send_queue.drain_queue(db, [send_queue.KIND_BATCH], generate, deliver, prepare=prepare)
+
+    # The next cron tick or the worker draining the queue while the batch runs
+    concurrent = []
+    openai_batch.pregenerate_run(db, run, build_batch_requests, read_batch_completion, client=stub.client(),
+                                 workdir=str(tmp_path), sleep=lambda seconds: concurrent.append(clients.run(drain())))
+    assert concurrent == [(0, 0), (0, 0)]
+
+    # Released once the results are stored
+    assert clients.run(drain()) == (4, 0)
+    assert "openai.tokens" not in sync_openai.stats.counts
+
+def test_failed_requests_are_left_for_the_drain_and_resume_reuses_the_batch(tmp_path):
+    db, run = start_batch_run()
+    failing = db.tables["send_queue"][0]["id"]
+    stub = StubOpenAIBatch(polls_to_complete=5, fail_custom_ids=[failing])
+
+    with pytest.raises(TimeoutError):
+        pregenerate(db, run, stub, workdir=str(tmp_path), wait_seconds=0)
+    # Released on timeout, so a drain can still send them if the run isn't resumed
+    assert all(row["available_at"] <= datetime.datetime.now(datetime.timezone.utc).isoformat()
+               for row in db.tables["send_queue"])
+
+    resumed = cron_runs.load_run(db, cron_runs.JOB_BATCH, run["id"])
+    assert pregenerate(db, resumed, stub) == (3, 1)
+    assert len(stub.batches) == 1
+    ungenerated = [row["id"] for page in send_queue.iter_ungenerated(db, run["id"]) for row in page]
+    assert ungenerated == [failing]
+
+def test_weekly_requests_are_built_from_one_bulk_load_and_skip_rows_that_fail(monkeypatch):
+    db = FakeSupabase()
+    seed_users(db, 4, history_per_user=4)
+    install_database(db)
+    send_weekly_evaluation_cron.enqueue_weekly_evaluations(db, db.tables["users"], "2025-W31")
+    items = db.tables["send_queue"]
+    profile_cache.clear()
+    expected = send_weekly_evaluation_cron.build_weekly_evaluation_request(
+        send_weekly_evaluation_cron.get_user_context(items[0]["payload"]["email"]))
+
+    build = send_weekly_evaluation_cron.build_weekly_evaluation_request
+
+    def flaky_build(user):
+        if user["auth_user_id"] == items[1]["auth_user_id"]:
+            raise RuntimeError("connection reset")
+        return build(user)
+
+    monkeypatch.setattr(send_weekly_evaluation_cron, "build_weekly_evaluation_request", flaky_build)
+    before = dict(db.stats.counts)
+    requests = send_weekly_evaluation_cron.build_batch_requests(items)
+    queries = {name: count - before.get(name, 0) for name, count in db.stats.counts.items() if count != before.get(name, 0)}
+
+    # The failing row is left to the synchronous drain; the others match the per-user prompt
+    assert set(requests) == {item["id"] for item in items} - {items[1]["id"]}
+    assert requests[items[0]["id"]] == expected
+    assert queries == {"supabase.users.select": 1, "supabase.rpc.get_evaluation_history": 1}
+
+if __name__ == "__main__":
+    pytest.main([__file__])
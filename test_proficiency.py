@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Tests for the proficiency level and language tables.
+These run offline.
+
+Usage:
+    python -m pytest test_proficiency.py
+"""
+
+import pytest
+from Backend.proficiency import (
+    LEVELS, get_vocabulary_guidance, language_info, level_info, level_to_semester, normalize_language,
+)
+
+def test_level_table_covers_every_level_on_the_semester_bands():
+    assert len(LEVELS) == 101
+    assert [level_to_semester(level)[0] for level in (0, 12, 13, 25, 26, 50, 51, 87, 88, 100)] == [1, 1, 2, 2, 3, 4, 5, 7, 8, 8]
+    assert level_info(-5) == LEVELS[0] and level_info(250) == LEVELS[100]
+    assert level_info(None).level == 1
+    assert "(Levels 1-12)" in get_vocabulary_guidance(12, "spanish")
+    assert "(Levels 51-100)" in get_vocabulary_guidance(62, "spanish")
+
+def test_language_table_resolves_aliases_and_falls_back_to_english():
+    assert normalize_language(" Chinese ") == "mandarin"
+    mandarin = language_info("chinese")
+    assert (mandarin.name, mandarin.greeting) == ("Mandarin Chinese", "你好！你最近好吗？")
+    assert mandarin.welcome_subject == "Welcome to Bennie! Your Mandarin Chinese Learning Journey Begins 🌟"
+    assert language_info("Spanish").closing == "Con cariño, Bennie"
+    klingon = language_info("klingon")
+    assert klingon.greeting == "Hello! How are you? (Learning Klingon)"
+    assert klingon.farewell == "Goodbye and thank you for everything!"
+    assert klingon.subject == "Language Learning Email from Bennie! Klingon Learning Email"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tests for the indexed user lookup of GET /api/users/{email} and the read-through profile cache.
+These run offline - the app is driven in process against the fake Supabase.
+
+Usage:
+    python -m pytest test_profile_cache.py
+"""
+
+import os
+import asyncio
+import pytest
+
+for name, value in {"SUPABASE_URL": "https://test.supabase.co", "SUPABASE_KEY": "test",
+                    "SUPABASE_ANON_KEY": "test", "OPENAI_API_KEY": "sk-test", "SENDGRID_API_KEY": "SG.test"}.items():
+    os.environ.setdefault(name, value)
+
+import httpx
+from Backend import clients
+from Backend.benchmark_user_lookup import parse_args, run
+from Backend.fake_services import FakeAsyncSupabase, FakeRedis, FakeSupabase, seed_users
+from Backend.profile_cache import MemoryBackend, ProfileCache, RedisBackend, profile_cache
+
+def test_profiles_are_found_by_email_or_id_and_expire():
+    now = [0.0]
+    cache = ProfileCache(MemoryBackend(clock=lambda: now[0]), ttl=30)
+    cache.set({"auth_user_id": "a1", "email": "Ana@Example.com", "name": "Ana"})
+    cache.set({"auth_user_id": "b2", "email": "ben@example.com", "name": "Ben"})
+
+    profile = cache.get(email="ana@example.com")
+    profile["name"] = "changed"
+    assert cache.get(email="ANA@example.com")["name"] == "Ana"
+    assert cache.get(auth_user_id="b2")["name"] == "Ben"
+
+    cache.invalidate(auth_user_id="a1")
+    assert cache.get(email="ana@example.com") is None
+    cache.invalidate(email="BEN@example.com")
+    assert cache.get(auth_user_id="b2") is None and cache.backend.size() == 0
+
+    cache.set({"auth_user_id": "a1", "email": "ana@example.com"})
+    now[0] = 30
+    assert cache.get(email="ana@example.com") is None
+    assert cache.stats()["hits"] == 3 and cache.stats()["invalidations"] == 2
+
+def test_lru_bound_and_read_through():
+    cache = ProfileCache(MemoryBackend(max_entries=4), ttl=30)
+    loads = []
+
+    def loader(i):
+        def load():
+            loads.append(i)
+            return {"auth_user_id": f"id{i}", "email": f"user{i}@example.com"} if i < 3 else None
+        return load
+
+    for i in (0, 1, 0, 3, 3):
+        cache.get_or_load(loader(i), email=f"user{i}@example.com")
+    # A missing user is never cached, so it is loaded every time
+    assert loads == [0, 1, 3, 3]
+    cache.get_or_load(loader(2), email="user2@example.com")
+    # Two keys per profile: user1, least recently used, was evicted
+    assert cache.get(auth_user_id="id1") is None and cache.get(auth_user_id="id0") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 2 and stats["size"] == 4 and stats["backend"] == "MemoryBackend"
+
+def test_redis_backend_shares_invalidations_between_caches():
+    server = FakeRedis()
+    api, sender = ProfileCache(RedisBackend(server), ttl=30), ProfileCache(RedisBackend(server), ttl=30)
+    api.set({"auth_user_id": "a1", "email": "ana@example.com", "proficiency_level": 10})
+    assert sender.get(email="ana@example.com")["proficiency_level"] == 10
+    sender.invalidate(auth_user_id="a1")
+    assert api.get(auth_user_id="a1") is None
+    api.set({"auth_user_id": "a1", "email": "ana@example.com"})
+    api.clear()
+    assert sender.backend.size() == 0 and api.stats()["evictions"] is None
+
+def test_get_user_finds_any_user_with_one_lookup_then_serves_the_cache():
+    import main
+
+    db = FakeSupabase()
+    seed_users(db, 120, history_per_user=0)
+    profile_cache.clear()
+
+    async def scenario():
+        clients.register_async_client("supabase:SUPABASE_ANON_KEY", FakeAsyncSupabase(db))
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                # list_users returned 50 users per page; this one was never found
+                first = await http.get("/api/users/SIM99@example.com")
+                again = await http.get("/api/users/sim99@example.com")
+                missing = await http.get("/api/users/nobody@example.com")
+        return first, again, missing
+
+    first, again, missing = asyncio.run(scenario())
+    assert first.status_code == 200 and first.json()["user"]["name"] == "Learner 99"
+    assert "auth_user_id" not in first.json()["user"]
+    assert again.json() == first.json()
+    assert missing.status_code == 404
+    assert db.stats.counts["supabase.rpc.get_user_by_email"] == 2
+    assert "supabase.auth.list_users" not in db.stats.counts
+    profile_cache.clear()
+
+def test_sender_context_uses_the_indexed_lookup_then_the_cache():
+    from Backend import bennie_email_sender
+    from Backend.simulate_batch import install_database
+
+    db = FakeSupabase()
+    seed_users(db, 3, history_per_user=0)
+    install_database(db)
+    profile_cache.clear()
+    for email in ("SIM1@example.com", "sim1@example.com"):
+        assert bennie_email_sender.get_user_context(email)["name"] == "Learner 1"
+    assert db.stats.counts["supabase.rpc.get_user_by_email"] == 1
+    assert "supabase.users.select" not in db.stats.counts
+    profile_cache.clear()
+
+def test_weekly_evaluation_finds_a_mixed_case_email():
+    from Backend import send_weekly_evaluation_email
+    from Backend.simulate_batch import install_database
+
+    db = FakeSupabase()
+    seed_users(db, 3, history_per_user=0)
+    db.tables["users"][2]["email"] = "Sim2@Example.com"
+    install_database(db)
+    profile_cache.clear()
+    assert send_weekly_evaluation_email.get_user_context("sim2@example.com")["name"] == "Learner 2"
+    assert send_weekly_evaluation_email.get_user_context("SIM2@example.com")["name"] == "Learner 2"
+    assert db.stats.counts["supabase.rpc.get_user_by_email"] == 1
+    profile_cache.clear()
+
+def test_benchmark_compares_every_method():
+    results = run(parse_args(["--users", "2000", "--lookups", "20"]))
+    by_method = {r["method"]: r for r in results}
+    assert by_method["index used"]["value"] is True
+    assert all(r["found"] == 1 for r in results if "found" in r)
+    assert by_method["lower(email) index"]["round_trips"] == 1
+    assert by_method["list_users scan"]["round_trips"] > 1
+
+if __name__ == "__main__":
+    pytest.main([__file__])
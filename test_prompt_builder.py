@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for prompt assembly and the prompt token report.
+These run offline.
+
+Usage:
+    python -m pytest test_prompt_builder.py
+"""
+
+import json
+import pytest
+from Backend.prompt_report import legacy_prompt, main, sample_context
+from Backend.prompt_builder import PromptBuilder, count_tokens
+from Backend.fake_services import FakeSupabase, seed_users
+from Backend.send_batch_learning_emails import enqueue_batch, iter_users_in_shard
+from Backend import send_queue
+from Backend.bennie_email_sender import (
+    SYSTEM_MESSAGE, build_segment_prompt, create_enhanced_prompt, get_vocabulary_guidance, prompt_segment,
+)
+
+def test_builder_drops_repeated_sections_and_lines():
+    builder = PromptBuilder(exclude=["You are Bennie."])
+    builder.add("persona", "You are Bennie.")
+    builder.add("rules", "RULES:\n- Be kind\n- Ask a question")
+    builder.add("more", "MORE:\n- be  KIND\n- Use simple words")
+    builder.add("again", "RULES:\n- Be kind\n- Ask a question")
+
+    assert builder.build() == "RULES:\n- Be kind\n- Ask a question\n\nMORE:\n- Use simple words"
+    report = {entry["section"]: entry for entry in builder.report()}
+    assert report["persona"]["tokens"] == 0 and report["again"]["tokens"] == 0
+    assert report["more"]["duplicate_lines"] == 1
+
+def test_builder_trims_sections_over_budget_by_whole_lines():
+    text = "\n".join(f"- rule number {i} with some words" for i in range(10))
+    builder = PromptBuilder().add("rules", text, budget=count_tokens(text) // 2)
+    entry = builder.report()[0]
+    assert 0 < entry["tokens"] <= entry["budget"]
+    assert entry["trimmed_lines"] >= 5
+    assert builder.build() == "\n".join(text.splitlines()[:10 - entry["trimmed_lines"]])
+
+def test_prompt_sends_vocabulary_guidance_once_and_persona_only_in_the_prefix():
+    context = sample_context("spanish", 6)
+    system = build_segment_prompt("spanish", 6).build()
+    prompt = system + create_enhanced_prompt(context, ["food"], True, "music")
+    guidance = get_vocabulary_guidance(6, "spanish").strip().splitlines()[0]
+    assert prompt.count(guidance) == 1
+    assert legacy_prompt(context, ["food"], True, "music").count(guidance) == 2
+    assert prompt.count("playful personality") == 1 and system.startswith(SYSTEM_MESSAGE)
+    assert prompt.endswith("Write your email now:")
+
+def test_segment_prefix_is_shared_and_user_details_come_last():
+    assert prompt_segment("Spanish", 14) == prompt_segment("spanish", 25) == "spanish:2"
+    assert build_segment_prompt("spanish", 14) is build_segment_prompt("Spanish", 25)
+    system = build_segment_prompt("spanish", 14).build()
+    for name, level in (("Alex", 14), ("Sam", 25)):
+        user_prompt = create_enhanced_prompt(dict(sample_context("spanish", level), name=name), [], True, "music")
+        assert name not in system and f"Name: {name}" in user_prompt
+        assert f"{level}/100" not in system
+    assert build_segment_prompt("spanish", 26).build() != system
+
+def test_batch_rows_are_claimed_in_segment_order():
+    db = FakeSupabase()
+    seed_users(db, 40, history_per_user=0)
+    for page in iter_users_in_shard(db, 0, 1):
+        enqueue_batch(db, page)
+    claimed = send_queue.claim(db, "worker", [send_queue.KIND_BATCH], limit=40)
+    segments = [row["segment"] for row in claimed]
+    users = {user["auth_user_id"]: user for user in db.tables["users"]}
+    assert segments == sorted(segments)
+    assert all(row["segment"] == prompt_segment(users[row["auth_user_id"]]["target_language"],
+                                                users[row["auth_user_id"]]["proficiency_level"])
+               for row in claimed)
+
+def test_report_compares_against_a_saved_baseline(tmp_path, capsys):
+    saved = tmp_path / "before.json"
+    results = main(["--save", str(saved)])
+    assert len(results) == 48
+    # The shared prefix is long enough for OpenAI's prompt cache, and cheaper than the old prompt once cached
+    assert all(r["cacheable"] and r["billed"] < r["before"] and not r["over_budget"] for r in results)
+
+    baseline = json.loads(saved.read_text())
+    baseline["spanish/1-12"] += 50
+    saved.write_text(json.dumps(baseline))
+    again = {r["segment"]: r for r in main(["--baseline", str(saved)])}
+    assert again["spanish/1-12"]["before"] - again["spanish/1-12"]["after"] == 50
+    assert "spanish/1-12" in capsys.readouterr().out
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared adaptive rate limiter.
+These run offline - no OpenAI or SendGrid access needed.
+
+Usage:
+    python -m pytest test_rate_limiter.py
+"""
+
+import time
+import httpx
+import pytest
+from Backend.clients import SendGridClient
+from Backend.rate_limiter import RateLimiter, parse_rate_limit_headers, parse_duration
+
+def test_parse_openai_headers():
+    info = parse_rate_limit_headers({
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-remaining-requests": "499",
+        "x-ratelimit-reset-requests": "120ms",
+        "x-ratelimit-limit-tokens": "30000",
+        "x-ratelimit-remaining-tokens": "29000",
+        "x-ratelimit-reset-tokens": "1m2.5s",
+        "retry-after": "3",
+    })
+    assert info["limit_requests"] == 500 and info["remaining_requests"] == 499
+    assert info["reset_requests"] == pytest.approx(0.12)
+    assert info["limit_tokens"] == 30000 and info["reset_tokens"] == pytest.approx(62.5)
+    assert info["retry_after"] == 3
+    assert parse_duration("6m0s") == 360
+
+def test_parse_sendgrid_headers():
+    info = parse_rate_limit_headers({
+        "X-RateLimit-Limit": "600",
+        "X-RateLimit-Remaining": "0",
+        "X-RateLimit-Reset": str(time.time() + 10),
+    })
+    assert info["limit_requests"] == 600 and info["remaining_requests"] == 0
+    assert 9 < info["reset_requests"] <= 10
+
+def test_requests_and_tokens_are_budgeted():
+    """The burst budget is spent first, then calls have to wait for the refill."""
+    limiter = RateLimiter("test", requests_per_minute=600, tokens_per_minute=6000)
+    # Burst capacity is a sixth of a minute: 100 requests and 1000 tokens
+    for _ in range(10):
+        assert limiter._reserve(100) == 0
+    wait = limiter._reserve(100)
+    assert 0.9 < wait <= 1.0  # 100 tokens at 100 tokens/s
+
+    limiter.record_usage(estimated_tokens=100, actual_tokens=40)
+    assert limiter.tokens.level == pytest.approx(60, abs=1)
+
+def test_rate_limited_pauses_and_recovers():
+    limiter = RateLimiter("test", requests_per_minute=600)
+    assert limiter.record_rate_limited({"retry-after": "0.5"}) == 0.5
+    # A second 429 from a call already in flight does not halve the rate again
+    limiter.record_rate_limited({"retry-after": "0.5"})
+    assert limiter.factor == 0.5
+    assert 0.4 < limiter._reserve(0) <= 0.5
+
+    limiter.record_success()
+    assert limiter.factor == pytest.approx(0.55)
+
+def test_headers_adjust_the_limits():
+    limiter = RateLimiter("test", requests_per_minute=600, tokens_per_minute=6000)
+    limiter.record_success({"x-ratelimit-limit-tokens": "60000", "x-ratelimit-remaining-requests": "2"})
+    assert limiter.tokens_per_minute == 60000
+    assert limiter._reserve(0) == 0
+    assert limiter._reserve(0) == 0
+    assert limiter._reserve(0) > 0
+
+def test_sendgrid_client_retries_after_429():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.05"})
+        return httpx.Response(202)
+
+    limiter = RateLimiter("sendgrid-test", requests_per_minute=600)
+    client = SendGridClient(httpx.Client(base_url="http://sendgrid.stub", transport=httpx.MockTransport(handler)),
+                            limiter=limiter)
+    response = client.send({"personalizations": []})
+
+    assert response.status_code == 202
+    assert len(calls) == 2
+    assert limiter.rate_limited_count == 1
+
+if __name__ == "__main__":
+    pytest.main([__file__])
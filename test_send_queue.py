@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for draining the send queue with a sliding window of rows in flight.
+These run offline, against the fake Supabase.
+
+Usage:
+    python -m pytest test_send_queue.py
+"""
+
+import asyncio
+import pytest
+from Backend.fake_services import FakeSupabase
+from Backend import send_queue
+
+def queued(rows):
+    db = FakeSupabase()
+    send_queue.enqueue(db, [{"kind": send_queue.KIND_BATCH, "auth_user_id": f"user-{i}",
+                             "idempotency_key": f"batch:user-{i}:2025-08-01"} for i in range(rows)])
+    return db
+
+def test_a_slow_row_does_not_hold_back_the_others():
+    db = queued(8)
+    slow = db.tables["send_queue"][0]["auth_user_id"]
+    claims = []
+    delivered = []
+
+    async def scenario():
+        others_sent = asyncio.Event()
+
+        def prepare(items):
+            claims.append(len(items))
+
+        async def generate(item):
+            if item["auth_user_id"] == slow:
+                # Only finishes once every other row went out around it
+                await asyncio.wait_for(others_sent.wait(), 5)
+            return f"Hola {item['auth_user_id']}"
+
+        async def deliver(item, content):
+            delivered.append(item["auth_user_id"])
+            if len(delivered) == 7:
+                others_sent.set()
+
+        return await send_queue.drain_queue(db, [send_queue.KIND_BATCH], generate, deliver, prepare=prepare,
+                                            openai_concurrency=2, sendgrid_concurrency=1)
+
+    assert asyncio.run(scenario()) == (8, 0)
+    assert delivered[-1] == slow
+    # Never more than three rows in flight: the first claim fills the window, later ones refill freed slots
+    assert claims[0] == 3 and sum(claims) == 8
+    assert all(row["state"] == "done" for row in db.tables["send_queue"])
+
+def test_should_stop_finishes_the_claimed_rows_without_claiming_more():
+    db = queued(6)
+    delivered = []
+
+    async def scenario():
+        return await send_queue.drain_queue(db, [send_queue.KIND_BATCH], lambda item: "Hola",
+                                            lambda item, content: delivered.append(item["id"]),
+                                            openai_concurrency=2, sendgrid_concurrency=2,
+                                            should_stop=lambda: len(delivered) > 0)
+
+    assert asyncio.run(scenario()) == (4, 0)
+    assert sum(row["state"] == "pending" for row in db.tables["send_queue"]) == 2
+
+def drain_all(db, delivered):
+    async def scenario():
+        return await send_queue.drain_queue(db, [send_queue.KIND_BATCH], lambda item: "Hola",
+                                            lambda item, content: delivered.append(item["id"]))
+    return asyncio.run(scenario())
+
+def test_a_delivered_row_is_never_released_for_a_second_send(monkeypatch):
+    db = queued(2)
+    first, second = db.tables["send_queue"]
+    complete = send_queue.complete
+    failures = {first["id"]: 1, second["id"]: send_queue.COMPLETE_ATTEMPTS}
+
+    def flaky_complete(supabase, item, worker_id):
+        if failures[item["id"]]:
+            failures[item["id"]] -= 1
+            raise RuntimeError("connection reset")
+        return complete(supabase, item, worker_id)
+
+    monkeypatch.setattr(send_queue, "complete", flaky_complete)
+    monkeypatch.setattr(send_queue, "COMPLETE_RETRY_SECONDS", 0)
+    delivered = []
+
+    # The first row is marked done on the retry; the second is reported, not sent again
+    assert drain_all(db, delivered) == (1, 1)
+    assert first["state"] == "done" and second["state"] == "leased"
+    assert drain_all(db, delivered) == (0, 0)
+    assert sorted(delivered) == sorted([first["id"], second["id"]])
+
+def test_a_row_whose_lease_expired_during_delivery_is_marked_done(monkeypatch):
+    db = queued(1)
+    [row] = db.tables["send_queue"]
+    monkeypatch.setattr(send_queue, "complete", lambda supabase, item, worker_id: False)
+    delivered = []
+
+    assert drain_all(db, delivered) == (1, 0)
+    assert row["state"] == "done" and row["last_error"] == "lease lost during delivery"
+    assert drain_all(db, delivered) == (0, 0) and delivered == [row["id"]]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
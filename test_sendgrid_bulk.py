@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for bulk SendGrid sends with personalizations.
+These run offline against Backend/sendgrid_stub.py - no SendGrid access needed.
+
+Usage:
+    python -m pytest test_sendgrid_bulk.py
+"""
+
+import threading
+import httpx
+import pytest
+from Backend.clients import SendGridClient
+from Backend.fake_services import FakeSupabase, seed_users
+from Backend.sendgrid_stub import RecordingSendGrid, make_server
+from Backend.sendgrid_bulk import (
+    MAX_PERSONALIZATIONS_PER_REQUEST,
+    NAME_TAG,
+    build_bulk_payload,
+    send_broadcast,
+    send_bulk,
+)
+
+SUBJECT = f"News for you, {NAME_TAG}!"
+HTML = f"<p>Hi {NAME_TAG}, Bennie has news.</p>"
+TEXT = f"Hi {NAME_TAG}, Bennie has news."
+
+def learners(count, language="spanish"):
+    db = FakeSupabase()
+    seed_users(db, count, history_per_user=0)
+    for user in db.tables["users"]:
+        user["target_language"] = language
+    return db
+
+def test_broadcast_sends_one_request_per_page_of_users():
+    """2500 users take three requests instead of 2500."""
+    stub = RecordingSendGrid()
+    db = learners(2500)
+
+    assert send_broadcast(db, SUBJECT, HTML, TEXT, client=stub.client()) == (2500, 0)
+    assert [len(payload["personalizations"]) for payload in stub.payloads] == [1000, 1000, 500]
+    assert stub.payloads[0]["subject"] == SUBJECT and stub.payloads[0]["content"][1]["value"] == HTML
+    first = stub.payloads[0]["personalizations"][0]
+    assert first == {"to": [{"email": "sim0@example.com"}], "substitutions": {NAME_TAG: "Learner 0"}}
+
+def test_broadcast_reaches_only_active_verified_learners_of_the_language():
+    stub = RecordingSendGrid()
+    db = learners(6, "french")
+    users = db.tables["users"]
+    users[0]["target_language"] = "chinese"
+    users[1]["target_language"] = "mandarin"
+    users[2]["target_language"] = "mandarin"
+    users[2]["is_active"] = False
+
+    # Stored 'chinese' is the same language as 'mandarin'
+    assert send_broadcast(db, SUBJECT, HTML, TEXT, language="Chinese", client=stub.client()) == (2, 0)
+    assert [p["to"][0]["email"] for p in stub.personalizations] == ["sim0@example.com", "sim1@example.com"]
+
+def test_broadcast_dry_run_sends_nothing():
+    stub = RecordingSendGrid()
+    assert send_broadcast(learners(3), SUBJECT, HTML, TEXT, client=stub.client(), dry_run=True) == (3, 0)
+    assert stub.payloads == []
+
+def test_rejected_request_fails_its_chunk():
+    stub = RecordingSendGrid(status_code=400)
+    recipients = [{"email": f"{i}@example.com"} for i in range(5)]
+
+    assert send_bulk(recipients, SUBJECT, HTML, TEXT, client=stub.client(), chunk_size=2) == (0, 5)
+    assert [len(payload["personalizations"]) for payload in stub.payloads] == [2, 2, 1]
+
+def test_payload_limit():
+    recipients = [{"email": f"{i}@example.com"} for i in range(MAX_PERSONALIZATIONS_PER_REQUEST + 1)]
+    with pytest.raises(ValueError):
+        build_bulk_payload(recipients, "subject", "<p>hi</p>", "hi")
+
+def test_stub_server_records_over_http():
+    """The runnable stub accepts real HTTP posts, as used via SENDGRID_API_BASE."""
+    stub = RecordingSendGrid()
+    server = make_server(stub, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = SendGridClient(httpx.Client(base_url=f"http://127.0.0.1:{server.server_port}"))
+        assert send_broadcast(learners(3), SUBJECT, HTML, TEXT, client=client) == (3, 0)
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(stub.payloads) == 1
+    assert stub.personalizations[2]["substitutions"] == {NAME_TAG: "Learner 2"}
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the hash sharding used by the batch email cron jobs.
+These run offline - shard walks run against the fake Supabase.
+
+Usage:
+    python -m pytest test_sharding.py
+"""
+
+import uuid
+import datetime
+import pytest
+from Backend import simulate_batch  # noqa: F401 - dummy credentials so the sender modules import
+from Backend.fake_services import FakeSupabase, seed_users
+from Backend.send_batch_learning_emails import iter_users_in_shard
+from Backend.sharding import shard_for, shard_key, shard_range, parse_shard, shard_from_time_slot, CRON_SLOT_HOURS
+
+def test_shard_is_stable():
+    """The same user always lands in the same shard."""
+    user_id = "3f1b2c4d-1111-4222-8333-444455556666"
+    assert shard_for(user_id, 9) == shard_for(user_id.upper(), 9)
+    assert shard_for(user_id, 9) == shard_for(user_id, 9)
+
+def test_shards_cover_users_evenly():
+    """Every user is in exactly one shard and shards are roughly equal in size."""
+    user_ids = [str(uuid.UUID(int=i * 7919 + 1)) for i in range(9000)]
+    counts = [0] * 9
+    for user_id in user_ids:
+        counts[shard_for(user_id, 9)] += 1
+
+    assert sum(counts) == len(user_ids)
+    assert min(counts) > 900 and max(counts) < 1100
+
+def test_shard_ranges_match_shard_for():
+    """A user's shard_key falls in the range of the shard they belong to, and the ranges tile the bigint range."""
+    for count in (1, 2, 7, 9):
+        ranges = [shard_range(index, count) for index in range(count)]
+        assert ranges[0][0] == -2 ** 63 and ranges[-1][1] is None
+        assert all(ranges[i][1] == ranges[i + 1][0] for i in range(count - 1))
+        for i in range(500):
+            user_id = str(uuid.UUID(int=i * 7919 + 1))
+            low, high = ranges[shard_for(user_id, count)]
+            assert low <= shard_key(user_id) and (high is None or shard_key(user_id) < high)
+
+def test_each_slot_reads_only_its_own_users():
+    """Walking the nine shards returns every active user once, so no slot reads the whole table."""
+    db = FakeSupabase()
+    seed_users(db, 300, history_per_user=0)
+    db.tables["users"][0]["is_active"] = False
+    active = {user["auth_user_id"] for user in db.tables["users"][1:]}
+
+    seen = []
+    for index in range(9):
+        for page in iter_users_in_shard(db, index, 9, page_size=10):
+            assert all(shard_for(user["auth_user_id"], 9) == index for user in page)
+            seen.extend(user["auth_user_id"] for user in page)
+
+    assert sorted(seen) == sorted(active)
+    # About one query per ten users in total, where scanning every user per slot took 9 * 30
+    assert db.stats.counts["supabase.users.select"] <= len(active) // 10 + 9
+
+def test_shard_walk_resumes_after_its_cursor():
+    db = FakeSupabase()
+    seed_users(db, 200, history_per_user=0)
+    pages = list(iter_users_in_shard(db, 4, 9, page_size=5))
+    cursor = (pages[1][-1]["shard_key"], pages[1][-1]["id"])
+
+    resumed = list(iter_users_in_shard(db, 4, 9, page_size=5, start_after=cursor))
+    assert resumed == pages[2:]
+
+def test_parse_shard():
+    assert parse_shard("3/9") == (3, 9)
+    assert parse_shard(" 0/1 ") == (0, 1)
+    for bad in ["9/9", "-1/9", "1", "a/b", "1/0"]:
+        with pytest.raises(ValueError):
+            parse_shard(bad)
+
+def test_time_slot_shard():
+    """Each cron slot hour maps to its own shard, and late starts keep their slot."""
+    for index, hour in enumerate(CRON_SLOT_HOURS):
+        start = datetime.datetime(2025, 1, 1, hour, 5, tzinfo=datetime.timezone.utc)
+        assert shard_from_time_slot(start) == (index, len(CRON_SLOT_HOURS))
+        assert parse_shard("auto", start + datetime.timedelta(minutes=40)) == (index, len(CRON_SLOT_HOURS))
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline throughput simulator and its fake services.
+These run offline - the simulator never talks to Supabase, OpenAI or SendGrid.
+
+Usage:
+    python -m pytest test_simulator.py
+"""
+
+import pytest
+from Backend import rate_limiter
+from Backend.simulate_batch import parse_args, simulate
+
+def run(*argv):
+    return simulate(parse_args(["--time-scale", "0", "--no-trace-memory", *argv]))
+
+def test_batch_run_sends_to_every_user():
+    result = run("--users", "120")
+
+    assert (result["enqueued"], result["sent"], result["failed"]) == (120, 120, 0)
+    assert result["counts"]["sendgrid.accepted"] == 120
+    assert result["counts"]["supabase.email_history.insert"] == 120
+    assert set(result["stages"]) == {"enqueue", "prepare", "generate", "deliver"}
+    # Contexts are bulk-loaded per claimed chunk, not fetched per user
+    assert result["counts"]["supabase.rpc.get_recent_email_history"] < 10
+
+def test_weekly_run_recovers_from_injected_faults():
+    result = run("--job", "weekly", "--users", "60",
+                 "--openai-429-rate", "0.1", "--openai-error-rate", "0.05", "--sendgrid-429-rate", "0.1")
+
+    assert result["sent"] + result["failed"] == 60
+    assert result["sent"] >= 55
+    assert result["counts"].get("openai.injected_429", 0) > 0
+    assert result["rate_limited"]["openai"] > 0
+
+def test_each_run_gets_fresh_rate_limiters():
+    first = run("--job", "weekly", "--users", "30", "--openai-429-rate", "0.2", "--seed", "3")
+    again = run("--job", "weekly", "--users", "30", "--openai-429-rate", "0.2", "--seed", "3")
+    assert first["rate_limited"]["openai"] > 0
+    assert again["rate_limited"] == first["rate_limited"]
+
+    # A smaller simulated account is not served by the previous run's limiter
+    slow = run("--users", "10", "--openai-rpm", "60")
+    assert rate_limiter.get_limiter(rate_limiter.OPENAI).requests_per_minute == 60
+    assert slow["rate_limited"]["openai"] == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for the precompiled multilingual topic classifier.
+These run offline.
+
+Usage:
+    python -m pytest test_topic_classifier.py
+"""
+
+import pytest
+from Backend.topic_classifier import get_classifier, normalize_language
+from Backend.benchmark_topic_classifier import legacy_first_match, parse_args, run
+
+def test_scores_count_every_topic_and_classify_picks_the_strongest():
+    classifier = get_classifier("spanish")
+    text = "Hace sol. Después del trabajo fuimos al restaurante, una cena y un desayuno increíbles."
+
+    assert classifier.scores(text) == {"weather": 1, "work": 1, "food": 3}
+    # The legacy loop stopped at the first topic in its keyword order
+    assert legacy_first_match([text]) == ["food"]
+    assert classifier.classify("Lluvia y frío toda la semana, pero un buen proyecto") == "weather"
+    assert classifier.classify("Sin tema") is None
+    # Ties go to the topic mentioned first
+    assert classifier.classify("Mi familia y mi trabajo") == "family"
+
+def test_latin_keywords_match_word_starts_and_short_ones_whole_words():
+    spanish = get_classifier("spanish")
+    assert spanish.scores("Mis viajes y vacaciones") == {"travel": 2}
+    assert spanish.scores("Estoy solo en casa, es arte") == {"hobbies": 1}
+    assert spanish.scores("un bonito parque") == {}
+    assert get_classifier("german").scores("Das Wetter: Sonne, kein Regen") == {"weather": 3}
+    assert get_classifier("french").scores("Le petit-déjeuner, puis le déjeuner") == {"food": 2}
+
+def test_language_scoping_and_unspaced_scripts():
+    assert normalize_language("Chinese") == "mandarin"
+    assert normalize_language("klingon") is None
+    assert get_classifier("chinese").scores("今天天气很好，我们去餐厅吃晚餐") == {"weather": 1, "food": 2}
+    assert get_classifier("japanese").classify("週末は旅行と観光を楽しみました") == "travel"
+    # Italian "sole" isn't a Spanish keyword; unknown languages use every language's keywords
+    assert get_classifier("spanish").scores("il sole") == {}
+    assert get_classifier(None).scores("il sole") == {"weather": 1}
+    assert get_classifier("spanish") is get_classifier("SPANISH")
+
+def test_batches_give_the_per_text_results():
+    texts = ["Hace sol", "solo en casa", None, "", "Mi familia y mi trabajo", "天气很好\x00sol",
+             "arte", "Lluvia y frío, pero un buen proyecto de trabajo en la oficina"]
+    for classifier in (get_classifier("spanish"), get_classifier(None)):
+        assert classifier.classify_batch(texts) == [classifier.classify(text) for text in texts]
+        assert classifier.scores_batch(texts) == [classifier.scores(text) for text in texts]
+    assert get_classifier("spanish").classify_batch([]) == []
+
+def test_benchmark_runs_every_language_and_shape():
+    results = run(parse_args(["--emails", "2", "--sentences", "2", "--repeat", "1"]))
+    assert len(results) == 18
+    assert all(r["classifier"] > 0 and r["legacy"] > 0 for r in results)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
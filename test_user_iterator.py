@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the keyset-paginated user iterator used by the cron jobs.
+These run offline against a small in-memory stand-in for the Supabase query builder.
+
+Usage:
+    python -m pytest test_user_iterator.py
+"""
+
+import re
+import pytest
+from Backend.user_iterator import iter_users, iter_user_pages, keyset_filter
+
+KEYSET = re.compile(r'^(\w+)\.gt\."(.*)",and\(\1\.eq\."(.*)",(\w+)\.gt\."(.*)"\)$')
+
+class FakeQuery:
+    """Just enough of the PostgREST builder for iter_user_pages."""
+
+    def __init__(self, table):
+        self.table = table
+        self.filters = []
+        self.limit_count = None
+        self.order_by = []
+
+    def select(self, columns):
+        self.columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def or_(self, expression):
+        first, after, _, second, after_second = KEYSET.match(expression).groups()
+        self.filters.append(lambda row: (row[first], row[second]) > (after, after_second))
+        self.table.keyset_queries += 1
+        return self
+
+    def order(self, column):
+        self.order_by.append(column)
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def execute(self):
+        rows = [r for r in self.table.rows if all(f(r) for f in self.filters)]
+        rows.sort(key=lambda r: tuple(r[c] for c in self.order_by))
+        rows = rows[:self.limit_count]
+
+        class Response:
+            data = [{c: r[c] for c in self.columns} for r in rows]
+        return Response()
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.keyset_queries = 0
+
+    def table(self, name):
+        return FakeQuery(self)
+
+def make_users(count):
+    # Several users share a created_at so the id tiebreak matters
+    return [
+        {"id": f"{i:05d}", "created_at": f"2025-01-01T00:00:{i // 3:02d}+00:00",
+         "auth_user_id": f"auth-{i}", "email": f"user{i}@example.com", "is_active": i % 4 != 0}
+        for i in range(count)
+    ]
+
+def test_keyset_filter_quotes_values():
+    expr = keyset_filter(("created_at", "id"), ("2025-01-01T00:00:00+00:00", "abc"))
+    assert expr == 'created_at.gt."2025-01-01T00:00:00+00:00",and(created_at.eq."2025-01-01T00:00:00+00:00",id.gt."abc")'
+
+def test_iterates_every_row_once_in_order():
+    supabase = FakeSupabase(make_users(103))
+    rows = list(iter_users(supabase, "auth_user_id, email", page_size=10))
+
+    assert [r["id"] for r in rows] == [f"{i:05d}" for i in range(103)]
+    assert supabase.keyset_queries == 10
+
+def test_filters_and_page_sizes():
+    supabase = FakeSupabase(make_users(40))
+    pages = list(iter_user_pages(supabase, "auth_user_id", filters=lambda q: q.eq("is_active", True), page_size=10))
+
+    assert [len(p) for p in pages] == [10, 10, 10]
+    assert all(set(r) == {"auth_user_id", "created_at", "id"} for p in pages for r in p)
+
+def test_rows_deleted_mid_run_do_not_shift_pages():
+    supabase = FakeSupabase(make_users(30))
+    pages = iter_user_pages(supabase, "auth_user_id", page_size=10)
+    first = next(pages)
+    # Deleting already-visited rows would make an OFFSET walk skip ahead
+    del supabase.rows[:5]
+    rest = [r for p in pages for r in p]
+
+    assert [r["id"] for r in first + rest] == [f"{i:05d}" for i in range(30)]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
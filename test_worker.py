@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the long-running Bennie worker.
+These run offline - the worker runs against the fakes from Backend/fake_services.py.
+
+Usage:
+    python -m pytest test_worker.py
+"""
+
+import asyncio
+import datetime
+import pytest
+from Backend.simulate_batch import install_database
+from Backend.fake_services import FakeOpenAI, FakeSendGrid, FakeSupabase, seed_users
+from Backend import bennie_worker, clients, cron_runs, send_queue
+
+UTC = datetime.timezone.utc
+
+def test_weekly_run_starts_once_per_week_and_completes_when_drained():
+    db = FakeSupabase()
+    seed_users(db, 12, history_per_user=0)
+    saturday_9am = datetime.time(9, 0)
+    friday = datetime.datetime(2025, 8, 1, 12, tzinfo=UTC)
+    saturday = datetime.datetime(2025, 8, 2, 9, 30, tzinfo=UTC)
+
+    assert bennie_worker.enqueue_weekly_run(db, friday, 5, saturday_9am) is None
+    run = bennie_worker.enqueue_weekly_run(db, saturday, 5, saturday_9am)
+    assert run["params"] == {"iso_week": "2025-W31"} and run["state"] == "enqueued"
+    assert bennie_worker.enqueue_weekly_run(db, saturday, 5, saturday_9am)["id"] == run["id"]
+    assert len(db.tables["send_queue"]) == 12
+    assert len(db.tables["cron_runs"]) == 1
+
+    assert not bennie_worker.finish_drained_run(db, run)
+    for row in db.tables["send_queue"]:
+        row["state"] = "done"
+    db.tables["send_queue"][0]["state"] = "failed"
+    assert bennie_worker.finish_drained_run(db, run)
+    stored = db.tables["cron_runs"][0]
+    assert (stored["state"], stored["success_count"], stored["error_count"]) == ("completed", 11, 1)
+
+def test_worker_sends_due_and_queued_emails_then_stops():
+    db = FakeSupabase()
+    seed_users(db, 20, history_per_user=2)
+    past = datetime.datetime.now(UTC) - datetime.timedelta(hours=1)
+    for user in db.tables["users"]:
+        user["next_send_at"] = past.isoformat()
+    install_database(db)
+    send_queue.enqueue(db, [{
+        "kind": send_queue.KIND_INSTANT_REPLY,
+        "auth_user_id": db.tables["users"][0]["auth_user_id"],
+        "idempotency_key": "instant_reply:test",
+        "payload": {"email": db.tables["users"][0]["email"]},
+    }])
+    # Weekly evaluations start on a day that isn't today, so only learning emails go out
+    tomorrow = bennie_worker.email_scheduler.WEEKDAYS[(datetime.datetime.now(UTC).weekday() + 1) % 7]
+    args = bennie_worker.parse_args(["--poll-interval", "0.05", "--idle-interval", "0.01",
+                                     "--weekly-day", tomorrow, "--weekly-time", "23:59"])
+
+    async def scenario():
+        clients.register_async_client("openai", FakeOpenAI().client())
+        clients.register_async_client("sendgrid", FakeSendGrid().client())
+        worker = bennie_worker.BennieWorker(db, args)
+        task = asyncio.create_task(worker.run())
+        for _ in range(500):
+            queue = db.tables.get("send_queue", [])
+            if len(queue) == 21 and all(row["state"] == "done" for row in queue):
+                break
+            await asyncio.sleep(0.01)
+        worker.request_stop()
+        await asyncio.wait_for(task, timeout=5)
+        return worker
+
+    worker = clients.run(scenario())
+    assert worker.success_count == 21 and worker.error_count == 0
+    assert all(user["next_send_at"] > past.isoformat() for user in db.tables["users"])
+    assert "cron_runs" not in db.tables or not db.tables["cron_runs"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])